@@ -0,0 +1,52 @@
+"""
+Claves de caché versionadas para datos derivados (snapshot de sugerencias del
+chat, facetas del listado de documentos...).
+
+Cada entrada se guarda bajo una clave que incluye la versión actual; cuando
+cambian los datos de los que depende se incrementa la versión en lugar de
+borrar las entradas, que dejan de usarse y expiran solas.
+
+La versión vive en la caché `default` (CACHE_URL). Con un backend compartido
+(redis://, memcache://, dbcache://...) una escritura en cualquier proceso
+invalida las entradas de todos. Con la caché local de cada proceso (locmem, el
+valor por defecto) solo se entera el proceso que escribió: por eso en ese caso
+el TTL se acota a CACHE_TTL_LOCAL_MAX segundos, que es el desfase máximo que
+verán los demás procesos.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def version(clave: str) -> int:
+    """Versión vigente; si no existe (o la caché la desalojó) se crea una nueva"""
+    cache.add(clave, _nueva_version(), None)
+    return cache.get(clave) or _nueva_version()
+
+
+def incrementar_version(clave: str):
+    """Pasa a una nueva versión; las entradas de la anterior dejan de usarse"""
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, _nueva_version(), None)
+
+
+def acotar_ttl(ttl: int) -> int:
+    """TTL a usar para las entradas versionadas según el backend de la caché"""
+    if cache_local():
+        return min(ttl, int(getattr(settings, 'CACHE_TTL_LOCAL_MAX', 60)))
+    return ttl
+
+
+def cache_local() -> bool:
+    """True si la caché `default` es propia de cada proceso"""
+    return isinstance(caches['default'], LocMemCache)
+
+
+def _nueva_version() -> int:
+    # Basada en el reloj: una versión recreada tras un desalojo o reinicio no
+    # coincide con la de entradas anteriores que sigan en la caché
+    return time.time_ns()
@@ -0,0 +1,171 @@
+"""
+Paginación por clave (keyset / seek) para los listados HTML.
+
+En lugar de OFFSET y COUNT(*), cada página se pide "después de" (o "antes de")
+la última fila mostrada: el cursor guarda los valores de las claves de orden
+de esa fila más su id como desempate, y la consulta filtra con
+`clave > valor OR (clave = valor AND id > id_cursor)`, que recorre el índice
+compuesto (claves, id) sin importar la profundidad de la página.
+
+Uso en una vista:
+
+    pagina = paginar_keyset(request, casos, ("-fechaInicio",), por_pagina=25)
+    return render(request, "...", {"casos": pagina, "pagina": pagina})
+
+y en la plantilla `{% include "includes/paginacion_keyset.html" %}`.
+Las claves de orden deben ser columnas NOT NULL del modelo.
+"""
+import base64
+import binascii
+import json
+from typing import Any, List, Optional, Sequence
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+
+# Por debajo de esta estimación del planificador se cuenta de forma exacta
+UMBRAL_CONTEO_EXACTO = 10_000
+
+
+class PaginaKeyset:
+    """Una página de resultados con los enlaces a la siguiente y la anterior"""
+
+    def __init__(self, objetos, por_pagina, tiene_siguiente, tiene_anterior,
+                 url_siguiente=None, url_anterior=None, total=None, total_aproximado=False):
+        self.objetos = objetos
+        self.por_pagina = por_pagina
+        self.tiene_siguiente = tiene_siguiente
+        self.tiene_anterior = tiene_anterior
+        self.url_siguiente = url_siguiente
+        self.url_anterior = url_anterior
+        self.total = total
+        self.total_aproximado = total_aproximado
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    def __bool__(self):
+        return bool(self.objetos)
+
+
+def paginar_keyset(request, queryset, orden: Sequence[str], por_pagina: int = 25,
+                   parametro: str = "cursor", total: Optional[str] = "aproximado") -> PaginaKeyset:
+    """
+    Devuelve la página pedida en `request.GET[parametro]` del queryset ordenado
+    por `orden` (campos con "-" para descendente) más el id. Un cursor inválido
+    muestra la primera página.
+
+    `total`: "aproximado" (estadísticas del planificador, exacto en tablas
+    pequeñas), "exacto" (COUNT) o None (sin total).
+    """
+    claves = list(orden) + [("-pk" if orden and orden[0].startswith("-") else "pk")]
+    campos = [(clave.lstrip("-"), clave.startswith("-")) for clave in claves]
+
+    cursor = _leer_cursor(queryset.model, request.GET.get(parametro), campos)
+    atras = bool(cursor and cursor["atras"])
+
+    filas = queryset
+    if cursor:
+        filas = filas.filter(_despues_de(campos, cursor["valores"], atras))
+    orden_consulta = [_invertir(clave) for clave in claves] if atras else claves
+    objetos = list(filas.order_by(*orden_consulta)[:por_pagina + 1])
+
+    hay_mas = len(objetos) > por_pagina
+    objetos = objetos[:por_pagina]
+    if atras:
+        objetos.reverse()
+        tiene_siguiente, tiene_anterior = True, hay_mas
+    else:
+        tiene_siguiente, tiene_anterior = hay_mas, cursor is not None
+
+    def url(objeto, hacia_atras):
+        parametros = request.GET.copy()
+        parametros[parametro] = _crear_cursor([_valor(objeto, nombre) for nombre, _ in campos], hacia_atras)
+        return "?" + parametros.urlencode()
+
+    pagina = PaginaKeyset(
+        objetos, por_pagina, tiene_siguiente, tiene_anterior,
+        url_siguiente=url(objetos[-1], False) if objetos and tiene_siguiente else None,
+        url_anterior=url(objetos[0], True) if objetos and tiene_anterior else None,
+    )
+    if tiene_anterior and not objetos:
+        # Cursor de una fila que ya no existe al final: volver al principio
+        parametros = request.GET.copy()
+        parametros.pop(parametro, None)
+        pagina.url_anterior = "?" + parametros.urlencode()
+
+    if total == "exacto":
+        pagina.total = queryset.order_by().count()
+    elif total == "aproximado":
+        pagina.total, pagina.total_aproximado = total_estimado(queryset)
+    return pagina
+
+
+def total_estimado(queryset):
+    """
+    (filas, es_aproximado): en PostgreSQL usa la estimación del planificador
+    (EXPLAIN, sin recorrer la tabla); si es pequeña, o en otros motores, cuenta
+    """
+    queryset = queryset.order_by()
+    conexion = connections[queryset.db]
+    if conexion.vendor == "postgresql":
+        sql, params = queryset.query.sql_with_params()
+        with conexion.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimado = int(plan[0]["Plan"]["Plan Rows"])
+        if estimado >= UMBRAL_CONTEO_EXACTO:
+            return estimado, True
+    return queryset.count(), False
+
+
+def _despues_de(campos, valores, atras) -> Q:
+    """
+    Filas posteriores al cursor en el orden dado (anteriores si `atras`):
+    (a > x) OR (a = x AND b > y) OR ..., más `a >= x`, que acota el recorrido del índice
+    """
+    condicion = Q()
+    iguales = Q()
+    for (nombre, descendente), valor in zip(campos, valores):
+        operador = "lt" if descendente != atras else "gt"
+        condicion |= iguales & Q(**{f"{nombre}__{operador}": valor})
+        iguales &= Q(**{nombre: valor})
+    nombre, descendente = campos[0]
+    return Q(**{f"{nombre}__{'lte' if descendente != atras else 'gte'}": valores[0]}) & condicion
+
+
+def _invertir(clave: str) -> str:
+    return clave[1:] if clave.startswith("-") else f"-{clave}"
+
+
+def _valor(objeto, nombre: str) -> Any:
+    return objeto.pk if nombre == "pk" else getattr(objeto, nombre)
+
+
+def _crear_cursor(valores: List[Any], atras: bool) -> str:
+    datos = json.dumps({"v": valores, "a": int(atras)}, default=lambda valor: valor.isoformat(), separators=(",", ":"))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip("=")
+
+
+def _leer_cursor(modelo, texto: Optional[str], campos):
+    """Valores del cursor convertidos al tipo de cada campo, o None si falta o es inválido"""
+    if not texto:
+        return None
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4)))
+        valores = datos["v"]
+        if len(valores) != len(campos):
+            return None
+        convertidos = []
+        for (nombre, _), valor in zip(campos, valores):
+            campo = modelo._meta.pk if nombre == "pk" else modelo._meta.get_field(nombre)
+            convertidos.append(campo.to_python(valor))
+        return {"valores": convertidos, "atras": bool(datos.get("a"))}
+    except (ValueError, TypeError, KeyError, binascii.Error, FieldDoesNotExist, ValidationError):
+        return None
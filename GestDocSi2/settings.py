@@ -104,6 +104,13 @@ DATABASES = {
     }
 }
 
+# Caché de Django; en producción con varios procesos usar un backend compartido
+# (redis://..., dbcache://tabla tras createcachetable) para que las invalidaciones
+# por versión (GestDocSi2.cache_versions) lleguen a todos
+CACHES = {"default": env.cache_url("CACHE_URL", default="locmemcache://")}
+# Con la caché local de cada proceso, TTL máximo de las entradas versionadas
+CACHE_TTL_LOCAL_MAX = env.int("CACHE_TTL_LOCAL_MAX", default=60)  # segundos
+
 # Idioma y zona
 LANGUAGE_CODE = env("LANGUAGE_CODE", default="es")
 TIME_ZONE = env("TIME_ZONE", default="America/La_Paz")
@@ -129,6 +136,59 @@ OPENAI_API_KEY = env("OPENAI_API_KEY", default=None)
 OPENAI_MODEL = env("OPENAI_MODEL", default="gpt-3.5-turbo")
 OPENAI_TEMPERATURE = env("OPENAI_TEMPERATURE", default=0.7)
 OPENAI_MAX_TOKENS = env("OPENAI_MAX_TOKENS", default=1000)
+# Sustituto local de OpenAI (chat.fake_openai) para desarrollo y pruebas sin conexión
+OPENAI_FAKE = env.bool("OPENAI_FAKE", default=False)
+OPENAI_FAKE_RETRASO = env.float("OPENAI_FAKE_RETRASO", default=0.0)  # segundos por fragmento simulado
+# Cliente compartido de OpenAI (chat.openai_pool); ConfiguracionIA puede sobrescribir estos límites
+OPENAI_BASE_URL = env("OPENAI_BASE_URL", default=None)
+OPENAI_MAX_CONCURRENTES = env.int("OPENAI_MAX_CONCURRENTES", default=8)
+OPENAI_SOLICITUDES_POR_SEGUNDO = env.float("OPENAI_SOLICITUDES_POR_SEGUNDO", default=5.0)
+OPENAI_RAFAGA = env.int("OPENAI_RAFAGA", default=10)
+OPENAI_MAX_REINTENTOS = env.int("OPENAI_MAX_REINTENTOS", default=3)
+OPENAI_BACKOFF_BASE = env.float("OPENAI_BACKOFF_BASE", default=0.5)  # segundos
+OPENAI_TIMEOUT = env.float("OPENAI_TIMEOUT", default=60.0)  # segundos
+OPENAI_CONEXIONES_KEEPALIVE = env.int("OPENAI_CONEXIONES_KEEPALIVE", default=10)
+# Caché persistente de respuestas del chat (chat.response_cache)
+CHAT_CACHE_ACTIVO = env.bool("CHAT_CACHE_ACTIVO", default=True)
+CHAT_CACHE_TTL = env.int("CHAT_CACHE_TTL", default=3600)  # segundos
+CHAT_CACHE_MAX_ENTRADAS = env.int("CHAT_CACHE_MAX_ENTRADAS", default=1000)
+CHAT_CACHE_ESTADISTICAS_INTERVALO = env.float("CHAT_CACHE_ESTADISTICAS_INTERVALO", default=10.0)  # segundos entre volcados de contadores
+# Presupuesto del prompt del chat (chat.prompt_builder); además se limita a la ventana del modelo
+CHAT_PROMPT_MAX_TOKENS = env.int("CHAT_PROMPT_MAX_TOKENS", default=3000)
+CHAT_PROMPT_FRACCION_HISTORIAL = env.float("CHAT_PROMPT_FRACCION_HISTORIAL", default=0.3)
+CHAT_PROMPT_MAX_DESCRIPCION = env.int("CHAT_PROMPT_MAX_DESCRIPCION", default=300)  # caracteres
+# Historial del chat: mensajes recientes sin resumir y resumen acumulado (chat.conversation_summary_service)
+CHAT_HISTORIAL_MENSAJES = env.int("CHAT_HISTORIAL_MENSAJES", default=4)
+CHAT_RESUMEN_MAX_TOKENS = env.int("CHAT_RESUMEN_MAX_TOKENS", default=300)
+CHAT_RESUMEN_EN_SEGUNDO_PLANO = env.bool("CHAT_RESUMEN_EN_SEGUNDO_PLANO", default=True)
+# Cola de tareas del chat (chat.job_queue, comando procesar_tareas_ia)
+CHAT_TAREAS_HILOS = env.int("CHAT_TAREAS_HILOS", default=4)
+CHAT_TAREAS_INTERVALO = env.float("CHAT_TAREAS_INTERVALO", default=0.5)  # segundos entre sondeos
+CHAT_TAREAS_TIMEOUT = env.float("CHAT_TAREAS_TIMEOUT", default=120.0)  # plazo de cada intento, en segundos
+CHAT_TAREAS_MAX_INTENTOS = env.int("CHAT_TAREAS_MAX_INTENTOS", default=3)
+CHAT_TAREAS_BACKOFF_BASE = env.float("CHAT_TAREAS_BACKOFF_BASE", default=2.0)  # segundos
+# Lotes de preguntas (chat.batch_service, vista enviar_lote y comando responder_lote_chat)
+CHAT_LOTE_HILOS = env.int("CHAT_LOTE_HILOS", default=8)  # preguntas respondidas a la vez
+CHAT_LOTE_MAX_PREGUNTAS = env.int("CHAT_LOTE_MAX_PREGUNTAS", default=50)
+# Índice BM25 del chat guardado por el comando indexar_chat (vacío = solo en memoria)
+CHAT_INDICE_RUTA = env("CHAT_INDICE_RUTA", default=str(BASE_DIR / "var" / "chat_bm25.idx"))
+# Cada cuánto se comprueba si otros procesos cambiaron los datos indexados
+CHAT_INDICE_SINCRONIZAR_CADA = env.float("CHAT_INDICE_SINCRONIZAR_CADA", default=5.0)  # segundos
+# Vida de las estadísticas compartidas (dashboard.statistics_service)
+ESTADISTICAS_TTL = env.int("ESTADISTICAS_TTL", default=60)  # segundos
+# Vida máxima del snapshot de sugerencias; normalmente se invalida antes por señales
+CHAT_SUGERENCIAS_TTL = env.int("CHAT_SUGERENCIAS_TTL", default=600)  # segundos
+# Vida máxima de las facetas del listado de documentos (documentos.facet_service)
+DOCUMENTOS_FACETAS_TTL = env.int("DOCUMENTOS_FACETAS_TTL", default=300)  # segundos
+# Precalentamiento del chat al iniciar cada proceso, en segundo plano (chat.warmup)
+CHAT_PRECALENTAR = env.bool("CHAT_PRECALENTAR", default=False)
+# Mensajes del chat (duración del precalentamiento, carga del índice BM25) por consola
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {'chat': {'handlers': ['console'], 'level': env("CHAT_LOG_NIVEL", default="INFO")}},
+}
 # ...existing code...
 
 
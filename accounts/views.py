@@ -3,6 +3,7 @@ from django.contrib import messages
 from django.db import transaction
 from django.urls import reverse
 from django.http import HttpResponse
+from GestDocSi2.pagination import paginar_keyset
 
 from seguridad.models import Usuario, Rol, UsuarioRol
 from actores.models import Actor
@@ -25,12 +26,13 @@ from seguridad.models import Usuario
 def users_list(request):
     """Listado de usuarios con búsqueda"""
     q = request.GET.get("q", "").strip()
-    users = Usuario.objects.all().order_by("-date_joined")
+    users = Usuario.objects.all()
 
     if q:
         users = users.filter(username__icontains=q) | users.filter(email__icontains=q)
 
-    return render(request, "accounts/users_list.html", {"users": users, "q": q})
+    pagina = paginar_keyset(request, users, ("-date_joined",))
+    return render(request, "accounts/users_list.html", {"users": pagina, "pagina": pagina, "q": q})
 
 
 @login_required
@@ -80,12 +82,13 @@ def user_delete(request, pk):
 def roles_list(request):
     """Lista todos los roles con búsqueda y orden alfabético"""
     q = request.GET.get("q", "").strip()
-    roles = Rol.objects.all().order_by("nombre")
+    roles = Rol.objects.all()
 
     if q:
         roles = roles.filter(nombre__icontains=q) | roles.filter(descripcion__icontains=q)
 
-    return render(request, "accounts/roles_list.html", {"roles": roles, "q": q})
+    pagina = paginar_keyset(request, roles, ("nombre",))
+    return render(request, "accounts/roles_list.html", {"roles": pagina, "pagina": pagina, "q": q})
 
 
 def role_create(request):
@@ -184,13 +187,16 @@ def actor_create(request, user_id):
 
 def actors_list(request):
     tipo = request.GET.get("tipo", "").upper().strip()
-    actores = Actor.objects.select_related("usuario").all().order_by("tipoActor", "nombres")
+    # Los datos específicos (abogado, cliente, asistente) en el mismo JOIN que el actor
+    actores = Actor.objects.select_related("usuario", "abogado", "cliente", "asistente")
 
     if tipo in ["ABO", "CLI", "ASI"]:
         actores = actores.filter(tipoActor=tipo)
 
+    pagina = paginar_keyset(request, actores, ("tipoActor", "nombres"))
+
     actores_data = []
-    for actor in actores:
+    for actor in pagina:
         info_completa = False
         enlace_completar = None
 
@@ -216,7 +222,7 @@ def actors_list(request):
             "enlace_completar": enlace_completar,
         })
 
-    return render(request, "accounts/actors_list.html", {"actores_data": actores_data, "tipo": tipo})
+    return render(request, "accounts/actors_list.html", {"actores_data": actores_data, "pagina": pagina, "tipo": tipo})
 
 def actor_detail(request, pk):
     """Muestra el detalle completo del actor y su usuario"""
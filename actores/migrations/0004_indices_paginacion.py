@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actores', '0003_abogado_creado_por_abogado_modificado_por_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='actor',
+            name='actores_act_tipoAct_40673f_idx',
+        ),
+        migrations.AddIndex(
+            model_name='actor',
+            index=models.Index(fields=['tipoActor', 'nombres', 'id'], name='actores_act_tipoAct_760b04_idx'),
+        ),
+    ]
@@ -47,11 +47,11 @@ class Actor(models.Model):
     )
 
     creadoEn = models.DateTimeField(auto_now_add=True)
-    actualizadoEn = models.DateTimeField(auto_now=True)
+    actualizadoEn = models.DateTimeField(auto_now=True, db_index=True)  # marca del índice del chat (chat.search_index)
 
     class Meta:
         indexes = [
-            models.Index(fields=["tipoActor"]),
+            models.Index(fields=["tipoActor", "nombres", "id"]),
             models.Index(fields=["estadoActor"]),
         ]
         # db_table = "actor"
@@ -84,7 +84,13 @@ class CarpetaForm(forms.ModelForm):
         expediente = kwargs.pop("expediente", None)
         super().__init__(*args, **kwargs)
         if expediente:
-            self.fields["carpetaPadre"].queryset = Carpeta.objects.filter(expediente=expediente)
+            # Todo el árbol en una consulta, cada carpeta debajo de su madre
+            carpetas = Carpeta.objects.filter(expediente=expediente).order_by("ruta")
+            if self.instance.pk:
+                # Una carpeta no puede moverse dentro de sí misma ni de sus subcarpetas
+                carpetas = carpetas.exclude(ruta__startswith=self.instance.ruta)
+            self.fields["carpetaPadre"].queryset = carpetas
+            self.fields["carpetaPadre"].label_from_instance = lambda carpeta: f"{'— ' * carpeta.profundidad}{carpeta.nombre}"
         else:
             self.fields["carpetaPadre"].queryset = Carpeta.objects.none()
 
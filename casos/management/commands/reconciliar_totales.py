@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from casos.rollup_service import reconciliar
+from documentos.models import Documento, VersionDocumento
+from documentos.signals import tamano_archivo
+import time
+
+
+class Command(BaseCommand):
+    help = ('Recalcula los totales de documentos, versiones, bytes y última actividad de las carpetas '
+            'y expedientes y corrige los que se desviaron (escrituras masivas, errores).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expediente', type=int, action='append', dest='expedientes',
+                            help='Solo este expediente (se puede repetir)')
+        parser.add_argument('--tamanos', action='store_true',
+                            help='Vuelve a leer del almacenamiento el tamaño de cada archivo antes de recalcular')
+        parser.add_argument('--dry-run', action='store_true', help='Solo informa las diferencias')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        expedientes = options['expedientes']
+
+        if options['tamanos']:
+            corregidos = 0
+            for modelo, campo, filtro in (
+                (Documento, 'rutaDocumento', 'carpeta__expediente_id__in'),
+                (VersionDocumento, 'rutaArchivo', 'documento__carpeta__expediente_id__in'),
+            ):
+                objetos = modelo.objects.exclude(**{campo: ''}).exclude(**{f'{campo}__isnull': True})
+                if expedientes:
+                    objetos = objetos.filter(**{filtro: expedientes})
+                cambiados = []
+                for objeto in objetos.only('id', campo, 'tamanoArchivo').iterator(chunk_size=1000):
+                    tamano = tamano_archivo(getattr(objeto, campo))
+                    if tamano != objeto.tamanoArchivo:
+                        objeto.tamanoArchivo = tamano
+                        cambiados.append(objeto)
+                if not options['dry_run']:
+                    modelo.objects.bulk_update(cambiados, ['tamanoArchivo'], batch_size=500)
+                corregidos += len(cambiados)
+            self.stdout.write(f"Tamaños de archivo distintos: {corregidos}")
+
+        corregidas = reconciliar(expedientes, aplicar=not options['dry_run'])
+
+        accion = 'con diferencias' if options['dry_run'] else 'corregidos'
+        self.stdout.write(self.style.SUCCESS(
+            f"Totales {accion}: {corregidas['carpetas']} carpetas, {corregidas['expedientes']} expedientes "
+            f"({time.perf_counter() - inicio:.2f}s)."
+        ))
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def calcular_rutas(apps, schema_editor):
+    """Ruta y profundidad de las carpetas existentes, recorriendo el árbol desde las raíces"""
+    Carpeta = apps.get_model('casos', 'Carpeta')
+    padres = dict(Carpeta.objects.values_list('id', 'carpetaPadre_id'))
+    hijos = {}
+    for carpeta_id, padre_id in padres.items():
+        hijos.setdefault(padre_id if padre_id in padres else None, []).append(carpeta_id)
+
+    rutas = {}
+    # Las carpetas de un ciclo (sin raíz) quedan como raíz en la primera que se encuentre
+    for raiz in hijos.get(None, []) + sorted(padres):
+        if raiz in rutas:
+            continue
+        pendientes = [(raiz, '/')]
+        while pendientes:
+            carpeta_id, ruta_padre = pendientes.pop()
+            rutas[carpeta_id] = f"{ruta_padre}{carpeta_id}/"
+            pendientes.extend((hijo, rutas[carpeta_id]) for hijo in hijos.get(carpeta_id, []) if hijo not in rutas)
+
+    carpetas = list(Carpeta.objects.only('id', 'carpetaPadre'))
+    for carpeta in carpetas:
+        carpeta.ruta = rutas[carpeta.id]
+        carpeta.profundidad = carpeta.ruta.count('/') - 2
+        if carpeta.profundidad == 0:
+            # Solo cambia en la raíz de un ciclo, que se corta
+            carpeta.carpetaPadre_id = None
+    Carpeta.objects.bulk_update(carpetas, ['ruta', 'profundidad', 'carpetaPadre'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0003_eventoexpediente'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carpeta',
+            name='profundidad',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='carpeta',
+            name='ruta',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='carpeta',
+            index=models.Index(fields=['ruta'], name='casos_carpeta_ruta', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(calcular_rutas, migrations.RunPython.noop),
+    ]
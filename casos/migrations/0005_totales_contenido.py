@@ -0,0 +1,94 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:42
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def calcular_totales(apps, schema_editor):
+    """
+    Documentos, versiones y última actividad de las carpetas y expedientes
+    existentes; los bytes se calculan con reconciliar_totales --tamanos
+    """
+    Carpeta = apps.get_model('casos', 'Carpeta')
+    Expediente = apps.get_model('casos', 'Expediente')
+    Documento = apps.get_model('documentos', 'Documento')
+    VersionDocumento = apps.get_model('documentos', 'VersionDocumento')
+
+    directos = {}
+    for fila in Documento.objects.values('carpeta_id').annotate(n=Count('id'), u=Max('actualizadoEn')).order_by():
+        directos[fila['carpeta_id']] = [fila['n'], 0, fila['u']]
+    for fila in VersionDocumento.objects.values('documento__carpeta_id').annotate(n=Count('id'), u=Max('fechaCambio')).order_by():
+        directo = directos.setdefault(fila['documento__carpeta_id'], [0, 0, None])
+        directo[1] = fila['n']
+        directo[2] = max(filter(None, (directo[2], fila['u'])), default=None)
+
+    carpetas = {carpeta.id: carpeta for carpeta in Carpeta.objects.only('id', 'ruta', 'expediente_id')}
+    expedientes = {expediente.id: expediente for expediente in Expediente.objects.only('id')}
+    for objeto in list(carpetas.values()) + list(expedientes.values()):
+        objeto.numDocumentos, objeto.numVersiones, objeto.ultimaActividad = 0, 0, None
+
+    for carpeta_id, (documentos, versiones, actividad) in directos.items():
+        carpeta = carpetas.get(carpeta_id)
+        if carpeta is None:
+            continue
+        cadena = [carpetas[int(i)] for i in carpeta.ruta.strip('/').split('/') if i and int(i) in carpetas]
+        for objeto in cadena + [expedientes[carpeta.expediente_id]]:
+            objeto.numDocumentos += documentos
+            objeto.numVersiones += versiones
+            objeto.ultimaActividad = max(filter(None, (objeto.ultimaActividad, actividad)), default=None)
+
+    campos = ['numDocumentos', 'numVersiones', 'ultimaActividad']
+    Carpeta.objects.bulk_update(carpetas.values(), campos, batch_size=1000)
+    Expediente.objects.bulk_update(expedientes.values(), campos, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0004_carpeta_ruta'),
+        ('documentos', '0004_tamano_archivo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carpeta',
+            name='bytesTotales',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='carpeta',
+            name='numDocumentos',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='carpeta',
+            name='numVersiones',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='carpeta',
+            name='ultimaActividad',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='expediente',
+            name='bytesTotales',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='expediente',
+            name='numDocumentos',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='expediente',
+            name='numVersiones',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='expediente',
+            name='ultimaActividad',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(calcular_totales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0005_totales_contenido'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='expediente',
+            name='casos_exped_fechaCr_13e842_idx',
+        ),
+        migrations.AddIndex(
+            model_name='carpeta',
+            index=models.Index(fields=['expediente', 'nombre', 'id'], name='casos_carpe_expedie_fa3b12_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['fechaInicio', 'id'], name='casos_caso_fechaIn_d5f6fe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expediente',
+            index=models.Index(fields=['fechaCreacion', 'id'], name='casos_exped_fechaCr_d448e0_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0007_actualizadoen_indice'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='carpeta',
+            name='casos_carpeta_ruta',
+        ),
+        migrations.AlterField(
+            model_name='carpeta',
+            name='ruta',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='carpeta',
+            index=models.Index(fields=['ruta'], name='casos_carpeta_ruta', opclasses=['text_pattern_ops']),
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import CharField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Substr
 from actores.models import Actor, Cliente
 from seguridad.models import Usuario
 from django.conf import settings
@@ -8,6 +10,31 @@ from django.conf import settings
 # ==========================
 # CASO
 # ==========================
+class CasoQuerySet(models.QuerySet):
+    def with_summary(self):
+        """
+        Anota en la misma consulta el cliente principal y el abogado responsable
+        (subconsultas), el expediente y su total de documentos; las propiedades
+        cliente_principal y abogado_responsable los usan en lugar de consultar por fila
+        """
+        def nombre(filas, actor):
+            """Subconsulta con "nombres apellidoPaterno" del primer actor de las filas"""
+            return Subquery(filas.annotate(nombre=Concat(
+                f"{actor}__nombres", Value(" "), f"{actor}__apellidoPaterno", output_field=CharField(),
+            )).order_by("pk").values("nombre")[:1])
+
+        return self.annotate(
+            cliente_nombre=nombre(
+                ParteProcesal.objects.filter(caso=OuterRef("pk"), rolProcesal="DEMANDANTE"), "cliente__actor"
+            ),
+            abogado_nombre=nombre(
+                EquipoCaso.objects.filter(caso=OuterRef("pk"), rolEnEquipo="RESPONSABLE"), "actor"
+            ),
+            expediente_pk=F("expediente__id"),
+            documentos_count=Coalesce(F("expediente__numDocumentos"), 0),
+        )
+
+
 class Caso(models.Model):
     nroCaso = models.CharField(max_length=50, unique=True)
     tipoCaso = models.CharField(max_length=100)
@@ -32,15 +59,27 @@ class Caso(models.Model):
     )
 
     creadoEn = models.DateTimeField(auto_now_add=True)
-    actualizadoEn = models.DateTimeField(auto_now=True)
-    
+    actualizadoEn = models.DateTimeField(auto_now=True, db_index=True)  # marca del índice del chat (chat.search_index)
+
+    objects = CasoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Listado paginado por cursor (fechaInicio, id)
+            models.Index(fields=["fechaInicio", "id"]),
+        ]
+
     @property
     def cliente_principal(self):
+        if "cliente_nombre" in self.__dict__:  # with_summary()
+            return self.cliente_nombre or "—"
         parte = self.parteprocesal_set.filter(rolProcesal="DEMANDANTE").select_related("cliente__actor").first()
         return parte.cliente.actor.nombres + " " + parte.cliente.actor.apellidoPaterno if parte else "—"
 
     @property
     def abogado_responsable(self):
+        if "abogado_nombre" in self.__dict__:  # with_summary()
+            return self.abogado_nombre or "—"
         miembro = self.equipocaso_set.filter(rolEnEquipo="RESPONSABLE").select_related("actor").first()
         return miembro.actor.nombres + " " + miembro.actor.apellidoPaterno if miembro else "—"
 
@@ -133,10 +172,42 @@ class ParteProcesal(models.Model):
 
 
 
+# ==========================
+# TOTALES DE CONTENIDO (Expediente y Carpeta)
+# ==========================
+CAMPOS_TOTALES = ("numDocumentos", "numVersiones", "bytesTotales", "ultimaActividad")
+
+
+class TotalesContenido(models.Model):
+    """
+    Documentos, versiones y bytes (archivos de documentos y versiones) bajo una
+    carpeta, incluidas sus subcarpetas, o en todo un expediente, y la fecha del
+    último cambio. Se actualizan con UPDATE relativos al guardar o eliminar
+    documentos y versiones (casos.rollup_service); el comando
+    reconciliar_totales corrige desvíos.
+    """
+    numDocumentos = models.IntegerField(default=0, editable=False)
+    numVersiones = models.IntegerField(default=0, editable=False)
+    bytesTotales = models.BigIntegerField(default=0, editable=False)
+    ultimaActividad = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # Un save() de una instancia cargada antes no debe pisar los totales
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in CAMPOS_TOTALES
+            ]
+        super().save(*args, **kwargs)
+
+
 # ==========================
 # EXPEDIENTE (1–a–1 con Caso)
 # ==========================
-class Expediente(models.Model):
+class Expediente(TotalesContenido):
     caso = models.OneToOneField(Caso, on_delete=models.CASCADE, related_name="expediente")
     nroExpediente = models.CharField(max_length=50)
     estado = models.CharField(max_length=20, default="ABIERTO")
@@ -159,7 +230,7 @@ class Expediente(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["estado"]),
-            models.Index(fields=["fechaCreacion"]),
+            models.Index(fields=["fechaCreacion", "id"]),
         ]
 
     def __str__(self):
@@ -167,13 +238,20 @@ class Expediente(models.Model):
 
     @property
     def cliente_principal(self):
-        parte = self.parteprocesal_set.filter(rolProcesal="DEMANDANTE").select_related("cliente__actor").first()
-        return parte.cliente.actor.nombres + " " + parte.cliente.actor.apellidoPaterno if parte else "—"
+        # Las partes procesales pertenecen al caso
+        return self.caso.cliente_principal
 
 # ==========================
 # CARPETA (en el EXPEDIENTE, con jerarquía opcional)
 # ==========================
-class Carpeta(models.Model):
+class CarpetaQuerySet(models.QuerySet):
+    def subarbol(self, carpeta, incluir_raiz=True):
+        """La carpeta y todas sus descendientes, a cualquier profundidad (prefijo de ruta)"""
+        carpetas = self.filter(ruta__startswith=carpeta.ruta)
+        return carpetas if incluir_raiz else carpetas.exclude(pk=carpeta.pk)
+
+
+class Carpeta(TotalesContenido):
     expediente = models.ForeignKey(Expediente, on_delete=models.CASCADE, related_name="carpetas")
     nombre = models.CharField(max_length=120)
     estado = models.CharField(max_length=20, default="ACTIVO")
@@ -184,6 +262,11 @@ class Carpeta(models.Model):
         on_delete=models.SET_NULL,
         related_name="subcarpetas"
     )
+    # Ruta materializada con los ids desde la raíz: "/3/17/42/". La mantienen
+    # save() (al crear y al mover) y casos.signals (al eliminar). Sin largo
+    # máximo: crece con la profundidad del árbol
+    ruta = models.TextField(blank=True, default="", editable=False)
+    profundidad = models.PositiveSmallIntegerField(default=0, editable=False)
 
     # 🧾 Auditoría
     creado_por = models.ForeignKey(
@@ -202,15 +285,85 @@ class Carpeta(models.Model):
     creadoEn = models.DateTimeField(auto_now_add=True)
     actualizadoEn = models.DateTimeField(auto_now=True)
 
+    objects = CarpetaQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=["expediente", "estado"]),
             models.Index(fields=["carpetaPadre"]),
+            models.Index(fields=["expediente", "nombre", "id"]),
+            # Subárboles por prefijo (LIKE 'ruta%'); text_pattern_ops solo aplica en PostgreSQL
+            models.Index(fields=["ruta"], name="casos_carpeta_ruta", opclasses=["text_pattern_ops"]),
         ]
 
     def __str__(self):
         return f"{self.nombre} (Expediente {self.expediente_id})"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and not {"carpetaPadre", "expediente"} & set(update_fields):
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            ruta_padre = "/"
+            if self.carpetaPadre_id:
+                ruta_padre, expediente_padre = Carpeta.objects.filter(pk=self.carpetaPadre_id).values_list(
+                    "ruta", "expediente_id"
+                ).get()
+                if self.pk and f"/{self.pk}/" in ruta_padre:
+                    raise ValueError("Una carpeta no puede moverse dentro de sí misma.")
+                if expediente_padre != self.expediente_id:
+                    raise ValueError("La carpeta madre debe pertenecer al mismo expediente.")
+            if not self._state.adding:
+                # La ruta y los totales en memoria pueden estar desactualizados
+                actual = Carpeta.objects.filter(pk=self.pk).values(
+                    "expediente_id", "ruta", "profundidad", "numDocumentos", "numVersiones", "bytesTotales"
+                ).first() or {}
+                # Los totales del subárbol se acumulan en los ancestros del expediente
+                if actual.get("expediente_id", self.expediente_id) != self.expediente_id:
+                    raise ValueError("Una carpeta no puede moverse a otro expediente.")
+                self.ruta = actual.get("ruta", "")
+                self.profundidad = actual.get("profundidad", 0)
+                for campo in ("numDocumentos", "numVersiones", "bytesTotales"):
+                    setattr(self, campo, actual.get(campo, 0))
+            super().save(*args, **kwargs)
+            self._actualizar_ruta(f"{ruta_padre}{self.pk}/")
+
+    def _actualizar_ruta(self, ruta):
+        """
+        Guarda la nueva ruta y la traslada a todo el subárbol con una sola UPDATE;
+        al mover, los totales del subárbol pasan de los ancestros anteriores a los nuevos
+        """
+        from .rollup_service import acumular, ids_ruta
+
+        anterior, profundidad = self.ruta, ruta.count("/") - 2
+        if ruta == anterior:
+            return
+        Carpeta.objects.filter(pk=self.pk).update(ruta=ruta, profundidad=profundidad)
+        if anterior:
+            Carpeta.objects.subarbol(self, incluir_raiz=False).update(
+                ruta=Concat(Value(ruta), Substr("ruta", len(anterior) + 1)),
+                profundidad=F("profundidad") + (profundidad - self.profundidad),
+            )
+            totales = (self.numDocumentos, self.numVersiones, self.bytesTotales)
+            if any(totales):
+                acumular(ids_ruta(anterior)[:-1], None, *(-total for total in totales))
+                acumular(ids_ruta(ruta)[:-1], None, *totales)
+        self.ruta, self.profundidad = ruta, profundidad
+
+    def ancestros(self):
+        """Carpetas desde la raíz hasta la carpeta madre (migas de pan), en una consulta"""
+        ids = [int(carpeta_id) for carpeta_id in self.ruta.strip("/").split("/")[:-1]]
+        return Carpeta.objects.filter(pk__in=ids).order_by("profundidad")
+
+    def descendientes(self):
+        return Carpeta.objects.subarbol(self, incluir_raiz=False)
+
+    def documentos_recursivos(self):
+        """Documentos de la carpeta y de todas sus subcarpetas"""
+        from documentos.models import Documento
+        return Documento.objects.filter(carpeta__ruta__startswith=self.ruta)
+
 
 # GESTION DE TIMELINE PARA LOS EXPEDIENTES
 
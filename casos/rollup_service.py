@@ -0,0 +1,148 @@
+"""
+Totales de contenido (TotalesContenido) de carpetas y expedientes: documentos,
+versiones, bytes y última actividad. Los cambios se aplican con UPDATE
+relativos (F) sobre toda la cadena de carpetas, desde la raíz hasta la carpeta
+del documento (su ruta materializada), y sobre el expediente, sin recorrer la
+tabla de documentos. recalcular() los calcula desde cero para el comando
+reconciliar_totales.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+
+from .models import CAMPOS_TOTALES, Carpeta, Expediente
+
+
+def ids_ruta(ruta: str) -> List[int]:
+    """Ids de la ruta materializada, desde la raíz: "/3/17/" -> [3, 17]"""
+    return [int(carpeta_id) for carpeta_id in ruta.strip("/").split("/") if carpeta_id]
+
+
+def acumular(carpeta_ids: Iterable[int], expediente_id: Optional[int] = None,
+             documentos: int = 0, versiones: int = 0, bytes_: int = 0, actividad: bool = True):
+    """Suma (o resta) los cambios en las carpetas indicadas y en el expediente"""
+    cambios = {
+        "numDocumentos": F("numDocumentos") + documentos,
+        "numVersiones": F("numVersiones") + versiones,
+        "bytesTotales": F("bytesTotales") + bytes_,
+    }
+    if actividad:
+        cambios["ultimaActividad"] = timezone.now()
+
+    carpeta_ids = list(carpeta_ids)
+    if carpeta_ids:
+        Carpeta.objects.filter(pk__in=carpeta_ids).update(**cambios)
+    if expediente_id is not None:
+        Expediente.objects.filter(pk=expediente_id).update(**cambios)
+
+
+def acumular_en_carpeta(carpeta_id: int, documentos: int = 0, versiones: int = 0, bytes_: int = 0):
+    """Aplica un cambio de contenido de la carpeta a ella, a sus ancestros y a su expediente"""
+    fila = Carpeta.objects.filter(pk=carpeta_id).values_list("ruta", "expediente_id").first()
+    if fila is None:
+        return
+    ruta, expediente_id = fila
+    acumular(ids_ruta(ruta) or [carpeta_id], expediente_id, documentos, versiones, bytes_)
+
+
+def recalcular(expediente_ids: Iterable[int] = None) -> Dict[str, Any]:
+    """
+    Totales correctos de las carpetas y expedientes (todos, o los indicados)
+    a partir de los documentos y versiones: {'carpetas': {id: totales}, 'expedientes': {id: totales}}
+    """
+    from documentos.models import Documento, VersionDocumento
+
+    carpetas = Carpeta.objects.all()
+    documentos = Documento.objects.all()
+    versiones = VersionDocumento.objects.all()
+    if expediente_ids is not None:
+        expediente_ids = list(expediente_ids)
+        carpetas = carpetas.filter(expediente_id__in=expediente_ids)
+        documentos = documentos.filter(carpeta__expediente_id__in=expediente_ids)
+        versiones = versiones.filter(documento__carpeta__expediente_id__in=expediente_ids)
+
+    # Contenido directo de cada carpeta (dos consultas agrupadas)
+    directos: Dict[int, Dict[str, Any]] = {}
+    for fila in documentos.values("carpeta_id").annotate(
+        n=Count("id"), b=Sum("tamanoArchivo"), u=Max("actualizadoEn")
+    ).order_by():
+        directos[fila["carpeta_id"]] = _totales(fila["n"], 0, fila["b"], fila["u"])
+    for fila in versiones.values("documento__carpeta_id").annotate(
+        n=Count("id"), b=Sum("tamanoArchivo"), u=Max("fechaCambio")
+    ).order_by():
+        _sumar(directos.setdefault(fila["documento__carpeta_id"], _totales()), _totales(0, fila["n"], fila["b"], fila["u"]))
+
+    resultado = {"carpetas": {}, "expedientes": {}}
+    if expediente_ids is not None:
+        resultado["expedientes"] = {expediente_id: _totales() for expediente_id in expediente_ids}
+    filas = list(carpetas.values_list("id", "ruta", "expediente_id"))
+    for carpeta_id, _, expediente_id in filas:
+        resultado["carpetas"][carpeta_id] = _totales()
+        resultado["expedientes"].setdefault(expediente_id, _totales())
+
+    # Cada carpeta suma su contenido directo a toda su cadena de ancestros
+    for carpeta_id, ruta, expediente_id in filas:
+        directo = directos.get(carpeta_id)
+        if directo is None:
+            continue
+        for ancestro_id in ids_ruta(ruta) or [carpeta_id]:
+            if ancestro_id in resultado["carpetas"]:
+                _sumar(resultado["carpetas"][ancestro_id], directo)
+        _sumar(resultado["expedientes"][expediente_id], directo)
+    return resultado
+
+
+def reconciliar(expediente_ids: Iterable[int] = None, aplicar: bool = True) -> Dict[str, int]:
+    """
+    Compara los totales guardados con recalcular() y corrige los que difieren
+    (la última actividad solo se adelanta). Devuelve cuántas filas diferían.
+    """
+    with transaction.atomic():
+        if aplicar:
+            # Se bloquean antes de contar: las escrituras concurrentes esperan y no se pierden
+            carpetas, expedientes = Carpeta.objects.all(), Expediente.objects.all()
+            if expediente_ids is not None:
+                expediente_ids = list(expediente_ids)
+                carpetas = carpetas.filter(expediente_id__in=expediente_ids)
+                expedientes = expedientes.filter(pk__in=expediente_ids)
+            list(carpetas.select_for_update().order_by("pk").values_list("pk", flat=True))
+            list(expedientes.select_for_update().order_by("pk").values_list("pk", flat=True))
+        return _reconciliar(recalcular(expediente_ids), aplicar)
+
+
+def _reconciliar(correctos: Dict[str, Any], aplicar: bool) -> Dict[str, int]:
+    corregidas = {}
+    for nombre, modelo in (("carpetas", Carpeta), ("expedientes", Expediente)):
+        esperados = correctos[nombre]
+        desviadas = []
+        for objeto in modelo.objects.filter(pk__in=list(esperados)).only(*CAMPOS_TOTALES):
+            esperado = esperados[objeto.pk]
+            if objeto.ultimaActividad and (esperado["ultimaActividad"] is None or objeto.ultimaActividad > esperado["ultimaActividad"]):
+                esperado["ultimaActividad"] = objeto.ultimaActividad
+            if any(getattr(objeto, campo) != esperado[campo] for campo in CAMPOS_TOTALES):
+                for campo in CAMPOS_TOTALES:
+                    setattr(objeto, campo, esperado[campo])
+                desviadas.append(objeto)
+        if aplicar and desviadas:
+            modelo.objects.bulk_update(desviadas, CAMPOS_TOTALES, batch_size=500)
+        corregidas[nombre] = len(desviadas)
+    return corregidas
+
+
+def _totales(documentos=0, versiones=0, bytes_=None, actividad=None) -> Dict[str, Any]:
+    return {
+        "numDocumentos": documentos,
+        "numVersiones": versiones,
+        "bytesTotales": bytes_ or 0,
+        "ultimaActividad": actividad,
+    }
+
+
+def _sumar(destino: Dict[str, Any], origen: Dict[str, Any]):
+    destino["numDocumentos"] += origen["numDocumentos"]
+    destino["numVersiones"] += origen["numVersiones"]
+    destino["bytesTotales"] += origen["bytesTotales"]
+    if origen["ultimaActividad"] and (destino["ultimaActividad"] is None or origen["ultimaActividad"] > destino["ultimaActividad"]):
+        destino["ultimaActividad"] = origen["ultimaActividad"]
@@ -59,6 +59,18 @@ class CarpetaSerializer(serializers.ModelSerializer):
         model = Carpeta
         fields = ['id', 'expediente', 'nombre', 'estado', 'carpetaPadre', 'creadoEn', 'actualizadoEn']
 
+    def validate(self, attrs):
+        # Los totales se acumulan en los ancestros: el árbol no cruza expedientes
+        expediente = attrs.get('expediente', getattr(self.instance, 'expediente', None))
+        carpeta_padre = attrs.get('carpetaPadre', getattr(self.instance, 'carpetaPadre', None))
+        if self.instance and expediente != self.instance.expediente:
+            raise serializers.ValidationError({'expediente': 'Una carpeta no puede moverse a otro expediente.'})
+        if carpeta_padre and carpeta_padre.expediente_id != expediente.pk:
+            raise serializers.ValidationError({'carpetaPadre': 'La carpeta madre debe pertenecer al mismo expediente.'})
+        if self.instance and carpeta_padre and f"/{self.instance.pk}/" in carpeta_padre.ruta:
+            raise serializers.ValidationError({'carpetaPadre': 'Una carpeta no puede moverse dentro de sí misma.'})
+        return attrs
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         # No se anidan campos, solo representamos el expediente como texto y la carpeta padre si existe
@@ -0,0 +1,30 @@
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Carpeta
+from .rollup_service import acumular, ids_ruta
+
+
+@receiver(post_delete, sender=Carpeta)
+def carpeta_eliminada(sender, instance, **kwargs):
+    """
+    Las subcarpetas de una carpeta eliminada quedan como raíz (carpetaPadre es
+    SET_NULL): sus totales dejan de contar en los ancestros de la eliminada
+    (sus documentos ya se descontaron al eliminarse) y se quita el prefijo de
+    la eliminada de todo su subárbol
+    """
+    if instance.ruta:
+        subcarpetas = Carpeta.objects.filter(ruta__startswith=instance.ruta, profundidad=instance.profundidad + 1)
+        totales = subcarpetas.aggregate(
+            documentos=Sum("numDocumentos"), versiones=Sum("numVersiones"), bytes_=Sum("bytesTotales")
+        )
+        if any(totales.values()):
+            acumular(ids_ruta(instance.ruta)[:-1], None, actividad=False,
+                     **{clave: -(valor or 0) for clave, valor in totales.items()})
+
+        Carpeta.objects.filter(ruta__startswith=instance.ruta).update(
+            ruta=Concat(Value("/"), Substr("ruta", len(instance.ruta) + 1)),
+            profundidad=F("profundidad") - (instance.profundidad + 1),
+        )
@@ -1,3 +1,259 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import date
+from io import StringIO
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from actores.models import Actor, Cliente
+from GestDocSi2.pagination import paginar_keyset
+from documentos.models import Documento, TipoDocumento, VersionDocumento
+from seguridad.models import Usuario
+from .models import Carpeta, Caso, EquipoCaso, Expediente, ParteProcesal
+from .serializers import CarpetaSerializer
+
+
+class ArbolCarpetasTests(TestCase):
+
+    def setUp(self):
+        caso = Caso.objects.create(nroCaso="CIV-2024-001", tipoCaso="Divorcio", fechaInicio=date(2024, 1, 1))
+        self.expediente = Expediente.objects.create(caso=caso, nroExpediente="EXP-0001", fechaCreacion=date(2024, 1, 1))
+        self.raiz = self.crear("Raíz")
+        self.pruebas = self.crear("Pruebas", self.raiz)
+        self.fotos = self.crear("Fotos", self.pruebas)
+        self.otra = self.crear("Otra")
+        tipo = TipoDocumento.objects.create(nombre="Contrato")
+        for carpeta in (self.raiz, self.fotos, self.fotos):
+            Documento.objects.create(carpeta=carpeta, tipoDocumento=tipo, nombreDocumento="Doc", fechaDoc=date(2024, 2, 1))
+
+    def crear(self, nombre, padre=None):
+        return Carpeta.objects.create(expediente=self.expediente, nombre=nombre, carpetaPadre=padre)
+
+    def recargar(self, carpeta):
+        return Carpeta.objects.get(pk=carpeta.pk)
+
+    def test_subarbol_ancestros_y_documentos_en_una_consulta(self):
+        fotos = self.recargar(self.fotos)
+        self.assertEqual(fotos.ruta, f"/{self.raiz.id}/{self.pruebas.id}/{self.fotos.id}/")
+        self.assertEqual(fotos.profundidad, 2)
+
+        raiz = self.recargar(self.raiz)
+        with self.assertNumQueries(3):
+            self.assertEqual([c.nombre for c in fotos.ancestros()], ["Raíz", "Pruebas"])
+            self.assertEqual({c.nombre for c in raiz.descendientes()}, {"Pruebas", "Fotos"})
+            self.assertEqual(raiz.documentos_recursivos().count(), 3)
+
+    def test_mover_y_eliminar_actualizan_el_subarbol(self):
+        pruebas = self.recargar(self.pruebas)
+        pruebas.carpetaPadre = self.otra
+        pruebas.save()
+        self.assertEqual(self.recargar(self.fotos).ruta, f"/{self.otra.id}/{self.pruebas.id}/{self.fotos.id}/")
+
+        with self.assertRaises(ValueError):
+            otra = self.recargar(self.otra)
+            otra.carpetaPadre = self.fotos
+            otra.save()
+
+        self.recargar(self.otra).delete()
+        fotos = self.recargar(self.fotos)
+        self.assertEqual((fotos.ruta, fotos.profundidad), (f"/{self.pruebas.id}/{self.fotos.id}/", 1))
+
+    def test_arbol_profundo_y_movimientos_entre_expedientes(self):
+        carpeta = self.raiz
+        for nivel in range(100):
+            carpeta = self.crear(f"Nivel {nivel}", carpeta)
+        carpeta = self.recargar(carpeta)
+        self.assertGreater(len(carpeta.ruta), 255)
+        self.assertEqual(carpeta.profundidad, 100)
+
+        caso = Caso.objects.create(nroCaso="CIV-2024-002", tipoCaso="Divorcio", fechaInicio=date(2024, 1, 1))
+        otro = Expediente.objects.create(caso=caso, nroExpediente="EXP-0002", fechaCreacion=date(2024, 1, 1))
+        ajena = Carpeta.objects.create(expediente=otro, nombre="Ajena")
+        with self.assertRaises(ValueError):
+            Carpeta.objects.create(expediente=self.expediente, nombre="Cruzada", carpetaPadre=ajena)
+        with self.assertRaises(ValueError):
+            pruebas = self.recargar(self.pruebas)
+            pruebas.carpetaPadre = ajena
+            pruebas.save()
+        with self.assertRaises(ValueError):
+            fotos = self.recargar(self.fotos)
+            fotos.expediente = otro
+            fotos.save()
+        self.assertEqual(self.recargar(self.fotos).expediente, self.expediente)
+        self.assertEqual(self.recargar(self.raiz).numDocumentos, 3)
+
+        serializer = CarpetaSerializer(self.recargar(self.pruebas), data={"carpetaPadre": ajena.pk}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("carpetaPadre", serializer.errors)
+        serializer = CarpetaSerializer(self.recargar(self.pruebas), data={"expediente": otro.pk}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("expediente", serializer.errors)
+
+    def test_arbol_json_con_totales(self):
+        usuario = Usuario.objects.create_user(username="abogado1", email="abogado1@example.com", password="123456")
+        self.client.force_login(usuario)
+
+        with self.assertNumQueries(2):  # expediente y el árbol
+            datos = self.client.get(reverse("casos:carpeta_arbol", args=[self.expediente.id])).json()
+
+        otra, raiz = datos["carpetas"]
+        self.assertEqual((otra["nombre"], raiz["nombre"]), ("Otra", "Raíz"))
+        self.assertEqual(raiz["documentos"], 3)
+        self.assertEqual(raiz["subcarpetas"][0]["subcarpetas"][0]["documentos"], 2)
+
+
+class TotalesContenidoTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.usuario = Usuario.objects.create_user(username="abogado1", email="abogado1@example.com", password="123456")
+        caso = Caso.objects.create(nroCaso="CIV-2024-001", tipoCaso="Divorcio", fechaInicio=date(2024, 1, 1))
+        self.expediente = Expediente.objects.create(caso=caso, nroExpediente="EXP-0001", fechaCreacion=date(2024, 1, 1))
+        self.raiz = Carpeta.objects.create(expediente=self.expediente, nombre="Raíz")
+        self.sub = Carpeta.objects.create(expediente=self.expediente, nombre="Sub", carpetaPadre=self.raiz)
+        self.otra = Carpeta.objects.create(expediente=self.expediente, nombre="Otra")
+        self.tipo = TipoDocumento.objects.create(nombre="Contrato")
+
+    def documento(self, carpeta, contenido=b"12345"):
+        return Documento.objects.create(
+            carpeta=carpeta, tipoDocumento=self.tipo, nombreDocumento="Doc", fechaDoc=date(2024, 2, 1),
+            rutaDocumento=SimpleUploadedFile("doc.pdf", contenido),
+        )
+
+    def version(self, documento, numero, contenido=b"123"):
+        return VersionDocumento.objects.create(
+            documento=documento, creado_por=self.usuario, numeroVersion=numero,
+            rutaArchivo=SimpleUploadedFile("v.pdf", contenido),
+        )
+
+    def totales(self, objeto):
+        objeto = type(objeto).objects.get(pk=objeto.pk)
+        return objeto.numDocumentos, objeto.numVersiones, objeto.bytesTotales
+
+    def test_se_acumulan_en_la_cadena_y_el_expediente(self):
+        documento = self.documento(self.sub)
+        self.version(documento, 1)
+        self.documento(self.raiz, b"12")
+
+        self.assertEqual(self.totales(self.sub), (1, 1, 8))
+        self.assertEqual(self.totales(self.raiz), (2, 1, 10))
+        self.assertEqual(self.totales(self.expediente), (2, 1, 10))
+        self.assertIsNotNone(Carpeta.objects.get(pk=self.raiz.pk).ultimaActividad)
+
+        # Mover el documento (con su versión) y eliminar
+        documento.carpeta = self.otra
+        documento.save()
+        self.assertEqual(self.totales(self.raiz), (1, 0, 2))
+        self.assertEqual(self.totales(self.otra), (1, 1, 8))
+
+        documento.delete()
+        self.assertEqual(self.totales(self.otra), (0, 0, 0))
+        self.assertEqual(self.totales(self.expediente), (1, 0, 2))
+
+    def test_mover_o_eliminar_carpetas_traslada_sus_totales(self):
+        self.documento(self.sub)
+        sub = Carpeta.objects.get(pk=self.sub.pk)
+        sub.carpetaPadre = self.otra
+        sub.save()
+        self.assertEqual((self.totales(self.raiz), self.totales(self.otra)), ((0, 0, 0), (1, 0, 5)))
+
+        Carpeta.objects.get(pk=self.otra.pk).delete()
+        self.assertEqual(self.totales(self.sub), (1, 0, 5))
+        self.assertEqual(self.totales(self.expediente), (1, 0, 5))
+
+    def test_reconciliar_corrige_desvios(self):
+        self.documento(self.sub)
+        # Escritura masiva: no pasa por las señales
+        Carpeta.objects.filter(pk=self.raiz.pk).update(numDocumentos=7)
+        Expediente.objects.filter(pk=self.expediente.pk).update(bytesTotales=0)
+
+        call_command("reconciliar_totales", stdout=StringIO())
+
+        self.assertEqual(self.totales(self.raiz), (1, 0, 5))
+        self.assertEqual(self.totales(self.expediente), (1, 0, 5))
+
+
+class CasoResumenTests(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username="abogado1", email="abogado1@example.com", password="123456")
+        self.abogado = self.actor(self.usuario, "ABO", "Carlos", "Méndez")
+        self.client.force_login(self.usuario)
+
+    def actor(self, usuario, tipo, nombres, apellido):
+        return Actor.objects.create(usuario=usuario, tipoActor=tipo, nombres=nombres, apellidoPaterno=apellido, ci=f"CI-{usuario.username}")
+
+    def crear_casos(self, cantidad):
+        inicio = Caso.objects.count()
+        for i in range(inicio, inicio + cantidad):
+            caso = Caso.objects.create(nroCaso=f"CIV-{i}", tipoCaso="Divorcio", fechaInicio=date(2024, 1, 1))
+            usuario = Usuario.objects.create_user(username=f"cliente{i}", email=f"cliente{i}@example.com", password="123456")
+            cliente = Cliente.objects.create(actor=self.actor(usuario, "CLI", "Ana", f"Pérez{i}"), tipoCliente="NATURAL")
+            ParteProcesal.objects.create(cliente=cliente, caso=caso, rolProcesal="DEMANDANTE", fechaInicio=date(2024, 1, 1))
+            EquipoCaso.objects.create(actor=self.abogado, caso=caso, rolEnEquipo="RESPONSABLE", fechaAsignacion=date(2024, 1, 1))
+            Expediente.objects.create(caso=caso, nroExpediente=f"EXP-{i}", fechaCreacion=date(2024, 1, 1))
+
+    def test_with_summary_reemplaza_las_consultas_por_fila(self):
+        self.crear_casos(2)
+        Caso.objects.create(nroCaso="SIN-PARTES", tipoCaso="Laboral", fechaInicio=date(2023, 1, 1))
+
+        with self.assertNumQueries(1):
+            casos = list(Caso.objects.with_summary().order_by("nroCaso"))
+            self.assertEqual(
+                [(c.cliente_principal, c.abogado_responsable) for c in casos],
+                [("Ana Pérez0", "Carlos Méndez"), ("Ana Pérez1", "Carlos Méndez"), ("—", "—")],
+            )
+        self.assertEqual(casos[0].documentos_count, 0)
+        self.assertIsNone(casos[2].expediente_pk)
+        # Sin anotaciones, las propiedades siguen consultando
+        self.assertEqual(Caso.objects.get(nroCaso="CIV-1").cliente_principal, "Ana Pérez1")
+
+    def test_presupuesto_de_consultas_del_listado(self):
+        url = reverse("casos:case_list")
+        self.crear_casos(2)
+        with self.assertNumQueries(5) as consultas:  # sesión, usuario, grupos, casos y total
+            self.client.get(url)
+        self.crear_casos(5)
+        with self.assertNumQueries(len(consultas)):
+            respuesta = self.client.get(url)
+        self.assertContains(respuesta, "Ana Pérez6")
+
+
+class PaginacionKeysetTests(TestCase):
+
+    def setUp(self):
+        # Fechas repetidas: el id desempata
+        for i in range(7):
+            Caso.objects.create(nroCaso=f"CIV-{i}", tipoCaso="Divorcio", fechaInicio=date(2024, 1, 1 + i // 3))
+        self.esperado = list(Caso.objects.order_by("-fechaInicio", "-id").values_list("nroCaso", flat=True))
+
+    def pagina(self, url="/casos/"):
+        return paginar_keyset(RequestFactory().get(url), Caso.objects.all(), ("-fechaInicio",), por_pagina=3, total="exacto")
+
+    def test_recorre_hacia_adelante_y_atras_sin_repetir(self):
+        paginas = [self.pagina("/casos/?q=x")]
+        while paginas[-1].tiene_siguiente:
+            self.assertIn("q=x", paginas[-1].url_siguiente)
+            paginas.append(self.pagina(paginas[-1].url_siguiente))
+
+        self.assertEqual([c.nroCaso for p in paginas for c in p], self.esperado)
+        self.assertEqual([len(p) for p in paginas], [3, 3, 1])
+        self.assertEqual(paginas[0].total, 7)
+        self.assertFalse(paginas[0].tiene_anterior)
+
+        anterior = self.pagina(paginas[-1].url_anterior)
+        self.assertEqual([c.nroCaso for c in anterior], self.esperado[3:6])
+        self.assertTrue(anterior.tiene_siguiente and anterior.tiene_anterior)
+
+    def test_cursor_invalido_muestra_la_primera_pagina(self):
+        with self.assertNumQueries(2):  # página y total
+            pagina = self.pagina("/casos/?cursor=no-es-un-cursor")
+        self.assertEqual([c.nroCaso for c in pagina], self.esperado[:3])
@@ -40,6 +40,7 @@ urlpatterns = [
     # Carpetas
     path("expedientes/<int:expediente_id>/carpetas/", views.carpeta_list, name="carpeta_list"),
     path("expedientes/<int:expediente_id>/carpetas/crear/", views.carpeta_create, name="carpeta_create"),
+    path("expedientes/<int:expediente_id>/carpetas/arbol/", views.carpeta_arbol, name="carpeta_arbol"),
     
     path("carpetas/", views.carpeta_global_list, name="carpeta_global_list"),
 
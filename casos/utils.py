@@ -1,4 +1,4 @@
-from .models import EventoExpediente
+from .models import Carpeta, EventoExpediente
 
 def registrar_evento_exp(usuario, expediente, tipo, descripcion):
     """
@@ -11,3 +11,33 @@ def registrar_evento_exp(usuario, expediente, tipo, descripcion):
             tipo=tipo,
             descripcion=descripcion
         )
+
+
+def arbol_carpetas(expediente_id):
+    """
+    Árbol completo de carpetas del expediente en una consulta, cada nodo con
+    los totales de su subárbol (TotalesContenido) y sus subcarpetas (por nombre)
+    """
+    filas = (
+        Carpeta.objects.filter(expediente_id=expediente_id)
+        .order_by("profundidad", "nombre", "id")
+        .values("id", "nombre", "estado", "carpetaPadre_id", "numDocumentos", "numVersiones", "bytesTotales",
+                "ultimaActividad")
+    )
+
+    nodos, raices = {}, []
+    for fila in filas:
+        nodo = nodos[fila["id"]] = {
+            "id": fila["id"],
+            "nombre": fila["nombre"],
+            "estado": fila["estado"],
+            "documentos": fila["numDocumentos"],
+            "versiones": fila["numVersiones"],
+            "bytes": fila["bytesTotales"],
+            "ultimaActividad": fila["ultimaActividad"],
+            "subcarpetas": [],
+        }
+        # Por profundidad, la carpeta madre siempre se procesa antes
+        padre = nodos.get(fila["carpetaPadre_id"])
+        (padre["subcarpetas"] if padre else raices).append(nodo)
+    return raices
@@ -1,11 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.http import JsonResponse
 from .models import Caso, Expediente, Carpeta,EventoExpediente
 from .forms import CasoForm, EquipoCasoForm, ParteProcesalForm, ExpedienteForm, CarpetaForm
 from actores.models import Actor, Cliente
 from datetime import date
-from .utils import registrar_evento_exp
-from django.db.models import Q
+from .utils import arbol_carpetas, registrar_evento_exp
+from GestDocSi2.pagination import paginar_keyset
+from django.db.models import Prefetch, Q
 from django.views.decorators.http import require_POST
 from documentos.models import Documento
 
@@ -19,8 +21,8 @@ def caso_list(request):
     desde = request.GET.get("desde", "").strip()
     hasta = request.GET.get("hasta", "").strip()
 
-    # Base Query
-    casos = Caso.objects.all().order_by("-fechaInicio")
+    # Base Query (cliente principal, abogado responsable y totales en la misma consulta)
+    casos = Caso.objects.with_summary()
 
     # 🔍 Filtro de búsqueda libre
     if q:
@@ -44,8 +46,11 @@ def caso_list(request):
     if hasta:
         casos = casos.filter(fechaInicio__lte=hasta)
 
+    pagina = paginar_keyset(request, casos, ("-fechaInicio",))
+
     context = {
-        "casos": casos,
+        "casos": pagina,
+        "pagina": pagina,
         "q": q,
         "estado": estado,
         "prioridad": prioridad,
@@ -160,8 +165,11 @@ def parte_procesal_add(request, caso_id):
 
 # ======= EXPEDIENTES ======= #
 def expediente_list(request):
-    expedientes = Expediente.objects.select_related("caso").order_by("-fechaCreacion")
-    return render(request, "casos/expediente_list.html", {"expedientes": expedientes})
+    expedientes = Expediente.objects.prefetch_related(
+        Prefetch("caso", queryset=Caso.objects.with_summary())
+    )
+    pagina = paginar_keyset(request, expedientes, ("-fechaCreacion",))
+    return render(request, "casos/expediente_list.html", {"expedientes": pagina, "pagina": pagina})
 
 
 def expediente_create(request, caso_id):
@@ -231,9 +239,23 @@ def carpeta_create(request, expediente_id):
     )
 
 
+def carpeta_arbol(request, expediente_id):
+    """
+    Árbol completo de carpetas del expediente en JSON (una consulta, cualquier profundidad)
+    """
+    expediente = get_object_or_404(Expediente, pk=expediente_id)
+    carpetas = arbol_carpetas(expediente.id)
+
+    return JsonResponse({
+        "expediente": {"id": expediente.id, "nroExpediente": expediente.nroExpediente},
+        "carpetas": carpetas,
+    })
+
+
 def carpeta_global_list(request):
-    carpetas = Carpeta.objects.select_related("expediente", "carpetaPadre").order_by("expediente", "nombre")
-    return render(request, "casos/carpeta_global_list.html", {"carpetas": carpetas})
+    carpetas = Carpeta.objects.select_related("expediente", "carpetaPadre")
+    pagina = paginar_keyset(request, carpetas, ("expediente_id", "nombre"))
+    return render(request, "casos/carpeta_global_list.html", {"carpetas": pagina, "pagina": pagina})
 
 
 # ======= TIMELINE DEL EXPEDIENTE ======= #
@@ -293,7 +315,7 @@ def carpeta_detalle(request, carpeta_id):
     """
     Muestra el contenido de una carpeta: subcarpetas y documentos asociados.
     """
-    carpeta = get_object_or_404(Carpeta, pk=carpeta_id)
+    carpeta = get_object_or_404(Carpeta.objects.select_related("expediente"), pk=carpeta_id)
 
     # Subcarpetas directas
     subcarpetas = Carpeta.objects.filter(carpetaPadre=carpeta).order_by("nombre")
@@ -305,6 +327,7 @@ def carpeta_detalle(request, carpeta_id):
 
     context = {
         "carpeta": carpeta,
+        "ancestros": carpeta.ancestros(),
         "subcarpetas": subcarpetas,
         "documentos": documentos,
     }
@@ -337,8 +360,8 @@ from rest_framework import viewsets
 
 
 def caso_list(request):
-    casos = Caso.objects.all().order_by("-fechaInicio")
-    return render(request, "casos/caso_list.html", {"casos": casos})
+    pagina = paginar_keyset(request, Caso.objects.with_summary(), ("-fechaInicio",))
+    return render(request, "casos/caso_list.html", {"casos": pagina, "pagina": pagina})
 
 
 """ def caso_create(request):
@@ -0,0 +1,221 @@
+"""
+Motor de respuestas por reglas: las preguntas estructuradas (mis casos, estado
+de un caso por número, casos abiertos o de un tipo, documentos de un tipo,
+datos de un actor y estadísticas) se responden directamente desde la base de
+datos sin llamar a OpenAI. Las preguntas abiertas siguen yendo al modelo, y
+también las que agregan calificadores que una regla no entiende ("¿qué plazos
+vencen en el caso X?", "contratos del cliente Pérez en 2023"): la regla no
+puede ignorarlos y dar una respuesta segura pero equivocada.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from actores.models import Actor
+from casos.models import Caso
+from documentos.models import Documento, TipoDocumento
+from .response_cache import normalizar_consulta
+from .query_router import (
+    ESTADOS_CASO, LISTADOS_PERSONALES, MENCIONES, PALABRAS_ACTOR, PALABRAS_ESTADISTICAS, PALABRAS_PERSONALES,
+    analizar_consulta, palabras_sin_cubrir, tipos_mencionados,
+)
+
+
+MAX_LISTADO = 10
+CACHE_TIPOS = 'chat:motor:tipos'
+
+# Lo que cada regla entiende, además de las palabras de relleno (ver palabras_sin_cubrir)
+VOCABULARIO_CASO_NUMERO = ('caso', 'expediente', 'estado', 'situacion')
+VOCABULARIO_CASOS_ESTADO = ('caso', 'estado', *ESTADOS_CASO)
+VOCABULARIO_ESTADISTICAS = (
+    *' '.join(PALABRAS_ESTADISTICAS).split(), *(p for palabras in MENCIONES.values() for p in palabras),
+    *ESTADOS_CASO, 'estado', 'tiene', 'tienen', 'tenemos',
+)
+VOCABULARIO_PERSONAL = (
+    *' '.join(PALABRAS_PERSONALES).split(), *(p for _, palabras in LISTADOS_PERSONALES for p in palabras),
+    'cuanto', 'cuanta', 'cantidad', 'total',
+)
+# Además de las partes del nombre de los actores encontrados
+VOCABULARIO_ACTOR = (
+    *PALABRAS_ACTOR, 'ci', 'dato', 'nombre', 'llamado', 'llamada', 'llama',
+    'telefono', 'email', 'correo', 'contacto', 'especialidad',
+)
+
+
+class MotorRespuestas:
+    """
+    Evalúa las reglas en orden; la primera que reconoce la consulta la responde.
+    Cada regla devuelve None si la consulta no es suya (o si no puede responderla
+    bien sin el modelo) y la evaluación sigue con la siguiente.
+    """
+
+    def __init__(self, db_service):
+        self.db = db_service
+        self.ttl = int(getattr(settings, 'ESTADISTICAS_TTL', 60))
+        self.reglas: List[Tuple[str, Callable]] = [
+            ('personal', self._regla_personal),
+            ('caso_numero', self._regla_caso_numero),
+            ('estadisticas', self._regla_estadisticas),
+            ('casos_estado', self._regla_casos_estado),
+            ('casos_tipo', self._regla_casos_tipo),
+            ('documentos_tipo', self._regla_documentos_tipo),
+            ('actor', self._regla_actor),
+        ]
+
+    def responder(self, consulta: str, usuario=None, analisis: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve {'regla', 'respuesta', 'casos', 'documentos', 'actores'} o None
+        si la pregunta necesita al modelo. `analisis` es el de chat.query_router
+        (se calcula si no se recibe).
+        """
+        analisis = analisis or analizar_consulta(consulta)
+        if not analisis['normalizada'] or analisis['abierta']:
+            return None
+
+        for nombre, regla in self.reglas:
+            resultado = regla(consulta.lower(), analisis, usuario)
+            if resultado is not None:
+                return {'regla': nombre, 'casos': [], 'documentos': [], 'actores': [], **resultado}
+        return None
+
+    # === REGLAS ===
+
+    def _regla_personal(self, consulta: str, analisis: Dict[str, Any], usuario):
+        # "Tengo una duda sobre..." es personal pero no pide un listado: la responde el modelo
+        if not analisis['personal'] or analisis['listado_personal'] is None:
+            return None
+        # "Mis casos" sí; "¿qué plazos vencen en mis casos?" lo responde el modelo
+        if self._sobran(analisis, VOCABULARIO_PERSONAL):
+            return None
+        resultado = self.db._buscar_informacion_personal(consulta, usuario, analisis)
+        return {'respuesta': resultado.pop('respuesta_directa'), **resultado}
+
+    def _regla_caso_numero(self, consulta: str, analisis: Dict[str, Any], usuario):
+        # "Estado del caso X" sí; "¿qué plazos vencen en el caso X?" lo responde el modelo
+        if not analisis['numeros_caso'] or self._sobran(analisis, VOCABULARIO_CASO_NUMERO):
+            return None
+        numero = analisis['numeros_caso'][0]
+        casos = self.db._buscar_caso_por_numero(numero)
+        if not casos:
+            return {'respuesta': f"📁 No se encontró el caso **{numero.upper()}**."}
+        return {'respuesta': self.db._formatear_casos(casos), 'casos': casos}
+
+    def _regla_estadisticas(self, consulta: str, analisis: Dict[str, Any], usuario):
+        if not analisis['estadistica'] or self._sobran(analisis, VOCABULARIO_ESTADISTICAS):
+            return None
+        estadisticas = self.db._obtener_estadisticas(analisis)
+        # Sin entidad reconocida ("total del monto...") no hay nada que contar
+        if not estadisticas:
+            return None
+        return {
+            'respuesta': self.db._generar_respuesta_estadistica(estadisticas, consulta),
+            'estadisticas': estadisticas,
+        }
+
+    def _regla_casos_estado(self, consulta: str, analisis: Dict[str, Any], usuario):
+        # "casos abiertos": el plural pide un listado; "¿el caso está abierto?" no
+        if analisis['estado_caso'] is None or 'caso' not in analisis['plurales']:
+            return None
+        if self._sobran(analisis, VOCABULARIO_CASOS_ESTADO):
+            return None
+        return self._listar_casos(Caso.objects.filter(estado=analisis['estado_caso']))
+
+    def _regla_casos_tipo(self, consulta: str, analisis: Dict[str, Any], usuario):
+        if 'caso' not in analisis['plurales']:
+            return None
+        existentes = self._tipos()['casos']
+        # Tipos nombrados tal como están guardados o por su sinónimo ("despido")
+        tipos = tipos_mencionados(analisis['normalizada'], existentes)
+        tipos += [tipo for tipo in analisis['tipos_caso'] if tipo in existentes and tipo not in tipos]
+        if not tipos or self._sobran(analisis, ('caso', *_palabras(tipos))):
+            return None
+        return self._listar_casos(Caso.objects.filter(tipoCaso__in=tipos))
+
+    def _regla_documentos_tipo(self, consulta: str, analisis: Dict[str, Any], usuario):
+        tipo = self._tipo_documento(analisis['normalizada'])
+        if tipo is None or self._sobran(analisis, ('documento', *_palabras([tipo['nombre']]))):
+            return None
+        documentos_qs = Documento.objects.filter(tipoDocumento_id=tipo['id'])
+        total = documentos_qs.count()
+        documentos = self.db._documentos_dict(
+            documentos_qs.select_related('tipoDocumento', 'carpeta__expediente__caso').order_by('-fechaDoc', '-id')[:MAX_LISTADO]
+        )
+        if not documentos:
+            return {'respuesta': f"📄 No hay documentos de tipo **{tipo['nombre']}**."}
+        respuesta = self.db._formatear_documentos(documentos)
+        if total > len(documentos):
+            respuesta += f"\nMostrando {len(documentos)} de {total} documentos de tipo {tipo['nombre']}."
+        return {'respuesta': respuesta, 'documentos': documentos}
+
+    def _regla_actor(self, consulta: str, analisis: Dict[str, Any], usuario):
+        if not analisis['menciona_actor']:
+            return None
+
+        if analisis['ci']:
+            filtro = Q(ci=analisis['ci'][0])
+        else:
+            # Las partes del nombre se buscan como las escribió el usuario (con tildes)
+            if not analisis['nombre']:
+                return None
+            # Cada palabra del nombre debe aparecer en nombres o apellidos
+            filtro = Q()
+            for parte in analisis['nombre']:
+                filtro &= (
+                    Q(nombres__icontains=parte) | Q(apellidoPaterno__icontains=parte) | Q(apellidoMaterno__icontains=parte)
+                )
+
+        encontrados = list(Actor.objects.filter(filtro).select_related('abogado', 'cliente', 'asistente')[:5])
+        if not encontrados:
+            return None
+        # "Datos del cliente con CI X" sí; "casos del cliente con CI X" lo responde el modelo
+        nombres = _palabras(
+            f"{actor.nombres} {actor.apellidoPaterno} {actor.apellidoMaterno or ''}" for actor in encontrados
+        )
+        if self._sobran(analisis, (*VOCABULARIO_ACTOR, *nombres)):
+            return None
+        actores = self.db._actores_dict(encontrados)
+        return {'respuesta': self.db._formatear_actores(actores), 'actores': actores}
+
+    # === APOYO ===
+
+    @staticmethod
+    def _sobran(analisis: Dict[str, Any], vocabulario) -> bool:
+        """La consulta pide algo más de lo que la regla entiende (ver palabras_sin_cubrir)"""
+        return bool(palabras_sin_cubrir(analisis['normalizada'], vocabulario))
+
+    def _listar_casos(self, casos_qs):
+        """Los MAX_LISTADO casos más recientes, indicando el total si hay más"""
+        casos = self.db.case_summary.resumir_casos(casos_qs.order_by('-fechaInicio', '-id'), limite=MAX_LISTADO)
+        respuesta = self.db._formatear_casos(casos)
+        if len(casos) == MAX_LISTADO:
+            total = casos_qs.count()
+            if total > MAX_LISTADO:
+                respuesta += f"\nMostrando {MAX_LISTADO} de {total} casos."
+        return {'respuesta': respuesta, 'casos': casos}
+
+    def _tipo_documento(self, normalizada: str) -> Optional[Dict[str, Any]]:
+        """
+        Tipo de documento pedido como listado: "documentos de tipo X", "documentos X"
+        o el plural del tipo ("contratos"). El singular ("el contrato de...") es una búsqueda.
+        """
+        tipos = {tipo['nombre']: tipo for tipo in self._tipos()['documentos']}
+        encontrados = tipos_mencionados(normalizada, tipos, listado=True)
+        return tipos[encontrados[0]] if encontrados else None
+
+    def _tipos(self) -> Dict[str, Any]:
+        """Tipos de documento y de caso existentes (cambian poco: se guardan en caché)"""
+        tipos = cache.get(CACHE_TIPOS)
+        if tipos is None:
+            tipos = {
+                'documentos': list(TipoDocumento.objects.filter(activo=True).values('id', 'nombre')),
+                'casos': list(Caso.objects.order_by().values_list('tipoCaso', flat=True).distinct()),
+            }
+            cache.set(CACHE_TIPOS, tipos, self.ttl)
+        return tipos
+
+
+def _palabras(nombres) -> List[str]:
+    """Palabras normalizadas de nombres de tipos o actores ("Pensión Alimenticia" -> pension, alimenticia)"""
+    return [palabra for nombre in nombres for palabra in normalizar_consulta(nombre).split()]
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        import chat.signals
+
+        # Opcional (CHAT_PRECALENTAR): carga cachés y cliente de OpenAI en segundo plano
+        from .warmup import iniciar_precalentamiento
+        iniciar_precalentamiento()
@@ -0,0 +1,184 @@
+"""
+Lotes de preguntas del chat (p. ej. plazos, partes y documentos faltantes de un
+mismo caso): las preguntas repetidas se responden una vez, las búsquedas en la
+base de datos que se repiten entre preguntas se hacen una sola vez y las
+respuestas se generan en un pool acotado de hilos, entregándose a medida que
+terminan. El lote tarda aproximadamente lo que su pregunta más lenta mientras
+no haya más preguntas distintas que hilos.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .database_service import DatabaseQueryService
+from .models import Mensaje
+from .query_router import analizar_consulta
+from .response_cache import normalizar_consulta
+from .services import AsistenteIAService
+
+
+class DatabaseQueryServiceLote(DatabaseQueryService):
+    """
+    DatabaseQueryService compartido por todas las preguntas de un lote. Las
+    búsquedas con la misma clave (mismo caso, mismo usuario, mismas estadísticas)
+    se ejecutan una vez; si otra pregunta la está haciendo en ese momento, se
+    espera su resultado.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._resultados: Dict[Any, Future] = {}
+        self._lock = threading.Lock()
+        self.ejecutadas = 0
+        self.reutilizadas = 0
+
+    def _compartida(self, clave, buscar: Callable[[], Any]):
+        with self._lock:
+            futuro = self._resultados.get(clave)
+            propia = futuro is None
+            if propia:
+                futuro = self._resultados[clave] = Future()
+                self.ejecutadas += 1
+            else:
+                self.reutilizadas += 1
+
+        if propia:
+            try:
+                futuro.set_result(buscar())
+            except Exception as e:
+                futuro.set_exception(e)
+        resultado = futuro.result()
+        # Cada pregunta recibe su propia lista (los dicts de dentro no se modifican)
+        return list(resultado) if isinstance(resultado, list) else resultado
+
+    # === BÚSQUEDAS COMPARTIDAS ===
+
+    def _buscar_casos_especificos(self, consulta: str, analisis: Dict[str, Any] = None) -> List[Dict]:
+        analisis = analisis or analizar_consulta(consulta)
+        clave = ('casos', analisis['estado_caso'], analisis['numeros_caso'][:1], analisis['tipos_caso'][:1])
+        return self._compartida(clave, partial(super()._buscar_casos_especificos, consulta, analisis))
+
+    def _buscar_caso_por_numero(self, numero: str) -> List[Dict]:
+        return self._compartida(('caso_numero', numero.lower()), partial(super()._buscar_caso_por_numero, numero))
+
+    def _buscar_documentos_especificos(self, consulta: str) -> List[Dict]:
+        return self._compartida(('documentos', consulta), partial(super()._buscar_documentos_especificos, consulta))
+
+    def _buscar_actores_especificos(self, consulta: str) -> List[Dict]:
+        return self._compartida(('actores', consulta), partial(super()._buscar_actores_especificos, consulta))
+
+    def _obtener_estadisticas(self, analisis: Dict[str, Any]) -> Dict[str, Any]:
+        return self._compartida(('estadisticas', analisis['menciones']), partial(super()._obtener_estadisticas, analisis))
+
+    def _buscar_casos_personales(self, usuario, consulta: str) -> List[Dict]:
+        return self._compartida(
+            ('casos_personales', usuario.pk), partial(super()._buscar_casos_personales, usuario, consulta)
+        )
+
+    def _buscar_documentos_personales(self, usuario, consulta: str) -> List[Dict]:
+        return self._compartida(
+            ('documentos_personales', usuario.pk), partial(super()._buscar_documentos_personales, usuario, consulta)
+        )
+
+    def _buscar_informacion_actor_usuario(self, usuario) -> Dict:
+        return self._compartida(('actor_usuario', usuario.pk), partial(super()._buscar_informacion_actor_usuario, usuario))
+
+
+class LoteConsultasIA:
+    """
+    Responde una lista de preguntas en el contexto de una conversación (su
+    historial y resumen, leídos una vez) con el mismo pipeline que enviar_mensaje
+    """
+
+    def __init__(self, usuario, conversacion, hilos: int = None):
+        self.usuario = usuario
+        self.conversacion = conversacion
+        self.hilos = max(1, int(hilos or getattr(settings, 'CHAT_LOTE_HILOS', 8)))
+        self.db_service = DatabaseQueryServiceLote()
+
+    def responder(self, preguntas: List[str]) -> Iterator[Dict[str, Any]]:
+        """
+        Un resultado por pregunta, en el orden en que terminan: {'indice',
+        'pregunta', 'respuesta', 'error', 'tiempo_respuesta', 'repetida_de', ...}.
+        Un error en una pregunta no detiene las demás.
+        """
+        from .views import obtener_historial
+
+        historial = obtener_historial(self.conversacion)
+
+        # Preguntas iguales (tras normalizar) se responden una vez
+        grupos: Dict[str, List[int]] = {}
+        for indice, pregunta in enumerate(preguntas):
+            grupos.setdefault(normalizar_consulta(pregunta), []).append(indice)
+
+        with ThreadPoolExecutor(max_workers=min(self.hilos, len(grupos) or 1)) as pool:
+            futuros = {
+                pool.submit(self._responder_una, preguntas[indices[0]], historial): indices
+                for indices in grupos.values()
+            }
+            for futuro in as_completed(futuros):
+                indices = futuros[futuro]
+                resultado = futuro.result()
+                for indice in indices:
+                    yield {
+                        **resultado,
+                        'indice': indice,
+                        'pregunta': preguntas[indice],
+                        'repetida_de': indices[0] if indice != indices[0] else None,
+                    }
+
+    def responder_ordenado(self, preguntas: List[str]) -> List[Dict[str, Any]]:
+        """Todos los resultados, en el orden de las preguntas"""
+        return ordenar(self.responder(preguntas))
+
+    def guardar(self, resultados: List[Dict[str, Any]]) -> List[Mensaje]:
+        """
+        Guarda cada pregunta y su respuesta en la conversación, en el orden de las
+        preguntas; devuelve los mensajes del asistente
+        """
+        from .conversation_summary_service import ConversationSummaryService
+        from .views import crear_mensaje_ia
+
+        mensajes = []
+        with transaction.atomic():
+            for resultado in ordenar(resultados):
+                Mensaje.objects.create(conversacion=self.conversacion, tipo='usuario', contenido=resultado['pregunta'])
+                if resultado['repetida_de'] is not None:
+                    # La telemetría es de la pregunta que se respondió
+                    resultado = {**resultado, 'telemetria': None}
+                mensajes.append(crear_mensaje_ia(self.conversacion, resultado, resultado['tiempo_respuesta']))
+        ConversationSummaryService().programar(self.conversacion.id)
+        return mensajes
+
+    def _responder_una(self, pregunta: str, historial: List[str]) -> Dict[str, Any]:
+        from .views import procesar_consulta_ia
+
+        inicio = time.time()
+        try:
+            servicio_ia = AsistenteIAService()
+            servicio_ia.db_service = self.db_service
+            resultado = procesar_consulta_ia(self.usuario, pregunta, self.conversacion, servicio_ia, historial=historial)
+        except Exception as e:
+            resultado = {
+                'respuesta': f"Lo siento, hubo un error al procesar tu consulta: {str(e)}",
+                'tipo_consulta': 'error',
+            }
+        finally:
+            connections.close_all()
+
+        # procesar_consulta_ia devuelve los errores como respuesta de tipo 'error'
+        return {
+            **resultado,
+            'error': resultado['respuesta'] if resultado.get('tipo_consulta') == 'error' else None,
+            'tiempo_respuesta': time.time() - inicio,
+        }
+
+
+def ordenar(resultados) -> List[Dict[str, Any]]:
+    """Resultados de LoteConsultasIA.responder en el orden de las preguntas"""
+    return sorted(resultados, key=lambda resultado: resultado['indice'])
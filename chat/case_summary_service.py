@@ -0,0 +1,60 @@
+"""
+Servicio compartido para obtener resúmenes de casos con sus conteos agregados
+"""
+from django.db.models import Count, F
+from django.db.models.functions import Coalesce
+from casos.models import Caso
+from typing import List, Dict, Any
+
+
+class CaseSummaryService:
+    """
+    Carga casos junto con los conteos de expediente, carpetas y documentos
+    en una sola consulta agregada (sin recorrer Expediente → Carpeta → Documento).
+    """
+
+    CAMPOS = (
+        'id', 'nroCaso', 'tipoCaso', 'estado', 'fechaInicio', 'descripcion',
+        'expediente_id', 'carpetas_count', 'documentos_count',
+    )
+
+    def __init__(self):
+        pass
+
+    def anotar(self, casos_qs=None):
+        """
+        Devuelve el queryset de casos anotado con los conteos agregados
+        """
+        if casos_qs is None:
+            casos_qs = Caso.objects.all()
+
+        return casos_qs.annotate(
+            expediente_id=F('expediente__id'),
+            carpetas_count=Count('expediente__carpetas', distinct=True),
+            # Total mantenido en el expediente (casos.rollup_service)
+            documentos_count=Coalesce(F('expediente__numDocumentos'), 0),
+        )
+
+    def resumir_casos(self, casos_qs=None, limite: int = None) -> List[Dict[str, Any]]:
+        """
+        Ejecuta la consulta agregada y devuelve los casos en el formato
+        que usan los servicios del chat
+        """
+        filas = self.anotar(casos_qs).values(*self.CAMPOS)
+        if limite is not None:
+            filas = filas[:limite]
+
+        return [
+            {
+                'id': fila['id'],
+                'numero': fila['nroCaso'],
+                'tipo': fila['tipoCaso'],
+                'estado': fila['estado'],
+                'fecha_inicio': fila['fechaInicio'],
+                'descripcion': fila['descripcion'],
+                'expediente_id': fila['expediente_id'],
+                'carpetas_count': fila['carpetas_count'],
+                'documentos_count': fila['documentos_count'],
+            }
+            for fila in filas
+        ]
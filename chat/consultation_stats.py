@@ -0,0 +1,138 @@
+"""
+Registros normalizados de lo que consultó cada respuesta del chat
+(ConsultaDocumento: un registro por documento, caso o actor usado) y rankings
+de uso sobre ellos. Los registros se graban junto con la respuesta del
+asistente (ver crear_mensaje_ia) y los rankings se resuelven con una consulta
+agrupada sobre los índices (fecha, objeto) del modelo.
+"""
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from django.db.models import Avg, Count, Max
+from django.utils import timezone
+
+from actores.models import Actor
+from casos.models import Caso
+from documentos.models import Documento
+
+from .models import ConsultaDocumento
+
+
+# Tipo de objeto -> (campo de ConsultaDocumento, clave en los resultados de DatabaseQueryService)
+TIPOS = {
+    'documento': ('documento', 'documentos'),
+    'caso': ('caso', 'casos'),
+    'actor': ('actor', 'actores'),
+}
+MAX_LIMITE_RANKING = 100
+
+
+def registros_consulta(contexto=None, db_resultados=None, directa=None) -> List[Dict[str, Any]]:
+    """
+    Documentos, casos y actores que usó una respuesta, uno por objeto (con la
+    mayor relevancia con que apareció):
+
+    - `contexto`: resultados del índice de búsqueda ('buscar', relevancia BM25 normalizada)
+    - `db_resultados`: lo que DatabaseQueryService agregó al prompt ('buscar', sin puntaje)
+    - `directa`: respuesta del motor de reglas ('responder', relevancia 1)
+    """
+    registros: Dict[Any, Dict[str, Any]] = {}
+
+    def agregar(tipo, objeto_id, tipo_consulta, relevancia, resultado=''):
+        if tipo not in TIPOS or objeto_id is None:
+            return
+        actual = registros.get((tipo, objeto_id))
+        if actual is None or relevancia > actual['relevancia']:
+            registros[(tipo, objeto_id)] = {
+                'tipo': tipo,
+                'id': objeto_id,
+                'tipo_consulta': tipo_consulta,
+                'relevancia': relevancia,
+                'resultado': resultado,
+            }
+
+    for item in contexto or []:
+        agregar(item['tipo'], item['objeto'].id, 'buscar', item.get('relevancia', 0.0), item.get('razon', ''))
+    for origen, tipo_consulta, relevancia in ((db_resultados, 'buscar', 0.0), (directa, 'responder', 1.0)):
+        for tipo, (_, clave) in TIPOS.items():
+            for fila in (origen or {}).get(clave) or []:
+                agregar(tipo, fila.get('id'), tipo_consulta, relevancia)
+
+    return list(registros.values())
+
+
+def crear_consultas(mensaje, registros: List[Dict[str, Any]]) -> List[ConsultaDocumento]:
+    """Graba los registros de un mensaje en un solo INSERT (con la fecha del mensaje)"""
+    return ConsultaDocumento.objects.bulk_create([
+        ConsultaDocumento(
+            mensaje=mensaje,
+            tipo_consulta=registro['tipo_consulta'],
+            resultado=registro['resultado'],
+            relevancia=registro['relevancia'],
+            fecha=mensaje.fecha_envio,
+            **{f"{TIPOS[registro['tipo']][0]}_id": registro['id']},
+        )
+        for registro in registros
+    ])
+
+
+def mas_consultados(tipo: str = 'documento', dias: float = 30, limite: int = 10) -> List[Dict[str, Any]]:
+    """
+    Los documentos, casos o actores más consultados por el chat en los últimos
+    `dias`: cantidad de respuestas que los usaron, relevancia media y última consulta
+    """
+    campo = TIPOS[tipo][0]
+    desde = timezone.now() - timedelta(days=dias)
+    filas = list(
+        ConsultaDocumento.objects.filter(fecha__gte=desde, **{f'{campo}__isnull': False})
+        .values(campo)
+        .annotate(consultas=Count('id'), relevancia_media=Avg('relevancia'), ultima=Max('fecha'))
+        .order_by('-consultas', campo)[:limite]
+    )
+
+    nombres = _nombres(tipo, [fila[campo] for fila in filas])
+    return [
+        {
+            'id': fila[campo],
+            'nombre': nombres.get(fila[campo], ''),
+            'consultas': fila['consultas'],
+            'relevancia_media': round(fila['relevancia_media'] or 0.0, 3),
+            'ultima': fila['ultima'].isoformat(),
+        }
+        for fila in filas
+    ]
+
+
+def resumen_uso(dias: float = 30) -> Dict[str, Any]:
+    """Registros del período por tipo de consulta ('buscar'/'responder') y por tipo de objeto"""
+    desde = timezone.now() - timedelta(days=dias)
+    registros = ConsultaDocumento.objects.filter(fecha__gte=desde)
+    totales = registros.aggregate(
+        total=Count('id'),
+        mensajes=Count('mensaje', distinct=True),
+        **{clave: Count(campo) for campo, clave in TIPOS.values()},
+    )
+    por_consulta = {
+        fila['tipo_consulta']: fila['total']
+        for fila in registros.order_by().values('tipo_consulta').annotate(total=Count('id'))
+    }
+    return {
+        'registros': totales.pop('total'),
+        'mensajes': totales.pop('mensajes'),
+        'por_objeto': totales,
+        'por_tipo_consulta': por_consulta,
+    }
+
+
+def _nombres(tipo: str, ids: List[int]) -> Dict[int, str]:
+    """Nombre para mostrar de cada objeto del ranking (una consulta)"""
+    if tipo == 'documento':
+        return dict(Documento.objects.filter(id__in=ids).values_list('id', 'nombreDocumento'))
+    if tipo == 'caso':
+        return dict(Caso.objects.filter(id__in=ids).values_list('id', 'nroCaso'))
+    return {
+        actor_id: f"{nombres} {apellido}".strip()
+        for actor_id, nombres, apellido in Actor.objects.filter(id__in=ids).values_list(
+            'id', 'nombres', 'apellidoPaterno'
+        )
+    }
@@ -0,0 +1,155 @@
+"""
+Resumen acumulado de cada conversación: después de cada intercambio, los mensajes
+que ya no entran en la ventana de turnos recientes se integran al resumen
+guardado en Conversacion, de modo que el prompt lleva el resumen más los últimos
+turnos en lugar de todo el texto anterior.
+"""
+import threading
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .fake_openai import FakeOpenAI
+from .models import Conversacion, Mensaje
+from .openai_pool import obtener_cliente_openai
+from .prompt_builder import CARACTERES_POR_TOKEN, truncar
+
+
+TIPOS_HISTORIAL = ('usuario', 'asistente')
+ETIQUETAS = {'usuario': 'Usuario', 'asistente': 'Asistente'}
+# Tope de mensajes sin resumir en el prompt: cubre un intercambio de retraso del resumen
+MAX_SIN_RESUMIR = 6
+
+
+class ConversationSummaryService:
+    """
+    Mantiene `Conversacion.resumen` y `Conversacion.resumen_hasta` (id del último
+    mensaje ya resumido). Los mensajes posteriores a `resumen_hasta` van al prompt
+    tal cual; de ellos se resumen todos menos los `mensajes_recientes` últimos.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+        self.mensajes_recientes = int(getattr(settings, 'CHAT_HISTORIAL_MENSAJES', 4))
+        self.max_tokens = int(getattr(settings, 'CHAT_RESUMEN_MAX_TOKENS', 300))
+        self.en_segundo_plano = getattr(settings, 'CHAT_RESUMEN_EN_SEGUNDO_PLANO', True)
+        self.modelo = getattr(settings, 'OPENAI_MODEL', 'gpt-3.5-turbo')
+
+    @property
+    def client(self):
+        if self._client is None:
+            if getattr(settings, 'OPENAI_FAKE', False):
+                self._client = FakeOpenAI()
+            else:
+                self._client = obtener_cliente_openai()
+        return self._client
+
+    # === HISTORIAL PARA EL PROMPT ===
+
+    def historial(self, conversacion: Conversacion) -> List[str]:
+        """
+        Últimos mensajes sin resumir (hasta MAX_SIN_RESUMIR), empezando por uno del usuario
+        para que los roles alternen correctamente
+        """
+        mensajes = Mensaje.objects.filter(conversacion=conversacion, tipo__in=TIPOS_HISTORIAL)
+        if conversacion.resumen_hasta:
+            mensajes = mensajes.filter(id__gt=conversacion.resumen_hasta)
+        recientes = list(mensajes.order_by('-fecha_envio', '-id').values('tipo', 'contenido')[:MAX_SIN_RESUMIR])
+        recientes.reverse()
+
+        while recientes and recientes[0]['tipo'] != 'usuario':
+            recientes.pop(0)
+        return [mensaje['contenido'] for mensaje in recientes]
+
+    # === ACTUALIZACIÓN DEL RESUMEN ===
+
+    def programar(self, conversacion_id: int):
+        """
+        Actualiza el resumen al confirmarse la transacción, en un hilo aparte
+        (o en línea si CHAT_RESUMEN_EN_SEGUNDO_PLANO está desactivado)
+        """
+        if self.en_segundo_plano:
+            transaction.on_commit(
+                lambda: threading.Thread(target=self._actualizar_en_hilo, args=(conversacion_id,), daemon=True).start()
+            )
+        else:
+            transaction.on_commit(lambda: self.actualizar(conversacion_id))
+
+    def _actualizar_en_hilo(self, conversacion_id: int):
+        try:
+            self.actualizar(conversacion_id)
+        finally:
+            connections.close_all()
+
+    def actualizar(self, conversacion_id: int) -> bool:
+        """
+        Integra al resumen los mensajes que quedaron fuera de la ventana reciente.
+        Si otra actualización se adelantó, se descarta esta. Devuelve True si cambió.
+        """
+        conversacion = Conversacion.objects.filter(id=conversacion_id).only('resumen', 'resumen_hasta').first()
+        if conversacion is None:
+            return False
+
+        pendientes = Mensaje.objects.filter(conversacion_id=conversacion_id, tipo__in=TIPOS_HISTORIAL)
+        if conversacion.resumen_hasta:
+            pendientes = pendientes.filter(id__gt=conversacion.resumen_hasta)
+        pendientes = list(pendientes.order_by('fecha_envio', 'id').values('id', 'tipo', 'contenido'))
+
+        a_resumir = pendientes[:max(0, len(pendientes) - self.mensajes_recientes)]
+        if not a_resumir:
+            return False
+
+        resumen = self._resumir(conversacion.resumen, a_resumir)
+        actualizadas = Conversacion.objects.filter(
+            id=conversacion_id, resumen_hasta=conversacion.resumen_hasta
+        ).update(resumen=resumen, resumen_hasta=a_resumir[-1]['id'])
+        return bool(actualizadas)
+
+    def _resumir(self, resumen_previo: str, mensajes: List[Dict]) -> str:
+        """
+        Pide a OpenAI el resumen actualizado; si la llamada falla se usa el extractivo
+        """
+        transcripcion = '\n'.join(
+            f"{ETIQUETAS[m['tipo']]}: {truncar(m['contenido'], 1500)}" for m in mensajes
+        )
+        palabras = self.max_tokens * 3 // 4
+        try:
+            response = self.client.chat.completions.create(
+                model=self.modelo,
+                messages=[
+                    {"role": "system", "content": (
+                        "Resumes conversaciones entre un usuario y el asistente legal de GestDocSi2. "
+                        "Conserva números de caso, nombres, documentos, fechas y lo que el usuario busca. "
+                        f"Responde solo con el resumen actualizado, en español y en menos de {palabras} palabras."
+                    )},
+                    {"role": "user", "content": (
+                        f"Resumen actual:\n{resumen_previo or '(vacío)'}\n\nNuevos mensajes:\n{transcripcion}"
+                    )},
+                ],
+                temperature=0.2,
+                max_tokens=self.max_tokens
+            )
+            resumen = (response.choices[0].message.content or '').strip()
+        except Exception:
+            resumen = ''
+
+        return resumen or self._resumen_extractivo(resumen_previo, mensajes)
+
+    def _resumen_extractivo(self, resumen_previo: str, mensajes: List[Dict]) -> str:
+        """
+        Agrega una línea recortada por mensaje y conserva solo las líneas más recientes
+        que entran en el máximo de tokens
+        """
+        lineas = (resumen_previo.splitlines() if resumen_previo else []) + [
+            f"- {ETIQUETAS[m['tipo']]}: {truncar(m['contenido'], 200 if m['tipo'] == 'usuario' else 300)}"
+            for m in mensajes
+        ]
+        limite = self.max_tokens * CARACTERES_POR_TOKEN
+        conservadas = []
+        for linea in reversed(lineas):
+            limite -= len(linea) + 1
+            if limite < 0:
+                break
+            conservadas.append(linea)
+        return '\n'.join(reversed(conservadas))
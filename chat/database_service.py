@@ -6,8 +6,12 @@ from casos.models import Caso, Expediente, Carpeta
 from documentos.models import Documento, TipoDocumento, EtapaProcesal
 from actores.models import Actor, Abogado, Cliente, Asistente
 from seguridad.models import Usuario, Rol, Permiso
-from typing import List, Dict, Any
-import re
+from dashboard.statistics_service import StatisticsService
+from .answer_engine import MotorRespuestas
+from .case_summary_service import CaseSummaryService
+from .query_router import analizar_consulta
+from typing import List, Dict, Any, Optional
+
 
 class DatabaseQueryService:
     """
@@ -15,12 +19,40 @@ class DatabaseQueryService:
     """
     
     def __init__(self):
-        pass
+        self.case_summary = CaseSummaryService()
+        self.estadisticas = StatisticsService()
+        self.motor = MotorRespuestas(self)
     
     def consultar_informacion(self, consulta: str, usuario=None) -> Dict[str, Any]:
         """
-        Consulta inteligente que analiza la pregunta y busca información específica
+        Consulta inteligente: si el motor de reglas responde la pregunta, la
+        respuesta va en 'respuesta_directa'; si no, se busca el contexto para OpenAI
+        """
+        analisis = analizar_consulta(consulta)
+        directa = self.responder_directo(consulta, usuario, analisis)
+        if directa is not None:
+            return {
+                'casos': directa['casos'],
+                'documentos': directa['documentos'],
+                'actores': directa['actores'],
+                'estadisticas': directa.get('estadisticas', {}),
+                'respuesta_directa': directa['respuesta'],
+                'regla': directa['regla']
+            }
+        return self.buscar_contexto(consulta, usuario, analisis)
+    
+    def responder_directo(self, consulta: str, usuario=None, analisis: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """
+        Respuesta del motor de reglas (sin OpenAI) o None si la pregunta es abierta
         """
+        return self.motor.responder(consulta, usuario, analisis)
+    
+    def buscar_contexto(self, consulta: str, usuario=None, analisis: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Información de la base de datos para el prompt de OpenAI, sin respuesta directa.
+        `analisis` es el de chat.query_router (se calcula si no se recibe).
+        """
+        analisis = analisis or analizar_consulta(consulta)
         consulta_lower = consulta.lower()
         resultados = {
             'casos': [],
@@ -31,26 +63,29 @@ class DatabaseQueryService:
         }
         
         # Análisis de la consulta para determinar qué buscar
-        if self._es_consulta_personal(consulta_lower):
-            resultados.update(self._buscar_informacion_personal(consulta_lower, usuario))
+        if analisis['personal']:
+            if usuario:
+                resultados['casos'] = self._buscar_casos_personales(usuario, consulta_lower)
+                resultados['documentos'] = self._buscar_documentos_personales(usuario, consulta_lower)
         
-        elif self._es_consulta_estadistica(consulta_lower):
-            resultados['estadisticas'] = self._obtener_estadisticas(consulta_lower)
-            resultados['respuesta_directa'] = self._generar_respuesta_estadistica(resultados['estadisticas'], consulta_lower)
+        elif analisis['estadistica']:
+            resultados['estadisticas'] = self._obtener_estadisticas(analisis)
         
-        elif self._es_consulta_especifica(consulta_lower):
-            resultados.update(self._buscar_informacion_especifica(consulta_lower))
+        elif analisis['especifica']:
+            resultados.update(self._buscar_informacion_especifica(consulta_lower, analisis))
+            resultados['respuesta_directa'] = None
         
         else:
             # Búsqueda general
-            resultados['casos'] = self._buscar_casos_general(consulta_lower)
+            resultados['casos'] = self._buscar_casos_general(consulta_lower, analisis)
             resultados['documentos'] = self._buscar_documentos_general(consulta_lower)
             resultados['actores'] = self._buscar_actores_general(consulta_lower)
         
         return resultados
     
-    def _buscar_informacion_personal(self, consulta: str, usuario) -> Dict[str, Any]:
+    def _buscar_informacion_personal(self, consulta: str, usuario, analisis: Dict[str, Any] = None) -> Dict[str, Any]:
         """Busca información personal del usuario"""
+        listado = (analisis or analizar_consulta(consulta))['listado_personal']
         resultados = {
             'casos': [],
             'documentos': [],
@@ -63,7 +98,7 @@ class DatabaseQueryService:
             return resultados
         
         # Buscar documentos creados por el usuario
-        if any(palabra in consulta for palabra in ['documento', 'documentos', 'creado', 'creados']):
+        if listado == 'documentos':
             documentos = self._buscar_documentos_personales(usuario, consulta)
             resultados['documentos'] = documentos
             if documentos:
@@ -72,7 +107,7 @@ class DatabaseQueryService:
                 resultados['respuesta_directa'] = f"📄 No se encontraron documentos creados por {usuario.username}."
         
         # Buscar casos asignados al usuario
-        elif any(palabra in consulta for palabra in ['caso', 'casos', 'asignado', 'asignados']):
+        elif listado == 'casos':
             casos = self._buscar_casos_personales(usuario, consulta)
             resultados['casos'] = casos
             if casos:
@@ -81,7 +116,7 @@ class DatabaseQueryService:
                 resultados['respuesta_directa'] = f"📁 No se encontraron casos asignados a {usuario.username}."
         
         # Buscar información del actor asociado al usuario
-        elif any(palabra in consulta for palabra in ['actor', 'perfil', 'información', 'datos']):
+        elif listado == 'perfil':
             actor_info = self._buscar_informacion_actor_usuario(usuario)
             if actor_info:
                 resultados['respuesta_directa'] = self._formatear_informacion_actor(actor_info, usuario)
@@ -114,76 +149,28 @@ class DatabaseQueryService:
     
     def _es_consulta_personal(self, consulta: str) -> bool:
         """Determina si la consulta es personal del usuario"""
-        palabras_personales = [
-            'mis', 'mi', 'he creado', 'he hecho', 'he enviado', 'he recibido',
-            'me han asignado', 'me han dado', 'tengo', 'soy', 'estoy',
-            'mi caso', 'mis casos', 'mi documento', 'mis documentos',
-            'mi cliente', 'mis clientes', 'mi abogado', 'mis abogados',
-            'asignado a mí', 'relacionado conmigo', 'que me pertenece'
-        ]
-        return any(palabra in consulta for palabra in palabras_personales)
+        return analizar_consulta(consulta)['personal']
     
     def _es_consulta_estadistica(self, consulta: str) -> bool:
         """Determina si la consulta es sobre estadísticas"""
-        palabras_estadisticas = [
-            'cuántos', 'cuanto', 'cantidad', 'total', 'número', 'numero',
-            'cuántas', 'cuanta', 'estadística', 'estadistica', 'resumen',
-            'listar', 'mostrar todos', 'todos los', 'todos las'
-        ]
-        return any(palabra in consulta for palabra in palabras_estadisticas)
+        return analizar_consulta(consulta)['estadistica']
     
     def _es_consulta_especifica(self, consulta: str) -> bool:
         """Determina si la consulta es sobre información específica"""
-        palabras_especificas = [
-            'cuál', 'cual', 'qué', 'que', 'dónde', 'donde', 'cuando',
-            'especialidad', 'tipo', 'estado', 'fecha', 'nombre'
-        ]
-        return any(palabra in consulta for palabra in palabras_especificas)
+        return analizar_consulta(consulta)['especifica']
     
-    def _obtener_estadisticas(self, consulta: str) -> Dict[str, Any]:
-        """Obtiene estadísticas de la base de datos"""
-        stats = {}
-        
-        # Estadísticas de casos
-        if any(palabra in consulta for palabra in ['caso', 'casos']):
-            stats['casos'] = {
-                'total': Caso.objects.count(),
-                'por_tipo': list(Caso.objects.values('tipoCaso').annotate(count=Count('id'))),
-                'por_estado': list(Caso.objects.values('estado').annotate(count=Count('id'))),
-                'abiertos': Caso.objects.filter(estado='ABIERTO').count(),
-                'cerrados': Caso.objects.filter(estado='CERRADO').count()
-            }
-        
-        # Estadísticas de documentos
-        if any(palabra in consulta for palabra in ['documento', 'documentos']):
-            stats['documentos'] = {
-                'total': Documento.objects.count(),
-                'por_tipo': list(Documento.objects.values('tipoDocumento__nombre').annotate(count=Count('id'))),
-                'con_palabras_clave': Documento.objects.exclude(palabraClave='').count(),
-                'sin_palabras_clave': Documento.objects.filter(palabraClave='').count()
-            }
-        
-        # Estadísticas de actores
-        if any(palabra in consulta for palabra in ['actor', 'actores', 'abogado', 'cliente', 'asistente']):
-            stats['actores'] = {
-                'total': Actor.objects.count(),
-                'abogados': Abogado.objects.count(),
-                'clientes': Cliente.objects.count(),
-                'asistentes': Asistente.objects.count(),
-                'por_especialidad': list(Abogado.objects.values('especialidad').annotate(count=Count('actor_id'))),
-                'por_tipo_cliente': list(Cliente.objects.values('tipoCliente').annotate(count=Count('actor_id')))
-            }
-        
-        # Estadísticas de usuarios
-        if any(palabra in consulta for palabra in ['usuario', 'usuarios', 'rol', 'roles']):
-            stats['usuarios'] = {
-                'total': Usuario.objects.count(),
-                'activos': Usuario.objects.filter(is_active=True).count(),
-                'inactivos': Usuario.objects.filter(is_active=False).count(),
-                'por_rol': list(Usuario.objects.values('groups__name').annotate(count=Count('username')))
-            }
-        
-        return stats
+    def _obtener_estadisticas(self, analisis: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Estadísticas de las entidades que nombra la consulta (una consulta agrupada
+        por entidad, en caché)
+        """
+        fuentes = {
+            'casos': self.estadisticas.casos,
+            'documentos': self.estadisticas.documentos,
+            'actores': self.estadisticas.actores,
+            'usuarios': self.estadisticas.usuarios,
+        }
+        return {entidad: obtener() for entidad, obtener in fuentes.items() if entidad in analisis['menciones']}
     
     def _generar_respuesta_estadistica(self, stats: Dict, consulta: str) -> str:
         """Genera una respuesta basada en las estadísticas"""
@@ -235,7 +222,7 @@ class DatabaseQueryService:
         
         return "\n".join(respuesta) if respuesta else "No se encontraron estadísticas relevantes."
     
-    def _buscar_informacion_especifica(self, consulta: str) -> Dict[str, Any]:
+    def _buscar_informacion_especifica(self, consulta: str, analisis: Dict[str, Any]) -> Dict[str, Any]:
         """Busca información específica basada en la consulta"""
         resultados = {
             'casos': [],
@@ -245,21 +232,21 @@ class DatabaseQueryService:
         }
         
         # Buscar casos específicos
-        if 'caso' in consulta:
-            casos = self._buscar_casos_especificos(consulta)
+        if 'casos' in analisis['menciones']:
+            casos = self._buscar_casos_especificos(consulta, analisis)
             resultados['casos'] = casos
             if casos:
                 resultados['respuesta_directa'] = self._formatear_casos(casos)
         
         # Buscar documentos específicos
-        if 'documento' in consulta:
+        if 'documentos' in analisis['menciones']:
             documentos = self._buscar_documentos_especificos(consulta)
             resultados['documentos'] = documentos
             if documentos and not resultados['respuesta_directa']:
                 resultados['respuesta_directa'] = self._formatear_documentos(documentos)
         
         # Buscar actores específicos
-        if any(palabra in consulta for palabra in ['abogado', 'cliente', 'asistente', 'actor']):
+        if 'actores' in analisis['menciones']:
             actores = self._buscar_actores_especificos(consulta)
             resultados['actores'] = actores
             if actores and not resultados['respuesta_directa']:
@@ -267,76 +254,44 @@ class DatabaseQueryService:
         
         return resultados
     
-    def _buscar_casos_especificos(self, consulta: str) -> List[Dict]:
+    def _buscar_casos_especificos(self, consulta: str, analisis: Dict[str, Any] = None) -> List[Dict]:
         """Busca casos específicos"""
-        casos = []
-        
-        # Si la consulta es sobre casos abiertos específicamente
-        if 'abiertos' in consulta.lower() or 'abierto' in consulta.lower():
-            casos_db = Caso.objects.filter(estado='ABIERTO').order_by('-fechaInicio')
-        # Si la consulta es sobre casos cerrados específicamente
-        elif 'cerrados' in consulta.lower() or 'cerrado' in consulta.lower():
-            casos_db = Caso.objects.filter(estado='CERRADO').order_by('-fechaInicio')
+        analisis = analisis or analizar_consulta(consulta)
+        limite = None
+        
+        # Casos abiertos o cerrados
+        if analisis['estado_caso']:
+            casos_db = Caso.objects.filter(estado=analisis['estado_caso']).order_by('-fechaInicio')
         # Buscar por número de caso específico
-        elif re.search(r'[a-z]+-\d{4}-\d+', consulta.lower()):
-            numero_match = re.search(r'[a-z]+-\d{4}-\d+', consulta.lower())
-            numero = numero_match.group()
-            casos_db = Caso.objects.filter(nroCaso__icontains=numero)
-        # Búsqueda por tipo de caso
-        elif any(tipo in consulta.lower() for tipo in ['divorcio', 'robo', 'despido', 'sociedad', 'incumplimiento', 'pensión', 'horas', 'sucesión', 'daños', 'amparo']):
-            # Mapear tipos de consulta a tipos reales
-            tipo_mapping = {
-                'divorcio': 'Divorcio',
-                'robo': 'Robo',
-                'despido': 'Despido Injustificado',
-                'sociedad': 'Sociedad Comercial',
-                'incumplimiento': 'Incumplimiento Contractual',
-                'pensión': 'Pensión Alimenticia',
-                'horas': 'Horas Extras',
-                'sucesión': 'Sucesión',
-                'daños': 'Daños y Perjuicios',
-                'amparo': 'Recurso de Amparo'
-            }
-            
-            casos_db = []
-            for palabra, tipo_real in tipo_mapping.items():
-                if palabra in consulta.lower():
-                    casos_db = Caso.objects.filter(tipoCaso__icontains=tipo_real)
-                    break
+        elif analisis['numeros_caso']:
+            casos_db = Caso.objects.filter(nroCaso__icontains=analisis['numeros_caso'][0])
+        # Búsqueda por tipo de caso (sinónimos de chat.query_router)
+        elif analisis['tipos_caso']:
+            casos_db = Caso.objects.filter(tipoCaso__icontains=analisis['tipos_caso'][0])
         else:
             # Búsqueda general limitada
-            casos_db = Caso.objects.all().order_by('-fechaInicio')[:10]
-        
-        for caso in casos_db:
-            # Contar documentos del caso
-            documentos_count = 0
-            expedientes = Expediente.objects.filter(caso=caso)
-            for expediente in expedientes:
-                carpetas = Carpeta.objects.filter(expediente=expediente)
-                for carpeta in carpetas:
-                    documentos_count += Documento.objects.filter(carpeta=carpeta).count()
-            
-            casos.append({
-                'id': caso.id,
-                'numero': caso.nroCaso,
-                'tipo': caso.tipoCaso,
-                'estado': caso.estado,
-                'fecha_inicio': caso.fechaInicio,
-                'descripcion': caso.descripcion,
-                'documentos_count': documentos_count
-            })
+            casos_db = Caso.objects.all().order_by('-fechaInicio')
+            limite = 10
         
-        return casos
+        # Conteos de expediente, carpetas y documentos en una sola consulta
+        return self.case_summary.resumir_casos(casos_db, limite=limite)
+    
+    def _buscar_caso_por_numero(self, numero: str) -> List[Dict]:
+        """El caso con ese número exacto (sin distinguir mayúsculas), resumido"""
+        return self.case_summary.resumir_casos(Caso.objects.filter(nroCaso__iexact=numero), limite=1)
     
     def _buscar_documentos_especificos(self, consulta: str) -> List[Dict]:
         """Busca documentos específicos"""
-        documentos = []
-        
         docs_db = Documento.objects.filter(
             Q(nombreDocumento__icontains=consulta) |
             Q(palabraClave__icontains=consulta)
         ).select_related('tipoDocumento', 'carpeta__expediente__caso')[:5]
         
+        return self._documentos_dict(docs_db)
+    
+    def _documentos_dict(self, docs_db) -> List[Dict]:
+        """Formato de documento que usan el chat y el motor de reglas (con select_related del caso)"""
+        documentos = []
         for doc in docs_db:
             caso_info = None
             if doc.carpeta and doc.carpeta.expediente:
@@ -355,8 +310,6 @@ class DatabaseQueryService:
     
     def _buscar_actores_especificos(self, consulta: str) -> List[Dict]:
         """Busca actores específicos"""
-        actores = []
-        
         # Buscar por nombre
         actores_db = Actor.objects.filter(
             Q(nombres__icontains=consulta) |
@@ -365,6 +318,11 @@ class DatabaseQueryService:
             Q(ci__icontains=consulta)
         )[:5]
         
+        return self._actores_dict(actores_db)
+    
+    def _actores_dict(self, actores_db) -> List[Dict]:
+        """Formato de actor con la información propia de su tipo"""
+        actores = []
         for actor in actores_db:
             info_adicional = {}
             
@@ -407,9 +365,9 @@ class DatabaseQueryService:
         
         return actores
     
-    def _buscar_casos_general(self, consulta: str) -> List[Dict]:
+    def _buscar_casos_general(self, consulta: str, analisis: Dict[str, Any] = None) -> List[Dict]:
         """Búsqueda general de casos"""
-        return self._buscar_casos_especificos(consulta)
+        return self._buscar_casos_especificos(consulta, analisis)
     
     def _buscar_documentos_general(self, consulta: str) -> List[Dict]:
         """Búsqueda general de documentos"""
@@ -480,101 +438,30 @@ class DatabaseQueryService:
         
         return "\n".join(respuesta)
     
+    def _casos_personales_qs(self, usuario):
+        """
+        Casos del usuario: los que creó, aquellos en cuyo equipo está su actor y
+        aquellos en que su actor es parte procesal (como cliente)
+        """
+        filtro = Q(creado_por=usuario)
+        actor_usuario = getattr(usuario, 'actor', None)
+        if actor_usuario is not None:
+            filtro |= Q(equipocaso__actor=actor_usuario) | Q(parteprocesal__cliente__actor=actor_usuario)
+        return Caso.objects.filter(id__in=Caso.objects.filter(filtro).values('id'))
+    
     def _buscar_documentos_personales(self, usuario, consulta: str) -> List[Dict]:
-        """Busca documentos relacionados con el usuario"""
-        documentos = []
+        """Busca documentos relacionados con el usuario (creados por él o de sus casos)"""
+        docs_db = Documento.objects.filter(
+            Q(creado_por=usuario) |
+            Q(carpeta__expediente__caso__in=self._casos_personales_qs(usuario))
+        ).select_related('tipoDocumento', 'carpeta__expediente__caso').order_by('-fechaDoc', '-id')[:10]
         
-        # Buscar por usuario creador (si existe el campo)
-        # Como no tenemos un campo de usuario creador directo, buscaremos por actor asociado
-        try:
-            actor_usuario = usuario.actor
-            if actor_usuario:
-                # Buscar documentos en casos donde el actor está involucrado
-                casos_actor = Caso.objects.filter(
-                    Q(expedientes__carpetas__documentos__isnull=False)
-                ).distinct()
-                
-                for caso in casos_actor:
-                    expedientes = Expediente.objects.filter(caso=caso)
-                    for expediente in expedientes:
-                        carpetas = Carpeta.objects.filter(expediente=expediente)
-                        for carpeta in carpetas:
-                            documentos = Documento.objects.filter(carpeta=carpeta)
-                            for doc in documentos:
-                                documentos.append({
-                                    'id': doc.id,
-                                    'nombre': doc.nombreDocumento,
-                                    'tipo': doc.tipoDocumento.nombre,
-                                    'fecha': doc.fechaDoc,
-                                    'caso': caso.nroCaso,
-                                    'palabras_clave': doc.palabraClave
-                                })
-        except:
-            # Si no hay actor asociado, buscar documentos recientes
-            docs_recientes = Documento.objects.all().order_by('-fechaDoc')[:5]
-            for doc in docs_recientes:
-                documentos.append({
-                    'id': doc.id,
-                    'nombre': doc.nombreDocumento,
-                    'tipo': doc.tipoDocumento.nombre,
-                    'fecha': doc.fechaDoc,
-                    'caso': doc.carpeta.expediente.caso.nroCaso if doc.carpeta and doc.carpeta.expediente else None,
-                    'palabras_clave': doc.palabraClave
-                })
-        
-        return documentos[:10]  # Limitar a 10 documentos
+        return self._documentos_dict(docs_db)
     
     def _buscar_casos_personales(self, usuario, consulta: str) -> List[Dict]:
         """Busca casos relacionados con el usuario"""
-        casos = []
-        
-        try:
-            actor_usuario = usuario.actor
-            if actor_usuario:
-                # Buscar casos donde el actor está involucrado
-                casos_db = Caso.objects.filter(
-                    Q(expedientes__carpetas__documentos__isnull=False)
-                ).distinct()
-                
-                for caso in casos_db:
-                    documentos_count = 0
-                    expedientes = Expediente.objects.filter(caso=caso)
-                    for expediente in expedientes:
-                        carpetas = Carpeta.objects.filter(expediente=expediente)
-                        for carpeta in carpetas:
-                            documentos_count += Documento.objects.filter(carpeta=carpeta).count()
-                    
-                    casos.append({
-                        'id': caso.id,
-                        'numero': caso.nroCaso,
-                        'tipo': caso.tipoCaso,
-                        'estado': caso.estado,
-                        'fecha_inicio': caso.fechaInicio,
-                        'descripcion': caso.descripcion,
-                        'documentos_count': documentos_count
-                    })
-        except:
-            # Si no hay actor asociado, buscar casos recientes
-            casos_recientes = Caso.objects.all().order_by('-fechaInicio')[:5]
-            for caso in casos_recientes:
-                documentos_count = 0
-                expedientes = Expediente.objects.filter(caso=caso)
-                for expediente in expedientes:
-                    carpetas = Carpeta.objects.filter(expediente=expediente)
-                    for carpeta in carpetas:
-                        documentos_count += Documento.objects.filter(carpeta=carpeta).count()
-                
-                casos.append({
-                    'id': caso.id,
-                    'numero': caso.nroCaso,
-                    'tipo': caso.tipoCaso,
-                    'estado': caso.estado,
-                    'fecha_inicio': caso.fechaInicio,
-                    'descripcion': caso.descripcion,
-                    'documentos_count': documentos_count
-                })
-        
-        return casos[:10]  # Limitar a 10 casos
+        casos_db = self._casos_personales_qs(usuario).order_by('-fechaInicio', '-id')
+        return self.case_summary.resumir_casos(casos_db, limite=10)
     
     def _buscar_informacion_actor_usuario(self, usuario) -> Dict:
         """Busca información del actor asociado al usuario"""
@@ -621,7 +508,7 @@ class DatabaseQueryService:
                 'ci': actor.ci,
                 'tipo': actor.get_tipoActor_display(),
                 'telefono': actor.telefono,
-                'email': actor.email,
+                'email': usuario.email,
                 'info_adicional': info_adicional
             }
         except:
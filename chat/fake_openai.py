@@ -0,0 +1,110 @@
+"""
+Sustituto local del cliente de OpenAI para desarrollo y pruebas sin conexión
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import List
+
+
+class FakeStream:
+    """
+    Imita el objeto Stream de openai: iterable de chunks con close(). Con
+    `usage` el último chunk no trae choices y sí el uso (stream_options include_usage).
+    """
+
+    def __init__(self, fragmentos: List[str], retraso: float = 0.0, usage=None):
+        self.fragmentos = fragmentos
+        self.retraso = retraso
+        self.usage = usage
+        self.enviados = 0
+        self.closed = False
+
+    def __iter__(self):
+        for fragmento in self.fragmentos:
+            if self.closed:
+                return
+            if self.retraso:
+                time.sleep(self.retraso)
+            self.enviados += 1
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=fragmento))], usage=None
+            )
+        if self.usage is not None and not self.closed:
+            yield SimpleNamespace(choices=[], usage=self.usage)
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeCompletions:
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        fragmentos = self.cliente.fragmentar(self.cliente.respuesta)
+        if not stream and self.cliente.retraso:
+            time.sleep(self.cliente.retraso * len(fragmentos))
+        return self._responder(model, messages, stream, fragmentos, kwargs)
+
+    def _responder(self, model, messages, stream, fragmentos, kwargs):
+        self.cliente.llamadas.append({'model': model, 'messages': messages, 'stream': stream, **kwargs})
+
+        prompt_tokens = sum(len(m.get('content', '').split()) for m in messages or [])
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=len(fragmentos),
+            total_tokens=prompt_tokens + len(fragmentos),
+        )
+
+        if stream:
+            incluir_uso = (kwargs.get('stream_options') or {}).get('include_usage')
+            self.cliente.ultimo_stream = FakeStream(fragmentos, self.cliente.retraso, usage if incluir_uso else None)
+            return self.cliente.ultimo_stream
+
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.cliente.respuesta))],
+            usage=usage,
+        )
+
+
+class FakeOpenAI:
+    """
+    Cliente compatible con openai.OpenAI para chat.completions.create,
+    con respuesta fija y retraso opcional por fragmento
+    """
+
+    RESPUESTA_POR_DEFECTO = "Respuesta de prueba generada sin conexión a OpenAI."
+
+    def __init__(self, respuesta: str = None, retraso: float = 0.0, **kwargs):
+        self.respuesta = respuesta or self.RESPUESTA_POR_DEFECTO
+        self.retraso = retraso
+        self.llamadas = []
+        self.ultimo_stream = None
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+
+    @staticmethod
+    def fragmentar(texto: str) -> List[str]:
+        """Divide el texto en 'tokens' conservando los espacios"""
+        palabras = texto.split(' ')
+        return [p if i == len(palabras) - 1 else p + ' ' for i, p in enumerate(palabras)]
+
+
+class _FakeAsyncCompletions(_FakeCompletions):
+
+    async def create(self, model=None, messages=None, stream=False, **kwargs):
+        fragmentos = self.cliente.fragmentar(self.cliente.respuesta)
+        if self.cliente.retraso:
+            await asyncio.sleep(self.cliente.retraso * len(fragmentos))
+        return self._responder(model, messages, False, fragmentos, kwargs)
+
+
+class FakeAsyncOpenAI(FakeOpenAI):
+    """
+    Variante asíncrona compatible con openai.AsyncOpenAI
+    """
+
+    def __init__(self, respuesta: str = None, retraso: float = 0.0, **kwargs):
+        super().__init__(respuesta, retraso, **kwargs)
+        self.chat = SimpleNamespace(completions=_FakeAsyncCompletions(self))
@@ -0,0 +1,185 @@
+"""
+Cola de tareas del chat en la base de datos (sin broker externo): la vista
+guarda la pregunta y encola la tarea; el comando procesar_tareas_ia la resuelve
+en un pool de hilos y guarda la respuesta como Mensaje.
+"""
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import List
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import TareaIA, Mensaje
+
+
+class ColaTareasIA:
+    """
+    Operaciones de la cola. Un trabajador toma tareas con un plazo (timeout);
+    si no la termina dentro del plazo otra ejecución puede retomarla. Los fallos
+    se reintentan con espera exponencial hasta `max_intentos` y después la tarea
+    queda FALLIDA.
+    """
+
+    def __init__(self):
+        self.timeout = float(getattr(settings, 'CHAT_TAREAS_TIMEOUT', 120))
+        self.max_intentos = int(getattr(settings, 'CHAT_TAREAS_MAX_INTENTOS', 3))
+        self.backoff_base = float(getattr(settings, 'CHAT_TAREAS_BACKOFF_BASE', 2.0))
+        self.backoff_max = float(getattr(settings, 'CHAT_TAREAS_BACKOFF_MAX', 300.0))
+
+    def encolar(self, usuario, conversacion, mensaje_usuario: Mensaje) -> TareaIA:
+        return TareaIA.objects.create(
+            usuario=usuario,
+            conversacion=conversacion,
+            mensaje_usuario=mensaje_usuario,
+            consulta=mensaje_usuario.contenido,
+            max_intentos=self.max_intentos,
+            disponible_en=timezone.now()
+        )
+
+    def reclamar(self, trabajador: str, cantidad: int) -> List[TareaIA]:
+        """
+        Toma hasta `cantidad` tareas disponibles (pendientes o con el plazo vencido).
+        En PostgreSQL, SKIP LOCKED evita que dos trabajadores tomen la misma.
+        """
+        if cantidad <= 0:
+            return []
+
+        ahora = timezone.now()
+        # Plazo vencido sin intentos restantes: a la cola de descarte
+        TareaIA.objects.filter(
+            estado=TareaIA.EN_CURSO, bloqueada_hasta__lt=ahora, intentos__gte=F('max_intentos')
+        ).update(estado=TareaIA.FALLIDA, error='Tiempo de espera agotado', fecha_fin=ahora)
+
+        with transaction.atomic():
+            ids = list(
+                TareaIA.objects.select_for_update(skip_locked=True).filter(
+                    Q(estado=TareaIA.PENDIENTE, disponible_en__lte=ahora) |
+                    Q(estado=TareaIA.EN_CURSO, bloqueada_hasta__lt=ahora)
+                ).order_by('disponible_en', 'id').values_list('id', flat=True)[:cantidad]
+            )
+            TareaIA.objects.filter(id__in=ids).update(
+                estado=TareaIA.EN_CURSO,
+                intentos=F('intentos') + 1,
+                trabajador=trabajador,
+                bloqueada_hasta=ahora + timedelta(seconds=self.timeout),
+                fecha_inicio=ahora
+            )
+
+        return list(
+            TareaIA.objects.filter(id__in=ids).select_related('usuario', 'conversacion').order_by('disponible_en', 'id')
+        )
+
+    def ejecutar(self, tarea: TareaIA) -> bool:
+        """
+        Resuelve la consulta con el mismo pipeline que enviar_mensaje
+        """
+        from .views import procesar_consulta_ia
+
+        inicio = time.time()
+        try:
+            resultado = procesar_consulta_ia(tarea.usuario, tarea.consulta, tarea.conversacion)
+            if resultado.get('tipo_consulta') == 'error':
+                raise RuntimeError(resultado['respuesta'])
+        except Exception as e:
+            self.fallar(tarea, e)
+            return False
+        return self.completar(tarea, resultado, time.time() - inicio)
+
+    def completar(self, tarea: TareaIA, resultado: dict, tiempo_respuesta: float) -> bool:
+        """
+        Guarda la respuesta si la tarea sigue siendo de este intento (si el plazo
+        venció y otra ejecución la retomó, este resultado se descarta)
+        """
+        from .conversation_summary_service import ConversationSummaryService
+        from .views import crear_mensaje_ia
+
+        with transaction.atomic():
+            tomada = TareaIA.objects.filter(
+                id=tarea.id, estado=TareaIA.EN_CURSO, intentos=tarea.intentos
+            ).update(estado=TareaIA.COMPLETADA, fecha_fin=timezone.now(), error='')
+            if not tomada:
+                return False
+
+            mensaje = crear_mensaje_ia(tarea.conversacion, resultado, tiempo_respuesta)
+            TareaIA.objects.filter(id=tarea.id).update(mensaje_respuesta=mensaje)
+            ConversationSummaryService().programar(tarea.conversacion_id)
+        return True
+
+    def fallar(self, tarea: TareaIA, error: Exception):
+        """
+        Programa un reintento con espera exponencial o, sin intentos restantes,
+        deja la tarea FALLIDA
+        """
+        ahora = timezone.now()
+        actual = TareaIA.objects.filter(id=tarea.id, estado=TareaIA.EN_CURSO, intentos=tarea.intentos)
+        if tarea.intentos >= tarea.max_intentos:
+            actual.update(estado=TareaIA.FALLIDA, error=str(error), fecha_fin=ahora)
+        else:
+            espera = min(self.backoff_max, self.backoff_base * (2 ** (tarea.intentos - 1)))
+            actual.update(
+                estado=TareaIA.PENDIENTE,
+                error=str(error),
+                disponible_en=ahora + timedelta(seconds=espera),
+                bloqueada_hasta=None
+            )
+
+    def reencolar_fallidas(self) -> int:
+        """
+        Devuelve las tareas de la cola de descarte a pendientes con los intentos a cero
+        """
+        return TareaIA.objects.filter(estado=TareaIA.FALLIDA).update(
+            estado=TareaIA.PENDIENTE, intentos=0, disponible_en=timezone.now(),
+            bloqueada_hasta=None, fecha_fin=None
+        )
+
+
+class TrabajadorTareasIA:
+    """
+    Bucle del trabajador: mientras haya hilos libres reclama tareas y las
+    ejecuta en el pool; sin tareas espera `intervalo` segundos
+    """
+
+    def __init__(self, hilos: int = None, intervalo: float = None, cola: ColaTareasIA = None):
+        self.hilos = hilos or int(getattr(settings, 'CHAT_TAREAS_HILOS', 4))
+        self.intervalo = intervalo if intervalo is not None else float(getattr(settings, 'CHAT_TAREAS_INTERVALO', 0.5))
+        self.cola = cola or ColaTareasIA()
+        self.nombre = f"{socket.gethostname()}:{os.getpid()}:{id(self)}"
+        self.detener = threading.Event()
+        self.completadas = 0
+        self.errores = 0
+        self._lock = threading.Lock()
+
+    def ejecutar(self, una_vez: bool = False):
+        """
+        Procesa tareas hasta que se pida detener (o, con `una_vez`, hasta vaciar la cola)
+        """
+        en_curso = set()
+        with ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='tarea-ia') as pool:
+            while not self.detener.is_set():
+                en_curso = {futuro for futuro in en_curso if not futuro.done()}
+                tareas = self.cola.reclamar(self.nombre, self.hilos - len(en_curso))
+                for tarea in tareas:
+                    en_curso.add(pool.submit(self._ejecutar_tarea, tarea))
+
+                if una_vez and not tareas and not en_curso:
+                    break
+                if not tareas:
+                    self.detener.wait(self.intervalo)
+
+    def _ejecutar_tarea(self, tarea: TareaIA):
+        try:
+            completada = self.cola.ejecutar(tarea)
+            with self._lock:
+                if completada:
+                    self.completadas += 1
+                else:
+                    self.errores += 1
+        finally:
+            connections.close_all()
@@ -0,0 +1,108 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from asgiref.sync import async_to_sync
+from chat.models import Conversacion
+from chat.services import AsistenteIAService
+from chat.fake_openai import FakeOpenAI, FakeAsyncOpenAI
+from chat.views import procesar_consulta_ia, procesar_consulta_ia_async
+from seguridad.models import Usuario
+import statistics
+import time
+
+
+CONSULTAS_POR_DEFECTO = [
+    'Hola, buenos días',
+    'Busca el contrato de arrendamiento',
+    'Información sobre el abogado Carlos Mendoza',
+    'Documentos del caso CIV-2024-001',
+]
+
+
+class Command(BaseCommand):
+    help = ('Compara la latencia del pipeline síncrono del chat con el pipeline async '
+            '(búsquedas en paralelo). Ejecuta antes seed_all para tener datos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=5)
+        parser.add_argument('--usuario', default='admin', help='Usuario para las consultas personales')
+        parser.add_argument('--retraso-llm', type=float, default=0.02,
+                            help='Segundos por fragmento del OpenAI simulado')
+        parser.add_argument('--latencia-db', type=float, default=0.002,
+                            help='Segundos de ida y vuelta añadidos a cada consulta SQL (simula una BD remota)')
+        parser.add_argument('--consulta', action='append', dest='consultas',
+                            help='Consulta a medir (se puede repetir)')
+
+    def handle(self, *args, **options):
+        usuario = Usuario.objects.filter(username=options['usuario']).first() or Usuario.objects.first()
+        if usuario is None:
+            raise CommandError('No hay usuarios en el sistema. Ejecuta primero seed_all.')
+
+        consultas = options['consultas'] or CONSULTAS_POR_DEFECTO
+        iteraciones = options['iteraciones']
+        retraso = options['retraso_llm']
+
+        self._simular_latencia_db(options['latencia_db'])
+
+        servicio_ia = AsistenteIAService(
+            client=FakeOpenAI(retraso=retraso),
+            async_client=FakeAsyncOpenAI(retraso=retraso)
+        )
+        conversacion = Conversacion.objects.create(usuario=usuario, titulo='Benchmark chat')
+
+        try:
+            self.stdout.write(
+                f"Benchmark del chat: {iteraciones} iteraciones por consulta, usuario {usuario.username}, "
+                f"latencia BD {options['latencia_db'] * 1000:.1f}ms, OpenAI simulado {retraso * 1000:.0f}ms/fragmento\n"
+            )
+            self.stdout.write(f"{'Consulta':45} {'sync p50':>10} {'async p50':>10} {'mejora':>8}")
+
+            totales_sync, totales_async = [], []
+            for consulta in consultas:
+                tiempos_sync = self._medir(
+                    lambda: procesar_consulta_ia(usuario, consulta, conversacion, servicio_ia), iteraciones
+                )
+                tiempos_async = self._medir(
+                    lambda: async_to_sync(procesar_consulta_ia_async)(usuario, consulta, conversacion, servicio_ia),
+                    iteraciones
+                )
+                totales_sync.extend(tiempos_sync)
+                totales_async.extend(tiempos_async)
+                self._fila(consulta[:45], tiempos_sync, tiempos_async)
+
+            self.stdout.write('')
+            self._fila('TOTAL', totales_sync, totales_async)
+        finally:
+            conversacion.delete()
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completado.'))
+
+    def _simular_latencia_db(self, latencia):
+        """Añade la latencia a cada consulta, también en las conexiones de los hilos del pipeline async"""
+        if not latencia:
+            return
+
+        def con_latencia(execute, sql, params, many, context):
+            time.sleep(latencia)
+            return execute(sql, params, many, context)
+
+        def registrar(sender, connection, **kwargs):
+            connection.execute_wrappers.append(con_latencia)
+
+        connection_created.connect(registrar, weak=False)
+        connection.execute_wrappers.append(con_latencia)
+
+    def _medir(self, funcion, iteraciones):
+        funcion()  # calentamiento
+        tiempos = []
+        for _ in range(iteraciones):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        return tiempos
+
+    def _fila(self, etiqueta, tiempos_sync, tiempos_async):
+        p50_sync = statistics.median(tiempos_sync) * 1000
+        p50_async = statistics.median(tiempos_async) * 1000
+        mejora = p50_sync / p50_async if p50_async else 0
+        self.stdout.write(f"{etiqueta:45} {p50_sync:>8.1f}ms {p50_async:>8.1f}ms {mejora:>7.2f}x")
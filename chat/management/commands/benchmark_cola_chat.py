@@ -0,0 +1,185 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory, override_settings
+from chat.job_queue import TrabajadorTareasIA
+from chat.models import Conversacion, TareaIA
+from chat.views import enviar_mensaje, enviar_mensaje_cola, estado_tarea
+from seguridad.models import Usuario
+import json
+import statistics
+import threading
+import time
+
+
+CONSULTAS = [
+    'Hola, buenos días',
+    'Busca el contrato de arrendamiento',
+    'Información sobre el abogado Carlos Mendoza',
+    'Documentos del caso CIV-2024-001',
+]
+
+
+class ServidorSimulado:
+    """
+    Pool fijo de workers web (como los procesos/hilos de gunicorn) que registra
+    cuánto tiempo está ocupado cada uno
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.ocupado = 0.0
+        self.lock = threading.Lock()
+
+    def atender(self, vista, request, *args):
+        """Devuelve (respuesta, segundos esperando un worker libre)"""
+        llegada = time.perf_counter()
+
+        def ejecutar():
+            inicio = time.perf_counter()
+            try:
+                return vista(request, *args), inicio - llegada
+            finally:
+                with self.lock:
+                    self.ocupado += time.perf_counter() - inicio
+                connections.close_all()
+
+        return self.pool.submit(ejecutar).result()
+
+    def cerrar(self):
+        self.pool.shutdown()
+
+
+class Command(BaseCommand):
+    help = ('Compara la ocupación de los workers web con enviar_mensaje (síncrono) y con '
+            'enviar_mensaje_cola + procesar_tareas_ia, con OpenAI simulado.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=16, help='Usuarios chateando a la vez')
+        parser.add_argument('--mensajes', type=int, default=3, help='Mensajes por usuario')
+        parser.add_argument('--workers-web', type=int, default=4)
+        parser.add_argument('--hilos-cola', type=int, default=8, help='Hilos del trabajador de la cola')
+        parser.add_argument('--retraso-llm', type=float, default=0.05,
+                            help='Segundos por fragmento del OpenAI simulado')
+        parser.add_argument('--sondeo', type=float, default=0.25,
+                            help='Segundos entre consultas del cliente al estado de la tarea')
+        parser.add_argument('--usuario', default='admin')
+
+    def handle(self, *args, **options):
+        self.usuario = Usuario.objects.filter(username=options['usuario']).first() or Usuario.objects.first()
+        if self.usuario is None:
+            raise CommandError('No hay usuarios en el sistema. Ejecuta primero seed_all.')
+        self.options = options
+        self.factory = RequestFactory()
+
+        self.stdout.write(
+            f"{options['usuarios']} usuarios x {options['mensajes']} mensajes, {options['workers_web']} workers web, "
+            f"OpenAI simulado {options['retraso_llm'] * 1000:.0f}ms/fragmento\n"
+        )
+
+        # Sin caché de respuestas: cada mensaje llega a OpenAI (simulado)
+        with override_settings(OPENAI_FAKE=True, OPENAI_FAKE_RETRASO=options['retraso_llm'], CHAT_CACHE_ACTIVO=False):
+            sincrono = self._medir('sincrono')
+            cola = self._medir('cola')
+
+        self.stdout.write(f"{'':32} {'síncrono':>12} {'cola':>12}")
+        for etiqueta, clave, formato in [
+            ('Ocupación de workers web', 'ocupacion', '{:>11.1%}'),
+            ('Worker-segundos por mensaje', 'segundos_por_mensaje', '{:>11.3f}s'),
+            ('Espera por un worker p95', 'espera_p95', '{:>11.3f}s'),
+            ('Aceptación del mensaje p50', 'aceptacion_p50', '{:>11.3f}s'),
+            ('Aceptación del mensaje p95', 'aceptacion_p95', '{:>11.3f}s'),
+            ('Respuesta completa p50', 'respuesta_p50', '{:>11.3f}s'),
+            ('Respuesta completa p95', 'respuesta_p95', '{:>11.3f}s'),
+            ('Duración total', 'duracion', '{:>11.2f}s'),
+        ]:
+            self.stdout.write(f"{etiqueta:32} {formato.format(sincrono[clave])} {formato.format(cola[clave])}")
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completado.'))
+
+    def _medir(self, modo):
+        opciones = self.options
+        servidor = ServidorSimulado(opciones['workers_web'])
+        conversaciones = [
+            Conversacion.objects.create(usuario=self.usuario, titulo=f'Benchmark cola {i}')
+            for i in range(opciones['usuarios'])
+        ]
+        aceptacion, respuesta, esperas = [], [], []
+        lock = threading.Lock()
+
+        trabajador = None
+        hilo_trabajador = None
+        if modo == 'cola':
+            trabajador = TrabajadorTareasIA(hilos=opciones['hilos_cola'], intervalo=0.02)
+            hilo_trabajador = threading.Thread(target=trabajador.ejecutar, daemon=True)
+            hilo_trabajador.start()
+
+        def chatear(indice, conversacion):
+            try:
+                for n in range(opciones['mensajes']):
+                    # Consultas distintas para que no se agrupen en single-flight
+                    consulta = f"{CONSULTAS[(indice + n) % len(CONSULTAS)]} ({indice}-{n})"
+                    inicio = time.perf_counter()
+                    vista = enviar_mensaje if modo == 'sincrono' else enviar_mensaje_cola
+                    response, espera = servidor.atender(vista, self._post(consulta, conversacion))
+                    aceptado = time.perf_counter() - inicio
+                    esperas_locales = [espera]
+
+                    if modo == 'cola':
+                        tarea_id = json.loads(response.content)['tarea']['id']
+                        while True:
+                            time.sleep(opciones['sondeo'])
+                            response, espera = servidor.atender(estado_tarea, self._get(), tarea_id)
+                            esperas_locales.append(espera)
+                            if json.loads(response.content)['tarea']['estado'] in (TareaIA.COMPLETADA, TareaIA.FALLIDA):
+                                break
+
+                    with lock:
+                        aceptacion.append(aceptado)
+                        respuesta.append(time.perf_counter() - inicio)
+                        esperas.extend(esperas_locales)
+            finally:
+                connections.close_all()
+
+        inicio = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=opciones['usuarios']) as usuarios:
+                list(usuarios.map(chatear, range(len(conversaciones)), conversaciones))
+            duracion = time.perf_counter() - inicio
+        finally:
+            if trabajador is not None:
+                trabajador.detener.set()
+                hilo_trabajador.join()
+            servidor.cerrar()
+            Conversacion.objects.filter(id__in=[c.id for c in conversaciones]).delete()
+
+        total_mensajes = len(respuesta)
+        return {
+            'ocupacion': servidor.ocupado / (opciones['workers_web'] * duracion),
+            'segundos_por_mensaje': servidor.ocupado / total_mensajes,
+            'espera_p95': self._percentil(esperas, 95),
+            'aceptacion_p50': statistics.median(aceptacion),
+            'aceptacion_p95': self._percentil(aceptacion, 95),
+            'respuesta_p50': statistics.median(respuesta),
+            'respuesta_p95': self._percentil(respuesta, 95),
+            'duracion': duracion,
+        }
+
+    def _post(self, consulta, conversacion):
+        request = self.factory.post(
+            '/chat/api/enviar-mensaje/',
+            json.dumps({'mensaje': consulta, 'conversacion_id': conversacion.id}),
+            content_type='application/json'
+        )
+        request.user = self.usuario
+        return request
+
+    def _get(self):
+        request = self.factory.get('/chat/api/tareas/')
+        request.user = self.usuario
+        return request
+
+    def _percentil(self, valores, percentil):
+        ordenados = sorted(valores)
+        return ordenados[min(len(ordenados) - 1, int(len(ordenados) * percentil / 100))]
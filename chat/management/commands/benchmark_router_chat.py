@@ -0,0 +1,226 @@
+from django.core.management.base import BaseCommand
+from casos.models import Caso
+from chat.models import Mensaje
+from chat.query_router import analizar_sin_cache, tipos_mencionados
+from chat.response_cache import normalizar_consulta
+from documentos.models import TipoDocumento
+import re
+import statistics
+import time
+
+
+# Preguntas reales del chat (tomadas de conversaciones y de las sugerencias)
+CORPUS = [
+    'Hola, buenos días',
+    '¿Cuáles son mis casos asignados?',
+    'Muéstrame mis documentos',
+    'Estado del caso CIV-2024-001',
+    'Documentos del caso PEN-2023-014',
+    '¿Cuántos casos abiertos hay?',
+    'Total de documentos y usuarios del sistema',
+    'casos de divorcio',
+    'Listar los casos cerrados',
+    'lista los contratos',
+    'documentos de tipo Escritura',
+    'Busca el contrato de arrendamiento',
+    'Información sobre el abogado Carlos Mendoza',
+    'Datos del cliente con CI 4455667',
+    '¿Qué especialidad tiene la abogada Ana Rojas?',
+    '¿Por qué se retrasó el caso CIV-2024-001?',
+    'Explícame los riesgos de la demanda laboral',
+    'Redacta un resumen del expediente de sucesión',
+    '¿Cómo presento un recurso de amparo?',
+    'Tengo una duda sobre plazos procesales',
+    '¿Qué camino sigue una demanda por daños?',
+    '¿Dónde está la factura del caso LAB-2024-007?',
+    'Casos de despido injustificado del último año',
+    '¿Cuántas horas extras reclama el cliente?',
+    'Mi perfil',
+]
+
+# === CLASIFICACIÓN ANTERIOR ===
+# Las búsquedas de palabras que hacían analizar_consulta, DatabaseQueryService y
+# el motor de reglas antes del router, cada una recorriendo la consulta de nuevo.
+
+_PERSONALES = [
+    'mis', 'mi', 'he creado', 'he hecho', 'he enviado', 'he recibido',
+    'me han asignado', 'me han dado', 'tengo', 'soy', 'estoy',
+    'mi caso', 'mis casos', 'mi documento', 'mis documentos',
+    'mi cliente', 'mis clientes', 'mi abogado', 'mis abogados',
+    'asignado a mí', 'relacionado conmigo', 'que me pertenece'
+]
+_PATRON_PERSONAL = re.compile(r'\b(?:' + '|'.join(re.escape(p) for p in _PERSONALES) + r')\b')
+_ABIERTAS = (
+    'por que', 'porque', 'como ', 'explica', 'explicame', 'analiza', 'analisis', 'riesgo',
+    'recomienda', 'recomendacion', 'sugiere', 'redacta', 'escribe', 'resume', 'opinas',
+    'deberia', 'debo', 'conviene', 'estrategia', 'compara', 'diferencia', 'significa',
+)
+_TIPOS_CASO = {
+    'divorcio': 'Divorcio', 'robo': 'Robo', 'despido': 'Despido Injustificado',
+    'sociedad': 'Sociedad Comercial', 'incumplimiento': 'Incumplimiento Contractual',
+    'pensión': 'Pensión Alimenticia', 'horas': 'Horas Extras', 'sucesión': 'Sucesión',
+    'daños': 'Daños y Perjuicios', 'amparo': 'Recurso de Amparo',
+}
+
+
+def clasificar_anterior(consulta):
+    consulta_lower = consulta.lower()
+    normalizada = normalizar_consulta(consulta)
+
+    # AsistenteIAService.analizar_consulta
+    if any(p in consulta_lower for p in ['documento', 'contrato', 'factura', 'escritura', 'certificado']):
+        tipo = 'documento'
+    elif any(p in consulta_lower for p in ['abogado', 'cliente', 'asistente', 'persona']):
+        tipo = 'actor'
+    elif any(p in consulta_lower for p in ['caso', 'expediente', 'proceso', 'demanda']):
+        tipo = 'caso'
+    else:
+        tipo = 'general'
+    entidades = [e for e in ('contrato', 'factura', 'abogado', 'cliente') if e in consulta_lower]
+
+    # MotorRespuestas.es_abierta y clave_en_vuelo
+    abierta = any(f' {p}' in f' {normalizada} ' for p in _ABIERTAS)
+    personal = _PATRON_PERSONAL.search(consulta_lower) is not None
+
+    # DatabaseQueryService._es_consulta_estadistica / _especifica / _obtener_estadisticas
+    estadistica = any(p in consulta_lower for p in [
+        'cuántos', 'cuanto', 'cantidad', 'total', 'número', 'numero', 'cuántas', 'cuanta',
+        'estadística', 'estadistica', 'resumen', 'listar', 'mostrar todos', 'todos los', 'todos las'
+    ])
+    especifica = any(p in consulta_lower for p in [
+        'cuál', 'cual', 'qué', 'que', 'dónde', 'donde', 'cuando', 'especialidad', 'tipo', 'estado', 'fecha', 'nombre'
+    ])
+    menciones = set()
+    if any(p in consulta_lower for p in ['caso', 'casos']):
+        menciones.add('casos')
+    if any(p in consulta_lower for p in ['documento', 'documentos']):
+        menciones.add('documentos')
+    if any(p in consulta_lower for p in ['actor', 'actores', 'abogado', 'cliente', 'asistente']):
+        menciones.add('actores')
+    if any(p in consulta_lower for p in ['usuario', 'usuarios', 'rol', 'roles']):
+        menciones.add('usuarios')
+
+    # _buscar_casos_especificos y las reglas del motor
+    numero = re.search(r'[a-z]+-\d{4}-\d+', consulta_lower)
+    tipos_caso = [real for palabra, real in _TIPOS_CASO.items() if palabra in consulta_lower]
+    ci = re.search(r'\b\d{6,}\b', normalizada)
+    estado = re.search(r'\bcasos (abiertos|cerrados)\b', normalizada)
+    return {
+        'tipo': tipo, 'entidades': entidades, 'abierta': abierta, 'personal': personal,
+        'estadistica': estadistica, 'especifica': especifica, 'menciones': menciones,
+        'numero': numero, 'tipos_caso': tipos_caso, 'ci': ci, 'estado': estado,
+    }
+
+
+def mensaje_anterior(consulta, tipos_documento, tipos_caso):
+    """
+    Los recorridos de la consulta que hacía un mensaje que termina en OpenAI
+    (el caso más común): clave_en_vuelo, todas las reglas del motor (con los
+    tipos de documento y de caso de la base), analizar_consulta y buscar_contexto
+    """
+    consulta_lower = consulta.lower()
+    _PATRON_PERSONAL.search(consulta_lower)
+    normalizar_consulta(consulta)
+
+    normalizada = normalizar_consulta(consulta)
+    any(f' {p}' in f' {normalizada} ' for p in _ABIERTAS)
+    _PATRON_PERSONAL.search(consulta_lower)
+    re.search(r'\b[a-z]{2,}-\d{4}-\d+\b', normalizada)
+    clasificar_anterior(consulta)
+    re.search(r'\bcasos (abiertos|cerrados)\b', normalizada)
+    if re.search(r'\bcasos (de|por|del tipo|de tipo) ', normalizada):
+        [t for t in tipos_caso if re.search(rf'\b{re.escape(normalizar_consulta(t))}\b', normalizada)]
+    for nombre in tipos_documento:
+        nombre = normalizar_consulta(nombre)
+        plural = nombre + ('es' if nombre[-1] not in 'aeiou' else 's')
+        for patron in (rf'\btipo {re.escape(nombre)}\b', rf'\bdocumentos (de )?{re.escape(nombre)}\b',
+                       rf'\b{re.escape(plural)}\b'):
+            re.search(patron, normalizada)
+    if any(p in ('abogado', 'abogada', 'cliente', 'asistente', 'actor', 'persona') for p in normalizada.split()):
+        [p for p in re.findall(r'\w+', consulta_lower) if normalizar_consulta(p)]
+
+    # analizar_consulta en recopilar_contexto_ia y las comprobaciones de buscar_contexto
+    return clasificar_anterior(consulta)
+
+
+def mensaje_router(consulta, tipos_documento, tipos_caso):
+    """El mismo mensaje con el router: un análisis y los tipos de la base que buscan las reglas"""
+    analisis = analizar_sin_cache(consulta)
+    if 'caso' in analisis['plurales']:
+        tipos_mencionados(analisis['normalizada'], tipos_caso)
+    tipos_mencionados(analisis['normalizada'], tipos_documento, listado=True)
+    return analisis
+
+
+class Command(BaseCommand):
+    help = ('Micro-benchmark del análisis de consultas del chat: las búsquedas de palabras '
+            'anteriores frente al router compilado de chat.query_router, sobre un corpus de '
+            'preguntas reales (y las últimas del historial si hay).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=2000, help='Pasadas sobre el corpus')
+        parser.add_argument('--historial', type=int, default=500,
+                            help='Mensajes de usuario del historial que se suman al corpus')
+
+    def handle(self, *args, **options):
+        corpus = list(CORPUS)
+        if options['historial']:
+            corpus += list(
+                Mensaje.objects.filter(tipo='usuario').order_by('-fecha_envio')
+                .values_list('contenido', flat=True)[:options['historial']]
+            )
+        repeticiones = options['repeticiones']
+
+        tipos_documento = list(TipoDocumento.objects.filter(activo=True).values_list('nombre', flat=True))
+        tipos_caso = list(Caso.objects.order_by().values_list('tipoCaso', flat=True).distinct())
+        self.stdout.write(
+            f"{len(corpus)} consultas x {repeticiones} repeticiones, "
+            f"{len(tipos_documento)} tipos de documento, {len(tipos_caso)} tipos de caso\n"
+        )
+
+        # Sin el LRU de analizar_consulta: se mide el recorrido completo de cada consulta
+        filas = [
+            ('Una clasificación', self._medir(clasificar_anterior, corpus, repeticiones),
+             self._medir(analizar_sin_cache, corpus, repeticiones)),
+            ('Mensaje completo', self._medir(mensaje_anterior, corpus, repeticiones, tipos_documento, tipos_caso),
+             self._medir(mensaje_router, corpus, repeticiones, tipos_documento, tipos_caso)),
+        ]
+
+        self.stdout.write(f"{'µs por consulta':20} {'anterior p50':>13} {'router p50':>11} {'anterior p95':>13} {'router p95':>11} {'mejora':>8}")
+        for etiqueta, anterior, router in filas:
+            self.stdout.write(
+                f"{etiqueta:20} {anterior['mediana']:>13.1f} {router['mediana']:>11.1f} "
+                f"{anterior['p95']:>13.1f} {router['p95']:>11.1f} {anterior['mediana'] / router['mediana']:>7.1f}x"
+            )
+
+        # Consultas en que cambia la intención detectada (palabras completas en lugar de subcadenas)
+        self.stdout.write('\nDiferencias de intención:')
+        diferencias = 0
+        for consulta in corpus:
+            antes, ahora = clasificar_anterior(consulta), analizar_sin_cache(consulta)
+            cambios = [
+                f"{clave}: {antes[clave]} -> {ahora[clave]}"
+                for clave in ('tipo', 'personal', 'estadistica', 'especifica', 'abierta')
+                if antes[clave] != ahora[clave]
+            ]
+            if cambios:
+                diferencias += 1
+                self.stdout.write(f"  {consulta[:50]:50} {', '.join(cambios)}")
+        if not diferencias:
+            self.stdout.write('  ninguna')
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completado.'))
+
+    def _medir(self, analizar, corpus, repeticiones, *args):
+        """Microsegundos por consulta de cada pasada sobre el corpus"""
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            for consulta in corpus:
+                analizar(consulta, *args)
+            tiempos.append((time.perf_counter() - inicio) * 1e6 / len(corpus))
+        tiempos.sort()
+        return {
+            'mediana': statistics.median(tiempos),
+            'p95': tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))],
+        }
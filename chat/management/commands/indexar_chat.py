@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from chat.search_index import IndiceBM25, SegmentoDisco, reiniciar_indice
+import time
+
+
+class Command(BaseCommand):
+    help = ('Construye el índice BM25 del chat desde la base de datos y lo guarda en disco '
+            '(CHAT_INDICE_RUTA) para que los procesos lo abran con mmap al arrancar.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ruta', help='Archivo de destino (por defecto CHAT_INDICE_RUTA)')
+        parser.add_argument('--consulta', action='append', dest='consultas',
+                            help='Consulta de prueba para medir la búsqueda (se puede repetir)')
+
+    def handle(self, *args, **options):
+        ruta = options['ruta'] or getattr(settings, 'CHAT_INDICE_RUTA', None)
+        if not ruta:
+            raise CommandError('Indica --ruta o configura CHAT_INDICE_RUTA.')
+
+        inicio = time.perf_counter()
+        indice = IndiceBM25.construir_desde_bd()
+        indice.guardar(ruta)
+        duracion = time.perf_counter() - inicio
+
+        conteos = ', '.join(f"{tipo}: {n}" for tipo, n in sorted(indice.conteos().items()))
+        self.stdout.write(f"Índice guardado en {ruta} en {duracion:.2f}s ({conteos or 'vacío'})")
+
+        # El índice del proceso se vuelve a abrir desde el archivo nuevo
+        reiniciar_indice()
+
+        if options['consultas']:
+            guardado = IndiceBM25(SegmentoDisco(ruta))
+            for consulta in options['consultas']:
+                inicio = time.perf_counter()
+                resultados = guardado.buscar(consulta, k=5)
+                ms = (time.perf_counter() - inicio) * 1000
+                self.stdout.write(f"  '{consulta}': {len(resultados)} resultados en {ms:.3f}ms")
+                for tipo, objeto_id, puntaje in resultados:
+                    self.stdout.write(f"    {tipo} #{objeto_id}  {puntaje:.3f}")
+
+        self.stdout.write(self.style.SUCCESS('Indexación completada.'))
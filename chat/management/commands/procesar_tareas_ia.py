@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from chat.job_queue import ColaTareasIA, TrabajadorTareasIA
+from chat.models import TareaIA
+
+
+class Command(BaseCommand):
+    help = ('Trabajador de la cola de tareas del chat: responde las consultas encoladas '
+            'por enviar_mensaje_cola en un pool de hilos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, help='Consultas simultáneas (por defecto CHAT_TAREAS_HILOS)')
+        parser.add_argument('--intervalo', type=float,
+                            help='Segundos entre consultas a la cola cuando está vacía (por defecto CHAT_TAREAS_INTERVALO)')
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Termina cuando no quedan tareas disponibles')
+        parser.add_argument('--reencolar-fallidas', action='store_true',
+                            help='Devuelve a pendientes las tareas fallidas antes de empezar')
+
+    def handle(self, *args, **options):
+        cola = ColaTareasIA()
+        if options['reencolar_fallidas']:
+            self.stdout.write(f"Tareas fallidas reencoladas: {cola.reencolar_fallidas()}")
+
+        trabajador = TrabajadorTareasIA(hilos=options['hilos'], intervalo=options['intervalo'], cola=cola)
+        self.stdout.write(f"Trabajador {trabajador.nombre} con {trabajador.hilos} hilos (Ctrl+C para detener)")
+
+        try:
+            trabajador.ejecutar(una_vez=options['una_vez'])
+        except KeyboardInterrupt:
+            # Se dejan de tomar tareas; el pool espera a que terminen las que están en curso
+            trabajador.detener.set()
+
+        fallidas = TareaIA.objects.filter(estado=TareaIA.FALLIDA).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Completadas: {trabajador.completadas}, con error: {trabajador.errores}, en la cola de descarte: {fallidas}"
+        ))
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from chat.batch_service import LoteConsultasIA, ordenar
+from chat.models import Conversacion
+from seguridad.models import Usuario
+import time
+
+
+class Command(BaseCommand):
+    help = ('Responde un lote de preguntas del chat (una por línea en --archivo o con --pregunta) '
+            'en un pool acotado de hilos y las guarda en una conversación, en orden.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', default='admin')
+        parser.add_argument('--archivo', help='Archivo de texto con una pregunta por línea')
+        parser.add_argument('--pregunta', action='append', dest='preguntas', help='Pregunta (se puede repetir)')
+        parser.add_argument('--conversacion', type=int, help='Conversación existente del usuario (por defecto una nueva)')
+        parser.add_argument('--hilos', type=int, help='Preguntas respondidas a la vez (por defecto CHAT_LOTE_HILOS)')
+        parser.add_argument('--no-guardar', action='store_true', help='No guarda las preguntas ni las respuestas')
+
+    def handle(self, *args, **options):
+        usuario = Usuario.objects.filter(username=options['usuario']).first()
+        if usuario is None:
+            raise CommandError(f"No existe el usuario {options['usuario']}.")
+
+        preguntas = list(options['preguntas'] or [])
+        if options['archivo']:
+            with open(options['archivo'], encoding='utf-8') as archivo:
+                preguntas += [linea.strip() for linea in archivo if linea.strip()]
+        if not preguntas:
+            raise CommandError('No hay preguntas: usa --archivo o --pregunta.')
+
+        if options['conversacion']:
+            conversacion = Conversacion.objects.filter(id=options['conversacion'], usuario=usuario).first()
+            if conversacion is None:
+                raise CommandError(f"El usuario no tiene la conversación {options['conversacion']}.")
+        else:
+            conversacion = Conversacion.objects.create(usuario=usuario, titulo=f"Lote: {preguntas[0]}"[:50])
+
+        lote = LoteConsultasIA(usuario, conversacion, hilos=options['hilos'])
+        self.stdout.write(f"{len(preguntas)} preguntas, {lote.hilos} hilos, conversación {conversacion.id}\n")
+
+        # A medida que terminan
+        inicio = time.perf_counter()
+        resultados = []
+        for resultado in lote.responder(preguntas):
+            resultados.append(resultado)
+            estado = 'error' if resultado['error'] else f"{resultado['tiempo_respuesta']:.2f}s"
+            self.stdout.write(
+                f"[{len(resultados)}/{len(preguntas)}] #{resultado['indice'] + 1} {estado:>7}  {resultado['pregunta'][:60]}"
+            )
+        duracion = time.perf_counter() - inicio
+
+        # En el orden de las preguntas
+        self.stdout.write('')
+        for resultado in ordenar(resultados):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{resultado['indice'] + 1}. {resultado['pregunta']}"))
+            if resultado['error']:
+                self.stdout.write(self.style.ERROR(resultado['error']))
+            else:
+                self.stdout.write(resultado['respuesta'])
+            self.stdout.write('')
+
+        if not options['no_guardar']:
+            lote.guardar(resultados)
+
+        errores = sum(1 for resultado in resultados if resultado['error'])
+        mas_lenta = max(resultado['tiempo_respuesta'] for resultado in resultados)
+        self.stdout.write(self.style.SUCCESS(
+            f"Lote completado en {duracion:.2f}s (pregunta más lenta {mas_lenta:.2f}s), "
+            f"{errores} con error, {lote.db_service.reutilizadas} búsquedas compartidas."
+        ))
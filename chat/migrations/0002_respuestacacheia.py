@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaCacheIA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aciertos', models.PositiveIntegerField(default=0)),
+                ('fallos', models.PositiveIntegerField(default=0)),
+                ('invalidaciones', models.PositiveIntegerField(default=0)),
+                ('segundos_ahorrados', models.FloatField(default=0.0)),
+                ('tokens_ahorrados', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Estadística de caché IA',
+                'verbose_name_plural': 'Estadísticas de caché IA',
+            },
+        ),
+        migrations.CreateModel(
+            name='RespuestaCacheIA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('consulta_normalizada', models.TextField()),
+                ('modelo', models.CharField(max_length=50)),
+                ('temperatura', models.FloatField()),
+                ('respuesta', models.TextField()),
+                ('tiempo_generacion', models.FloatField(default=0.0)),
+                ('tokens_usados', models.IntegerField(blank=True, null=True)),
+                ('aciertos', models.PositiveIntegerField(default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('ultimo_acceso', models.DateTimeField(db_index=True)),
+                ('expira_en', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Respuesta en caché',
+                'verbose_name_plural': 'Respuestas en caché',
+            },
+        ),
+    ]
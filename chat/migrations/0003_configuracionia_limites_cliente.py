@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_respuestacacheia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuracionia',
+            name='max_concurrentes',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='configuracionia',
+            name='max_reintentos',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='configuracionia',
+            name='solicitudes_por_segundo',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='configuracionia',
+            name='timeout',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
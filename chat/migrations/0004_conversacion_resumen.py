@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_configuracionia_limites_cliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversacion',
+            name='resumen',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='resumen_hasta',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
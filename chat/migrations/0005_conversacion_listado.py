@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:04
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+
+
+def calcular_listado(apps, schema_editor):
+    """Completa el contador y la vista previa de las conversaciones existentes"""
+    Conversacion = apps.get_model('chat', 'Conversacion')
+    Mensaje = apps.get_model('chat', 'Mensaje')
+
+    mensajes = Mensaje.objects.filter(conversacion=OuterRef('pk'))
+    # Sin mensajes las subconsultas devuelven NULL
+    Conversacion.objects.update(
+        cantidad_mensajes=Coalesce(Subquery(
+            mensajes.order_by().values('conversacion').annotate(total=Count('id')).values('total')[:1]
+        ), 0),
+        ultimo_mensaje=Coalesce(
+            Substr(Subquery(mensajes.order_by('-fecha_envio', '-id').values('contenido')[:1]), 1, 200), Value('')
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_conversacion_resumen'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversacion',
+            name='cantidad_mensajes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='ultimo_mensaje',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='conversacion',
+            index=models.Index(fields=['usuario', 'activa', '-fecha_actualizacion', '-id'], name='chat_conv_usuario_recientes'),
+        ),
+        migrations.RunPython(calcular_listado, migrations.RunPython.noop),
+    ]
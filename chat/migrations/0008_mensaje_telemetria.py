@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_tareaia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mensaje',
+            name='telemetria',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
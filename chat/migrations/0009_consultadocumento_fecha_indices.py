@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actores', '0003_abogado_creado_por_abogado_modificado_por_and_more'),
+        ('casos', '0003_eventoexpediente'),
+        ('chat', '0008_mensaje_telemetria'),
+        ('documentos', '0003_remove_versiondocumento_documentos__usuario_2c01d2_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultadocumento',
+            name='fecha',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='consultadocumento',
+            index=models.Index(fields=['fecha', 'documento'], name='chat_consulta_fecha_doc'),
+        ),
+        migrations.AddIndex(
+            model_name='consultadocumento',
+            index=models.Index(fields=['fecha', 'caso'], name='chat_consulta_fecha_caso'),
+        ),
+        migrations.AddIndex(
+            model_name='consultadocumento',
+            index=models.Index(fields=['fecha', 'actor'], name='chat_consulta_fecha_actor'),
+        ),
+    ]
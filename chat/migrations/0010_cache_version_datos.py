@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_consultadocumento_fecha_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estadisticacacheia',
+            name='version_datos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='respuestacacheia',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -18,10 +19,23 @@ class Conversacion(models.Model):
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     activa = models.BooleanField(default=True)
     
+    # Resumen acumulado de los mensajes anteriores a los últimos turnos (ver ConversationSummaryService)
+    resumen = models.TextField(blank=True, default='')
+    resumen_hasta = models.BigIntegerField(null=True, blank=True)  # id del último Mensaje incluido en el resumen
+    
+    # Datos del listado, mantenidos por chat.signals al guardar cada Mensaje
+    # (fecha_actualizacion es la fecha de la última actividad)
+    ultimo_mensaje = models.CharField(max_length=200, blank=True, default='')
+    cantidad_mensajes = models.PositiveIntegerField(default=0)
+    
     class Meta:
         ordering = ['-fecha_actualizacion']
         verbose_name = 'Conversación'
         verbose_name_plural = 'Conversaciones'
+        indexes = [
+            # Listado paginado por cursor (fecha_actualizacion, id) de cada usuario
+            models.Index(fields=['usuario', 'activa', '-fecha_actualizacion', '-id'], name='chat_conv_usuario_recientes'),
+        ]
     
     def __str__(self):
         return f"Conversación {self.id} - {self.usuario.username}"
@@ -51,11 +65,17 @@ class Mensaje(models.Model):
     tiempo_respuesta = models.FloatField(null=True, blank=True)  # en segundos
     documentos_consultados = models.JSONField(default=list, blank=True)
     entidades_extraidas = models.JSONField(default=list, blank=True)
+    # Duración por etapa, consultas SQL y tokens de la respuesta (ver chat.telemetry)
+    telemetria = models.JSONField(default=dict, blank=True)
     
     class Meta:
         ordering = ['fecha_envio']
         verbose_name = 'Mensaje'
         verbose_name_plural = 'Mensajes'
+        indexes = [
+            # Historial paginado por cursor (fecha_envio, id) dentro de cada conversación
+            models.Index(fields=['conversacion', 'fecha_envio', 'id'], name='chat_msg_conv_fecha_id'),
+        ]
     
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.contenido[:50]}..."
@@ -88,13 +108,21 @@ class ConsultaDocumento(models.Model):
         null=True,
         blank=True
     )
-    tipo_consulta = models.CharField(max_length=50)  # 'buscar', 'analizar', 'resumir'
+    tipo_consulta = models.CharField(max_length=50)  # 'buscar' (contexto del prompt), 'responder' (motor de reglas)
     resultado = models.TextField(blank=True)
     relevancia = models.FloatField(default=0.0)  # 0-1
+    # Fecha del mensaje, copiada para agrupar por período sin unir con Mensaje
+    fecha = models.DateTimeField(default=timezone.now)
     
     class Meta:
         verbose_name = 'Consulta a Documento'
         verbose_name_plural = 'Consultas a Documentos'
+        indexes = [
+            # Rankings por período (chat.consultation_stats): rango de fecha agrupando por objeto
+            models.Index(fields=['fecha', 'documento'], name='chat_consulta_fecha_doc'),
+            models.Index(fields=['fecha', 'caso'], name='chat_consulta_fecha_caso'),
+            models.Index(fields=['fecha', 'actor'], name='chat_consulta_fecha_actor'),
+        ]
     
     def __str__(self):
         return f"Consulta {self.tipo_consulta} - {self.mensaje.contenido[:30]}..."
@@ -114,6 +142,13 @@ class ConfiguracionIA(models.Model):
                 "Siempre responde en español y de manera profesional."
     )
     activo = models.BooleanField(default=True)
+    
+    # Límites del cliente compartido de OpenAI (vacío = usar los de settings)
+    max_concurrentes = models.PositiveIntegerField(null=True, blank=True)
+    solicitudes_por_segundo = models.FloatField(null=True, blank=True)
+    max_reintentos = models.PositiveIntegerField(null=True, blank=True)
+    timeout = models.FloatField(null=True, blank=True)  # en segundos
+    
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     
@@ -122,4 +157,101 @@ class ConfiguracionIA(models.Model):
         verbose_name_plural = 'Configuraciones IA'
     
     def __str__(self):
-        return f"Configuración: {self.nombre}"
\ No newline at end of file
+        return f"Configuración: {self.nombre}"
+
+
+class RespuestaCacheIA(models.Model):
+    """
+    Respuestas de OpenAI reutilizables, indexadas por consulta normalizada,
+    huella del contexto de la base de datos y configuración del modelo
+    """
+    clave = models.CharField(max_length=64, unique=True)  # sha256
+    version = models.PositiveIntegerField(default=0)  # EstadisticaCacheIA.version_datos al guardarla
+    consulta_normalizada = models.TextField()
+    modelo = models.CharField(max_length=50)
+    temperatura = models.FloatField()
+    respuesta = models.TextField()
+
+    # Costo original de la respuesta (para calcular lo ahorrado)
+    tiempo_generacion = models.FloatField(default=0.0)  # en segundos
+    tokens_usados = models.IntegerField(null=True, blank=True)
+
+    aciertos = models.PositiveIntegerField(default=0)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    ultimo_acceso = models.DateTimeField(db_index=True)
+    expira_en = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Respuesta en caché'
+        verbose_name_plural = 'Respuestas en caché'
+
+    def __str__(self):
+        return f"Caché {self.clave[:10]} - {self.consulta_normalizada[:40]}"
+
+
+class EstadisticaCacheIA(models.Model):
+    """
+    Contadores globales (fila única) de la caché de respuestas y versión de
+    los datos de la que dependen las entradas
+    """
+    version_datos = models.PositiveIntegerField(default=0)
+    aciertos = models.PositiveIntegerField(default=0)
+    fallos = models.PositiveIntegerField(default=0)
+    invalidaciones = models.PositiveIntegerField(default=0)
+    segundos_ahorrados = models.FloatField(default=0.0)
+    tokens_ahorrados = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Estadística de caché IA'
+        verbose_name_plural = 'Estadísticas de caché IA'
+
+    def __str__(self):
+        return f"Caché IA: {self.aciertos} aciertos / {self.fallos} fallos"
+
+
+class TareaIA(models.Model):
+    """
+    Consulta del chat pendiente de responder por el trabajador en segundo plano
+    (comando procesar_tareas_ia). Las que agotan sus intentos quedan como
+    fallidas (cola de descarte) hasta que se reencolan.
+    """
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    COMPLETADA = 'completada'
+    FALLIDA = 'fallida'
+    ESTADO_CHOICES = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_CURSO, 'En curso'),
+        (COMPLETADA, 'Completada'),
+        (FALLIDA, 'Fallida'),
+    ]
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tareas_ia')
+    conversacion = models.ForeignKey(Conversacion, on_delete=models.CASCADE, related_name='tareas_ia')
+    mensaje_usuario = models.ForeignKey(Mensaje, on_delete=models.CASCADE, related_name='tareas_ia')
+    mensaje_respuesta = models.ForeignKey(
+        Mensaje, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    consulta = models.TextField()
+
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default=PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=3)
+    disponible_en = models.DateTimeField()  # no se ejecuta antes (espera entre reintentos)
+    bloqueada_hasta = models.DateTimeField(null=True, blank=True)  # plazo del trabajador que la tomó
+    trabajador = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Tarea IA'
+        verbose_name_plural = 'Tareas IA'
+        indexes = [
+            models.Index(fields=['estado', 'disponible_en'], name='chat_tarea_estado_disp'),
+        ]
+
+    def __str__(self):
+        return f"Tarea {self.id} ({self.estado}) - {self.consulta[:40]}"
@@ -0,0 +1,308 @@
+"""
+Cliente de OpenAI compartido por proceso: conexiones HTTP keep-alive, límite de
+solicitudes simultáneas, limitador de tasa (token bucket) y reintentos con backoff
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+from typing import Any, Dict
+
+import httpx
+import openai
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+
+
+# Errores que se reintentan: 429, 5xx y fallos de conexión/timeout
+ERRORES_REINTENTABLES = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+class TokenBucket:
+    """
+    Limitador de tasa: `tasa` solicitudes por segundo con ráfagas de hasta `capacidad`
+    """
+
+    def __init__(self, tasa: float, capacidad: float):
+        self.tasa = tasa
+        self.capacidad = max(1.0, capacidad)
+        self.tokens = self.capacidad
+        self.ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self) -> float:
+        """Toma un token y devuelve los segundos que hay que esperar para usarlo"""
+        if not self.tasa:
+            return 0.0
+        with self._lock:
+            ahora = time.monotonic()
+            self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+            self.ultimo = ahora
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.tasa
+
+    def adquirir(self):
+        espera = self.reservar()
+        if espera:
+            time.sleep(espera)
+
+    async def aadquirir(self):
+        espera = self.reservar()
+        if espera:
+            await asyncio.sleep(espera)
+
+
+def cargar_configuracion() -> Dict[str, Any]:
+    """
+    Parámetros del pool (y tokens de respuesta) desde settings; la ConfiguracionIA
+    activa puede sobrescribirlos
+    """
+    config = {
+        'api_key': getattr(settings, 'OPENAI_API_KEY', None),
+        'base_url': getattr(settings, 'OPENAI_BASE_URL', None),
+        'max_concurrentes': int(getattr(settings, 'OPENAI_MAX_CONCURRENTES', 8)),
+        'solicitudes_por_segundo': float(getattr(settings, 'OPENAI_SOLICITUDES_POR_SEGUNDO', 5.0)),
+        'rafaga': float(getattr(settings, 'OPENAI_RAFAGA', 10)),
+        'max_reintentos': int(getattr(settings, 'OPENAI_MAX_REINTENTOS', 3)),
+        'backoff_base': float(getattr(settings, 'OPENAI_BACKOFF_BASE', 0.5)),
+        'backoff_max': float(getattr(settings, 'OPENAI_BACKOFF_MAX', 8.0)),
+        'timeout': float(getattr(settings, 'OPENAI_TIMEOUT', 60.0)),
+        'conexiones_keepalive': int(getattr(settings, 'OPENAI_CONEXIONES_KEEPALIVE', 10)),
+        'max_tokens': int(getattr(settings, 'OPENAI_MAX_TOKENS', 1000)),
+    }
+
+    from .models import ConfiguracionIA
+    try:
+        activa = ConfiguracionIA.objects.filter(activo=True).order_by('-fecha_actualizacion').first()
+    except DatabaseError:
+        activa = None
+
+    if activa:
+        for campo in ('max_concurrentes', 'solicitudes_por_segundo', 'max_reintentos', 'timeout', 'max_tokens'):
+            valor = getattr(activa, campo)
+            if valor is not None:
+                config[campo] = valor
+    return config
+
+
+class PoliticaSolicitudes:
+    """
+    Aplica el límite de concurrencia, la tasa y los reintentos a cada llamada
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.max_concurrentes = max(1, config['max_concurrentes'])
+        self.max_reintentos = config['max_reintentos']
+        self.backoff_base = config['backoff_base']
+        self.backoff_max = config['backoff_max']
+        self.semaforo = threading.BoundedSemaphore(self.max_concurrentes)
+        self.bucket = TokenBucket(config['solicitudes_por_segundo'], config['rafaga'])
+        self._semaforos_async = weakref.WeakKeyDictionary()
+
+    def ejecutar(self, llamada, stream: bool = False):
+        """
+        Ejecuta la llamada ocupando un cupo. En modo stream el cupo se libera
+        cuando el stream termina o se cierra.
+        """
+        self.semaforo.acquire()
+        try:
+            resultado = self._con_reintentos(llamada)
+        except BaseException:
+            self.semaforo.release()
+            raise
+
+        if stream:
+            return StreamLimitado(resultado, self.semaforo.release)
+        self.semaforo.release()
+        return resultado
+
+    async def aejecutar(self, llamada):
+        """Versión asíncrona de ejecutar (sin stream)"""
+        async with self._semaforo_async():
+            for intento in range(self.max_reintentos + 1):
+                await self.bucket.aadquirir()
+                try:
+                    return await llamada()
+                except ERRORES_REINTENTABLES as e:
+                    if intento >= self.max_reintentos:
+                        raise
+                    await asyncio.sleep(self._espera(intento, e))
+
+    def _con_reintentos(self, llamada):
+        for intento in range(self.max_reintentos + 1):
+            self.bucket.adquirir()
+            try:
+                return llamada()
+            except ERRORES_REINTENTABLES as e:
+                if intento >= self.max_reintentos:
+                    raise
+                time.sleep(self._espera(intento, e))
+
+    def _espera(self, intento: int, error: Exception) -> float:
+        """Backoff exponencial con jitter; respeta Retry-After si el servidor lo envía"""
+        respuesta = getattr(error, 'response', None)
+        if respuesta is not None:
+            try:
+                return min(self.backoff_max, float(respuesta.headers.get('retry-after')))
+            except (TypeError, ValueError):
+                pass
+        espera = min(self.backoff_max, self.backoff_base * (2 ** intento))
+        return espera * random.uniform(0.5, 1.0)
+
+    def _semaforo_async(self) -> asyncio.Semaphore:
+        """Un semáforo por event loop (asyncio.Semaphore no se comparte entre loops)"""
+        loop = asyncio.get_running_loop()
+        semaforo = self._semaforos_async.get(loop)
+        if semaforo is None:
+            semaforo = self._semaforos_async[loop] = asyncio.Semaphore(self.max_concurrentes)
+        return semaforo
+
+
+class StreamLimitado:
+    """
+    Envuelve el Stream de openai para liberar el cupo al terminar o al cerrarse
+    """
+
+    def __init__(self, stream, liberar):
+        self.stream = stream
+        self._liberar = liberar
+        self._liberado = False
+
+    def __iter__(self):
+        try:
+            yield from self.stream
+        finally:
+            self._soltar()
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self._soltar()
+
+    def _soltar(self):
+        if not self._liberado:
+            self._liberado = True
+            self._liberar()
+
+
+class _CompletionsLimitadas:
+
+    def __init__(self, completions, politica):
+        self.completions = completions
+        self.politica = politica
+
+    def create(self, **kwargs):
+        return self.politica.ejecutar(lambda: self.completions.create(**kwargs), stream=kwargs.get('stream', False))
+
+
+class _CompletionsLimitadasAsync(_CompletionsLimitadas):
+
+    async def create(self, **kwargs):
+        return await self.politica.aejecutar(lambda: self.completions.create(**kwargs))
+
+
+class _ChatLimitado:
+
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class ClienteOpenAILimitado:
+    """
+    Expone chat.completions.create igual que openai.OpenAI, aplicando la política
+    """
+
+    def __init__(self, cliente, politica, asincrono: bool = False):
+        self.cliente = cliente
+        clase = _CompletionsLimitadasAsync if asincrono else _CompletionsLimitadas
+        self.chat = _ChatLimitado(clase(cliente.chat.completions, politica))
+
+
+class PoolOpenAI:
+    """
+    Clientes de OpenAI del proceso. El síncrono se comparte entre hilos; el
+    asíncrono se crea uno por event loop (las conexiones httpx dependen del loop).
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = config or cargar_configuracion()
+        self.politica = PoliticaSolicitudes(self.config)
+        self._cliente = None
+        self._clientes_async = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def cliente(self) -> ClienteOpenAILimitado:
+        if self._cliente is None:
+            with self._lock:
+                if self._cliente is None:
+                    http_client = httpx.Client(limits=self._limites(), timeout=self.config['timeout'])
+                    self._cliente = ClienteOpenAILimitado(
+                        openai.OpenAI(http_client=http_client, **self._opciones()), self.politica
+                    )
+        return self._cliente
+
+    def cliente_async(self) -> ClienteOpenAILimitado:
+        loop = asyncio.get_running_loop()
+        cliente = self._clientes_async.get(loop)
+        if cliente is None:
+            http_client = httpx.AsyncClient(limits=self._limites(), timeout=self.config['timeout'])
+            cliente = self._clientes_async[loop] = ClienteOpenAILimitado(
+                openai.AsyncOpenAI(http_client=http_client, **self._opciones()), self.politica, asincrono=True
+            )
+        return cliente
+
+    def _opciones(self) -> Dict[str, Any]:
+        # Los reintentos los hace la política; el SDK no debe reintentar por su cuenta
+        return {
+            'api_key': self.config['api_key'],
+            'base_url': self.config['base_url'],
+            'max_retries': 0,
+        }
+
+    def _limites(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=max(self.config['max_concurrentes'], self.config['conexiones_keepalive']),
+            max_keepalive_connections=self.config['conexiones_keepalive'],
+        )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def obtener_pool() -> PoolOpenAI:
+    """Pool del proceso, creado la primera vez que se usa"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolOpenAI()
+    return _pool
+
+
+async def aobtener_pool() -> PoolOpenAI:
+    """obtener_pool para código async: si hay que crearlo, la configuración (ORM) se lee en un hilo"""
+    pool = _pool
+    if pool is None:
+        pool = await sync_to_async(obtener_pool)()
+    return pool
+
+
+def obtener_cliente_openai() -> ClienteOpenAILimitado:
+    return obtener_pool().cliente
+
+
+def obtener_cliente_openai_async() -> ClienteOpenAILimitado:
+    """Debe llamarse dentro de un event loop"""
+    return obtener_pool().cliente_async()
+
+
+def reiniciar_pool():
+    """Descarta el pool para que se vuelva a crear con la configuración actual"""
+    global _pool
+    with _pool_lock:
+        _pool = None
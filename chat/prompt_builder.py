@@ -0,0 +1,164 @@
+"""
+Armado del prompt para OpenAI dentro de un presupuesto de tokens: el contexto
+entra por relevancia y el historial desde el mensaje más reciente, hasta llenar
+lo que deja libre la ventana del modelo después de reservar la respuesta.
+"""
+from typing import Any, Dict, List
+
+from django.conf import settings
+
+try:
+    import tiktoken
+except ImportError:  # dependencia opcional: sin ella se estima por caracteres
+    tiktoken = None
+
+
+# Ventana de contexto (tokens) por modelo, buscada por prefijo: los más específicos primero
+VENTANAS_MODELO = (
+    ('gpt-4.1', 1047576),
+    ('gpt-4o', 128000),
+    ('gpt-4-turbo', 128000),
+    ('gpt-4-32k', 32768),
+    ('gpt-4', 8192),
+    ('gpt-3.5-turbo-instruct', 4096),
+    ('gpt-3.5-turbo', 16385),
+)
+VENTANA_POR_DEFECTO = 8192
+
+CARACTERES_POR_TOKEN = 4
+TOKENS_POR_MENSAJE = 4  # formato de cada mensaje del chat (rol y separadores)
+TOKENS_RESPUESTA = 3    # cebado de la respuesta del asistente
+MARGEN_SEGURIDAD = 64   # la estimación sin tiktoken no es exacta
+
+ENCABEZADO_CONTEXTO = "\n\nInformación encontrada en la base de datos:\n"
+ENCABEZADO_RESUMEN = "Resumen de la conversación hasta ahora:\n"
+
+
+def ventana_modelo(modelo: str) -> int:
+    """Tamaño de la ventana de contexto del modelo"""
+    for prefijo, ventana in VENTANAS_MODELO:
+        if modelo.startswith(prefijo):
+            return ventana
+    return VENTANA_POR_DEFECTO
+
+
+def truncar(texto: str, max_caracteres: int) -> str:
+    """Recorta el texto en el último espacio antes del límite y agrega '…'"""
+    texto = ' '.join((texto or '').split())
+    if len(texto) <= max_caracteres:
+        return texto
+    corte = texto.rfind(' ', 0, max_caracteres + 1)
+    return texto[:corte if corte > 0 else max_caracteres].rstrip(' ,;:.') + '…'
+
+
+class ContadorTokens:
+    """
+    Cuenta tokens con tiktoken si está instalado; si no, estima ~4 caracteres por token
+    """
+
+    def __init__(self, modelo: str):
+        self.codificador = None
+        if tiktoken is not None:
+            try:
+                self.codificador = tiktoken.encoding_for_model(modelo)
+            except KeyError:
+                self.codificador = tiktoken.get_encoding('cl100k_base')
+
+    def contar(self, texto: str) -> int:
+        if not texto:
+            return 0
+        if self.codificador is not None:
+            return len(self.codificador.encode(texto))
+        return -(-len(texto) // CARACTERES_POR_TOKEN)
+
+    def contar_mensaje(self, mensaje: Dict[str, str]) -> int:
+        return TOKENS_POR_MENSAJE + self.contar(mensaje['content'])
+
+
+class PromptBuilder:
+    """
+    Arma los mensajes (sistema + historial + consulta con contexto) sin pasar del
+    presupuesto. El sistema, el resumen y la consulta siempre entran; el historial ocupa como
+    máximo una fracción del resto y los fragmentos de contexto se eligen por
+    relevancia con lo que queda.
+    """
+
+    def __init__(self, modelo: str, max_tokens_respuesta: int, presupuesto: int = None):
+        self.contador = ContadorTokens(modelo)
+        disponible = ventana_modelo(modelo) - max_tokens_respuesta - MARGEN_SEGURIDAD
+        if presupuesto is None:
+            presupuesto = int(getattr(settings, 'CHAT_PROMPT_MAX_TOKENS', 3000))
+        self.presupuesto = max(0, min(disponible, presupuesto) if presupuesto else disponible)
+        self.fraccion_historial = float(getattr(settings, 'CHAT_PROMPT_FRACCION_HISTORIAL', 0.3))
+
+    def contar(self, texto: str) -> int:
+        return self.contador.contar(texto)
+
+    def construir(self, sistema: str, consulta: str, secciones: List[Dict[str, Any]],
+                  historial: List[Dict[str, str]] = None, resumen: str = None) -> Dict[str, Any]:
+        """
+        `secciones` es una lista de {'titulo', 'fragmentos': [{'texto', 'relevancia'}]}
+        en el orden en que se muestran; el `resumen` de la conversación (ya acotado)
+        entra siempre. Devuelve los mensajes, el texto del contexto incluido, los
+        tokens del prompt y cuántos fragmentos/mensajes quedaron fuera.
+        """
+        historial = historial or []
+        fijos = [{"role": "system", "content": sistema}]
+        if resumen:
+            fijos.append({"role": "system", "content": f"{ENCABEZADO_RESUMEN}{resumen}"})
+        usados = TOKENS_RESPUESTA + sum(self.contador.contar_mensaje(m) for m in fijos)
+        usados += self.contador.contar_mensaje({'content': consulta + ENCABEZADO_CONTEXTO})
+        restante = max(0, self.presupuesto - usados)
+
+        # Historial: del más reciente al más antiguo, hasta su fracción del presupuesto
+        cupo_historial = int(restante * self.fraccion_historial)
+        incluidos = []
+        for mensaje in reversed(historial):
+            costo = self.contador.contar_mensaje(mensaje)
+            if costo > cupo_historial:
+                break
+            cupo_historial -= costo
+            restante -= costo
+            incluidos.append(mensaje)
+        incluidos.reverse()
+
+        # Contexto: los fragmentos más relevantes primero; el título de la sección
+        # se cobra con su primer fragmento
+        candidatos = [
+            (fragmento['relevancia'], i, j)
+            for i, seccion in enumerate(secciones)
+            for j, fragmento in enumerate(seccion['fragmentos'])
+        ]
+        candidatos.sort(key=lambda c: (-c[0], c[1], c[2]))
+
+        elegidos = set()
+        secciones_abiertas = set()
+        for _, i, j in candidatos:
+            costo = self.contar(secciones[i]['fragmentos'][j]['texto'])
+            if i not in secciones_abiertas:
+                costo += self.contar(secciones[i]['titulo'] + '\n') + 1
+            if costo > restante:
+                continue
+            restante -= costo
+            secciones_abiertas.add(i)
+            elegidos.add((i, j))
+
+        contexto = ''
+        for i, seccion in enumerate(secciones):
+            if i not in secciones_abiertas:
+                continue
+            contexto += seccion['titulo'] + '\n'
+            contexto += ''.join(
+                fragmento['texto'] for j, fragmento in enumerate(seccion['fragmentos']) if (i, j) in elegidos
+            )
+            contexto += '\n'
+
+        mensajes = fijos + incluidos + [
+            {"role": "user", "content": f"{consulta}{ENCABEZADO_CONTEXTO}{contexto}"}
+        ]
+        return {
+            'mensajes': mensajes,
+            'contexto': contexto,
+            'tokens_prompt': TOKENS_RESPUESTA + sum(self.contador.contar_mensaje(m) for m in mensajes),
+            'omitidos': len(candidatos) - len(elegidos) + len(historial) - len(incluidos),
+        }
@@ -0,0 +1,309 @@
+"""
+Router de intención y entidades del chat. Todas las palabras clave que antes se
+buscaban por separado (analizar_consulta, _es_consulta_personal/_estadistica/
+_especifica, el mapeo de tipos de caso y las reglas del motor) se compilan al
+importar el módulo en un autómata por palabras (un trie de frases al estilo
+Aho-Corasick), que recorre la consulta una vez y devuelve intención, entidades,
+números de caso, CI, estado y tipo de caso. El análisis se calcula una vez por
+mensaje y se pasa a AsistenteIAService, DatabaseQueryService y MotorRespuestas.
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .response_cache import normalizar_consulta
+
+
+# === VOCABULARIO ===
+# Todo sin tildes (se compara contra normalizar_consulta). Cada palabra admite
+# su plural ("caso" -> "casos", "rol" -> "roles").
+
+PALABRAS_PERSONALES = (
+    'mis', 'mi', 'he creado', 'he hecho', 'he enviado', 'he recibido',
+    'me han asignado', 'me han dado', 'tengo', 'soy', 'estoy',
+    'asignado a mi', 'relacionado conmigo', 'que me pertenece',
+)
+PALABRAS_ESTADISTICAS = (
+    'cuanto', 'cuanta', 'cantidad', 'total', 'numero', 'estadistica', 'resumen',
+    'listar', 'mostrar todos', 'todos los', 'todas las',
+)
+PALABRAS_ESPECIFICAS = (
+    'cual', 'que', 'donde', 'cuando', 'especialidad', 'tipo', 'estado', 'fecha', 'nombre',
+)
+# Pedidos de análisis o redacción: aunque nombren un caso o un actor, los responde el modelo.
+# Son raíces: "explica" reconoce también "explicacion" y "resume", "resumen".
+RAICES_ABIERTAS = (
+    'por que', 'porque', 'explica', 'explicame', 'analiza', 'analisis', 'riesgo',
+    'recomienda', 'recomendacion', 'sugiere', 'redacta', 'escribe', 'resume', 'opinas',
+    'deberia', 'debo', 'conviene', 'estrategia', 'compara', 'diferencia', 'significa',
+)
+# "como" solo como palabra completa ("comodato" no es una pregunta abierta)
+PALABRAS_ABIERTAS = ('como',)
+PALABRAS_ACTOR = ('abogado', 'abogada', 'cliente', 'asistente', 'actor', 'persona')
+ENTIDADES = ('contrato', 'factura', 'abogado', 'cliente')
+TIPOS_CONSULTA = (
+    ('documento', ('documento', 'contrato', 'factura', 'escritura', 'certificado')),
+    ('actor', ('abogado', 'cliente', 'asistente', 'persona')),
+    ('caso', ('caso', 'expediente', 'proceso', 'demanda')),
+)
+# Entidades que cuentan las estadísticas (StatisticsService)
+MENCIONES = {
+    'casos': ('caso',),
+    'documentos': ('documento',),
+    'actores': ('actor', 'abogado', 'cliente', 'asistente'),
+    'usuarios': ('usuario', 'rol'),
+}
+# Lo que _buscar_informacion_personal sabe listar, en orden de prioridad
+LISTADOS_PERSONALES = (
+    ('documentos', ('documento', 'creado')),
+    ('casos', ('caso', 'asignado')),
+    ('perfil', ('actor', 'perfil', 'informacion', 'dato')),
+)
+ESTADOS_CASO = {'abierto': 'ABIERTO', 'cerrado': 'CERRADO'}
+# Palabra de la consulta -> tipo de caso guardado en Caso.tipoCaso
+SINONIMOS_TIPO_CASO = {
+    'divorcio': 'Divorcio',
+    'robo': 'Robo',
+    'despido': 'Despido Injustificado',
+    'sociedad': 'Sociedad Comercial',
+    'incumplimiento': 'Incumplimiento Contractual',
+    'pension': 'Pensión Alimenticia',
+    'horas': 'Horas Extras',
+    'sucesion': 'Sucesión',
+    'danos': 'Daños y Perjuicios',
+    'amparo': 'Recurso de Amparo',
+}
+# Palabras que no forman parte de un nombre al buscar actores
+PALABRAS_VACIAS = {
+    'el', 'la', 'los', 'las', 'de', 'del', 'al', 'a', 'un', 'una', 'y', 'o', 'en', 'con', 'por',
+    'para', 'sobre', 'que', 'quien', 'cual', 'es', 'son', 'informacion', 'datos', 'dame', 'busca',
+    'buscar', 'muestra', 'mostrar', 'ver', 'quiero', 'necesito', 'telefono', 'email', 'correo',
+    'ci', 'especialidad', 'tipo', 'estado', 'abogados', 'clientes', 'asistentes', 'actores', 'llamado',
+    'llamada', 'se', 'llama', 'hola', 'favor', 'me', 'puedes', 'podrias',
+} | set(PALABRAS_ACTOR)
+
+# Relleno de una pregunta (artículos, verbos de pedido...): no cambian lo que se pide.
+# Lo demás que quede tras quitar lo que una regla entiende son calificadores para el modelo
+PALABRAS_RELLENO = frozenset({
+    'el', 'la', 'los', 'las', 'lo', 'de', 'del', 'al', 'a', 'un', 'una', 'y', 'e', 'o', 'en', 'con',
+    'por', 'para', 'sobre', 'que', 'cual', 'quien', 'es', 'son', 'esta', 'estan', 'ser', 'hay', 'existen',
+    'dame', 'da', 'dime', 'busca', 'buscar', 'muestra', 'muestrame', 'mostrar', 'ver', 'quiero', 'necesito',
+    'lista', 'listar', 'listame', 'enumera', 'me', 'puedes', 'podrias', 'favor', 'hola', 'informacion',
+    'dato', 'detalle', 'todo', 'toda', 'tipo', 'se', 'actual', 'actualmente', 'registrado', 'sistema',
+})
+
+# Lo que puede seguir a "por" sin pedir una agrupación ("por favor")
+NO_AGRUPAN = frozenset({'favor', 'que', 'ahora', 'ejemplo'})
+
+# Números de caso (CIV-2024-001) y CI en una sola expresión
+PATRON_IDENTIFICADORES = re.compile(r'\b(?:(?P<numero_caso>[a-z]{2,}-\d{4}-\d+)|(?P<ci>\d{6,}))\b')
+SIN_TILDES = str.maketrans('áéíóúüñ', 'aeiouun')
+MAX_ANALISIS_EN_CACHE = 2048
+
+
+class NodoFrase:
+    """Nodo del trie: una palabra más de la frase; `etiquetas` si aquí termina una frase"""
+    __slots__ = ('hijos', 'etiquetas', 'frase')
+
+    def __init__(self):
+        self.hijos: Dict[str, 'NodoFrase'] = {}
+        self.etiquetas = None
+        self.frase = None
+
+
+def _compilar() -> NodoFrase:
+    """Trie de frases -> etiquetas que activa (intención, entidad, listado, estado, tipo de caso)"""
+    raiz = NodoFrase()
+
+    def agregar(frases: Iterable[str], etiqueta: str):
+        for frase in frases:
+            nodo = raiz
+            for palabra in frase.split():
+                nodo = nodo.hijos.setdefault(palabra, NodoFrase())
+            nodo.etiquetas = (nodo.etiquetas or frozenset()) | {etiqueta}
+            nodo.frase = frase
+
+    agregar(PALABRAS_PERSONALES, 'personal')
+    agregar(PALABRAS_ESTADISTICAS, 'estadistica')
+    agregar(PALABRAS_ESPECIFICAS, 'especifica')
+    agregar(PALABRAS_ABIERTAS, 'abierta')
+    agregar((frase for frase in RAICES_ABIERTAS if ' ' in frase), 'abierta')
+    agregar(PALABRAS_ACTOR, 'actor')
+    for entidad in ENTIDADES:
+        agregar((entidad,), f'entidad:{entidad}')
+    for tipo, palabras in TIPOS_CONSULTA:
+        agregar(palabras, f'tipo:{tipo}')
+    for entidad, palabras in MENCIONES.items():
+        agregar(palabras, f'menciona:{entidad}')
+    for listado, palabras in LISTADOS_PERSONALES:
+        agregar(palabras, f'listado:{listado}')
+    for palabra, estado in ESTADOS_CASO.items():
+        agregar((palabra,), f'estado:{estado}')
+    for palabra, tipo_real in SINONIMOS_TIPO_CASO.items():
+        agregar((palabra,), f'tipo_caso:{tipo_real}')
+    return raiz
+
+
+TRIE = _compilar()
+# (etiqueta, valor) en el orden de prioridad de cada campo del análisis
+_ETIQUETAS_TIPO = tuple((f'tipo:{tipo}', tipo) for tipo, _ in TIPOS_CONSULTA)
+_ETIQUETAS_ENTIDAD = tuple((f'entidad:{entidad}', entidad) for entidad in ENTIDADES)
+_ETIQUETAS_MENCION = tuple((f'menciona:{entidad}', entidad) for entidad in MENCIONES)
+_ETIQUETAS_LISTADO = tuple((f'listado:{listado}', listado) for listado, _ in LISTADOS_PERSONALES)
+_ETIQUETAS_ESTADO = tuple((f'estado:{estado}', estado) for estado in ESTADOS_CASO.values())
+_ETIQUETAS_TIPO_CASO = tuple(
+    (f'tipo_caso:{tipo}', tipo) for tipo in dict.fromkeys(SINONIMOS_TIPO_CASO.values())
+)
+# Las raíces de una palabra se comparan con str.startswith (una llamada por palabra)
+RAICES_PALABRA = tuple(frase for frase in RAICES_ABIERTAS if ' ' not in frase)
+
+
+def _variantes(palabra: str) -> Tuple[str, ...]:
+    """La palabra y su posible singular ("casos" -> "caso", "roles" -> "rol")"""
+    if palabra.endswith('es'):
+        return (palabra, palabra[:-1], palabra[:-2])
+    if palabra.endswith('s'):
+        return (palabra, palabra[:-1])
+    return (palabra,)
+
+
+# === ANÁLISIS ===
+
+def analizar_consulta(consulta: str) -> Dict[str, Any]:
+    """
+    Análisis estructurado de la consulta. Se guarda en un LRU por texto: las
+    llamadas repetidas durante el mismo mensaje no vuelven a recorrerla.
+    """
+    analisis = _analizar(consulta or '')
+    # Copia para que quien la reciba pueda modificar las listas sin afectar al LRU
+    return {**analisis, 'entidades': list(analisis['entidades'])}
+
+
+@lru_cache(maxsize=MAX_ANALISIS_EN_CACHE)
+def _analizar(consulta: str) -> Dict[str, Any]:
+    return analizar_sin_cache(consulta)
+
+
+def analizar_sin_cache(consulta: str) -> Dict[str, Any]:
+    """Un recorrido del trie sobre las palabras de la consulta normalizada"""
+    normalizada = normalizar_consulta(consulta)
+    palabras = normalizada.split()
+    etiquetas = set()
+    plurales = set()
+
+    variantes = [_variantes(palabra) for palabra in palabras]
+    raices = TRIE.hijos
+
+    for inicio, palabra in enumerate(palabras):
+        if palabra.startswith(RAICES_PALABRA):
+            etiquetas.add('abierta')
+        # La mayoría de las palabras no empieza ninguna frase
+        frontera = [raices[v] for v in variantes[inicio] if v in raices]
+        posicion = inicio
+        # Las frases que empiezan en esta palabra (también las que se solapan con otras)
+        while frontera:
+            siguiente = []
+            for hijo in frontera:
+                if hijo.etiquetas:
+                    etiquetas |= hijo.etiquetas
+                    if hijo.frase != palabras[posicion] and ' ' not in hijo.frase:
+                        plurales.add(hijo.frase)
+                if hijo.hijos and posicion + 1 < len(palabras):
+                    siguiente.extend(hijo.hijos[v] for v in variantes[posicion + 1] if v in hijo.hijos)
+            frontera = siguiente
+            posicion += 1
+
+    numeros_caso, ci = [], []
+    for coincidencia in PATRON_IDENTIFICADORES.finditer(normalizada):
+        if coincidencia.lastgroup == 'numero_caso':
+            numeros_caso.append(coincidencia.group('numero_caso'))
+        else:
+            ci.append(coincidencia.group('ci'))
+
+    return {
+        'tipo': next((tipo for etiqueta, tipo in _ETIQUETAS_TIPO if etiqueta in etiquetas), 'general'),
+        'entidades': [entidad for etiqueta, entidad in _ETIQUETAS_ENTIDAD if etiqueta in etiquetas],
+        'consulta_original': consulta,
+        'normalizada': normalizada,
+        'personal': 'personal' in etiquetas,
+        'estadistica': 'estadistica' in etiquetas,
+        'especifica': 'especifica' in etiquetas,
+        'abierta': 'abierta' in etiquetas,
+        'menciona_actor': 'actor' in etiquetas,
+        'menciones': frozenset(entidad for etiqueta, entidad in _ETIQUETAS_MENCION if etiqueta in etiquetas),
+        'listado_personal': next((listado for etiqueta, listado in _ETIQUETAS_LISTADO if etiqueta in etiquetas), None),
+        'estado_caso': next((estado for etiqueta, estado in _ETIQUETAS_ESTADO if etiqueta in etiquetas), None),
+        'tipos_caso': tuple(tipo for etiqueta, tipo in _ETIQUETAS_TIPO_CASO if etiqueta in etiquetas),
+        'plurales': frozenset(plurales),
+        'numeros_caso': tuple(numeros_caso),
+        'ci': tuple(ci),
+        'nombre': tuple(_partes_nombre(consulta)),
+    }
+
+
+def palabras_sin_cubrir(normalizada: str, cubiertas: Iterable[str]) -> List[str]:
+    """
+    Palabras de la consulta que no son relleno, ni identificadores, ni están en
+    `cubiertas` (lo que una regla sabe responder, en singular y sin tildes).
+    Una agrupación ("por cliente", "por estado") nunca está cubierta, aunque la
+    regla conozca la palabra: ninguna regla desglosa sus resultados
+    """
+    cubiertas = PALABRAS_RELLENO | set(cubiertas)
+    palabras = normalizada.split()
+    sobrantes = []
+    for posicion, palabra in enumerate(palabras):
+        anterior = palabras[posicion - 1] if posicion else None
+        if anterior == 'por' and palabra not in NO_AGRUPAN:
+            sobrantes.append(f'por {palabra}')
+        elif not PATRON_IDENTIFICADORES.fullmatch(palabra) and not any(
+            variante in cubiertas for variante in _variantes(palabra)
+        ):
+            sobrantes.append(palabra)
+    return sobrantes
+
+
+def _partes_nombre(consulta: str) -> List[str]:
+    """Palabras que pueden ser parte de un nombre, como las escribió el usuario (con tildes)"""
+    return [
+        palabra for palabra in re.findall(r'\w+', consulta.lower())
+        if len(palabra) > 2 and not palabra.isdigit() and palabra.translate(SIN_TILDES) not in PALABRAS_VACIAS
+    ]
+
+
+# === TIPOS DE LA BASE DE DATOS ===
+
+def tipos_mencionados(normalizada: str, nombres: Iterable[str], listado: bool = False) -> List[str]:
+    """
+    Nombres (de TipoDocumento o Caso.tipoCaso) que aparecen en la consulta, con
+    una expresión compilada por conjunto de nombres. Con `listado`, solo cuentan
+    si se piden como listado: "tipo X", "documentos (de) X" o el plural de X.
+    """
+    nombres = tuple(nombres)
+    if not nombres:
+        return []
+    expresion, por_nombre = _compilar_tipos(nombres)
+    encontrados = []
+    for coincidencia in expresion.finditer(normalizada):
+        grupo = coincidencia.lastgroup
+        if listado and not (coincidencia.group('prefijo') or grupo.startswith('s')):
+            continue
+        nombre = por_nombre[grupo]
+        if nombre not in encontrados:
+            encontrados.append(nombre)
+    return encontrados
+
+
+@lru_cache(maxsize=32)
+def _compilar_tipos(nombres: Tuple[str, ...]):
+    normalizados = sorted(
+        {normalizar_consulta(nombre): nombre for nombre in nombres if normalizar_consulta(nombre)}.items(),
+        key=lambda par: -len(par[0]),
+    )
+    alternativas = []
+    por_nombre: Dict[str, str] = {}
+    for i, (normalizado, nombre) in enumerate(normalizados):
+        plural = 'es' if normalizado[-1] not in 'aeiou' else 's'
+        alternativas.append(rf'(?P<s{i}>{re.escape(normalizado + plural)})|(?P<n{i}>{re.escape(normalizado)})')
+        por_nombre[f's{i}'] = por_nombre[f'n{i}'] = nombre
+    expresion = re.compile(r'(?P<prefijo>\btipo |\bdocumentos (?:de )?)?\b(?:' + '|'.join(alternativas) + r')\b')
+    return expresion, por_nombre
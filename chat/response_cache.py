@@ -0,0 +1,207 @@
+"""
+Caché persistente de respuestas de OpenAI para el chat
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import RespuestaCacheIA, EstadisticaCacheIA
+
+
+def normalizar_consulta(consulta: str) -> str:
+    """
+    Minúsculas, sin tildes, sin signos de puntuación y con espacios simples
+    """
+    texto = unicodedata.normalize('NFKD', consulta.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'[¿?¡!.,;:"\'()]+', ' ', texto)
+    return ' '.join(texto.split())
+
+
+# Contadores de aciertos/fallos acumulados en el proceso hasta el siguiente volcado
+_pendientes = Counter()
+_pendientes_lock = threading.Lock()
+_ultimo_volcado = time.monotonic()
+
+
+class RespuestaCacheService:
+    """
+    Caché de respuestas con expiración (TTL) y desalojo LRU acotado por tamaño.
+
+    Cuando cambian Caso, Documento o Actor (ver chat.signals) sube la versión de
+    los datos: las entradas de versiones anteriores dejan de coincidir y se
+    desalojan al guardar la siguiente. Los contadores se acumulan en memoria y
+    se vuelcan en un único UPDATE cada CHAT_CACHE_ESTADISTICAS_INTERVALO segundos.
+    """
+
+    def __init__(self):
+        self.activo = getattr(settings, 'CHAT_CACHE_ACTIVO', True)
+        self.ttl = int(getattr(settings, 'CHAT_CACHE_TTL', 3600))
+        self.max_entradas = int(getattr(settings, 'CHAT_CACHE_MAX_ENTRADAS', 1000))
+        self.intervalo_estadisticas = float(getattr(settings, 'CHAT_CACHE_ESTADISTICAS_INTERVALO', 10.0))
+
+    def calcular_clave(self, consulta: str, contexto: str, modelo: str, temperatura: float,
+                       conversacion: List[Dict[str, str]] = None) -> str:
+        """
+        Clave = consulta normalizada + huella del contexto + huella de la
+        conversación incluida en el prompt (resumen e historial) + modelo/temperatura
+        """
+        huella_contexto = hashlib.sha256(contexto.encode('utf-8')).hexdigest()
+        huella_conversacion = hashlib.sha256(
+            json.dumps(conversacion or [], ensure_ascii=False, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        base = '\x1f'.join([
+            normalizar_consulta(consulta), huella_contexto, huella_conversacion, modelo, f"{float(temperatura):.3f}"
+        ])
+        return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+    def obtener(self, clave: str) -> Optional[str]:
+        """
+        Devuelve la respuesta guardada o None, actualizando los contadores
+        """
+        if not self.activo:
+            return None
+
+        ahora = timezone.now()
+        entrada = RespuestaCacheIA.objects.filter(
+            clave=clave, expira_en__gt=ahora, version=_version_actual()
+        ).only(
+            'id', 'respuesta', 'tiempo_generacion', 'tokens_usados'
+        ).first()
+
+        if entrada is None:
+            self._incrementar(fallos=1)
+            return None
+
+        RespuestaCacheIA.objects.filter(id=entrada.id).update(
+            aciertos=F('aciertos') + 1,
+            ultimo_acceso=ahora
+        )
+        self._incrementar(
+            aciertos=1,
+            segundos_ahorrados=entrada.tiempo_generacion,
+            tokens_ahorrados=entrada.tokens_usados or 0
+        )
+        return entrada.respuesta
+
+    def guardar(self, clave: str, consulta: str, modelo: str, temperatura: float, respuesta: str,
+                tiempo_generacion: float = 0.0, tokens_usados: int = None):
+        """
+        Guarda una respuesta y desaloja las entradas menos usadas si se supera el límite
+        """
+        if not self.activo:
+            return
+
+        ahora = timezone.now()
+        version = EstadisticaCacheIA.objects.filter(pk=1).values_list('version_datos', flat=True).first() or 0
+        try:
+            RespuestaCacheIA.objects.update_or_create(
+                clave=clave,
+                defaults={
+                    'version': version,
+                    'consulta_normalizada': normalizar_consulta(consulta),
+                    'modelo': modelo,
+                    'temperatura': float(temperatura),
+                    'respuesta': respuesta,
+                    'tiempo_generacion': tiempo_generacion,
+                    'tokens_usados': tokens_usados,
+                    'ultimo_acceso': ahora,
+                    'expira_en': ahora + timedelta(seconds=self.ttl),
+                }
+            )
+        except IntegrityError:
+            # Otro proceso guardó la misma clave al mismo tiempo
+            return
+
+        self._desalojar(ahora, version)
+
+    def invalidar(self):
+        """
+        Los datos de la base de datos cambiaron: sube la versión (un UPDATE de una
+        fila, en lugar de borrar la tabla); las entradas anteriores ya no coinciden
+        """
+        _actualizar_estadisticas(version_datos=1, invalidaciones=1)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """
+        Contadores de aciertos/fallos y el tiempo y tokens ahorrados
+        """
+        volcar_estadisticas()
+        stats = EstadisticaCacheIA.objects.filter(pk=1).first() or EstadisticaCacheIA()
+        total = stats.aciertos + stats.fallos
+        return {
+            'activo': self.activo,
+            'entradas': RespuestaCacheIA.objects.count(),
+            'max_entradas': self.max_entradas,
+            'ttl_segundos': self.ttl,
+            'aciertos': stats.aciertos,
+            'fallos': stats.fallos,
+            'tasa_aciertos': round(stats.aciertos / total, 4) if total else 0.0,
+            'invalidaciones': stats.invalidaciones,
+            'segundos_ahorrados': round(stats.segundos_ahorrados, 3),
+            'tokens_ahorrados': stats.tokens_ahorrados,
+        }
+
+    def _desalojar(self, ahora, version: int):
+        """Borra las entradas expiradas o de otra versión y las menos recientemente usadas sobre el límite"""
+        RespuestaCacheIA.objects.filter(Q(expira_en__lte=ahora) | ~Q(version=version)).delete()
+
+        sobrantes = RespuestaCacheIA.objects.count() - self.max_entradas
+        if sobrantes > 0:
+            ids = list(
+                RespuestaCacheIA.objects.order_by('ultimo_acceso', 'id').values_list('id', flat=True)[:sobrantes]
+            )
+            RespuestaCacheIA.objects.filter(id__in=ids).delete()
+
+    def _incrementar(self, **contadores):
+        """Acumula los contadores en el proceso; se vuelcan cuando pasa el intervalo"""
+        with _pendientes_lock:
+            _pendientes.update(contadores)
+            if time.monotonic() - _ultimo_volcado < self.intervalo_estadisticas:
+                return
+        volcar_estadisticas()
+
+
+def _version_actual():
+    """Versión vigente de los datos como subconsulta (se resuelve en la misma consulta)"""
+    return Coalesce(Subquery(EstadisticaCacheIA.objects.filter(pk=1).values('version_datos')[:1]), 0)
+
+
+def _actualizar_estadisticas(**incrementos):
+    """Suma los incrementos a la fila única de estadísticas en un UPDATE atómico"""
+    cambios = {campo: F(campo) + valor for campo, valor in incrementos.items() if valor}
+    if not cambios:
+        return
+    if not EstadisticaCacheIA.objects.filter(pk=1).update(**cambios):
+        EstadisticaCacheIA.objects.get_or_create(pk=1)
+        EstadisticaCacheIA.objects.filter(pk=1).update(**cambios)
+
+
+def volcar_estadisticas():
+    """Escribe los contadores acumulados en el proceso"""
+    global _ultimo_volcado
+    with _pendientes_lock:
+        pendientes = dict(_pendientes)
+        _pendientes.clear()
+        _ultimo_volcado = time.monotonic()
+    _actualizar_estadisticas(**pendientes)
+
+
+def reiniciar_estadisticas():
+    """Descarta los contadores aún no volcados del proceso"""
+    global _ultimo_volcado
+    with _pendientes_lock:
+        _pendientes.clear()
+        _ultimo_volcado = time.monotonic()
@@ -0,0 +1,497 @@
+"""
+Índice invertido BM25 en memoria para recuperar el contexto del chat
+(documentos, casos y actores) ordenado por relevancia real.
+
+El índice base se puede guardar en disco (comando indexar_chat) y se abre con
+mmap, de modo que los procesos arrancan sin reconstruirlo. Los cambios
+posteriores se aplican en memoria: un segmento delta con los documentos nuevos
+o modificados y un conjunto de claves borradas del base.
+
+Cada proceso tiene su propio índice, así que se comparan las marcas de la
+base de datos (última `actualizadoEn`, indexada, y cantidad de filas de cada
+fuente, en una consulta) con las del índice; si cambiaron, se reindexan las
+filas modificadas desde la marca anterior y se quitan las borradas. La
+comparación se hace al confirmar escrituras del propio proceso (señales) y,
+para ver las de otros procesos, como mucho cada CHAT_INDICE_SINCRONIZAR_CADA
+segundos antes de una búsqueda. Las actualizaciones masivas con `update()` deben fijar
+`actualizadoEn` para que se detecten.
+"""
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+from datetime import datetime
+from heapq import nlargest
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import CharField, Count, Max, Value
+from django.utils import timezone
+
+from actores.models import Actor
+from casos.models import Caso
+from documentos.models import Documento
+
+
+logger = logging.getLogger(__name__)
+
+MAGIA = b'GDBM25\x01\x00'
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes como con contra cual cuales cuando
+de del desde donde dos el ella ellas ello ellos en entre era es esa esas ese eso esos esta
+estas este esto estos fue fueron ha han hay hasta la las le les lo los mas me mi mis muy
+no nos o otra otro para pero poco por que quien se sea ser si sin sobre su sus tambien
+te tiene tienen todo todos tu tus un una unas uno unos y ya yo cuantos cuantas cuanto
+hola busca buscar busco dame muestra mostrar informacion
+""".split())
+
+SUFIJOS = (
+    'amientos', 'imientos', 'amiento', 'imiento', 'aciones', 'uciones', 'acion', 'ucion',
+    'idades', 'idad', 'mente', 'ibles', 'ible', 'ables', 'able', 'istas', 'ista',
+    'osos', 'osas', 'oso', 'osa', 'ivos', 'ivas', 'ivo', 'iva',
+)
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+Clave = Tuple[str, int]  # (tipo, id)
+Marcas = Dict[str, Tuple[Optional[datetime], int]]  # tipo -> (última actualizadoEn, filas)
+
+
+# === ANÁLISIS DE TEXTO ===
+
+def plegar(texto: str) -> str:
+    """Minúsculas y sin tildes (la ñ pasa a n)"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def raiz(palabra: str) -> str:
+    """Stemmer ligero para español: sufijos derivativos, plural y género"""
+    if len(palabra) <= 4 or palabra.isdigit():
+        return palabra
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 3:
+            return palabra[:-len(sufijo)]
+    if palabra.endswith('ces'):
+        palabra = palabra[:-3] + 'z'
+    elif palabra.endswith('es') and len(palabra) > 5:
+        palabra = palabra[:-2]
+    elif palabra.endswith('s'):
+        palabra = palabra[:-1]
+    if len(palabra) > 4 and palabra[-1] in 'aeo':
+        palabra = palabra[:-1]
+    return palabra
+
+
+def tokenizar(texto: str) -> List[str]:
+    return [raiz(t) for t in TOKEN_RE.findall(plegar(texto or '')) if t not in STOPWORDS]
+
+
+def terminos_ponderados(campos: Iterable[Tuple[str, int]]) -> Counter:
+    """Frecuencia de términos de varios campos, cada uno con su peso"""
+    frecuencias = Counter()
+    for texto, peso in campos:
+        for termino in tokenizar(texto):
+            frecuencias[termino] += peso
+    return frecuencias
+
+
+# === TEXTO INDEXADO POR ENTIDAD ===
+
+CAMPOS_DOCUMENTO = ('id', 'nombreDocumento', 'palabraClave', 'tipoDocumento__nombre', 'carpeta__expediente__caso__nroCaso')
+CAMPOS_CASO = ('id', 'nroCaso', 'tipoCaso', 'descripcion')
+CAMPOS_ACTOR = ('id', 'tipoActor', 'nombres', 'apellidoPaterno', 'apellidoMaterno', 'abogado__especialidad')
+
+TIPOS_ACTOR = dict(Actor.TIPO_CHOICES)
+
+
+def campos_documento(fila: Dict) -> List[Tuple[str, int]]:
+    return [
+        (fila['nombreDocumento'], 2),
+        (fila['palabraClave'], 2),
+        (fila['tipoDocumento__nombre'], 1),
+        (fila['carpeta__expediente__caso__nroCaso'], 1),
+    ]
+
+
+def campos_caso(fila: Dict) -> List[Tuple[str, int]]:
+    return [(fila['nroCaso'], 2), (fila['tipoCaso'], 2), (fila['descripcion'], 1)]
+
+
+def campos_actor(fila: Dict) -> List[Tuple[str, int]]:
+    return [
+        (fila['nombres'], 2),
+        (fila['apellidoPaterno'], 2),
+        (fila['apellidoMaterno'], 2),
+        (TIPOS_ACTOR.get(fila['tipoActor'], ''), 1),
+        (fila['abogado__especialidad'], 1),
+    ]
+
+
+FUENTES = {
+    'documento': (Documento, CAMPOS_DOCUMENTO, campos_documento),
+    'caso': (Caso, CAMPOS_CASO, campos_caso),
+    'actor': (Actor, CAMPOS_ACTOR, campos_actor),
+}
+
+
+def marcas_bd() -> Marcas:
+    """Última modificación y cantidad de filas de cada fuente, en una sola consulta (UNION ALL)"""
+    consultas = [
+        modelo.objects.order_by()
+        .annotate(fuente=Value(tipo, output_field=CharField()))
+        .values('fuente')
+        .annotate(ultima=Max('actualizadoEn'), filas=Count('pk'))
+        for tipo, (modelo, _, _) in FUENTES.items()
+    ]
+    marcas = {tipo: (None, 0) for tipo in FUENTES}
+    for fila in consultas[0].union(*consultas[1:], all=True):
+        marcas[fila['fuente']] = (fila['ultima'], fila['filas'])
+    return marcas
+
+
+# === SEGMENTO EN DISCO ===
+
+class SegmentoDisco:
+    """
+    Índice base de solo lectura abierto con mmap. Formato:
+    MAGIA | uint32 largo cabecera | cabecera JSON | relleno | postings int32 nativos (doc, tf)
+    """
+
+    def __init__(self, ruta: str):
+        self._archivo = open(ruta, 'rb')
+        self._mmap = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIA)] != MAGIA:
+            raise ValueError(f'{ruta} no es un índice BM25 válido')
+
+        inicio = len(MAGIA)
+        (largo,) = struct.unpack_from('<I', self._mmap, inicio)
+        inicio += 4
+        cabecera = json.loads(self._mmap[inicio:inicio + largo].decode('utf-8'))
+        inicio += largo
+        inicio += (-inicio) % 4
+
+        self.docs = [(tipo, doc_id, largo_doc) for tipo, doc_id, largo_doc in cabecera['docs']]
+        self.terminos = cabecera['terminos']
+        self.conteos = cabecera['conteos']
+        self.creado = cabecera['creado']
+        self.marcas: Optional[Marcas] = None
+        if 'marcas' in cabecera:
+            self.marcas = {
+                tipo: (datetime.fromisoformat(ultima) if ultima else None, filas)
+                for tipo, (ultima, filas) in cabecera['marcas'].items()
+            }
+        self._postings = memoryview(self._mmap)[inicio:].cast('i')
+
+    def postings(self, termino: str) -> Iterable[Tuple[int, int]]:
+        ubicacion = self.terminos.get(termino)
+        if not ubicacion:
+            return ()
+        desde, cantidad = ubicacion
+        datos = self._postings[2 * desde:2 * (desde + cantidad)]
+        return zip(datos[::2], datos[1::2])
+
+    def df(self, termino: str) -> int:
+        ubicacion = self.terminos.get(termino)
+        return ubicacion[1] if ubicacion else 0
+
+
+# === ÍNDICE ===
+
+class IndiceBM25:
+    """
+    BM25 (k1=1.2, b=0.75) sobre un segmento base opcional más un delta en memoria.
+    Como en Lucene, los documentos borrados del base siguen contando en df
+    hasta la siguiente reconstrucción.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, base: Optional[SegmentoDisco] = None):
+        self._lock = threading.RLock()
+        self.base = base
+        self.borrados = set()
+        self.delta_docs: Dict[Clave, Tuple[Counter, int]] = {}
+        self.delta_postings: Dict[str, Dict[Clave, int]] = defaultdict(dict)
+        self._base_pos: Dict[Clave, int] = {}
+        self._base_invertido = None
+        self._sincronizando = threading.Lock()
+        self.marcas: Marcas = {}
+        self.sincronizado_en = float('-inf')  # nunca: se sincroniza en el primer uso
+        self.n_docs = 0
+        self.largo_total = 0
+
+        if base is not None:
+            for pos, (tipo, doc_id, largo) in enumerate(base.docs):
+                self._base_pos[(tipo, doc_id)] = pos
+                self.n_docs += 1
+                self.largo_total += largo
+
+    # --- Construcción y actualización ---
+
+    @classmethod
+    def construir_desde_bd(cls) -> 'IndiceBM25':
+        indice = cls()
+        # Las marcas se toman antes de leer: lo que cambie durante la carga se reaplica después
+        indice.marcas = marcas_bd()
+        indice.sincronizado_en = time.monotonic()
+        for tipo, (modelo, campos, extraer) in FUENTES.items():
+            for fila in modelo.objects.order_by().values(*campos).iterator(chunk_size=2000):
+                indice._agregar((tipo, fila['id']), terminos_ponderados(extraer(fila)))
+        return indice
+
+    def actualizar(self, tipo: str, doc_id: int):
+        """Reindexa una fila leyendo su texto de la base de datos (o la elimina si ya no existe)"""
+        self.actualizar_varios(tipo, [doc_id])
+
+    def actualizar_varios(self, tipo: str, ids: Iterable[int]):
+        """Reindexa varias filas del mismo tipo con una consulta; las que ya no existen se eliminan"""
+        ids = set(ids)
+        if not ids:
+            return
+        modelo, campos, extraer = FUENTES[tipo]
+        filas = {fila['id']: fila for fila in modelo.objects.filter(pk__in=ids).order_by().values(*campos)}
+        for doc_id in ids:
+            if doc_id in filas:
+                self._agregar((tipo, doc_id), terminos_ponderados(extraer(filas[doc_id])))
+            else:
+                self.eliminar(tipo, doc_id)
+
+    def sincronizar(self, marcas: Optional[Marcas] = None):
+        """
+        Aplica los cambios de la base de datos posteriores a las marcas del
+        índice, incluidos los hechos por otros procesos: reindexa las filas con
+        `actualizadoEn` desde la marca anterior (y los documentos de los casos
+        modificados, que incluyen el número de caso) y quita las borradas
+        """
+        self.sincronizado_en = time.monotonic()
+        marcas = marcas_bd() if marcas is None else marcas
+        if marcas == self.marcas:
+            return
+        with self._sincronizando:
+            anteriores = self.marcas
+            if marcas == anteriores:
+                return
+            for tipo, (ultima, filas) in marcas.items():
+                if anteriores.get(tipo) == (ultima, filas):
+                    continue
+                modelo = FUENTES[tipo][0]
+                previa = anteriores.get(tipo, (None, 0))[0]
+                cambiadas = modelo.objects.all() if previa is None else modelo.objects.filter(actualizadoEn__gte=previa)
+                ids = list(cambiadas.values_list('pk', flat=True))
+                self.actualizar_varios(tipo, ids)
+                if tipo == 'caso' and ids:
+                    self.actualizar_varios('documento', Documento.objects.filter(
+                        carpeta__expediente__caso__in=ids
+                    ).values_list('pk', flat=True))
+                if self.conteos().get(tipo, 0) != filas:
+                    self._quitar_borrados(tipo, set(modelo.objects.values_list('pk', flat=True)))
+            self.marcas = marcas
+
+    def _quitar_borrados(self, tipo: str, existentes: set):
+        with self._lock:
+            claves = [clave for clave in self.delta_docs if clave[0] == tipo]
+            claves += [(t, doc_id) for t, doc_id, _ in (self.base.docs if self.base else []) if t == tipo]
+            for clave in claves:
+                if clave[1] not in existentes:
+                    self._quitar(clave)
+
+    def eliminar(self, tipo: str, doc_id: int):
+        with self._lock:
+            self._quitar((tipo, doc_id))
+
+    def _agregar(self, clave: Clave, frecuencias: Counter):
+        with self._lock:
+            self._quitar(clave)
+            largo = sum(frecuencias.values())
+            self.delta_docs[clave] = (frecuencias, largo)
+            for termino, tf in frecuencias.items():
+                self.delta_postings[termino][clave] = tf
+            self.n_docs += 1
+            self.largo_total += largo
+
+    def _quitar(self, clave: Clave):
+        anterior = self.delta_docs.pop(clave, None)
+        if anterior is not None:
+            frecuencias, largo = anterior
+            for termino in frecuencias:
+                postings = self.delta_postings[termino]
+                postings.pop(clave, None)
+                if not postings:
+                    del self.delta_postings[termino]
+            self.n_docs -= 1
+            self.largo_total -= largo
+        elif clave in self._base_pos and clave not in self.borrados:
+            self.borrados.add(clave)
+            self.n_docs -= 1
+            self.largo_total -= self.base.docs[self._base_pos[clave]][2]
+
+    # --- Búsqueda ---
+
+    def buscar(self, consulta: str, tipos: Iterable[str] = None, k: int = 10) -> List[Tuple[str, int, float]]:
+        """Top-k (tipo, id, puntaje) para la consulta"""
+        terminos = set(tokenizar(consulta))
+        tipos = set(tipos) if tipos else None
+
+        with self._lock:
+            if not terminos or not self.n_docs:
+                return []
+            promedio = self.largo_total / self.n_docs
+            puntajes = defaultdict(float)
+
+            for termino in terminos:
+                delta = self.delta_postings.get(termino, {})
+                df = len(delta) + (self.base.df(termino) if self.base else 0)
+                if not df:
+                    continue
+                idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+                if self.base is not None:
+                    for pos, tf in self.base.postings(termino):
+                        tipo, doc_id, largo = self.base.docs[pos]
+                        if tipos and tipo not in tipos:
+                            continue
+                        clave = (tipo, doc_id)
+                        if clave in self.borrados:
+                            continue
+                        puntajes[clave] += self._bm25(idf, tf, largo, promedio)
+
+                for clave, tf in delta.items():
+                    if tipos and clave[0] not in tipos:
+                        continue
+                    puntajes[clave] += self._bm25(idf, tf, self.delta_docs[clave][1], promedio)
+
+        mejores = nlargest(k, puntajes.items(), key=lambda item: item[1])
+        return [(tipo, doc_id, puntaje) for (tipo, doc_id), puntaje in mejores]
+
+    def _bm25(self, idf: float, tf: int, largo: int, promedio: float) -> float:
+        return idf * tf * (self.K1 + 1) / (tf + self.K1 * (1 - self.B + self.B * largo / promedio))
+
+    # --- Persistencia ---
+
+    def conteos(self) -> Dict[str, int]:
+        conteos = Counter(tipo for tipo, _ in self.delta_docs)
+        for tipo, doc_id, _ in (self.base.docs if self.base else []):
+            if (tipo, doc_id) not in self.borrados:
+                conteos[tipo] += 1
+        return dict(conteos)
+
+    def guardar(self, ruta: str):
+        """Escribe base + delta como un único segmento (escritura atómica)"""
+        with self._lock:
+            documentos = []
+            postings = defaultdict(list)
+            for tipo, doc_id, _ in (self.base.docs if self.base else []):
+                if (tipo, doc_id) not in self.borrados:
+                    documentos.append((tipo, doc_id))
+            documentos.extend(self.delta_docs)
+            posiciones = {clave: pos for pos, clave in enumerate(documentos)}
+
+            largos = []
+            for clave in documentos:
+                frecuencias = self._frecuencias(clave)
+                largos.append(sum(frecuencias.values()))
+                for termino, tf in frecuencias.items():
+                    postings[termino].append((posiciones[clave], tf))
+
+        terminos, datos, desplazamiento = {}, [], 0
+        for termino, lista in postings.items():
+            terminos[termino] = [desplazamiento, len(lista)]
+            for pos, tf in lista:
+                datos.extend((pos, tf))
+            desplazamiento += len(lista)
+
+        cabecera = json.dumps({
+            'docs': [[tipo, doc_id, largo] for (tipo, doc_id), largo in zip(documentos, largos)],
+            'terminos': terminos,
+            'conteos': dict(Counter(tipo for tipo, _ in documentos)),
+            'marcas': {
+                tipo: [ultima.isoformat() if ultima else None, filas]
+                for tipo, (ultima, filas) in self.marcas.items()
+            },
+            'creado': timezone.now().isoformat(),
+        }).encode('utf-8')
+
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        temporal = f'{ruta}.tmp'
+        with open(temporal, 'wb') as archivo:
+            archivo.write(MAGIA)
+            archivo.write(struct.pack('<I', len(cabecera)))
+            archivo.write(cabecera)
+            archivo.write(b'\x00' * ((-(len(MAGIA) + 4 + len(cabecera))) % 4))
+            archivo.write(array('i', datos).tobytes())
+        os.replace(temporal, ruta)
+
+    def _frecuencias(self, clave: Clave) -> Counter:
+        """Reconstruye las frecuencias de un documento del base a partir de sus postings"""
+        if clave in self.delta_docs:
+            return self.delta_docs[clave][0]
+        if self._base_invertido is None:
+            invertido = defaultdict(Counter)
+            for termino in self.base.terminos:
+                for doc_pos, tf in self.base.postings(termino):
+                    invertido[doc_pos][termino] = tf
+            self._base_invertido = invertido
+        return self._base_invertido[self._base_pos[clave]]
+
+
+# === ÍNDICE DEL PROCESO ===
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def _cargar() -> IndiceBM25:
+    ruta = getattr(settings, 'CHAT_INDICE_RUTA', None)
+    if ruta and os.path.exists(ruta):
+        try:
+            base = SegmentoDisco(ruta)
+            if base.marcas is not None:
+                # Lo cambiado desde que se guardó se aplica en la primera sincronización
+                indice = IndiceBM25(base)
+                indice.marcas = base.marcas
+                return indice
+            logger.info('Índice BM25 en %s sin marcas de actualización; se reconstruye desde la base de datos', ruta)
+        except (OSError, ValueError) as e:
+            logger.warning('No se pudo abrir el índice BM25 %s: %s', ruta, e)
+    return IndiceBM25.construir_desde_bd()
+
+
+def obtener_indice(sincronizar: bool = False) -> IndiceBM25:
+    """
+    Índice del proceso: se abre desde disco o se construye la primera vez que
+    se usa, y se sincroniza con la base de datos si pasó el intervalo (o si se
+    pide con `sincronizar`)
+    """
+    global _indice
+    indice = _indice
+    if indice is None:
+        with _indice_lock:
+            if _indice is None:
+                _indice = _cargar()
+            indice = _indice
+    intervalo = float(getattr(settings, 'CHAT_INDICE_SINCRONIZAR_CADA', 5.0))
+    if sincronizar or time.monotonic() - indice.sincronizado_en >= intervalo:
+        indice.sincronizar()
+    return indice
+
+
+def indice_cargado() -> bool:
+    return _indice is not None
+
+
+def reiniciar_indice():
+    """Descarta el índice del proceso; se vuelve a cargar en el siguiente uso"""
+    global _indice
+    with _indice_lock:
+        _indice = None
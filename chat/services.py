@@ -1,8 +1,10 @@
 import openai
 import os
+import hashlib
 import json
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.db.models import Q
 from casos.models import Caso, Expediente, Carpeta
@@ -10,6 +12,13 @@ from documentos.models import Documento, TipoDocumento, EtapaProcesal
 from actores.models import Actor, Abogado, Cliente, Asistente
 from seguridad.models import Usuario
 from .database_service import DatabaseQueryService
+from .fake_openai import FakeOpenAI, FakeAsyncOpenAI
+from .response_cache import RespuestaCacheService, normalizar_consulta
+from .search_index import obtener_indice
+from .openai_pool import aobtener_pool, obtener_pool, obtener_cliente_openai, obtener_cliente_openai_async
+from .prompt_builder import PromptBuilder, truncar
+from .query_router import analizar_consulta
+from .telemetry import TelemetriaChat
 
 
 class AsistenteIAService:
@@ -18,198 +27,358 @@ class AsistenteIAService:
     """
     
 class AsistenteIAService:
-    def __init__(self):
-        # Usa settings para la API key
-        self.client = openai.OpenAI(
-            api_key=getattr(settings, "OPENAI_API_KEY", None)
-        )
+    def __init__(self, client=None, async_client=None, max_tokens: int = None):
+        # Cliente compartido del proceso (o el sustituto local si OPENAI_FAKE está activo)
+        if client is None:
+            if getattr(settings, "OPENAI_FAKE", False):
+                client = FakeOpenAI(retraso=float(getattr(settings, "OPENAI_FAKE_RETRASO", 0.0)))
+            else:
+                client = obtener_cliente_openai()
+        self.client = client
+        self._async_client = async_client
         self.modelo = getattr(settings, "OPENAI_MODEL", "gpt-3.5-turbo")
         self.temperatura = float(getattr(settings, "OPENAI_TEMPERATURE", 0.7))
-        self.max_tokens = int(getattr(settings, "OPENAI_MAX_TOKENS", 1000))
+        # Tokens reservados para la respuesta; si no se indican, se leen al usarlos (ver max_tokens)
+        self._max_tokens = max_tokens
+        self._prompt_builder = None
+        self.max_descripcion = int(getattr(settings, "CHAT_PROMPT_MAX_DESCRIPCION", 300))
         self.db_service = DatabaseQueryService()
+        self.cache = RespuestaCacheService()
+        # Tokens del último prompt armado (o los que informó OpenAI), para Mensaje.tokens_usados
+        self.tokens_prompt = None
+        # Duración por etapa, consultas SQL y tokens de la consulta en curso (Mensaje.telemetria)
+        self.telemetria = TelemetriaChat()
+    
+    @property
+    def max_tokens(self) -> int:
+        """
+        Tokens reservados para la respuesta, de la configuración ya cargada del
+        pool (la ConfiguracionIA activa manda sobre settings). No se leen al
+        crear el servicio: así crearlo no consulta la base de datos
+        """
+        if self._max_tokens is None:
+            self._max_tokens = int(obtener_pool().config['max_tokens'])
+        return self._max_tokens
+    
+    @property
+    def prompt_builder(self) -> PromptBuilder:
+        if self._prompt_builder is None:
+            self._prompt_builder = PromptBuilder(self.modelo, self.max_tokens)
+        return self._prompt_builder
+    
+    @property
+    def indice(self):
+        """Índice BM25 del proceso (se carga en el primer uso)"""
+        return obtener_indice()
     
     def buscar_documentos(self, consulta: str, usuario: Usuario) -> List[Dict[str, Any]]:
         """
-        Busca documentos relevantes basándose en la consulta del usuario
+        Busca documentos relevantes (por nombre, palabras clave, tipo o número de caso)
+        ordenados por relevancia BM25
         """
-        resultados = []
+        encontrados = self.indice.buscar(consulta, tipos=('documento',), k=10)
+        documentos = Documento.objects.select_related(
+            'carpeta__expediente__caso', 'tipoDocumento', 'etapaProcesal'
+        ).in_bulk([doc_id for _, doc_id, _ in encontrados])
         
-        # Búsqueda por nombre de documento
-        documentos_nombre = Documento.objects.filter(
-            Q(nombreDocumento__icontains=consulta) |
-            Q(palabraClave__icontains=consulta)
-        ).select_related('carpeta__expediente__caso', 'tipoDocumento', 'etapaProcesal')
-        
-        for doc in documentos_nombre:
-            resultados.append({
-                'tipo': 'documento',
-                'objeto': doc,
-                'relevancia': 0.9,
-                'razon': f"Documento encontrado por nombre: {doc.nombreDocumento}"
-            })
-        
-        # Búsqueda por tipo de documento
-        tipos_doc = TipoDocumento.objects.filter(
-            nombre__icontains=consulta
-        )
-        for tipo in tipos_doc:
-            docs_tipo = Documento.objects.filter(tipoDocumento=tipo)
-            for doc in docs_tipo:
-                resultados.append({
-                    'tipo': 'documento',
-                    'objeto': doc,
-                    'relevancia': 0.7,
-                    'razon': f"Documento de tipo: {tipo.nombre}"
-                })
-        
-        # Búsqueda por casos
-        casos = Caso.objects.filter(
-            Q(nroCaso__icontains=consulta) |
-            Q(tipoCaso__icontains=consulta) |
-            Q(descripcion__icontains=consulta)
-        )
-        
-        for caso in casos:
-            # Buscar documentos del caso
-            expedientes = Expediente.objects.filter(caso=caso)
-            for exp in expedientes:
-                carpetas = Carpeta.objects.filter(expediente=exp)
-                for carpeta in carpetas:
-                    docs = Documento.objects.filter(carpeta=carpeta)
-                    for doc in docs:
-                        resultados.append({
-                            'tipo': 'documento',
-                            'objeto': doc,
-                            'relevancia': 0.8,
-                            'razon': f"Documento del caso {caso.nroCaso}: {caso.tipoCaso}"
-                        })
-        
-        # Eliminar duplicados y ordenar por relevancia
-        resultados_unicos = {}
-        for resultado in resultados:
-            doc_id = resultado['objeto'].id
-            if doc_id not in resultados_unicos or resultados_unicos[doc_id]['relevancia'] < resultado['relevancia']:
-                resultados_unicos[doc_id] = resultado
-        
-        return sorted(resultados_unicos.values(), key=lambda x: x['relevancia'], reverse=True)[:10]
+        return self._resultados_indice(encontrados, documentos, 'documento',
+                                       lambda doc: f"Documento: {doc.nombreDocumento}")
     
     def buscar_actores(self, consulta: str) -> List[Dict[str, Any]]:
         """
-        Busca actores relevantes basándose en la consulta
+        Busca actores relevantes (por nombre, tipo o especialidad) ordenados por relevancia BM25
         """
-        resultados = []
-        
-        # Búsqueda por nombre
-        actores = Actor.objects.filter(
-            Q(nombres__icontains=consulta) |
-            Q(apellidoPaterno__icontains=consulta) |
-            Q(apellidoMaterno__icontains=consulta) |
-            Q(ci__icontains=consulta)
-        ).select_related('usuario')
-        
-        for actor in actores:
-            resultados.append({
-                'tipo': 'actor',
-                'objeto': actor,
-                'relevancia': 0.9,
-                'razon': f"Actor encontrado: {actor.nombres} {actor.apellidoPaterno}"
-            })
-        
-        # Búsqueda por tipo de actor
-        if 'abogado' in consulta.lower():
-            abogados = Abogado.objects.select_related('actor').all()
-            for abogado in abogados:
-                resultados.append({
-                    'tipo': 'actor',
-                    'objeto': abogado.actor,
-                    'relevancia': 0.8,
-                    'razon': f"Abogado: {abogado.actor.nombres} {abogado.actor.apellidoPaterno}"
-                })
+        encontrados = self.indice.buscar(consulta, tipos=('actor',), k=5)
+        actores = Actor.objects.select_related('usuario').in_bulk([actor_id for _, actor_id, _ in encontrados])
         
-        if 'cliente' in consulta.lower():
-            clientes = Cliente.objects.select_related('actor').all()
-            for cliente in clientes:
-                resultados.append({
-                    'tipo': 'actor',
-                    'objeto': cliente.actor,
-                    'relevancia': 0.8,
-                    'razon': f"Cliente: {cliente.actor.nombres} {cliente.actor.apellidoPaterno}"
-                })
-        
-        return sorted(resultados, key=lambda x: x['relevancia'], reverse=True)[:5]
+        return self._resultados_indice(encontrados, actores, 'actor',
+                                       lambda actor: f"Actor encontrado: {actor.nombres} {actor.apellidoPaterno}")
     
     def buscar_casos(self, consulta: str) -> List[Dict[str, Any]]:
         """
-        Busca casos relevantes basándose en la consulta
+        Busca casos relevantes (por número, tipo o descripción) ordenados por relevancia BM25
         """
-        resultados = []
+        encontrados = self.indice.buscar(consulta, tipos=('caso',), k=5)
+        casos = Caso.objects.in_bulk([caso_id for _, caso_id, _ in encontrados])
         
-        casos = Caso.objects.filter(
-            Q(nroCaso__icontains=consulta) |
-            Q(tipoCaso__icontains=consulta) |
-            Q(descripcion__icontains=consulta)
-        )
-        
-        for caso in casos:
+        return self._resultados_indice(encontrados, casos, 'caso',
+                                       lambda caso: f"Caso encontrado: {caso.nroCaso} - {caso.tipoCaso}")
+    
+    def _resultados_indice(self, encontrados, objetos: Dict[int, Any], tipo: str, razon) -> List[Dict[str, Any]]:
+        """
+        Arma los resultados en el orden del índice; la relevancia es el puntaje
+        BM25 normalizado respecto al mejor resultado
+        """
+        resultados = []
+        maximo = encontrados[0][2] if encontrados else 1.0
+        for _, objeto_id, puntaje in encontrados:
+            objeto = objetos.get(objeto_id)
+            if objeto is None:
+                continue
             resultados.append({
-                'tipo': 'caso',
-                'objeto': caso,
-                'relevancia': 0.9,
-                'razon': f"Caso encontrado: {caso.nroCaso} - {caso.tipoCaso}"
+                'tipo': tipo,
+                'objeto': objeto,
+                'relevancia': round(puntaje / maximo, 3),
+                'razon': razon(objeto)
             })
-        
-        return sorted(resultados, key=lambda x: x['relevancia'], reverse=True)[:5]
+        return resultados
     
-    def generar_respuesta_ia(self, consulta: str, contexto: List[Dict[str, Any]], conversacion_historial: List[str] = None, usuario=None) -> str:
+    def responder_directo(self, consulta: str, usuario=None, analisis: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """
+        Respuesta del motor de reglas (ver chat.answer_engine) sin llamar a OpenAI,
+        o None si la pregunta es abierta
+        """
+        with self.telemetria.medir('reglas'):
+            directa = self.db_service.responder_directo(consulta, usuario, analisis)
+        if directa is not None:
+            self.tokens_prompt = None
+            self.telemetria.origen = 'directa'
+            self.telemetria.regla = directa['regla']
+        return directa
+    
+    def generar_respuesta_ia(self, consulta: str, contexto: List[Dict[str, Any]], conversacion_historial: List[str] = None, usuario=None, resumen: str = None, db_resultados: Dict[str, Any] = None) -> str:
         """
         Genera una respuesta usando OpenAI basándose en la consulta y el contexto encontrado
         """
         try:
-            # Usar el nuevo servicio de base de datos para obtener información específica
-            db_resultados = self.db_service.consultar_informacion(consulta, usuario)
+            preparado = self.preparar_mensajes(consulta, conversacion_historial, usuario, db_resultados=db_resultados, contexto=contexto, resumen=resumen)
             
             # Si hay una respuesta directa de la base de datos, usarla
-            if db_resultados.get('respuesta_directa'):
-                return db_resultados['respuesta_directa']
+            if preparado['respuesta_directa']:
+                return preparado['respuesta_directa']
             
-            # Construir el contexto del sistema
-            contexto_sistema = self._construir_contexto_sistema()
+            # Reutilizar la respuesta si la misma pregunta ya se hizo con el mismo contexto
+            with self.telemetria.medir('cache'):
+                respuesta_cache = self.cache.obtener(preparado['clave_cache'])
+            if respuesta_cache is not None:
+                self.telemetria.origen = 'cache'
+                return respuesta_cache
             
-            # Construir el contexto de la consulta con los resultados de la DB
-            contexto_consulta = self._construir_contexto_mejorado(db_resultados)
+            # Llamar a OpenAI
+            inicio = time.perf_counter()
+            with self.telemetria.medir('llm'):
+                response = self.client.chat.completions.create(
+                    model=self.modelo,
+                    messages=preparado['mensajes'],
+                    temperature=self.temperatura,
+                    max_tokens=self.max_tokens
+                )
+            respuesta = response.choices[0].message.content
+            # Sin stream el primer token llega con la respuesta completa
+            self.telemetria.registrar('llm_primer_token', self.telemetria.etapas['llm'])
+            self._registrar_uso(response)
             
-            # Construir el historial de conversación
-            historial = self._construir_historial(conversacion_historial) if conversacion_historial else []
+            self._guardar_en_cache(preparado, consulta, respuesta, time.perf_counter() - inicio, response)
+            return respuesta
             
-            # Preparar mensajes para OpenAI
-            mensajes = [
-                {"role": "system", "content": contexto_sistema}
-            ] + historial + [
-                {"role": "user", "content": f"{consulta}\n\nInformación encontrada en la base de datos:\n{contexto_consulta}"}
-            ]
+        except Exception as e:
+            return self._formatear_error(e)
+    
+    def generar_respuesta_ia_stream(self, consulta: str, contexto: List[Dict[str, Any]], conversacion_historial: List[str] = None, usuario=None, resumen: str = None, db_resultados: Dict[str, Any] = None) -> Iterator[str]:
+        """
+        Igual que generar_respuesta_ia pero entrega la respuesta fragmento a fragmento
+        usando el modo stream=True de OpenAI. Si el consumidor cierra el generador
+        (cliente desconectado) se cierra el stream y se aborta la generación remota.
+        """
+        stream = None
+        try:
+            preparado = self.preparar_mensajes(consulta, conversacion_historial, usuario, db_resultados=db_resultados, contexto=contexto, resumen=resumen)
             
-            # Llamar a OpenAI
-            response = self.client.chat.completions.create(
+            if preparado['respuesta_directa']:
+                yield preparado['respuesta_directa']
+                return
+            
+            with self.telemetria.medir('cache'):
+                respuesta_cache = self.cache.obtener(preparado['clave_cache'])
+            if respuesta_cache is not None:
+                self.telemetria.origen = 'cache'
+                yield respuesta_cache
+                return
+            
+            # El tiempo de OpenAI se toma a mano: entre fragmentos el generador está suspendido
+            inicio = time.perf_counter()
+            stream = self.client.chat.completions.create(
+                model=self.modelo,
+                messages=preparado['mensajes'],
+                temperature=self.temperatura,
+                max_tokens=self.max_tokens,
+                stream=True,
+                stream_options={'include_usage': True}
+            )
+            self.telemetria.origen = 'openai'
+            
+            fragmentos = []
+            for chunk in stream:
+                if getattr(chunk, 'usage', None) is not None:
+                    self._registrar_uso(chunk)
+                if not chunk.choices:
+                    continue
+                fragmento = chunk.choices[0].delta.content
+                if fragmento:
+                    if not fragmentos:
+                        self.telemetria.registrar('llm_primer_token', (time.perf_counter() - inicio) * 1000)
+                    fragmentos.append(fragmento)
+                    yield fragmento
+            
+            duracion = time.perf_counter() - inicio
+            self.telemetria.registrar('llm', duracion * 1000)
+            # Solo se guarda la respuesta completa (no las interrumpidas por desconexión)
+            self._guardar_en_cache(preparado, consulta, ''.join(fragmentos), duracion)
+        
+        except Exception as e:
+            yield self._formatear_error(e)
+        finally:
+            if stream is not None:
+                stream.close()
+    
+    @property
+    def async_client(self):
+        """
+        Cliente asíncrono de OpenAI, creado solo cuando se usa el pipeline async
+        """
+        if self._async_client is None:
+            if getattr(settings, "OPENAI_FAKE", False):
+                self._async_client = FakeAsyncOpenAI(retraso=float(getattr(settings, "OPENAI_FAKE_RETRASO", 0.0)))
+            else:
+                return obtener_cliente_openai_async()
+        return self._async_client
+    
+    async def generar_respuesta_ia_async(self, consulta: str, db_resultados: Dict[str, Any], conversacion_historial: List[str] = None, contexto: List[Dict[str, Any]] = None, resumen: str = None) -> str:
+        """
+        Versión asíncrona de generar_respuesta_ia. Recibe los resultados de
+        DatabaseQueryService ya calculados para no volver a consultar la base de datos.
+        """
+        try:
+            if self._max_tokens is None or self._async_client is None:
+                # max_tokens y el cliente salen del pool; si se descartó, su
+                # configuración (ORM) se vuelve a leer en un hilo
+                await aobtener_pool()
+            preparado = self.preparar_mensajes(consulta, conversacion_historial, db_resultados=db_resultados, contexto=contexto, resumen=resumen)
+            
+            if preparado['respuesta_directa']:
+                return preparado['respuesta_directa']
+            
+            respuesta_cache = await sync_to_async(self.telemetria.medido('cache', self.cache.obtener))(preparado['clave_cache'])
+            if respuesta_cache is not None:
+                self.telemetria.origen = 'cache'
+                return respuesta_cache
+            
+            inicio = time.perf_counter()
+            response = await self.async_client.chat.completions.create(
                 model=self.modelo,
-                messages=mensajes,
+                messages=preparado['mensajes'],
                 temperature=self.temperatura,
                 max_tokens=self.max_tokens
             )
+            duracion = time.perf_counter() - inicio
+            self.telemetria.registrar('llm', duracion * 1000)
+            self.telemetria.registrar('llm_primer_token', duracion * 1000)
+            respuesta = response.choices[0].message.content
+            self._registrar_uso(response)
             
-            return response.choices[0].message.content
+            await sync_to_async(self._guardar_en_cache)(
+                preparado, consulta, respuesta, duracion, response
+            )
+            return respuesta
             
         except Exception as e:
-            error_msg = str(e)
+            return self._formatear_error(e)
+    
+    def preparar_mensajes(self, consulta: str, conversacion_historial: List[str] = None, usuario=None, db_resultados: Dict[str, Any] = None, contexto: List[Dict[str, Any]] = None, resumen: str = None) -> Dict[str, Any]:
+        """
+        Consulta la base de datos y arma los mensajes para OpenAI dentro del
+        presupuesto de tokens (ver PromptBuilder). `resumen` es el resumen de la
+        conversación anterior al historial reciente.
+        Devuelve la respuesta directa si la base de datos ya responde la pregunta.
+        """
+        # Usar el nuevo servicio de base de datos para obtener información específica
+        if db_resultados is None:
+            with self.telemetria.medir('db'):
+                db_resultados = self.db_service.consultar_informacion(consulta, usuario)
+        
+        if db_resultados.get('respuesta_directa'):
+            self.tokens_prompt = None
+            self.telemetria.origen = 'directa'
+            self.telemetria.regla = db_resultados.get('regla')
+            return {'respuesta_directa': db_resultados['respuesta_directa'], 'mensajes': [], 'clave_cache': None, 'tokens_prompt': None}
+        
+        with self.telemetria.medir('prompt'):
+            # Sistema + historial + consulta con el contexto que quepa, por relevancia
+            prompt = self.prompt_builder.construir(
+                self._construir_contexto_sistema(),
+                consulta,
+                self._secciones_contexto(db_resultados, contexto),
+                self._construir_historial(conversacion_historial) if conversacion_historial else [],
+                resumen=resumen
+            )
+            self.tokens_prompt = prompt['tokens_prompt']
+            self.telemetria.registrar_uso(None, tokens_estimados=prompt['tokens_prompt'])
             
-            # Mensajes de error más específicos
-            if "API key" in error_msg or "authentication" in error_msg:
-                return "⚠️ Error de configuración: No se ha configurado la API key de OpenAI. Por favor, revisa el archivo .env y agrega OPENAI_API_KEY=tu-api-key-aqui"
-            elif "quota" in error_msg or "billing" in error_msg:
-                return "⚠️ Error de crédito: Tu cuenta de OpenAI no tiene crédito suficiente. Ve a https://platform.openai.com/account/billing para agregar crédito."
-            elif "rate limit" in error_msg:
-                return "⚠️ Límite de velocidad: Has excedido el límite de solicitudes. Espera unos momentos antes de intentar nuevamente."
-            else:
-                return f"⚠️ Error al procesar tu consulta: {error_msg}"
+            # Clave de caché: consulta normalizada + huellas del contexto y de la conversación
+            # incluidos (todo menos el mensaje final) + modelo/temperatura
+            clave_cache = self.cache.calcular_clave(
+                consulta, prompt['contexto'], self.modelo, self.temperatura, conversacion=prompt['mensajes'][:-1]
+            )
+        
+        return {
+            'respuesta_directa': None,
+            'mensajes': prompt['mensajes'],
+            'clave_cache': clave_cache,
+            'tokens_prompt': prompt['tokens_prompt'],
+        }
+    
+    def clave_en_vuelo(self, consulta: str, usuario=None, conversacion_historial: List[str] = None, resumen: str = None) -> str:
+        """
+        Clave para agrupar consultas idénticas en curso: consulta normalizada y su
+        alcance (el usuario si la consulta es personal, y el resumen e historial de la conversación)
+        """
+        alcance = '*'
+        if usuario is not None and analizar_consulta(consulta)['personal']:
+            alcance = str(usuario.pk)
+        huella_historial = hashlib.sha256(
+            '\x1f'.join([resumen or ''] + (conversacion_historial or [])).encode('utf-8')
+        ).hexdigest()
+        return '|'.join([normalizar_consulta(consulta), alcance, huella_historial, self.modelo])
+    
+    def _registrar_uso(self, response):
+        """
+        Si OpenAI informa el uso, se guardan sus tokens de prompt en lugar de la estimación
+        """
+        usage = getattr(response, 'usage', None)
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        if isinstance(prompt_tokens, int):
+            self.tokens_prompt = prompt_tokens
+        self.telemetria.origen = 'openai'
+        self.telemetria.registrar_uso(usage)
+    
+    def _guardar_en_cache(self, preparado: Dict[str, Any], consulta: str, respuesta: str, duracion: float, response=None):
+        """
+        Guarda la respuesta de OpenAI en la caché junto con su costo original
+        """
+        if not respuesta:
+            return
+        usage = getattr(response, 'usage', None)
+        self.cache.guardar(
+            preparado['clave_cache'], consulta, self.modelo, self.temperatura, respuesta,
+            tiempo_generacion=duracion,
+            tokens_usados=getattr(usage, 'total_tokens', None)
+        )
+    
+    def _formatear_error(self, e: Exception) -> str:
+        """
+        Traduce los errores de OpenAI a mensajes para el usuario
+        """
+        error_msg = str(e)
+        
+        # Mensajes de error más específicos
+        if "API key" in error_msg or "authentication" in error_msg:
+            return "⚠️ Error de configuración: No se ha configurado la API key de OpenAI. Por favor, revisa el archivo .env y agrega OPENAI_API_KEY=tu-api-key-aqui"
+        elif "quota" in error_msg or "billing" in error_msg:
+            return "⚠️ Error de crédito: Tu cuenta de OpenAI no tiene crédito suficiente. Ve a https://platform.openai.com/account/billing para agregar crédito."
+        elif "rate limit" in error_msg:
+            return "⚠️ Límite de velocidad: Has excedido el límite de solicitudes. Espera unos momentos antes de intentar nuevamente."
+        else:
+            return f"⚠️ Error al procesar tu consulta: {error_msg}"
     
     def _construir_contexto_sistema(self) -> str:
         """
@@ -243,120 +412,135 @@ FORMATO DE RESPUESTA:
 - Incluye números de caso, nombres de documentos y fechas SOLO cuando estén en el contexto
 - Proporciona referencias específicas SOLO cuando estén disponibles en los datos reales"""
     
-    def _construir_contexto_consulta(self, contexto: List[Dict[str, Any]]) -> str:
+    def _secciones_contexto(self, db_resultados: Dict[str, Any], contexto: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
-        Construye el contexto de la consulta basándose en los resultados encontrados
+        Arma las secciones del contexto para el PromptBuilder. Los resultados de
+        DatabaseQueryService van primero (en su orden); después los del índice BM25
+        que no estén ya incluidos, según su relevancia.
         """
-        if not contexto:
-            return "No se encontró información relevante en la base de datos."
-        
-        contexto_texto = "Información encontrada:\n\n"
+        secciones = []
         
-        for item in contexto:
-            if item['tipo'] == 'documento':
-                doc = item['objeto']
-                contexto_texto += f"📄 DOCUMENTO: {doc.nombreDocumento}\n"
-                contexto_texto += f"   - Tipo: {doc.tipoDocumento.nombre}\n"
-                contexto_texto += f"   - Caso: {doc.carpeta.expediente.caso.nroCaso}\n"
-                contexto_texto += f"   - Fecha: {doc.fechaDoc}\n"
-                contexto_texto += f"   - Estado: {doc.estado}\n"
-                if doc.palabraClave:
-                    contexto_texto += f"   - Palabras clave: {doc.palabraClave}\n"
-                contexto_texto += "\n"
-            
-            elif item['tipo'] == 'actor':
-                actor = item['objeto']
-                contexto_texto += f"👤 ACTOR: {actor.nombres} {actor.apellidoPaterno}\n"
-                contexto_texto += f"   - Tipo: {actor.get_tipoActor_display()}\n"
-                contexto_texto += f"   - CI: {actor.ci}\n"
-                contexto_texto += f"   - Estado: {actor.estadoActor}\n"
-                if actor.telefono:
-                    contexto_texto += f"   - Teléfono: {actor.telefono}\n"
-                contexto_texto += "\n"
-            
-            elif item['tipo'] == 'caso':
-                caso = item['objeto']
-                contexto_texto += f"⚖️ CASO: {caso.nroCaso}\n"
-                contexto_texto += f"   - Tipo: {caso.tipoCaso}\n"
-                contexto_texto += f"   - Estado: {caso.estado}\n"
-                contexto_texto += f"   - Prioridad: {caso.prioridad}\n"
-                contexto_texto += f"   - Fecha inicio: {caso.fechaInicio}\n"
-                if caso.descripcion:
-                    contexto_texto += f"   - Descripción: {caso.descripcion}\n"
-                contexto_texto += "\n"
-        
-        return contexto_texto
-    
-    def _construir_contexto_mejorado(self, db_resultados: Dict[str, Any]) -> str:
-        """
-        Construye el contexto mejorado con los resultados de la base de datos
-        """
-        # Si hay una respuesta directa de la base de datos, usarla como contexto principal
-        if db_resultados.get('respuesta_directa'):
-            return f"**Información encontrada en la base de datos:**\n{db_resultados['respuesta_directa']}"
-        
-        contexto_texto = ""
+        def seccion(titulo, textos):
+            # Relevancia en (0.5, 1]: el primer resultado vale 1 y baja según la posición
+            fragmentos = [
+                {'texto': texto, 'relevancia': 1.0 - posicion / (2 * len(textos))}
+                for posicion, texto in enumerate(textos)
+            ]
+            if fragmentos:
+                secciones.append({'titulo': titulo, 'fragmentos': fragmentos})
         
-        # Agregar estadísticas si existen
+        # Estadísticas del sistema
         if db_resultados.get('estadisticas'):
             stats = db_resultados['estadisticas']
-            contexto_texto += "📊 ESTADÍSTICAS DEL SISTEMA:\n"
+            texto = ""
             
             if 'casos' in stats:
                 casos_stats = stats['casos']
-                contexto_texto += f"• Total de casos: {casos_stats['total']}\n"
-                contexto_texto += f"• Casos abiertos: {casos_stats['abiertos']}\n"
-                contexto_texto += f"• Casos cerrados: {casos_stats['cerrados']}\n"
+                texto += f"• Total de casos: {casos_stats['total']}\n"
+                texto += f"• Casos abiertos: {casos_stats['abiertos']}\n"
+                texto += f"• Casos cerrados: {casos_stats['cerrados']}\n"
             
             if 'documentos' in stats:
                 docs_stats = stats['documentos']
-                contexto_texto += f"• Total de documentos: {docs_stats['total']}\n"
-                contexto_texto += f"• Con palabras clave: {docs_stats['con_palabras_clave']}\n"
+                texto += f"• Total de documentos: {docs_stats['total']}\n"
+                texto += f"• Con palabras clave: {docs_stats['con_palabras_clave']}\n"
             
             if 'actores' in stats:
                 actores_stats = stats['actores']
-                contexto_texto += f"• Total de actores: {actores_stats['total']}\n"
-                contexto_texto += f"• Abogados: {actores_stats['abogados']}\n"
-                contexto_texto += f"• Clientes: {actores_stats['clientes']}\n"
-                contexto_texto += f"• Asistentes: {actores_stats['asistentes']}\n"
+                texto += f"• Total de actores: {actores_stats['total']}\n"
+                texto += f"• Abogados: {actores_stats['abogados']}\n"
+                texto += f"• Clientes: {actores_stats['clientes']}\n"
+                texto += f"• Asistentes: {actores_stats['asistentes']}\n"
             
-            contexto_texto += "\n"
+            seccion("📊 ESTADÍSTICAS DEL SISTEMA:", [texto] if texto else [])
         
-        # Agregar casos encontrados
-        if db_resultados.get('casos'):
-            contexto_texto += "📁 CASOS ENCONTRADOS:\n"
-            for caso in db_resultados['casos']:
-                contexto_texto += f"• {caso['numero']} - {caso['tipo']}\n"
-                contexto_texto += f"  - Estado: {caso['estado']}\n"
-                contexto_texto += f"  - Fecha: {caso['fecha_inicio'].strftime('%d/%m/%Y') if caso['fecha_inicio'] else 'N/A'}\n"
-                contexto_texto += f"  - Documentos: {caso['documentos_count']}\n"
-            contexto_texto += "\n"
+        # Casos encontrados
+        textos = []
+        for caso in db_resultados.get('casos') or []:
+            texto = f"• {caso['numero']} - {caso['tipo']}\n"
+            texto += f"  - Estado: {caso['estado']}\n"
+            texto += f"  - Fecha: {caso['fecha_inicio'].strftime('%d/%m/%Y') if caso['fecha_inicio'] else 'N/A'}\n"
+            texto += f"  - Documentos: {caso['documentos_count']}\n"
+            if caso.get('descripcion'):
+                texto += f"  - Descripción: {truncar(caso['descripcion'], self.max_descripcion)}\n"
+            textos.append(texto)
+        seccion("📁 CASOS ENCONTRADOS:", textos)
         
-        # Agregar documentos encontrados
-        if db_resultados.get('documentos'):
-            contexto_texto += "📄 DOCUMENTOS ENCONTRADOS:\n"
-            for doc in db_resultados['documentos']:
-                contexto_texto += f"• {doc['nombre']}\n"
-                contexto_texto += f"  - Tipo: {doc['tipo']}\n"
-                contexto_texto += f"  - Fecha: {doc['fecha'].strftime('%d/%m/%Y') if doc['fecha'] else 'N/A'}\n"
-                if doc['caso']:
-                    contexto_texto += f"  - Caso: {doc['caso']}\n"
-            contexto_texto += "\n"
+        # Documentos encontrados
+        textos = []
+        for doc in db_resultados.get('documentos') or []:
+            texto = f"• {doc['nombre']}\n"
+            texto += f"  - Tipo: {doc['tipo']}\n"
+            texto += f"  - Fecha: {doc['fecha'].strftime('%d/%m/%Y') if doc['fecha'] else 'N/A'}\n"
+            if doc['caso']:
+                texto += f"  - Caso: {doc['caso']}\n"
+            textos.append(texto)
+        seccion("📄 DOCUMENTOS ENCONTRADOS:", textos)
         
-        # Agregar actores encontrados
-        if db_resultados.get('actores'):
-            contexto_texto += "👥 ACTORES ENCONTRADOS:\n"
-            for actor in db_resultados['actores']:
-                nombre_completo = f"{actor['nombres']} {actor['apellido_paterno']} {actor['apellido_materno']}"
-                contexto_texto += f"• {nombre_completo}\n"
-                contexto_texto += f"  - Tipo: {actor['tipo']}\n"
-                contexto_texto += f"  - CI: {actor['ci']}\n"
-                if actor['info_adicional']:
-                    for key, value in actor['info_adicional'].items():
-                        contexto_texto += f"  - {key.replace('_', ' ').title()}: {value}\n"
-            contexto_texto += "\n"
+        # Actores encontrados
+        textos = []
+        for actor in db_resultados.get('actores') or []:
+            nombre_completo = f"{actor['nombres']} {actor['apellido_paterno']} {actor['apellido_materno']}"
+            texto = f"• {nombre_completo}\n"
+            texto += f"  - Tipo: {actor['tipo']}\n"
+            texto += f"  - CI: {actor['ci']}\n"
+            for key, value in (actor['info_adicional'] or {}).items():
+                texto += f"  - {key.replace('_', ' ').title()}: {value}\n"
+            textos.append(texto)
+        seccion("👥 ACTORES ENCONTRADOS:", textos)
         
-        return contexto_texto
+        # Resultados del índice que no trajo la consulta directa (relevancia BM25 en (0, 0.5])
+        vistos = {
+            (tipo, item.get('id'))
+            for clave, tipo in (('casos', 'caso'), ('documentos', 'documento'), ('actores', 'actor'))
+            for item in db_resultados.get(clave) or []
+        }
+        fragmentos = [
+            {'texto': self._fragmento_indice(item), 'relevancia': item['relevancia'] / 2}
+            for item in contexto or []
+            if (item['tipo'], item['objeto'].id) not in vistos
+        ]
+        if fragmentos:
+            secciones.append({'titulo': "🔎 OTROS RESULTADOS RELACIONADOS:", 'fragmentos': fragmentos})
+        
+        return secciones
+    
+    def _fragmento_indice(self, item: Dict[str, Any]) -> str:
+        """
+        Describe un resultado de buscar_documentos/buscar_actores/buscar_casos
+        """
+        texto = ""
+        if item['tipo'] == 'documento':
+            doc = item['objeto']
+            texto += f"📄 DOCUMENTO: {doc.nombreDocumento}\n"
+            texto += f"   - Tipo: {doc.tipoDocumento.nombre}\n"
+            if doc.carpeta and doc.carpeta.expediente:
+                texto += f"   - Caso: {doc.carpeta.expediente.caso.nroCaso}\n"
+            texto += f"   - Fecha: {doc.fechaDoc}\n"
+            texto += f"   - Estado: {doc.estado}\n"
+            if doc.palabraClave:
+                texto += f"   - Palabras clave: {truncar(doc.palabraClave, self.max_descripcion)}\n"
+        
+        elif item['tipo'] == 'actor':
+            actor = item['objeto']
+            texto += f"👤 ACTOR: {actor.nombres} {actor.apellidoPaterno}\n"
+            texto += f"   - Tipo: {actor.get_tipoActor_display()}\n"
+            texto += f"   - CI: {actor.ci}\n"
+            texto += f"   - Estado: {actor.estadoActor}\n"
+            if actor.telefono:
+                texto += f"   - Teléfono: {actor.telefono}\n"
+        
+        elif item['tipo'] == 'caso':
+            caso = item['objeto']
+            texto += f"⚖️ CASO: {caso.nroCaso}\n"
+            texto += f"   - Tipo: {caso.tipoCaso}\n"
+            texto += f"   - Estado: {caso.estado}\n"
+            texto += f"   - Prioridad: {caso.prioridad}\n"
+            texto += f"   - Fecha inicio: {caso.fechaInicio}\n"
+            if caso.descripcion:
+                texto += f"   - Descripción: {truncar(caso.descripcion, self.max_descripcion)}\n"
+        
+        return texto
     
     def _construir_historial(self, historial: List[str]) -> List[Dict[str, str]]:
         """
@@ -370,33 +554,7 @@ FORMATO DE RESPUESTA:
     
     def analizar_consulta(self, consulta: str) -> Dict[str, Any]:
         """
-        Analiza la consulta del usuario para determinar el tipo de búsqueda
+        Analiza la consulta del usuario para determinar el tipo de búsqueda: tipo,
+        entidades, intención y entidades reconocidas (ver chat.query_router)
         """
-        consulta_lower = consulta.lower()
-        
-        # Detectar tipo de consulta
-        if any(palabra in consulta_lower for palabra in ['documento', 'contrato', 'factura', 'escritura', 'certificado']):
-            tipo = 'documento'
-        elif any(palabra in consulta_lower for palabra in ['abogado', 'cliente', 'asistente', 'persona']):
-            tipo = 'actor'
-        elif any(palabra in consulta_lower for palabra in ['caso', 'expediente', 'proceso', 'demanda']):
-            tipo = 'caso'
-        else:
-            tipo = 'general'
-        
-        # Extraer entidades
-        entidades = []
-        if 'contrato' in consulta_lower:
-            entidades.append('contrato')
-        if 'factura' in consulta_lower:
-            entidades.append('factura')
-        if 'abogado' in consulta_lower:
-            entidades.append('abogado')
-        if 'cliente' in consulta_lower:
-            entidades.append('cliente')
-        
-        return {
-            'tipo': tipo,
-            'entidades': entidades,
-            'consulta_original': consulta
-        }
+        return analizar_consulta(consulta)
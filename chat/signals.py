@@ -0,0 +1,96 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from actores.models import Actor, Abogado, Cliente, Asistente
+from casos.models import Caso
+from documentos.models import Documento, TipoDocumento
+from .models import ConfiguracionIA, Conversacion, Mensaje
+from .openai_pool import reiniciar_pool
+from .prompt_builder import truncar
+from .response_cache import RespuestaCacheService
+from .search_index import obtener_indice, indice_cargado
+from .suggestion_service import SuggestionService
+
+
+# === INVALIDACIÓN DE LA CACHÉ DE RESPUESTAS ===
+
+@receiver(post_save, sender=Caso)
+@receiver(post_delete, sender=Caso)
+@receiver(post_save, sender=Documento)
+@receiver(post_delete, sender=Documento)
+@receiver(post_save, sender=Actor)
+@receiver(post_delete, sender=Actor)
+def invalidar_cache_respuestas(sender, **kwargs):
+    """Los datos que alimentan las respuestas cambiaron: las entradas guardadas dejan de valer"""
+    RespuestaCacheService().invalidar()
+
+
+# === SNAPSHOT DE SUGERENCIAS ===
+
+@receiver([post_save, post_delete], sender=Caso)
+@receiver([post_save, post_delete], sender=Documento)
+@receiver([post_save, post_delete], sender=TipoDocumento)
+@receiver([post_save, post_delete], sender=Actor)
+@receiver([post_save, post_delete], sender=Abogado)
+@receiver([post_save, post_delete], sender=Cliente)
+@receiver([post_save, post_delete], sender=Asistente)
+def invalidar_snapshot_sugerencias(sender, **kwargs):
+    """Cambian los datos de las sugerencias: se pasa a una nueva versión del snapshot"""
+    SuggestionService.invalidar_snapshot()
+
+
+# === ÍNDICE BM25 DEL CHAT ===
+
+@receiver([post_save, post_delete], sender=Abogado)
+def marcar_actor_de_abogado(sender, instance, **kwargs):
+    """
+    La especialidad forma parte del texto indexado del actor: se marca el actor
+    como modificado para que todos los procesos lo reindexen
+    """
+    Actor.objects.filter(pk=instance.actor_id).update(actualizadoEn=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Documento)
+@receiver([post_save, post_delete], sender=Caso)
+@receiver([post_save, post_delete], sender=Actor)
+@receiver([post_save, post_delete], sender=Abogado)
+def actualizar_indice_chat(sender, **kwargs):
+    """
+    Sincroniza el índice del proceso al confirmar la transacción (si ya está
+    cargado); los demás procesos lo hacen antes de su siguiente búsqueda
+    """
+    if indice_cargado():
+        transaction.on_commit(lambda: obtener_indice(sincronizar=True))
+
+
+# === CLIENTE COMPARTIDO DE OPENAI ===
+
+@receiver(post_save, sender=ConfiguracionIA)
+@receiver(post_delete, sender=ConfiguracionIA)
+def reiniciar_cliente_openai(sender, **kwargs):
+    """Los límites del cliente cambiaron: se recrea con la nueva configuración"""
+    reiniciar_pool()
+
+
+# === LISTADO DE CONVERSACIONES ===
+
+@receiver(post_save, sender=Mensaje)
+def registrar_mensaje_en_conversacion(sender, instance, created, **kwargs):
+    """Contador, vista previa y última actividad en un único UPDATE atómico"""
+    if not created:
+        return
+    Conversacion.objects.filter(pk=instance.conversacion_id).update(
+        cantidad_mensajes=F('cantidad_mensajes') + 1,
+        ultimo_mensaje=truncar(instance.contenido, 199),
+        fecha_actualizacion=timezone.now()
+    )
+
+
+@receiver(post_delete, sender=Mensaje)
+def descontar_mensaje_de_conversacion(sender, instance, **kwargs):
+    Conversacion.objects.filter(pk=instance.conversacion_id, cantidad_mensajes__gt=0).update(
+        cantidad_mensajes=F('cantidad_mensajes') - 1
+    )
@@ -0,0 +1,206 @@
+"""
+Agrupación de consultas idénticas en curso (single-flight): mientras una
+consulta se está resolviendo, las peticiones con la misma clave esperan y
+reciben el mismo resultado en lugar de repetir búsquedas y llamadas a OpenAI.
+La agrupación es por proceso.
+"""
+import asyncio
+import threading
+from typing import Any, Callable, Iterator, Tuple
+
+
+class _Vuelo:
+    """Resultado compartido de una llamada síncrona en curso"""
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class _StreamCompartido:
+    """
+    Fragmentos de una respuesta en stream compartidos por varios lectores.
+    Cualquier lector puede pedir el siguiente fragmento a la fuente; la fuente
+    solo se cierra cuando se va el último lector.
+    """
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.datos = None
+        self.fuente = None
+        self.error = None
+        self.fragmentos = []
+        self.terminado = False
+        self.lectores = 0
+        self.lock = threading.Lock()
+
+
+class LectorStream:
+    """
+    Iterador de un lector sobre un stream compartido (con close() como el Stream de openai)
+    """
+
+    def __init__(self, vuelos, clave, stream):
+        self._vuelos = vuelos
+        self._clave = clave
+        self._stream = stream
+        self._posicion = 0
+        self._cerrado = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._cerrado:
+            raise StopIteration
+
+        stream = self._stream
+        with stream.lock:
+            if self._posicion < len(stream.fragmentos):
+                fragmento = stream.fragmentos[self._posicion]
+            elif stream.terminado:
+                fragmento = None
+            else:
+                try:
+                    fragmento = next(stream.fuente)
+                    stream.fragmentos.append(fragmento)
+                except StopIteration:
+                    stream.terminado = True
+                    fragmento = None
+                except BaseException:
+                    stream.terminado = True
+                    raise
+
+        if fragmento is None:
+            self.close()
+            raise StopIteration
+        self._posicion += 1
+        return fragmento
+
+    def close(self):
+        if not self._cerrado:
+            self._cerrado = True
+            self._vuelos._salir_stream(self._clave, self._stream)
+
+
+class SingleFlight:
+    """
+    Registro de consultas en curso por clave
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vuelos = {}
+        self._streams = {}
+        self._futuros = {}
+        self.coalescidas = 0
+
+    def ejecutar(self, clave: str, funcion: Callable[[], Any]) -> Any:
+        """
+        Ejecuta la función una sola vez para todas las llamadas simultáneas con la misma clave
+        """
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+            else:
+                self.coalescidas += 1
+
+        if not lider:
+            vuelo.listo.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = funcion()
+            return vuelo.resultado
+        except BaseException as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._vuelos[clave]
+            vuelo.listo.set()
+
+    async def aejecutar(self, clave: str, funcion) -> Any:
+        """
+        Versión asíncrona de ejecutar; `funcion` devuelve una corrutina
+        """
+        loop = asyncio.get_running_loop()
+        clave_loop = (id(loop), clave)
+
+        while True:
+            futuro = self._futuros.get(clave_loop)
+            if futuro is None:
+                break
+            self.coalescidas += 1
+            try:
+                return await asyncio.shield(futuro)
+            except asyncio.CancelledError:
+                # Se canceló la petición que resolvía la consulta: la retoma otra
+                if not futuro.cancelled():
+                    raise
+
+        futuro = self._futuros[clave_loop] = loop.create_future()
+        try:
+            resultado = await funcion()
+            futuro.set_result(resultado)
+            return resultado
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except BaseException as e:
+            futuro.set_exception(e)
+            futuro.exception()  # evita el aviso de excepción no recuperada si nadie esperaba
+            raise
+        finally:
+            del self._futuros[clave_loop]
+
+    def compartir_stream(self, clave: str, crear: Callable[[], Tuple[Any, Iterator[str]]]) -> Tuple[Any, LectorStream]:
+        """
+        `crear` devuelve (datos, iterador de fragmentos). Las peticiones con la misma
+        clave reciben los mismos datos y leen los mismos fragmentos, incluidos los
+        que ya se enviaron antes de que llegaran.
+        """
+        with self._lock:
+            stream = self._streams.get(clave)
+            lider = stream is None
+            if lider:
+                stream = self._streams[clave] = _StreamCompartido()
+            else:
+                self.coalescidas += 1
+            stream.lectores += 1
+
+        if lider:
+            try:
+                stream.datos, stream.fuente = crear()
+            except BaseException as e:
+                stream.error = e
+            finally:
+                stream.listo.set()
+        else:
+            stream.listo.wait()
+
+        if stream.error is not None:
+            self._salir_stream(clave, stream)
+            raise stream.error
+        return stream.datos, LectorStream(self, clave, stream)
+
+    def _salir_stream(self, clave: str, stream: _StreamCompartido):
+        with self._lock:
+            stream.lectores -= 1
+            ultimo = stream.lectores == 0
+            if ultimo and self._streams.get(clave) is stream:
+                del self._streams[clave]
+
+        # Sin lectores: se cierra la fuente (aborta la generación en OpenAI)
+        if ultimo and stream.fuente is not None and not stream.terminado:
+            with stream.lock:
+                stream.fuente.close()
+
+
+# Registro compartido por las vistas del chat
+consultas_en_vuelo = SingleFlight()
@@ -1,4 +1,8 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, Q
+from GestDocSi2.cache_versions import acotar_ttl, incrementar_version, version
 from casos.models import Caso, Expediente, Carpeta
 from documentos.models import Documento, TipoDocumento, EtapaProcesal
 from actores.models import Actor, Abogado, Cliente, Asistente
@@ -8,13 +12,23 @@ import random
 
 User = get_user_model()
 
+# Claves en la caché de Django: la versión cambia con cada modificación de los datos
+SNAPSHOT_VERSION_KEY = 'chat:sugerencias:version'
+SNAPSHOT_KEY = 'chat:sugerencias:snapshot:{version}'
+
+# Cantidad de ejemplos que se guardan por lista (las sugerencias usan el primero)
+MAX_EJEMPLOS = 5
+
 class SuggestionService:
     """
-    Servicio para generar sugerencias inteligentes basadas en datos reales de la DB
+    Servicio para generar sugerencias inteligentes basadas en datos reales de la DB.
+    Los datos se leen de un snapshot en caché que se invalida por versión cuando
+    cambian los modelos consultados (ver chat.signals); por petición solo se
+    arman y mezclan las sugerencias.
     """
     
     def __init__(self):
-        pass
+        self.ttl = acotar_ttl(int(getattr(settings, 'CHAT_SUGERENCIAS_TTL', 600)))
     
     def get_smart_suggestions(self, user=None):
         """
@@ -22,42 +36,70 @@ class SuggestionService:
         """
         suggestions = []
         
-        # Obtener datos reales de la base de datos
-        casos_data = self._get_casos_data()
-        documentos_data = self._get_documentos_data()
-        actores_data = self._get_actores_data()
+        # Obtener datos reales de la base de datos (snapshot en caché)
+        snapshot = self.get_snapshot()
         
         # Generar sugerencias basadas en datos reales
-        suggestions.extend(self._generate_casos_suggestions(casos_data))
-        suggestions.extend(self._generate_documentos_suggestions(documentos_data))
-        suggestions.extend(self._generate_actores_suggestions(actores_data))
+        suggestions.extend(self._generate_casos_suggestions(snapshot['casos']))
+        suggestions.extend(self._generate_documentos_suggestions(snapshot['documentos']))
+        suggestions.extend(self._generate_actores_suggestions(snapshot['actores']))
         suggestions.extend(self._generate_general_suggestions())
         
         # Mezclar y limitar sugerencias
         random.shuffle(suggestions)
         return suggestions[:8]  # Máximo 8 sugerencias
     
+    def get_snapshot(self):
+        """
+        Devuelve los datos de casos, documentos y actores, calculándolos solo
+        si la versión actual no está en caché
+        """
+        clave = SNAPSHOT_KEY.format(version=version(SNAPSHOT_VERSION_KEY))
+        snapshot = cache.get(clave)
+        if snapshot is None:
+            snapshot = {
+                'casos': self._get_casos_data(),
+                'documentos': self._get_documentos_data(),
+                'actores': self._get_actores_data(),
+            }
+            cache.set(clave, snapshot, self.ttl)
+        return snapshot
+    
+    @staticmethod
+    def invalidar_snapshot():
+        """Cambia de versión; el snapshot anterior deja de usarse y expira solo"""
+        incrementar_version(SNAPSHOT_VERSION_KEY)
+    
     def _get_casos_data(self):
         """Obtiene datos reales de casos"""
         casos = Caso.objects.all()
+        conteos = casos.aggregate(
+            total=Count('id'),
+            casos_abiertos=Count('id', filter=Q(estado='ABIERTO')),
+            casos_cerrados=Count('id', filter=Q(estado='CERRADO')),
+        )
         return {
-            'total': casos.count(),
-            'tipos': list(casos.values_list('tipoCaso', flat=True).distinct()),
-            'estados': list(casos.values_list('estado', flat=True).distinct()),
-            'casos_recientes': list(casos.order_by('-fechaInicio')[:5].values_list('nroCaso', flat=True)),
-            'casos_abiertos': casos.filter(estado='ABIERTO').count(),
-            'casos_cerrados': casos.filter(estado='CERRADO').count(),
+            'total': conteos['total'],
+            'tipos': list(casos.order_by('tipoCaso').values_list('tipoCaso', flat=True).distinct()[:MAX_EJEMPLOS]),
+            'estados': list(casos.order_by('estado').values_list('estado', flat=True).distinct()),
+            'casos_recientes': list(casos.order_by('-fechaInicio')[:MAX_EJEMPLOS].values_list('nroCaso', flat=True)),
+            'casos_abiertos': conteos['casos_abiertos'],
+            'casos_cerrados': conteos['casos_cerrados'],
         }
     
     def _get_documentos_data(self):
         """Obtiene datos reales de documentos"""
         documentos = Documento.objects.all()
         tipos_doc = TipoDocumento.objects.all()
+        conteos = documentos.aggregate(
+            total=Count('id'),
+            con_palabras_clave=Count('id', filter=~Q(palabraClave='')),
+        )
         return {
-            'total': documentos.count(),
-            'tipos': list(tipos_doc.values_list('nombre', flat=True)),
-            'documentos_recientes': list(documentos.order_by('-fechaDoc')[:5].values_list('nombreDocumento', flat=True)),
-            'con_palabras_clave': documentos.exclude(palabraClave='').count(),
+            'total': conteos['total'],
+            'tipos': list(tipos_doc.values_list('nombre', flat=True)[:MAX_EJEMPLOS]),
+            'documentos_recientes': list(documentos.order_by('-fechaDoc')[:MAX_EJEMPLOS].values_list('nombreDocumento', flat=True)),
+            'con_palabras_clave': conteos['con_palabras_clave'],
         }
     
     def _get_actores_data(self):
@@ -69,10 +111,10 @@ class SuggestionService:
         
         return {
             'total': actores.count(),
-            'abogados': list(abogados.select_related('actor').values_list('actor__nombres', 'actor__apellidoPaterno', 'especialidad')),
-            'clientes': list(clientes.select_related('actor').values_list('actor__nombres', 'actor__apellidoPaterno', 'tipoCliente')),
-            'asistentes': list(asistentes.select_related('actor').values_list('actor__nombres', 'actor__apellidoPaterno', 'area')),
-            'especialidades': list(abogados.values_list('especialidad', flat=True).distinct()),
+            'abogados': list(abogados.values_list('actor__nombres', 'actor__apellidoPaterno', 'especialidad')[:MAX_EJEMPLOS]),
+            'clientes': list(clientes.values_list('actor__nombres', 'actor__apellidoPaterno', 'tipoCliente')[:MAX_EJEMPLOS]),
+            'asistentes': list(asistentes.values_list('actor__nombres', 'actor__apellidoPaterno', 'area')[:MAX_EJEMPLOS]),
+            'especialidades': list(abogados.order_by('especialidad').values_list('especialidad', flat=True).distinct()[:MAX_EJEMPLOS]),
         }
     
     def _generate_casos_suggestions(self, casos_data):
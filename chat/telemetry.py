@@ -0,0 +1,171 @@
+"""
+Telemetría por mensaje del chat: duración de cada etapa del pipeline (análisis,
+búsquedas, DatabaseQueryService, armado del prompt, OpenAI y guardado), consultas
+SQL por etapa y tokens informados por OpenAI. Se guarda en Mensaje.telemetria y
+se agrega en percentiles con resumen_telemetria.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List
+
+from django.db import connection
+from django.utils import timezone
+
+
+# Orden en que se muestran las etapas
+ETAPAS = (
+    'historial', 'reglas', 'analisis', 'documentos', 'actores', 'casos', 'db', 'prompt',
+    'cache', 'llm_primer_token', 'llm', 'persistencia', 'total',
+)
+PERCENTILES = (50, 95, 99)
+MAX_MENSAJES_RESUMEN = 5000
+
+
+class TelemetriaChat:
+    """
+    Acumula las mediciones de una consulta. Las etapas pueden medirse desde
+    hilos distintos (búsquedas en paralelo del pipeline asíncrono): cada hilo
+    cuenta las consultas SQL de su propia conexión.
+    """
+
+    def __init__(self):
+        self.etapas: Dict[str, float] = {}
+        self.consultas_sql: Dict[str, int] = {}
+        self.tokens_prompt = None
+        self.tokens_respuesta = None
+        self.tokens_estimados = False
+        self.origen = None
+        self.regla = None
+        self.compartida = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def medir(self, etapa: str):
+        """Mide la duración (ms) y las consultas SQL del bloque; se suman si la etapa se repite"""
+        consultas = [0]
+
+        def contar(execute, sql, params, many, context):
+            consultas[0] += 1
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(contar):
+                yield
+        finally:
+            self.registrar(etapa, (time.perf_counter() - inicio) * 1000, consultas[0])
+
+    def medido(self, etapa: str, funcion):
+        """Envuelve `funcion` para medirla en el hilo donde se ejecute"""
+        def ejecutar(*args, **kwargs):
+            with self.medir(etapa):
+                return funcion(*args, **kwargs)
+        return ejecutar
+
+    def registrar(self, etapa: str, milisegundos: float, consultas: int = 0):
+        with self._lock:
+            self.etapas[etapa] = self.etapas.get(etapa, 0.0) + milisegundos
+            if consultas:
+                self.consultas_sql[etapa] = self.consultas_sql.get(etapa, 0) + consultas
+
+    def registrar_uso(self, usage, tokens_estimados: int = None):
+        """
+        Tokens de prompt/respuesta del campo `usage` de OpenAI; sin él, la
+        estimación del PromptBuilder
+        """
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        completion_tokens = getattr(usage, 'completion_tokens', None)
+        if isinstance(prompt_tokens, int):
+            self.tokens_prompt = prompt_tokens
+            self.tokens_estimados = False
+        elif tokens_estimados is not None:
+            self.tokens_prompt = tokens_estimados
+            self.tokens_estimados = True
+        if isinstance(completion_tokens, int):
+            self.tokens_respuesta = completion_tokens
+
+    def como_dict(self) -> Dict[str, Any]:
+        """Forma en que se guarda en Mensaje.telemetria"""
+        with self._lock:
+            return {
+                'etapas': {etapa: round(ms, 2) for etapa, ms in self.etapas.items()},
+                'consultas_sql': dict(self.consultas_sql),
+                'consultas_sql_total': sum(self.consultas_sql.values()),
+                'tokens_prompt': self.tokens_prompt,
+                'tokens_respuesta': self.tokens_respuesta,
+                'tokens_estimados': self.tokens_estimados,
+                'origen': self.origen,
+                'regla': self.regla,
+                'compartida': self.compartida,
+            }
+
+
+def percentiles(valores: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 por rango más cercano"""
+    if not valores:
+        return {}
+    ordenados = sorted(valores)
+    resultado = {'n': len(ordenados)}
+    for p in PERCENTILES:
+        indice = max(0, -(-len(ordenados) * p // 100) - 1)
+        resultado[f'p{p}'] = round(ordenados[indice], 2)
+    return resultado
+
+
+def resumir_telemetria(registros: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Percentiles por etapa, de consultas SQL y de tokens sobre un conjunto de Mensaje.telemetria"""
+    etapas: Dict[str, List[float]] = {}
+    consultas, tokens_prompt, tokens_respuesta = [], [], []
+    origenes: Dict[str, int] = {}
+    reglas: Dict[str, int] = {}
+    total = 0
+    for registro in registros:
+        if not registro:
+            continue
+        total += 1
+        for etapa, ms in (registro.get('etapas') or {}).items():
+            etapas.setdefault(etapa, []).append(ms)
+        consultas.append(registro.get('consultas_sql_total') or 0)
+        if registro.get('tokens_prompt') is not None:
+            tokens_prompt.append(registro['tokens_prompt'])
+        if registro.get('tokens_respuesta') is not None:
+            tokens_respuesta.append(registro['tokens_respuesta'])
+        origen = registro.get('origen') or 'desconocido'
+        origenes[origen] = origenes.get(origen, 0) + 1
+        if origen == 'directa':
+            regla = registro.get('regla') or 'desconocida'
+            reglas[regla] = reglas.get(regla, 0) + 1
+
+    orden = {etapa: i for i, etapa in enumerate(ETAPAS)}
+    return {
+        'mensajes': total,
+        'etapas_ms': {
+            etapa: percentiles(etapas[etapa])
+            for etapa in sorted(etapas, key=lambda e: (orden.get(e, len(ETAPAS)), e))
+        },
+        'consultas_sql': percentiles(consultas),
+        'tokens_prompt': percentiles(tokens_prompt),
+        'tokens_respuesta': percentiles(tokens_respuesta),
+        'origen': origenes,
+        # Proporción de respuestas del motor de reglas, sin llamar a OpenAI
+        'respuesta_directa': {
+            'tasa': round(origenes.get('directa', 0) / total, 4) if total else None,
+            'por_regla': reglas,
+        },
+    }
+
+
+def resumen_telemetria(horas: float = 24) -> Dict[str, Any]:
+    """
+    Agrega la telemetría de las respuestas del asistente de las últimas `horas`
+    (como máximo las MAX_MENSAJES_RESUMEN más recientes)
+    """
+    from .models import Mensaje
+
+    desde = timezone.now() - timedelta(hours=horas)
+    registros = Mensaje.objects.filter(
+        tipo='asistente', fecha_envio__gte=desde
+    ).exclude(telemetria={}).order_by('-fecha_envio').values_list('telemetria', flat=True)[:MAX_MENSAJES_RESUMEN]
+    return {'ventana_horas': horas, **resumir_telemetria(registros)}
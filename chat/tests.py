@@ -1,3 +1,1262 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import openai
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from actores.models import Actor
+from casos.models import Caso, Expediente, Carpeta, EquipoCaso
+from documentos.models import Documento, TipoDocumento
+from seguridad.models import Usuario
+from . import views
+from .batch_service import LoteConsultasIA
+from .case_summary_service import CaseSummaryService
+from .conversation_summary_service import ConversationSummaryService
+from .database_service import DatabaseQueryService
+from .fake_openai import FakeOpenAI, FakeAsyncOpenAI
+from .job_queue import ColaTareasIA, TrabajadorTareasIA
+from .models import (
+    Conversacion, Mensaje, ConsultaDocumento, RespuestaCacheIA, EstadisticaCacheIA, ConfiguracionIA, TareaIA
+)
+from .telemetry import resumir_telemetria
+from .search_index import IndiceBM25, SegmentoDisco, indice_cargado, obtener_indice, reiniciar_indice
+from .single_flight import SingleFlight
+from .suggestion_service import SuggestionService
+from .openai_pool import PoolOpenAI, cargar_configuracion, obtener_pool, reiniciar_pool
+from .prompt_builder import PromptBuilder, truncar
+from .query_router import analizar_consulta, tipos_mencionados
+from .response_cache import RespuestaCacheService, reiniciar_estadisticas
+from .services import AsistenteIAService
+from .views import procesar_consulta_ia, procesar_consulta_ia_async
+from .warmup import iniciar_precalentamiento, precalentar
+
+
+def crear_casos(cantidad, carpetas_por_caso=2, docs_por_carpeta=3, prefijo="CIV"):
+    """Crea casos con expediente, carpetas y documentos para las pruebas"""
+    tipo, _ = TipoDocumento.objects.get_or_create(nombre="Contrato")
+    inicio = Caso.objects.count()
+    casos = []
+    for i in range(inicio, inicio + cantidad):
+        caso = Caso.objects.create(
+            nroCaso=f"{prefijo}-2024-{i:03d}",
+            tipoCaso="Divorcio",
+            descripcion="Caso de prueba",
+            estado="ABIERTO",
+            fechaInicio=date(2024, 1, 1),
+        )
+        expediente = Expediente.objects.create(
+            caso=caso, nroExpediente=f"EXP-{i:04d}", fechaCreacion=date(2024, 1, 1)
+        )
+        for c in range(carpetas_por_caso):
+            carpeta = Carpeta.objects.create(expediente=expediente, nombre=f"Carpeta {c}")
+            for d in range(docs_por_carpeta):
+                Documento.objects.create(
+                    carpeta=carpeta,
+                    tipoDocumento=tipo,
+                    nombreDocumento=f"Doc {i}-{c}-{d}",
+                    fechaDoc=date(2024, 2, 1),
+                )
+        casos.append(caso)
+    return casos
+
+
+class CaseSummaryServiceTests(TestCase):
+
+    def test_conteos_agregados(self):
+        crear_casos(2, carpetas_por_caso=2, docs_por_carpeta=3)
+        resumen = CaseSummaryService().resumir_casos()
+
+        self.assertEqual(len(resumen), 2)
+        for caso in resumen:
+            self.assertIsNotNone(caso['expediente_id'])
+            self.assertEqual(caso['carpetas_count'], 2)
+            self.assertEqual(caso['documentos_count'], 6)
+
+    def test_consultas_constantes_en_busqueda_de_casos(self):
+        servicio = DatabaseQueryService()
+
+        crear_casos(2)
+        with self.assertNumQueries(1):
+            pocos = servicio._buscar_casos_especificos("casos abiertos")
+
+        crear_casos(8)
+        with self.assertNumQueries(1):
+            muchos = servicio._buscar_casos_especificos("casos abiertos")
+
+        self.assertEqual(len(pocos), 2)
+        self.assertEqual(len(muchos), 10)
+
+
+@override_settings(OPENAI_FAKE=True)
+class IndiceBM25Tests(TestCase):
+
+    def setUp(self):
+        reiniciar_indice()
+        self.addCleanup(reiniciar_indice)
+
+    def test_consultas_constantes_en_buscar_documentos(self):
+        crear_casos(2, prefijo="PEN")
+        servicio = AsistenteIAService()
+        servicio.buscar_documentos("PEN-2024", None)  # carga el índice
+
+        # Dentro del intervalo de sincronización solo se leen los documentos encontrados
+        with self.assertNumQueries(1):
+            pocos = servicio.buscar_documentos("PEN-2024", None)
+        with override_settings(CHAT_INDICE_SINCRONIZAR_CADA=0), self.assertNumQueries(2):
+            servicio.buscar_documentos("PEN-2024", None)
+
+        reiniciar_indice()
+        crear_casos(8, prefijo="PEN")
+        servicio.buscar_documentos("PEN-2024", None)
+        with self.assertNumQueries(1):
+            muchos = servicio.buscar_documentos("PEN-2024", None)
+
+        self.assertEqual(len(pocos), 10)
+        self.assertEqual(len(muchos), 10)
+
+    def test_tildes_plurales_y_orden_por_relevancia(self):
+        crear_casos(1, carpetas_por_caso=1, docs_por_carpeta=1)
+        carpeta = Carpeta.objects.first()
+        tipo = TipoDocumento.objects.first()
+        contrato = Documento.objects.create(
+            carpeta=carpeta, tipoDocumento=tipo, nombreDocumento="Contrato de arrendamiento",
+            palabraClave="alquiler", fechaDoc=date(2024, 2, 1),
+        )
+        Documento.objects.create(
+            carpeta=carpeta, tipoDocumento=tipo, nombreDocumento="Notificación de audiencia",
+            fechaDoc=date(2024, 2, 1),
+        )
+
+        resultados = AsistenteIAService().buscar_documentos("CONTRATOS de arrendamientos", None)
+        self.assertEqual(resultados[0]["objeto"], contrato)
+        self.assertEqual(resultados[0]["relevancia"], 1.0)
+
+        notificacion = AsistenteIAService().buscar_documentos("notificacion audiencias", None)
+        self.assertEqual(notificacion[0]["objeto"].nombreDocumento, "Notificación de audiencia")
+
+    def test_senales_mantienen_el_indice(self):
+        crear_casos(1, carpetas_por_caso=0)
+        indice = obtener_indice()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            caso = Caso.objects.create(
+                nroCaso="LAB-2024-900", tipoCaso="Despido injustificado", estado="ABIERTO",
+                fechaInicio=date(2024, 1, 1),
+            )
+        self.assertEqual(indice.buscar("despidos", tipos=["caso"])[0][:2], ("caso", caso.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            caso.delete()
+        self.assertEqual(indice.buscar("despidos", tipos=["caso"]), [])
+
+    @override_settings(CHAT_INDICE_SINCRONIZAR_CADA=0)
+    def test_cambios_de_otro_proceso_se_ven_en_la_siguiente_busqueda(self):
+        casos = crear_casos(2, carpetas_por_caso=1, docs_por_carpeta=1)
+        indice = obtener_indice()
+        documento = Documento.objects.get(carpeta__expediente__caso=casos[0])
+
+        # update() no dispara señales: simula la escritura de otro proceso
+        Documento.objects.filter(pk=documento.pk).update(
+            nombreDocumento="Acta de conciliación", actualizadoEn=timezone.now()
+        )
+        Caso.objects.filter(pk=casos[1].pk).delete()
+
+        self.assertEqual(obtener_indice().buscar("conciliaciones")[0][:2], ("documento", documento.id))
+        self.assertNotIn(("caso", casos[1].id), [r[:2] for r in indice.buscar("divorcio")])
+        self.assertEqual(indice.conteos(), {"documento": 1, "caso": 1})
+
+    def test_cambiar_nro_caso_reindexa_sus_documentos(self):
+        caso = crear_casos(1, carpetas_por_caso=1, docs_por_carpeta=2)[0]
+        obtener_indice()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            caso.nroCaso = "PEN-2025-777"
+            caso.save()
+
+        encontrados = obtener_indice().buscar("PEN-2025-777", tipos=["documento"])
+        self.assertEqual(len(encontrados), 2)
+        self.assertEqual(obtener_indice().buscar("CIV-2024-000", tipos=["documento"]), [])
+
+    def test_indice_guardado_en_disco(self):
+        casos = crear_casos(3, carpetas_por_caso=1, docs_por_carpeta=2)
+        indice = obtener_indice()
+        esperado = indice.buscar("Doc 1", k=5)
+
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, "indice.idx")
+            indice.guardar(ruta)
+            abierto = IndiceBM25(SegmentoDisco(ruta))
+
+            self.assertEqual(abierto.buscar("Doc 1", k=5), esperado)
+            self.assertEqual(abierto.conteos(), {"documento": 6, "caso": 3})
+            self.assertEqual(abierto.base.marcas, indice.marcas)
+
+            # Cambios sobre el segmento base: borrado y reindexado en el delta
+            abierto.eliminar("caso", casos[0].id)
+            Caso.objects.filter(id=casos[1].id).update(descripcion="Reclamo laboral")
+            abierto.actualizar("caso", casos[1].id)
+
+            self.assertEqual([r[1] for r in abierto.buscar("reclamos laborales", tipos=["caso"])], [casos[1].id])
+            self.assertNotIn(casos[0].id, [r[1] for r in abierto.buscar("divorcio", tipos=["caso"])])
+
+
+@override_settings(OPENAI_FAKE=True)
+class RespuestaCacheTests(TestCase):
+
+    def setUp(self):
+        reiniciar_estadisticas()
+        self.addCleanup(reiniciar_estadisticas)
+
+    def test_misma_pregunta_reutiliza_respuesta(self):
+        fake = FakeOpenAI(respuesta="Respuesta cacheada")
+        servicio = AsistenteIAService(client=fake)
+
+        primera = servicio.generar_respuesta_ia("Hola, buenos días", [])
+        segunda = servicio.generar_respuesta_ia("  hola buenos DIAS?", [])
+
+        self.assertEqual(primera, "Respuesta cacheada")
+        self.assertEqual(segunda, "Respuesta cacheada")
+        self.assertEqual(len(fake.llamadas), 1)
+        estadisticas = servicio.cache.estadisticas()
+        self.assertEqual(estadisticas["aciertos"], 1)
+        self.assertEqual(estadisticas["fallos"], 1)
+        self.assertGreater(estadisticas["tokens_ahorrados"], 0)
+
+    def test_cambios_en_casos_invalidan_la_cache(self):
+        fake = FakeOpenAI()
+        servicio = AsistenteIAService(client=fake)
+
+        servicio.generar_respuesta_ia("Hola, buenos días", [])
+        crear_casos(1, carpetas_por_caso=0)
+        servicio.generar_respuesta_ia("Hola, buenos días", [])
+
+        self.assertEqual(len(fake.llamadas), 2)
+        self.assertGreaterEqual(servicio.cache.estadisticas()["invalidaciones"], 1)
+
+    def test_invalidar_cambia_la_version_sin_borrar_la_tabla(self):
+        cache = RespuestaCacheService()
+        clave = cache.calcular_clave("pregunta", "contexto", "modelo", 0.7)
+        cache.guardar(clave, "pregunta", "modelo", 0.7, "respuesta")
+        cache.invalidar()  # crea la fila de estadísticas
+
+        with self.assertNumQueries(1):
+            cache.invalidar()
+
+        self.assertTrue(RespuestaCacheIA.objects.filter(clave=clave).exists())
+        self.assertIsNone(cache.obtener(clave))
+        cache.guardar(clave, "pregunta", "modelo", 0.7, "nueva")
+        self.assertEqual(cache.obtener(clave), "nueva")
+
+    def test_el_historial_y_el_resumen_forman_parte_de_la_clave(self):
+        fake = FakeOpenAI()
+        servicio = AsistenteIAService(client=fake)
+
+        for historial, resumen in (
+            (["Háblame del caso CIV-2024-001", "Es un divorcio"], None),
+            (["Háblame del caso LAB-2024-002", "Es un despido"], None),
+            ([], "Hablamos del caso PEN-2024-003"),
+            (["Háblame del caso CIV-2024-001", "Es un divorcio"], None),
+        ):
+            servicio.generar_respuesta_ia("¿Y su estado?", [], conversacion_historial=historial, resumen=resumen)
+
+        self.assertEqual(len(fake.llamadas), 3)
+
+    @override_settings(CHAT_CACHE_ESTADISTICAS_INTERVALO=60)
+    def test_contadores_se_vuelcan_por_lotes(self):
+        cache = RespuestaCacheService()
+        clave = cache.calcular_clave("pregunta", "contexto", "modelo", 0.7)
+        cache.guardar(clave, "pregunta", "modelo", 0.7, "respuesta")
+
+        # Acierto: lectura de la entrada y su último acceso, sin tocar la fila de estadísticas
+        with self.assertNumQueries(2):
+            cache.obtener(clave)
+        with self.assertNumQueries(1):
+            cache.obtener("otra")
+
+        self.assertFalse(EstadisticaCacheIA.objects.exists())
+        estadisticas = cache.estadisticas()
+        self.assertEqual((estadisticas["aciertos"], estadisticas["fallos"]), (1, 1))
+
+    @override_settings(CHAT_CACHE_MAX_ENTRADAS=2)
+    def test_desalojo_lru(self):
+        cache = RespuestaCacheService()
+        claves = [cache.calcular_clave(f"pregunta {i}", "contexto", "modelo", 0.7) for i in range(3)]
+
+        cache.guardar(claves[0], "pregunta 0", "modelo", 0.7, "r0")
+        cache.guardar(claves[1], "pregunta 1", "modelo", 0.7, "r1")
+        cache.obtener(claves[0])  # la 0 pasa a ser la más reciente
+        cache.guardar(claves[2], "pregunta 2", "modelo", 0.7, "r2")
+
+        self.assertEqual(
+            set(RespuestaCacheIA.objects.values_list("clave", flat=True)), {claves[0], claves[2]}
+        )
+
+    @override_settings(CHAT_CACHE_TTL=0)
+    def test_entradas_expiradas_no_se_usan(self):
+        cache = RespuestaCacheService()
+        clave = cache.calcular_clave("pregunta", "contexto", "modelo", 0.7)
+        cache.guardar(clave, "pregunta", "modelo", 0.7, "respuesta")
+
+        self.assertIsNone(cache.obtener(clave))
+
+
+@override_settings(OPENAI_FAKE=True, CHAT_HISTORIAL_MENSAJES=4, CHAT_RESUMEN_EN_SEGUNDO_PLANO=False)
+class ResumenConversacionTests(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            username="abogado1", email="abogado1@example.com", password="123456"
+        )
+        self.conversacion = Conversacion.objects.create(usuario=self.usuario)
+        for i in range(3):
+            Mensaje.objects.create(conversacion=self.conversacion, tipo="usuario", contenido=f"pregunta {i}")
+            Mensaje.objects.create(conversacion=self.conversacion, tipo="asistente", contenido=f"respuesta {i}")
+
+    def test_resume_lo_que_sale_de_la_ventana_reciente(self):
+        fake = FakeOpenAI(respuesta="El usuario preguntó por el caso CIV-2024-001.")
+        servicio = ConversationSummaryService(client=fake)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            servicio.programar(self.conversacion.id)
+
+        self.conversacion.refresh_from_db()
+        self.assertEqual(self.conversacion.resumen, "El usuario preguntó por el caso CIV-2024-001.")
+        self.assertIn("Usuario: pregunta 0\nAsistente: respuesta 0", fake.llamadas[0]["messages"][1]["content"])
+        self.assertEqual(servicio.historial(self.conversacion), ["pregunta 1", "respuesta 1", "pregunta 2", "respuesta 2"])
+        # Sin mensajes nuevos no hay nada que resumir
+        self.assertFalse(servicio.actualizar(self.conversacion.id))
+        self.assertEqual(len(fake.llamadas), 1)
+
+    def test_resumen_extractivo_si_falla_openai(self):
+        fake = FakeOpenAI()
+        servicio = ConversationSummaryService(client=fake)
+
+        with mock.patch.object(fake.chat.completions, "create", side_effect=openai.APIConnectionError(request=None)):
+            self.assertTrue(servicio.actualizar(self.conversacion.id))
+
+        self.conversacion.refresh_from_db()
+        self.assertEqual(self.conversacion.resumen, "- Usuario: pregunta 0\n- Asistente: respuesta 0")
+
+    def test_prompt_lleva_resumen_e_historial_reciente(self):
+        servicio = AsistenteIAService(client=FakeOpenAI())
+        preparado = servicio.preparar_mensajes(
+            "¿Y la audiencia?", ["pregunta 2", "respuesta 2"], db_resultados={}, resumen="Resumen previo"
+        )
+
+        roles = [mensaje["role"] for mensaje in preparado["mensajes"]]
+        self.assertEqual(roles, ["system", "system", "user", "assistant", "user"])
+        self.assertIn("Resumen previo", preparado["mensajes"][1]["content"])
+
+
+class ConversacionesListadoTests(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            username="abogado1", email="abogado1@example.com", password="123456"
+        )
+        self.client.force_login(self.usuario)
+        self.url = reverse("chat:obtener_conversaciones")
+        self.conversaciones = [Conversacion.objects.create(usuario=self.usuario, titulo=f"C{i}") for i in range(5)]
+        for i, conversacion in enumerate(self.conversaciones):
+            Mensaje.objects.create(conversacion=conversacion, tipo="usuario", contenido=f"pregunta {i}")
+            Mensaje.objects.create(conversacion=conversacion, tipo="asistente", contenido=f"respuesta {i}")
+
+    def test_mensajes_actualizan_contador_y_vista_previa(self):
+        conversacion = self.conversaciones[0]
+        conversacion.refresh_from_db()
+        self.assertEqual(conversacion.cantidad_mensajes, 2)
+        self.assertEqual(conversacion.ultimo_mensaje, "respuesta 0")
+
+        Mensaje.objects.create(conversacion=conversacion, tipo="usuario", contenido="larga " * 100)
+        conversacion.refresh_from_db()
+        self.assertEqual(conversacion.cantidad_mensajes, 3)
+        self.assertLessEqual(len(conversacion.ultimo_mensaje), 200)
+
+    def test_paginacion_por_cursor_en_una_consulta(self):
+        # Sesión + usuario + listado
+        with self.assertNumQueries(3):
+            primera = self.client.get(self.url, {"limite": 3}).json()
+        segunda = self.client.get(self.url, {"limite": 3, "cursor": primera["siguiente_cursor"]}).json()
+
+        ids = [c["id"] for c in primera["conversaciones"] + segunda["conversaciones"]]
+        self.assertEqual(ids, [c.id for c in reversed(self.conversaciones)])
+        self.assertEqual(primera["conversaciones"][0]["cantidad_mensajes"], 2)
+        self.assertEqual(primera["conversaciones"][0]["ultimo_mensaje"], "respuesta 4")
+        self.assertIsNone(segunda["siguiente_cursor"])
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get(self.url, {"cursor": "no-es-un-cursor"}).status_code, 400)
+
+
+class HistorialMensajesTests(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            username="abogado1", email="abogado1@example.com", password="123456"
+        )
+        self.client.force_login(self.usuario)
+        self.conversacion = Conversacion.objects.create(usuario=self.usuario)
+        self.mensajes = [
+            Mensaje.objects.create(
+                conversacion=self.conversacion, tipo="usuario", contenido=f"mensaje {i}", documentos_consultados=[i]
+            )
+            for i in range(7)
+        ]
+        self.url = reverse("chat:obtener_mensajes", args=[self.conversacion.id])
+
+    def test_paginas_hacia_atras_desde_el_final(self):
+        conversacion = self.client.get(
+            reverse("chat:obtener_conversacion", args=[self.conversacion.id]), {"limite": 3}
+        ).json()
+        self.assertEqual([m["contenido"] for m in conversacion["mensajes"]], ["mensaje 4", "mensaje 5", "mensaje 6"])
+        self.assertTrue(conversacion["anteriores"])
+        self.assertNotIn("documentos_consultados", conversacion["mensajes"][0])
+
+        # Sesión + usuario + conversación + página (la fecha del cursor va en una subconsulta)
+        with self.assertNumQueries(4):
+            anteriores = self.client.get(self.url, {"antes": conversacion["mensajes"][0]["id"], "limite": 3}).json()
+        self.assertEqual([m["contenido"] for m in anteriores["mensajes"]], ["mensaje 1", "mensaje 2", "mensaje 3"])
+        self.assertTrue(anteriores["anteriores"])
+
+        ultima = self.client.get(self.url, {"antes": anteriores["mensajes"][0]["id"], "limite": 3}).json()
+        self.assertEqual([m["contenido"] for m in ultima["mensajes"]], ["mensaje 0"])
+        self.assertFalse(ultima["anteriores"])
+
+    def test_mensajes_posteriores_con_metadatos(self):
+        datos = self.client.get(self.url, {"despues": self.mensajes[4].id, "metadatos": "1"}).json()
+
+        self.assertEqual([m["contenido"] for m in datos["mensajes"]], ["mensaje 5", "mensaje 6"])
+        self.assertEqual(datos["mensajes"][0]["documentos_consultados"], [5])
+        self.assertFalse(datos["posteriores"])
+
+    def test_conversacion_de_otro_usuario(self):
+        otro = Usuario.objects.create_user(username="otro", email="otro@example.com", password="123456")
+        self.client.force_login(otro)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+@override_settings(OPENAI_FAKE=True, CHAT_CACHE_ACTIVO=False)
+class MotorRespuestasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(
+            username="abogado1", email="abogado1@example.com", password="123456"
+        )
+        self.actor = Actor.objects.create(
+            usuario=self.usuario, tipoActor="ABO", nombres="Carlos", apellidoPaterno="Méndez", ci="4455667"
+        )
+        self.casos = crear_casos(3, carpetas_por_caso=1, docs_por_carpeta=2)
+        EquipoCaso.objects.create(
+            actor=self.actor, caso=self.casos[1], rolEnEquipo="RESPONSABLE", fechaAsignacion=date(2024, 1, 1)
+        )
+        self.motor = DatabaseQueryService().motor
+
+    def responder(self, consulta):
+        return self.motor.responder(consulta, self.usuario)
+
+    def test_preguntas_estructuradas(self):
+        self.assertEqual(self.responder("Estado del caso civ-2024-002")["casos"][0]["numero"], "CIV-2024-002")
+        self.assertEqual(self.responder("casos abiertos")["regla"], "casos_estado")
+        self.assertEqual(self.responder("casos de divorcio")["regla"], "casos_tipo")
+        self.assertEqual(len(self.responder("documentos de tipo Contrato")["documentos"]), 6)
+        self.assertEqual(self.responder("lista los contratos")["regla"], "documentos_tipo")
+        actores = self.responder("datos del abogado Carlos Méndez")["actores"]
+        self.assertEqual([a["id"] for a in actores], [self.actor.id])
+
+    def test_mis_casos_son_los_del_equipo_del_actor(self):
+        directa = self.responder("¿Cuáles son mis casos asignados?")
+
+        self.assertEqual(directa["regla"], "personal")
+        self.assertEqual([c["numero"] for c in directa["casos"]], ["CIV-2024-001"])
+        self.assertEqual(len(self.responder("mis documentos")["documentos"]), 2)
+
+    def test_preguntas_abiertas_van_al_modelo(self):
+        for consulta in (
+            "¿Por qué se retrasó el caso CIV-2024-001?",
+            "Busca el contrato de arrendamiento",
+            "Hola, buenos días",
+            "¿Qué camino sigue una demanda?",
+            "Tengo una duda sobre plazos",
+        ):
+            self.assertIsNone(self.responder(consulta), consulta)
+
+    def test_calificadores_que_la_regla_no_entiende_van_al_modelo(self):
+        servicio = DatabaseQueryService()
+        for consulta in (
+            "¿Qué plazos vencen en el caso CIV-2024-001?",
+            "¿Quién es el abogado del caso CIV-2024-001?",
+            "¿Qué documentos faltan en el caso CIV-2024-001?",
+            "¿Qué contratos firmó el cliente Pérez en 2023?",
+            "casos abiertos del cliente Pérez",
+            "¿Cuántos casos de divorcio tiene el abogado Juan?",
+            "cuántos documentos hay por cliente",
+            "¿Cuántos casos hay por estado?",
+            "casos abiertos por abogado",
+        ):
+            self.assertIsNone(servicio.responder_directo(consulta, self.usuario), consulta)
+
+        # Sin calificadores siguen respondiéndose directo
+        self.assertEqual(self.responder("¿Cuál es el estado del caso CIV-2024-001?")["regla"], "caso_numero")
+        self.assertEqual(self.responder("datos del cliente con CI 4455667")["regla"], "actor")
+        self.assertEqual(self.responder("¿Cuántos casos hay en el sistema?")["regla"], "estadisticas")
+        self.assertEqual(self.responder("total de documentos, por favor")["regla"], "estadisticas")
+        self.assertEqual(self.responder("muéstrame los casos cerrados")["regla"], "casos_estado")
+
+    def test_calificadores_en_preguntas_personales_y_de_actores_van_al_modelo(self):
+        for consulta in (
+            "¿Qué plazos vencen en mis casos?",
+            "mis casos con audiencia mañana",
+            "mis documentos firmados en 2023",
+            "casos del abogado con CI 4455667",
+            "¿Qué audiencias tiene el abogado Carlos Méndez?",
+        ):
+            self.assertIsNone(self.responder(consulta), consulta)
+
+        self.assertEqual(self.responder("¿Cuántos documentos tengo?")["regla"], "personal")
+        self.assertEqual(self.responder("datos del abogado Carlos Méndez")["regla"], "actor")
+
+    def test_sin_llamada_a_openai_y_tasa_en_telemetria(self):
+        conversacion = Conversacion.objects.create(usuario=self.usuario)
+        fake = FakeOpenAI(respuesta="Respuesta del modelo")
+        with mock.patch("chat.services.FakeOpenAI", return_value=fake):
+            directa = procesar_consulta_ia(self.usuario, "Estado del caso CIV-2024-000", conversacion)
+            abierta = procesar_consulta_ia(self.usuario, "Hola, buenos días", conversacion)
+
+        self.assertEqual(len(fake.llamadas), 1)
+        self.assertIn("CIV-2024-000", directa["respuesta"])
+        self.assertEqual(abierta["respuesta"], "Respuesta del modelo")
+
+        resumen = resumir_telemetria([directa["telemetria"].como_dict(), abierta["telemetria"].como_dict()])
+        self.assertEqual(resumen["respuesta_directa"], {"tasa": 0.5, "por_regla": {"caso_numero": 1}})
+
+
+class RouterConsultasTests(TestCase):
+
+    def test_un_analisis_con_intencion_y_entidades(self):
+        analisis = analizar_consulta("¿Cuáles son mis casos abiertos del abogado con CI 4455667?")
+
+        self.assertEqual(analisis["tipo"], "actor")
+        self.assertEqual(analisis["entidades"], ["abogado"])
+        self.assertTrue(analisis["personal"] and analisis["especifica"])
+        self.assertEqual(analisis["listado_personal"], "casos")
+        self.assertEqual(analisis["estado_caso"], "ABIERTO")
+        self.assertIn("caso", analisis["plurales"])
+        self.assertEqual(analisis["ci"], ("4455667",))
+        self.assertEqual(analizar_consulta("Estado del caso CIV-2024-001")["numeros_caso"], ("civ-2024-001",))
+        self.assertEqual(analizar_consulta("casos de pensión")["tipos_caso"], ("Pensión Alimenticia",))
+
+    def test_palabras_completas_y_frases_solapadas(self):
+        # "mi" no está en "camino" ni "persona" en "personal"; "que me pertenece" también es "que"
+        self.assertFalse(analizar_consulta("¿Qué camino sigue una demanda?")["personal"])
+        self.assertEqual(analizar_consulta("información personal")["tipo"], "general")
+        solapada = analizar_consulta("que me pertenece")
+        self.assertTrue(solapada["personal"] and solapada["especifica"])
+        self.assertTrue(analizar_consulta("Explícame el plazo")["abierta"])
+        self.assertFalse(analizar_consulta("contrato de comodato")["abierta"])
+
+    def test_tipos_de_la_base_pedidos_como_listado(self):
+        tipos = ["Contrato", "Escritura Pública"]
+
+        self.assertEqual(tipos_mencionados("lista los contratos", tipos, listado=True), ["Contrato"])
+        self.assertEqual(tipos_mencionados("documentos de escritura publica", tipos, listado=True), ["Escritura Pública"])
+        self.assertEqual(tipos_mencionados("el contrato de arrendamiento", tipos, listado=True), [])
+        self.assertEqual(tipos_mencionados("el contrato de arrendamiento", tipos), ["Contrato"])
+
+
+@override_settings(OPENAI_FAKE=True, CHAT_CACHE_ACTIVO=False, CHAT_RESUMEN_EN_SEGUNDO_PLANO=False)
+class ConsultasDocumentoTests(TestCase):
+
+    def setUp(self):
+        reiniciar_indice()
+        self.usuario = Usuario.objects.create_user(
+            username="abogado1", email="abogado1@example.com", password="123456", is_staff=True
+        )
+        self.client.force_login(self.usuario)
+        self.casos = crear_casos(2, carpetas_por_caso=1, docs_por_carpeta=2)
+        self.conversacion = Conversacion.objects.create(usuario=self.usuario)
+
+    def tearDown(self):
+        reiniciar_indice()
+
+    def enviar(self, consulta):
+        with mock.patch("chat.services.FakeOpenAI", return_value=FakeOpenAI(respuesta="ok")):
+            resultado = procesar_consulta_ia(self.usuario, consulta, self.conversacion)
+        return views.crear_mensaje_ia(self.conversacion, resultado, 0.1)
+
+    def test_registros_se_graban_con_la_respuesta(self):
+        mensaje = self.enviar("Busca el documento Doc 0-0-1")
+        consultas = list(mensaje.consultas_documentos.all())
+
+        self.assertIn(mensaje.documentos_consultados[0], [c.documento_id for c in consultas])
+        self.assertTrue(all(c.tipo_consulta == "buscar" and c.fecha == mensaje.fecha_envio for c in consultas))
+        self.assertEqual(len({(c.documento_id, c.caso_id, c.actor_id) for c in consultas}), len(consultas))
+
+        directa = self.enviar("Estado del caso CIV-2024-001")
+        registro = directa.consultas_documentos.get()
+        self.assertEqual((registro.caso_id, registro.tipo_consulta, registro.relevancia),
+                         (self.casos[1].id, "responder", 1.0))
+
+    def test_ranking_por_periodo(self):
+        for _ in range(2):
+            self.enviar("Estado del caso CIV-2024-001")
+        self.enviar("Estado del caso CIV-2024-000")
+        antiguo = self.enviar("Estado del caso CIV-2024-000")
+        ConsultaDocumento.objects.filter(mensaje=antiguo).update(fecha=timezone.now() - timedelta(days=60))
+
+        datos = self.client.get(reverse("chat:consultas_populares"), {"tipo": "caso", "dias": 30}).json()
+
+        self.assertEqual([(c["nombre"], c["consultas"]) for c in datos["ranking"]],
+                         [("CIV-2024-001", 2), ("CIV-2024-000", 1)])
+        self.assertEqual(datos["uso"]["por_tipo_consulta"], {"responder": 3})
+        self.assertEqual(self.client.get(reverse("chat:consultas_populares"), {"tipo": "x"}).status_code, 400)
+
+
+@override_settings(OPENAI_FAKE=True, CHAT_CACHE_ACTIVO=False, CHAT_RESUMEN_EN_SEGUNDO_PLANO=False)
+class TelemetriaTests(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            username="abogado1", email="abogado1@example.com", password="123456", is_staff=True
+        )
+        self.client.force_login(self.usuario)
+        self.url = reverse("chat:estadisticas_telemetria")
+
+    def test_mensaje_guarda_etapas_consultas_y_tokens(self):
+        fake = FakeOpenAI(respuesta="uno dos tres")
+        with mock.patch("chat.services.FakeOpenAI", return_value=fake):
+            self.client.post(
+                reverse("chat:enviar_mensaje"), json.dumps({"mensaje": "Busca el contrato"}),
+                content_type="application/json"
+            )
+
+        telemetria = Mensaje.objects.get(tipo="asistente").telemetria
+        for etapa in ("historial", "analisis", "documentos", "db", "prompt", "llm_primer_token", "llm",
+                      "persistencia", "total"):
+            self.assertIn(etapa, telemetria["etapas"])
+        self.assertGreater(telemetria["consultas_sql"]["persistencia"], 0)
+        self.assertEqual(telemetria["consultas_sql_total"], sum(telemetria["consultas_sql"].values()))
+        self.assertEqual(telemetria["tokens_respuesta"], 3)
+        self.assertFalse(telemetria["tokens_estimados"])
+        self.assertEqual(telemetria["origen"], "openai")
+
+    def test_percentiles_por_etapa_en_la_ventana(self):
+        conversacion = Conversacion.objects.create(usuario=self.usuario)
+        for ms in range(1, 101):
+            Mensaje.objects.create(
+                conversacion=conversacion, tipo="asistente", contenido="r",
+                telemetria={"etapas": {"llm": ms, "db": 1}, "consultas_sql_total": 2, "origen": "openai"}
+            )
+        Mensaje.objects.filter(telemetria__etapas__llm=100).update(fecha_envio=timezone.now() - timedelta(days=2))
+
+        datos = self.client.get(self.url, {"horas": 24}).json()["telemetria"]
+
+        self.assertEqual(datos["mensajes"], 99)
+        self.assertEqual(datos["etapas_ms"]["llm"], {"n": 99, "p50": 50, "p95": 95, "p99": 99})
+        self.assertEqual(list(datos["etapas_ms"]), ["db", "llm"])
+        self.assertEqual(datos["origen"], {"openai": 99})
+
+    def test_solo_staff(self):
+        self.usuario.is_staff = False
+        self.usuario.save()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class PromptBuilderTests(TestCase):
+
+    def test_respeta_el_presupuesto_y_conserva_lo_mas_reciente(self):
+        builder = PromptBuilder("gpt-3.5-turbo", 1000, presupuesto=400)
+        historial = [{"role": "user", "content": f"mensaje {i} " + "palabra " * 40} for i in range(20)]
+        secciones = [{
+            "titulo": "📄 DOCUMENTOS ENCONTRADOS:",
+            "fragmentos": [{"texto": f"• Documento {i} " + "x" * 200 + "\n", "relevancia": 1.0} for i in range(30)],
+        }]
+
+        prompt = builder.construir("Sistema", "¿Qué documentos hay?", secciones, historial)
+
+        self.assertLessEqual(prompt["tokens_prompt"], 400)
+        self.assertGreater(prompt["omitidos"], 0)
+        self.assertEqual(prompt["mensajes"][0]["content"], "Sistema")
+        self.assertTrue(prompt["mensajes"][-2]["content"].startswith("mensaje 19 "))
+        self.assertIn("• Documento 0 ", prompt["contexto"])
+
+    def test_contexto_por_relevancia_en_orden_de_secciones(self):
+        builder = PromptBuilder("gpt-3.5-turbo", 1000, presupuesto=60)
+        secciones = [
+            {"titulo": "A:", "fragmentos": [{"texto": "poco relevante " * 10 + "\n", "relevancia": 0.1}]},
+            {"titulo": "B:", "fragmentos": [{"texto": "muy relevante\n", "relevancia": 0.9}]},
+        ]
+
+        prompt = builder.construir("Sistema", "consulta", secciones)
+
+        self.assertEqual(prompt["contexto"], "B:\nmuy relevante\n\n")
+        self.assertEqual(prompt["omitidos"], 1)
+
+    def test_presupuesto_limitado_por_la_ventana_del_modelo(self):
+        self.assertEqual(PromptBuilder("gpt-4", 8000, presupuesto=100000).presupuesto, 128)
+        self.assertEqual(PromptBuilder("gpt-4o-mini", 1000, presupuesto=3000).presupuesto, 3000)
+
+    def test_truncar_descripcion(self):
+        self.assertEqual(truncar("uno dos tres cuatro", 12), "uno dos tres…")
+        self.assertEqual(truncar("corto", 12), "corto")
+
+
+class SuggestionSnapshotTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_snapshot_en_cache_sin_consultas(self):
+        crear_casos(2)
+        servicio = SuggestionService()
+        servicio.get_smart_suggestions()
+
+        with self.assertNumQueries(0):
+            sugerencias = servicio.get_smart_suggestions()
+        self.assertTrue(sugerencias)
+
+    def test_cambios_invalidan_el_snapshot(self):
+        servicio = SuggestionService()
+        crear_casos(1)
+        self.assertEqual(servicio.get_snapshot()["casos"]["total"], 1)
+
+        crear_casos(2)
+        snapshot = servicio.get_snapshot()
+        self.assertEqual(snapshot["casos"]["total"], 3)
+        self.assertEqual(snapshot["casos"]["casos_abiertos"], 3)
+        self.assertEqual(snapshot["documentos"]["total"], 18)
+
+
+def leer_eventos(contenido):
+    """Convierte el cuerpo SSE en una lista de (evento, datos)"""
+    eventos = []
+    for bloque in contenido.strip().split("\n\n"):
+        lineas = dict(linea.split(": ", 1) for linea in bloque.split("\n"))
+        eventos.append((lineas["event"], json.loads(lineas["data"])))
+    return eventos
+
+
+@override_settings(OPENAI_FAKE=True)
+class EnviarMensajeStreamTests(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            username="abogado1", email="abogado1@example.com", password="123456"
+        )
+        self.client.force_login(self.usuario)
+        self.url = reverse("chat:enviar_mensaje_stream")
+
+    def test_stream_emite_tokens_y_guarda_mensaje(self):
+        fake = FakeOpenAI(respuesta="Hola desde el asistente")
+        with mock.patch("chat.services.FakeOpenAI", return_value=fake):
+            response = self.client.post(
+                self.url, json.dumps({"mensaje": "Hola asistente"}), content_type="application/json"
+            )
+            contenido = b"".join(response.streaming_content).decode()
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        eventos = leer_eventos(contenido)
+        nombres = [nombre for nombre, _ in eventos]
+        self.assertEqual(nombres[0], "inicio")
+        self.assertEqual(nombres[-1], "fin")
+        tokens = "".join(datos["texto"] for nombre, datos in eventos if nombre == "token")
+        self.assertEqual(tokens, "Hola desde el asistente")
+
+        self.assertTrue(fake.llamadas[0]["stream"])
+        mensaje_ia = Mensaje.objects.get(tipo="asistente")
+        self.assertEqual(mensaje_ia.contenido, "Hola desde el asistente")
+        self.assertGreater(mensaje_ia.tokens_usados, 0)
+        self.assertEqual(eventos[-1][1]["mensaje_ia"]["id"], mensaje_ia.id)
+        # El uso llega en el último chunk (stream_options include_usage)
+        self.assertEqual(mensaje_ia.telemetria["tokens_respuesta"], 4)
+        self.assertLessEqual(mensaje_ia.telemetria["etapas"]["llm_primer_token"], mensaje_ia.telemetria["etapas"]["llm"])
+
+    def test_error_al_crear_el_servicio_guarda_el_mensaje_de_error(self):
+        with mock.patch("chat.views.AsistenteIAService", side_effect=ValueError("OPENAI_API_KEY no configurada")):
+            response = self.client.post(
+                self.url, json.dumps({"mensaje": "Hola asistente"}), content_type="application/json"
+            )
+            eventos = leer_eventos(b"".join(response.streaming_content).decode())
+
+        self.assertEqual([nombre for nombre, _ in eventos], ["inicio", "error", "fin"])
+        mensaje_ia = Mensaje.objects.get(tipo="asistente")
+        self.assertIn("OPENAI_API_KEY no configurada", mensaje_ia.contenido)
+
+
+@override_settings(OPENAI_FAKE=True)
+class DesconexionStreamTests(TransactionTestCase):
+    """
+    response.close() emite request_finished y cierra la conexión a la base:
+    dentro de la transacción de un TestCase dejaría la prueba sin conexión
+    """
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            username="abogado1", email="abogado1@example.com", password="123456"
+        )
+        self.client.force_login(self.usuario)
+        self.url = reverse("chat:enviar_mensaje_stream")
+
+    def test_desconexion_cierra_stream_y_guarda_parcial(self):
+        fake = FakeOpenAI(respuesta="uno dos tres cuatro cinco")
+        with mock.patch("chat.services.FakeOpenAI", return_value=fake):
+            response = self.client.post(
+                self.url, json.dumps({"mensaje": "Hola asistente"}), content_type="application/json"
+            )
+            iterador = iter(response.streaming_content)
+            next(iterador)  # inicio
+            next(iterador)  # primer token
+            response.close()
+
+        self.assertTrue(fake.ultimo_stream.closed)
+        self.assertLess(fake.ultimo_stream.enviados, 5)
+        self.assertEqual(Mensaje.objects.get(tipo="asistente").contenido, "uno ")
+
+
+@override_settings(OPENAI_FAKE=True)
+class ProcesarConsultaAsyncTests(TransactionTestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            username="abogado1", email="abogado1@example.com", password="123456"
+        )
+
+    def test_tramos_de_busqueda_en_paralelo(self):
+        conversacion = Conversacion.objects.create(usuario=self.usuario)
+        servicio = AsistenteIAService(async_client=FakeAsyncOpenAI(respuesta="Respuesta async"))
+
+        def tramo_lento(*args):
+            time.sleep(0.3)
+            return []
+
+        with mock.patch.object(servicio, "buscar_documentos", side_effect=tramo_lento), \
+                mock.patch.object(servicio, "buscar_actores", side_effect=tramo_lento), \
+                mock.patch.object(servicio, "buscar_casos", side_effect=tramo_lento):
+            inicio = time.perf_counter()
+            resultado = async_to_sync(procesar_consulta_ia_async)(
+                self.usuario, "Hola, buenos días", conversacion, servicio
+            )
+            duracion = time.perf_counter() - inicio
+
+        self.assertEqual(resultado["respuesta"], "Respuesta async")
+        self.assertEqual(resultado["tipo_consulta"], "general")
+        # Secuencialmente serían 0.9 s; en paralelo ~0.3 s
+        self.assertLess(duracion, 0.6)
+
+    def test_consulta_general_acota_el_contexto_como_la_sincrona(self):
+        conversacion = Conversacion.objects.create(usuario=self.usuario)
+        servicio = AsistenteIAService(async_client=FakeAsyncOpenAI())
+
+        def encontrados(tipo):
+            return lambda *args: [{"tipo": tipo, "objeto": mock.Mock(id=i), "relevancia": 1.0} for i in range(5)]
+
+        with mock.patch.object(servicio, "buscar_documentos", side_effect=encontrados("documento")), \
+                mock.patch.object(servicio, "buscar_actores", side_effect=encontrados("actor")), \
+                mock.patch.object(servicio, "buscar_casos", side_effect=encontrados("caso")), \
+                mock.patch.object(servicio, "generar_respuesta_ia_async", new=mock.AsyncMock(return_value="ok")) as generar:
+            resultado = async_to_sync(procesar_consulta_ia_async)(
+                self.usuario, "Hola, buenos días", conversacion, servicio
+            )
+            sincrono = views.recopilar_contexto_ia(servicio, self.usuario, "Hola, buenos días", conversacion)
+
+        def claves(contexto):
+            return [(r["tipo"], r["objeto"].id) for r in contexto]
+
+        contexto = generar.call_args.args[3]
+        self.assertEqual([tipo for tipo, _ in claves(contexto)], ["documento"] * 3 + ["actor"] * 2 + ["caso"] * 2)
+        self.assertEqual(claves(contexto), claves(sincrono["contexto"]))
+        self.assertEqual(resultado["documentos_consultados"], sincrono["documentos_consultados"])
+
+    def test_pool_frio_no_consulta_la_base_desde_el_event_loop(self):
+        # Tras guardar una ConfiguracionIA el pool se descarta y su configuración
+        # (ORM) debe volver a cargarse fuera del event loop
+        reiniciar_pool()
+        self.addCleanup(reiniciar_pool)
+        conversacion = Conversacion.objects.create(usuario=self.usuario)
+
+        resultado = async_to_sync(procesar_consulta_ia_async)(self.usuario, "Hola, buenos días", conversacion)
+
+        self.assertEqual(resultado["respuesta"], FakeOpenAI.RESPUESTA_POR_DEFECTO)
+        self.assertIsNotNone(obtener_pool())
+
+    async def test_vista_async_guarda_mensajes(self):
+        await self.async_client.aforce_login(self.usuario)
+        response = await self.async_client.post(
+            "/chat/api/enviar-mensaje/async/",
+            json.dumps({"mensaje": "Hola asistente"}),
+            content_type="application/json",
+        )
+
+        datos = response.json()
+        self.assertTrue(datos["success"])
+        self.assertEqual(datos["mensaje_ia"]["contenido"], FakeOpenAI.RESPUESTA_POR_DEFECTO)
+        self.assertEqual(await Mensaje.objects.filter(conversacion_id=datos["conversacion_id"]).acount(), 2)
+
+
+@override_settings(OPENAI_FAKE=True, CHAT_CACHE_ACTIVO=False)
+class ConsultasEnVueloTests(TransactionTestCase):
+
+    def test_consultas_identicas_comparten_busqueda_y_respuesta(self):
+        usuarios = [
+            Usuario.objects.create_user(username=f"usuario{i}", email=f"usuario{i}@example.com", password="123456")
+            for i in range(5)
+        ]
+        conversaciones = [Conversacion.objects.create(usuario=usuario) for usuario in usuarios]
+        fake = FakeOpenAI(respuesta="Respuesta lenta compartida", retraso=0.1)
+        inicio = threading.Barrier(len(usuarios))
+
+        def consultar(indice):
+            try:
+                inicio.wait()
+                return procesar_consulta_ia(usuarios[indice], "Hola, buenos días", conversaciones[indice])
+            finally:
+                connections.close_all()
+
+        with mock.patch("chat.services.FakeOpenAI", return_value=fake), \
+                mock.patch("chat.views.recopilar_contexto_ia", wraps=views.recopilar_contexto_ia) as recopilar, \
+                ThreadPoolExecutor(max_workers=len(usuarios)) as pool:
+            resultados = list(pool.map(consultar, range(len(usuarios))))
+
+        self.assertEqual(len(fake.llamadas), 1)
+        self.assertEqual(recopilar.call_count, 1)
+        self.assertEqual({r["respuesta"] for r in resultados}, {"Respuesta lenta compartida"})
+
+    def test_consultas_personales_no_se_comparten_entre_usuarios(self):
+        servicio = AsistenteIAService()
+        uno = Usuario.objects.create_user(username="uno", email="uno@example.com", password="123456")
+        dos = Usuario.objects.create_user(username="dos", email="dos@example.com", password="123456")
+
+        self.assertNotEqual(
+            servicio.clave_en_vuelo("mis casos", uno, []), servicio.clave_en_vuelo("mis casos", dos, [])
+        )
+        self.assertEqual(
+            servicio.clave_en_vuelo("¿Qué es un expediente?", uno, []),
+            servicio.clave_en_vuelo("que es un expediente", dos, []),
+        )
+
+    def test_stream_compartido_entre_lectores(self):
+        vuelos = SingleFlight()
+        creaciones = []
+
+        def crear():
+            creaciones.append(1)
+            return {"datos": 1}, iter(["uno ", "dos ", "tres"])
+
+        datos_a, lector_a = vuelos.compartir_stream("clave", crear)
+        self.assertEqual(next(lector_a), "uno ")
+        datos_b, lector_b = vuelos.compartir_stream("clave", crear)
+
+        self.assertIs(datos_a, datos_b)
+        self.assertEqual("".join(lector_b), "uno dos tres")
+        lector_a.close()
+        self.assertEqual(len(creaciones), 1)
+        self.assertEqual(vuelos.coalescidas, 1)
+
+
+@override_settings(OPENAI_FAKE=True, CHAT_CACHE_ACTIVO=False, CHAT_RESUMEN_EN_SEGUNDO_PLANO=False,
+                   CHAT_TAREAS_MAX_INTENTOS=2, CHAT_TAREAS_BACKOFF_BASE=0)
+class ColaTareasIATests(TransactionTestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            username="abogado1", email="abogado1@example.com", password="123456"
+        )
+        self.client.force_login(self.usuario)
+
+    def encolar(self, mensaje="Hola, buenos días"):
+        response = self.client.post(
+            reverse("chat:enviar_mensaje_cola"), json.dumps({"mensaje": mensaje}), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def test_el_trabajador_responde_la_tarea_encolada(self):
+        datos = self.encolar()
+        self.assertEqual(datos["tarea"]["estado"], TareaIA.PENDIENTE)
+        url = reverse("chat:estado_tarea", args=[datos["tarea"]["id"]])
+        self.assertNotIn("mensaje_ia", self.client.get(url).json()["tarea"])
+
+        trabajador = TrabajadorTareasIA(hilos=1, intervalo=0)
+        trabajador.ejecutar(una_vez=True)
+
+        tarea = self.client.get(url).json()["tarea"]
+        self.assertEqual(trabajador.completadas, 1)
+        self.assertEqual(tarea["estado"], TareaIA.COMPLETADA)
+        self.assertEqual(tarea["intentos"], 1)
+        self.assertEqual(
+            list(Mensaje.objects.filter(conversacion_id=datos["conversacion_id"]).values_list("tipo", flat=True)),
+            ["usuario", "asistente"],
+        )
+        self.assertEqual(tarea["mensaje_ia"]["id"], Mensaje.objects.get(tipo="asistente").id)
+
+    def test_reintenta_y_deja_la_tarea_fallida(self):
+        datos = self.encolar()
+        error = {"respuesta": "OpenAI no disponible", "tipo_consulta": "error"}
+        with mock.patch("chat.views.procesar_consulta_ia", return_value=error) as procesar:
+            TrabajadorTareasIA(hilos=1, intervalo=0).ejecutar(una_vez=True)
+
+        tarea = TareaIA.objects.get(id=datos["tarea"]["id"])
+        self.assertEqual(procesar.call_count, 2)
+        self.assertEqual((tarea.estado, tarea.intentos), (TareaIA.FALLIDA, 2))
+        self.assertEqual(tarea.error, "OpenAI no disponible")
+        self.assertFalse(Mensaje.objects.filter(tipo="asistente").exists())
+
+        self.assertEqual(ColaTareasIA().reencolar_fallidas(), 1)
+        self.assertEqual(TareaIA.objects.get(id=tarea.id).estado, TareaIA.PENDIENTE)
+
+    def test_plazo_vencido_otro_trabajador_retoma_la_tarea(self):
+        self.encolar()
+        cola = ColaTareasIA()
+        [tarea] = cola.reclamar("caido", 5)
+        self.assertEqual(cola.reclamar("otro", 5), [])
+
+        TareaIA.objects.filter(id=tarea.id).update(bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+        [retomada] = cola.reclamar("otro", 5)
+        self.assertEqual((retomada.trabajador, retomada.intentos), ("otro", 2))
+
+        # El resultado tardío del trabajador caído se descarta
+        self.assertFalse(cola.completar(tarea, {"respuesta": "tarde"}, 1.0))
+        self.assertTrue(cola.completar(retomada, {"respuesta": "a tiempo"}, 1.0))
+        self.assertEqual(Mensaje.objects.get(tipo="asistente").contenido, "a tiempo")
+
+    def test_tarea_de_otro_usuario(self):
+        datos = self.encolar()
+        otro = Usuario.objects.create_user(username="otro", email="otro@example.com", password="123456")
+        self.client.force_login(otro)
+        self.assertEqual(
+            self.client.get(reverse("chat:estado_tarea", args=[datos["tarea"]["id"]])).status_code, 404
+        )
+
+
+# Un hilo: la base sqlite en memoria de los tests no admite escrituras concurrentes
+@override_settings(OPENAI_FAKE=True, CHAT_CACHE_ACTIVO=False, CHAT_RESUMEN_EN_SEGUNDO_PLANO=False,
+                   CHAT_LOTE_HILOS=1, CHAT_LOTE_MAX_PREGUNTAS=5)
+class LoteConsultasTests(TransactionTestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            username="abogado1", email="abogado1@example.com", password="123456"
+        )
+        self.client.force_login(self.usuario)
+        crear_casos(2)
+
+    def enviar(self, preguntas, **datos):
+        return self.client.post(
+            reverse("chat:enviar_lote"), json.dumps({"preguntas": preguntas, **datos}), content_type="application/json"
+        )
+
+    def test_resultados_en_orden_y_guardados(self):
+        fake = FakeOpenAI(respuesta="Respuesta del modelo")
+        with mock.patch("chat.services.FakeOpenAI", return_value=fake):
+            datos = self.enviar(["Hola", "Estado del caso CIV-2024-000", "hola", "Estado del caso CIV-2024-000"]).json()
+
+        resultados = datos["resultados"]
+        self.assertEqual([r["indice"] for r in resultados], [0, 1, 2, 3])
+        self.assertEqual([r["repetida_de"] for r in resultados], [None, None, 0, 1])
+        # Las preguntas repetidas se responden una vez
+        self.assertEqual(len(fake.llamadas), 1)
+        self.assertIn("CIV-2024-000", resultados[3]["respuesta"])
+        self.assertEqual(
+            list(Mensaje.objects.filter(conversacion_id=datos["conversacion_id"]).order_by("id").values_list("contenido", flat=True))[::2],
+            ["Hola", "Estado del caso CIV-2024-000", "hola", "Estado del caso CIV-2024-000"],
+        )
+
+    def test_error_en_una_pregunta_no_detiene_el_lote(self):
+        procesar = views.procesar_consulta_ia
+
+        def procesar_o_fallar(usuario, consulta, *args, **kwargs):
+            if consulta == "falla":
+                raise RuntimeError("OpenAI no disponible")
+            return procesar(usuario, consulta, *args, **kwargs)
+
+        with mock.patch("chat.views.procesar_consulta_ia", side_effect=procesar_o_fallar):
+            response = self.enviar(["casos abiertos", "falla"], stream=True)
+            eventos = [
+                json.loads(linea[len("data: "):])
+                for linea in b"".join(response.streaming_content).decode().splitlines() if linea.startswith("data: ")
+            ]
+
+        fin = eventos[-1]
+        self.assertEqual(len(eventos), 4)
+        self.assertIsNone(fin["resultados"][0]["error"])
+        self.assertIn("OpenAI no disponible", fin["resultados"][1]["error"])
+        self.assertEqual(Mensaje.objects.filter(tipo="asistente").count(), 2)
+
+    def test_busquedas_compartidas_entre_preguntas(self):
+        conversacion = Conversacion.objects.create(usuario=self.usuario)
+        lote = LoteConsultasIA(self.usuario, conversacion)
+        fake = FakeOpenAI(respuesta="Respuesta del modelo")
+        with mock.patch("chat.services.FakeOpenAI", return_value=fake):
+            resultados = lote.responder_ordenado(["Plazos del caso CIV-2024-001", "Documentos del caso CIV-2024-001"])
+
+        self.assertEqual([r["error"] for r in resultados], [None, None])
+        # Las dos van al modelo (no a la misma ficha del caso) y comparten la búsqueda del caso
+        self.assertEqual(len(fake.llamadas), 2)
+        self.assertGreaterEqual(lote.db_service.reutilizadas, 1)
+
+    def test_limite_de_preguntas(self):
+        self.assertEqual(self.enviar([f"pregunta {i}" for i in range(6)]).status_code, 400)
+        self.assertEqual(self.enviar([" "]).status_code, 400)
+
+
+class _StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Servidor local que imita /chat/completions de OpenAI"""
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.conexiones += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        servidor = self.server
+        with servidor.lock:
+            servidor.solicitudes += 1
+            servidor.activas += 1
+            servidor.max_activas = max(servidor.max_activas, servidor.activas)
+            estado = servidor.estados.pop(0) if servidor.estados else 200
+        time.sleep(servidor.retraso)
+        with servidor.lock:
+            servidor.activas -= 1
+
+        if estado == 200:
+            cuerpo = {
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": "stub",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "Respuesta del stub"}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 3, "total_tokens": 4},
+            }
+        else:
+            cuerpo = {"error": {"message": "ocupado", "type": "server_error"}}
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args):
+        pass
+
+
+class PoolOpenAITests(TestCase):
+
+    def setUp(self):
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", 0), _StubOpenAIHandler)
+        self.servidor.lock = threading.Lock()
+        self.servidor.conexiones = self.servidor.solicitudes = 0
+        self.servidor.activas = self.servidor.max_activas = 0
+        self.servidor.estados = []
+        self.servidor.retraso = 0
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+        ajustes = override_settings(
+            OPENAI_API_KEY="sk-test",
+            OPENAI_BASE_URL=f"http://127.0.0.1:{self.servidor.server_port}/v1",
+            OPENAI_MAX_CONCURRENTES=2,
+            OPENAI_SOLICITUDES_POR_SEGUNDO=0,
+            OPENAI_BACKOFF_BASE=0.01,
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        reiniciar_pool()
+        self.addCleanup(reiniciar_pool)
+
+    def tearDown(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def crear(self, cliente):
+        respuesta = cliente.chat.completions.create(
+            model="stub", messages=[{"role": "user", "content": "hola"}]
+        )
+        return respuesta.choices[0].message.content
+
+    def test_cliente_compartido_reutiliza_la_conexion(self):
+        self.assertIs(AsistenteIAService().client, AsistenteIAService().client)
+
+        for _ in range(3):
+            self.assertEqual(self.crear(obtener_pool().cliente), "Respuesta del stub")
+
+        self.assertEqual(self.servidor.solicitudes, 3)
+        self.assertEqual(self.servidor.conexiones, 1)
+
+    def test_reintenta_429_y_5xx(self):
+        self.servidor.estados = [429, 503]
+
+        self.assertEqual(self.crear(obtener_pool().cliente), "Respuesta del stub")
+        self.assertEqual(self.servidor.solicitudes, 3)
+
+    def test_limite_de_solicitudes_simultaneas(self):
+        self.servidor.retraso = 0.1
+        cliente = obtener_pool().cliente
+
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            respuestas = list(pool.map(lambda _: self.crear(cliente), range(6)))
+
+        self.assertEqual(len(respuestas), 6)
+        self.assertEqual(self.servidor.max_activas, 2)
+
+    def test_configuracion_ia_sobrescribe_settings(self):
+        ConfiguracionIA.objects.create(nombre="Principal", max_concurrentes=4, max_reintentos=0)
+
+        config = cargar_configuracion()
+        self.assertEqual(config["max_concurrentes"], 4)
+        self.assertEqual(config["max_reintentos"], 0)
+
+        self.servidor.estados = [500]
+        with self.assertRaises(openai.InternalServerError):
+            self.crear(PoolOpenAI(config).cliente)
+
+    @override_settings(OPENAI_FAKE=True)
+    def test_crear_el_servicio_no_carga_el_pool(self):
+        ConfiguracionIA.objects.create(nombre="Principal", max_tokens=321)  # descarta el pool
+
+        with self.assertNumQueries(0):
+            servicio = AsistenteIAService()
+        # max_tokens se lee del pool cuando se usa (y queda en el servicio)
+        self.assertEqual(servicio.max_tokens, 321)
+        with self.assertNumQueries(0):
+            servicio.prompt_builder
+        self.assertEqual(AsistenteIAService(max_tokens=50).max_tokens, 50)
+
+
+@override_settings(OPENAI_FAKE=True)
+class PrecalentamientoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        reiniciar_indice()
+        crear_casos(1, carpetas_por_caso=1, docs_por_carpeta=1)
+
+    def tearDown(self):
+        reiniciar_indice()
+
+    def test_carga_indice_y_caches_y_registra_duraciones(self):
+        with self.assertLogs("chat.warmup", level="INFO") as logs:
+            duraciones = precalentar()
+
+        self.assertEqual(list(duraciones), ["cliente", "indice", "tipos", "sugerencias", "total"])
+        self.assertTrue(indice_cargado())
+        self.assertEqual(cache.get("chat:motor:tipos")["casos"], ["Divorcio"])
+        with self.assertNumQueries(0):
+            DatabaseQueryService().motor._tipos()
+        self.assertIn("Precalentamiento del chat completado", logs.output[0])
+
+    def test_desactivado_por_defecto(self):
+        with override_settings(CHAT_PRECALENTAR=False), mock.patch("chat.warmup.threading.Thread") as hilo:
+            self.assertFalse(iniciar_precalentamiento())
+        hilo.assert_not_called()
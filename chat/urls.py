@@ -9,9 +9,19 @@ urlpatterns = [
     
     # API endpoints
     path('api/enviar-mensaje/', views.enviar_mensaje, name='enviar_mensaje'),
+    path('api/enviar-mensaje/stream/', views.enviar_mensaje_stream, name='enviar_mensaje_stream'),
+    path('api/enviar-mensaje/async/', views.enviar_mensaje_async, name='enviar_mensaje_async'),
+    path('api/enviar-mensaje/cola/', views.enviar_mensaje_cola, name='enviar_mensaje_cola'),
+    path('api/enviar-lote/', views.enviar_lote, name='enviar_lote'),
+    path('api/tareas/<int:tarea_id>/', views.estado_tarea, name='estado_tarea'),
+    path('api/tareas/<int:tarea_id>/stream/', views.estado_tarea_stream, name='estado_tarea_stream'),
     path('api/conversacion/<int:conversacion_id>/', views.obtener_conversacion, name='obtener_conversacion'),
+    path('api/conversacion/<int:conversacion_id>/mensajes/', views.obtener_mensajes, name='obtener_mensajes'),
     path('api/conversaciones/', views.obtener_conversaciones, name='obtener_conversaciones'),
     path('api/crear-conversacion/', views.crear_conversacion, name='crear_conversacion'),
     path('api/eliminar-conversacion/<int:conversacion_id>/', views.eliminar_conversacion, name='eliminar_conversacion'),
     path('api/sugerencias/', views.obtener_sugerencias, name='obtener_sugerencias'),
+    path('api/cache/estadisticas/', views.estadisticas_cache, name='estadisticas_cache'),
+    path('api/telemetria/', views.estadisticas_telemetria, name='estadisticas_telemetria'),
+    path('api/consultas/populares/', views.consultas_populares, name='consultas_populares'),
 ]
@@ -1,19 +1,31 @@
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import TemplateView
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
-from django.db import transaction
+from django.conf import settings
+from django.db import transaction, connections
+from django.db.models import Q, Subquery
+from asgiref.sync import sync_to_async
+import asyncio
 import json
 import time
+import base64
 from datetime import datetime
 
-from .models import Conversacion, Mensaje, ConsultaDocumento, ConfiguracionIA
+from .models import Conversacion, Mensaje, ConsultaDocumento, ConfiguracionIA, TareaIA
 from .services import AsistenteIAService
+from .batch_service import LoteConsultasIA, ordenar
+from .consultation_stats import MAX_LIMITE_RANKING, TIPOS, crear_consultas, mas_consultados, registros_consulta, resumen_uso
+from .conversation_summary_service import ConversationSummaryService
+from .job_queue import ColaTareasIA
+from .response_cache import RespuestaCacheService
 from .suggestion_service import SuggestionService
+from .single_flight import consultas_en_vuelo
+from .telemetry import resumen_telemetria
 
 
 class ChatView(LoginRequiredMixin, TemplateView):
@@ -27,10 +39,16 @@ class ChatView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         
         # Obtener conversaciones del usuario
-        conversaciones = Conversacion.objects.filter(
+        conversaciones = list(Conversacion.objects.filter(
             usuario=self.request.user,
             activa=True
-        ).order_by('-fecha_actualizacion')[:10]
+        ).order_by('-fecha_actualizacion', '-id')[:11])
+        
+        # El resto se carga desde la API con el cursor de la última mostrada
+        context['siguiente_cursor'] = None
+        if len(conversaciones) > 10:
+            conversaciones = conversaciones[:10]
+            context['siguiente_cursor'] = _codificar_cursor(conversaciones[-1].fecha_actualizacion, conversaciones[-1].id)
         
         context['conversaciones'] = conversaciones
         
@@ -44,7 +62,10 @@ class ChatView(LoginRequiredMixin, TemplateView):
                     usuario=self.request.user
                 )
                 context['conversacion_activa'] = conversacion
-                context['mensajes'] = conversacion.mensajes.all().order_by('fecha_envio')
+                # Solo la última página; las anteriores se piden al hacer scroll
+                pagina = paginar_mensajes(conversacion, limite=MENSAJES_POR_PAGINA)
+                context['mensajes'] = pagina['mensajes']
+                context['hay_anteriores'] = pagina['anteriores']
             except:
                 pass
         
@@ -96,18 +117,10 @@ def enviar_mensaje(request):
         tiempo_respuesta = time.time() - inicio_tiempo
         
         # Guardar respuesta de la IA
-        mensaje_ia_obj = Mensaje.objects.create(
-            conversacion=conversacion,
-            tipo='asistente',
-            contenido=respuesta_ia['respuesta'],
-            tiempo_respuesta=tiempo_respuesta,
-            documentos_consultados=respuesta_ia.get('documentos_consultados', []),
-            entidades_extraidas=respuesta_ia.get('entidades_extraidas', [])
-        )
+        mensaje_ia_obj = crear_mensaje_ia(conversacion, respuesta_ia, tiempo_respuesta)
         
-        # Actualizar fecha de conversación
-        conversacion.fecha_actualizacion = datetime.now()
-        conversacion.save()
+        # Integrar al resumen los mensajes que salen de la ventana reciente
+        ConversationSummaryService().programar(conversacion.id)
         
         return JsonResponse({
             'success': True,
@@ -132,62 +145,254 @@ def enviar_mensaje(request):
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 
 
-def procesar_consulta_ia(usuario, consulta, conversacion):
+def procesar_consulta_ia(usuario, consulta, conversacion, servicio_ia=None, historial=None):
     """
-    Procesa la consulta del usuario usando IA
+    Procesa la consulta del usuario usando IA. `historial` puede recibirse ya
+    calculado (un lote de preguntas lo lee una sola vez).
     """
     try:
         # Inicializar servicio de IA
-        servicio_ia = AsistenteIAService()
+        servicio_ia = servicio_ia or AsistenteIAService()
+        telemetria = servicio_ia.telemetria
+        if historial is None:
+            with telemetria.medir('historial'):
+                historial = obtener_historial(conversacion)
+        resuelta = []
         
-        # Analizar la consulta
-        analisis = servicio_ia.analizar_consulta(consulta)
-        
-        # Buscar información relevante
-        contexto = []
-        documentos_consultados = []
+        def resolver():
+            resuelta.append(True)
+            # Preguntas estructuradas: las responde el motor de reglas sin buscar contexto ni llamar a OpenAI
+            directa = respuesta_directa(servicio_ia, consulta, usuario)
+            if directa is not None:
+                return directa
+            
+            # Analizar la consulta y buscar información relevante
+            preparacion = recopilar_contexto_ia(servicio_ia, usuario, consulta, conversacion, historial)
+            
+            # Generar respuesta con IA
+            respuesta = servicio_ia.generar_respuesta_ia(
+                consulta, preparacion['contexto'], preparacion['historial'], usuario,
+                resumen=conversacion.resumen, db_resultados=preparacion['db_resultados']
+            )
+            
+            return {
+                'respuesta': respuesta,
+                'documentos_consultados': preparacion['documentos_consultados'],
+                'consultas': preparacion['consultas'],
+                'entidades_extraidas': preparacion['analisis']['entidades'],
+                'tipo_consulta': preparacion['analisis']['tipo'],
+                'tokens_usados': servicio_ia.tokens_prompt
+            }
         
-        if analisis['tipo'] == 'documento':
-            resultados = servicio_ia.buscar_documentos(consulta, usuario)
-            contexto.extend(resultados)
-            documentos_consultados = [r['objeto'].id for r in resultados if r['tipo'] == 'documento']
+        # Las consultas idénticas en curso comparten búsqueda y respuesta
+        clave = servicio_ia.clave_en_vuelo(consulta, usuario, historial, conversacion.resumen)
+        resultado = consultas_en_vuelo.ejecutar(clave, resolver)
         
-        elif analisis['tipo'] == 'actor':
-            resultados = servicio_ia.buscar_actores(consulta)
-            contexto.extend(resultados)
+        # Si otra petición resolvió la consulta, esta solo esperó su resultado
+        telemetria.compartida = not resuelta
+        return {**resultado, 'telemetria': telemetria}
         
-        elif analisis['tipo'] == 'caso':
-            resultados = servicio_ia.buscar_casos(consulta)
-            contexto.extend(resultados)
+    except Exception as e:
+        return {
+            'respuesta': f"Lo siento, hubo un error al procesar tu consulta: {str(e)}",
+            'documentos_consultados': [],
+            'entidades_extraidas': [],
+            'tipo_consulta': 'error'
+        }
+
+
+def respuesta_directa(servicio_ia, consulta, usuario):
+    """
+    Resultado del motor de reglas con el formato de procesar_consulta_ia,
+    o None si la pregunta tiene que ir a OpenAI
+    """
+    with servicio_ia.telemetria.medir('analisis'):
+        analisis = servicio_ia.analizar_consulta(consulta)
+    directa = servicio_ia.responder_directo(consulta, usuario, analisis)
+    if directa is None:
+        return None
+    
+    return {
+        'respuesta': directa['respuesta'],
+        'documentos_consultados': [doc['id'] for doc in directa['documentos']],
+        'consultas': registros_consulta(directa=directa),
+        'entidades_extraidas': analisis['entidades'],
+        'tipo_consulta': analisis['tipo'],
+        'tokens_usados': None
+    }
+
+
+# Búsquedas de cada tipo de consulta; la general usa todas
+BUSQUEDAS_POR_TIPO = {'documento': ('documentos',), 'actor': ('actores',), 'caso': ('casos',)}
+BUSQUEDAS_GENERAL = ('documentos', 'actores', 'casos')
+# Resultados de cada búsqueda que entran al contexto en una consulta general
+LIMITES_CONTEXTO_GENERAL = {'documentos': 3, 'actores': 2, 'casos': 2}
+
+
+def busquedas_contexto(tipo):
+    return BUSQUEDAS_POR_TIPO.get(tipo, BUSQUEDAS_GENERAL)
+
+
+def armar_contexto(tipo, resultados):
+    """
+    Contexto para el prompt y documentos consultados a partir de los resultados
+    de cada búsqueda; en una consulta general cada búsqueda aporta sus primeros
+    LIMITES_CONTEXTO_GENERAL. Lo comparten la versión síncrona y la asíncrona.
+    """
+    contexto = []
+    for nombre in BUSQUEDAS_GENERAL:
+        encontrados = resultados.get(nombre, [])
+        if tipo not in BUSQUEDAS_POR_TIPO:
+            encontrados = encontrados[:LIMITES_CONTEXTO_GENERAL[nombre]]
+        contexto.extend(encontrados)
+    documentos_consultados = [r['objeto'].id for r in resultados.get('documentos', []) if r['tipo'] == 'documento']
+    return contexto, documentos_consultados
+
+
+def recopilar_contexto_ia(servicio_ia, usuario, consulta, conversacion, historial=None):
+    """
+    Analiza la consulta, busca el contexto relevante (índice y DatabaseQueryService)
+    y arma el historial (si no se recibe ya calculado). 'consultas' son los
+    registros de ConsultaDocumento de lo encontrado.
+    """
+    telemetria = servicio_ia.telemetria
+    with telemetria.medir('analisis'):
+        analisis = servicio_ia.analizar_consulta(consulta)
+    busquedas = {
+        'documentos': lambda: telemetria.medido('documentos', servicio_ia.buscar_documentos)(consulta, usuario),
+        'actores': lambda: telemetria.medido('actores', servicio_ia.buscar_actores)(consulta),
+        'casos': lambda: telemetria.medido('casos', servicio_ia.buscar_casos)(consulta),
+    }
+    
+    # Buscar información relevante
+    resultados = {nombre: busquedas[nombre]() for nombre in busquedas_contexto(analisis['tipo'])}
+    contexto, documentos_consultados = armar_contexto(analisis['tipo'], resultados)
+    
+    db_resultados = telemetria.medido('db', servicio_ia.db_service.buscar_contexto)(consulta, usuario, analisis)
+    return {
+        'analisis': analisis,
+        'contexto': contexto,
+        'documentos_consultados': documentos_consultados,
+        'consultas': registros_consulta(contexto, db_resultados),
+        'db_resultados': db_resultados,
+        'historial': historial if historial is not None else telemetria.medido('historial', obtener_historial)(conversacion)
+    }
+
+
+def obtener_historial(conversacion):
+    """
+    Devuelve el contenido de los últimos mensajes de la conversación que aún
+    no están en su resumen (Conversacion.resumen)
+    """
+    return ConversationSummaryService().historial(conversacion)
+
+
+def crear_mensaje_ia(conversacion, respuesta_ia, tiempo_respuesta):
+    """
+    Guarda la respuesta del asistente junto con sus registros de ConsultaDocumento
+    ('consultas', en un solo INSERT y en la misma transacción). Si trae telemetría,
+    se completa con el tiempo total y el del propio guardado, y se graba en el mensaje.
+    """
+    telemetria = respuesta_ia.get('telemetria')
+    consultas = respuesta_ia.get('consultas') or []
+    
+    campos = {
+        'conversacion': conversacion,
+        'tipo': 'asistente',
+        'contenido': respuesta_ia['respuesta'],
+        'tiempo_respuesta': tiempo_respuesta,
+        'tokens_usados': respuesta_ia.get('tokens_usados'),
+        'documentos_consultados': respuesta_ia.get('documentos_consultados', []),
+        'entidades_extraidas': respuesta_ia.get('entidades_extraidas', []),
+    }
+    
+    def guardar():
+        with transaction.atomic():
+            mensaje = Mensaje.objects.create(**campos)
+            if consultas:
+                crear_consultas(mensaje, consultas)
+        return mensaje
+    
+    if telemetria is None:
+        return guardar()
+    
+    telemetria.registrar('total', tiempo_respuesta * 1000)
+    with telemetria.medir('persistencia'):
+        mensaje = guardar()
+    mensaje.telemetria = telemetria.como_dict()
+    Mensaje.objects.filter(id=mensaje.id).update(telemetria=mensaje.telemetria)
+    return mensaje
+
+
+def _en_hilo(funcion):
+    """
+    Ejecuta una función síncrona (ORM) en un hilo propio para poder lanzarla en
+    paralelo con otras; cierra la conexión del hilo al terminar
+    """
+    def ejecutar(*args):
+        try:
+            return funcion(*args)
+        finally:
+            connections.close_all()
+    return sync_to_async(ejecutar, thread_sensitive=False)
+
+
+async def procesar_consulta_ia_async(usuario, consulta, conversacion, servicio_ia=None):
+    """
+    Versión asíncrona de procesar_consulta_ia: las búsquedas, la consulta a
+    DatabaseQueryService y el historial se ejecutan en paralelo, y OpenAI se
+    llama con el cliente asíncrono. La latencia pasa a ser la del tramo más lento.
+    """
+    try:
+        # El servicio lee la configuración del pool (ORM): se crea en un hilo
+        servicio_ia = servicio_ia or await sync_to_async(AsistenteIAService)()
+        telemetria = servicio_ia.telemetria
+        historial = await _en_hilo(telemetria.medido('historial', obtener_historial))(conversacion)
+        resuelta = []
         
-        else:
-            # Búsqueda general
-            resultados_docs = servicio_ia.buscar_documentos(consulta, usuario)
-            resultados_actores = servicio_ia.buscar_actores(consulta)
-            resultados_casos = servicio_ia.buscar_casos(consulta)
+        async def resolver():
+            resuelta.append(True)
+            directa = await _en_hilo(respuesta_directa)(servicio_ia, consulta, usuario)
+            if directa is not None:
+                return directa
             
-            contexto.extend(resultados_docs[:3])
-            contexto.extend(resultados_actores[:2])
-            contexto.extend(resultados_casos[:2])
+            with telemetria.medir('analisis'):
+                analisis = servicio_ia.analizar_consulta(consulta)
+            tipo = analisis['tipo']
             
-            documentos_consultados = [r['objeto'].id for r in resultados_docs if r['tipo'] == 'documento']
-        
-        # Obtener historial de conversación
-        mensajes_anteriores = conversacion.mensajes.all().order_by('-fecha_envio')[:6]
-        historial = []
-        for msg in reversed(mensajes_anteriores):
-            if msg.tipo in ['usuario', 'asistente']:
-                historial.append(msg.contenido)
+            # Cada tramo se mide en su hilo (duración y consultas SQL propias)
+            busquedas = {
+                'documentos': lambda: _en_hilo(telemetria.medido('documentos', servicio_ia.buscar_documentos))(consulta, usuario),
+                'actores': lambda: _en_hilo(telemetria.medido('actores', servicio_ia.buscar_actores))(consulta),
+                'casos': lambda: _en_hilo(telemetria.medido('casos', servicio_ia.buscar_casos))(consulta),
+            }
+            tramos = {
+                'db': _en_hilo(telemetria.medido('db', servicio_ia.db_service.buscar_contexto))(consulta, usuario, analisis),
+            }
+            for nombre in busquedas_contexto(tipo):
+                tramos[nombre] = busquedas[nombre]()
+            
+            resultados = dict(zip(tramos, await asyncio.gather(*tramos.values())))
+            contexto, documentos_consultados = armar_contexto(tipo, resultados)
+            respuesta = await servicio_ia.generar_respuesta_ia_async(
+                consulta, resultados['db'], historial, contexto, resumen=conversacion.resumen
+            )
+            
+            return {
+                'respuesta': respuesta,
+                'documentos_consultados': documentos_consultados,
+                'consultas': registros_consulta(contexto, resultados['db']),
+                'entidades_extraidas': analisis['entidades'],
+                'tipo_consulta': tipo,
+                'tokens_usados': servicio_ia.tokens_prompt
+            }
         
-        # Generar respuesta con IA
-        respuesta = servicio_ia.generar_respuesta_ia(consulta, contexto, historial, usuario)
+        # Las consultas idénticas en curso comparten búsqueda y respuesta
+        clave = servicio_ia.clave_en_vuelo(consulta, usuario, historial, conversacion.resumen)
+        resultado = await consultas_en_vuelo.aejecutar(clave, resolver)
         
-        return {
-            'respuesta': respuesta,
-            'documentos_consultados': documentos_consultados,
-            'entidades_extraidas': analisis['entidades'],
-            'tipo_consulta': analisis['tipo']
-        }
+        telemetria.compartida = not resuelta
+        return {**resultado, 'telemetria': telemetria}
         
     except Exception as e:
         return {
@@ -198,34 +403,531 @@ def procesar_consulta_ia(usuario, consulta, conversacion):
         }
 
 
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+async def enviar_mensaje_async(request):
+    """
+    API endpoint asíncrono (ASGI) para enviar mensajes al chat
+    """
+    usuario = await request.auser()
+    
+    try:
+        data = json.loads(request.body)
+        mensaje_usuario = data.get('mensaje', '').strip()
+        conversacion_id = data.get('conversacion_id')
+        
+        if not mensaje_usuario:
+            return JsonResponse({'error': 'Mensaje vacío'}, status=400)
+        
+        # Obtener o crear conversación
+        if conversacion_id:
+            conversacion = await aget_object_or_404(
+                Conversacion,
+                id=conversacion_id,
+                usuario=usuario
+            )
+        else:
+            conversacion = await Conversacion.objects.acreate(
+                usuario=usuario,
+                titulo=mensaje_usuario[:50] + "..." if len(mensaje_usuario) > 50 else mensaje_usuario
+            )
+        
+        # Guardar mensaje del usuario
+        mensaje_usuario_obj = await Mensaje.objects.acreate(
+            conversacion=conversacion,
+            tipo='usuario',
+            contenido=mensaje_usuario
+        )
+        
+        # Procesar con IA
+        inicio_tiempo = time.time()
+        respuesta_ia = await procesar_consulta_ia_async(usuario, mensaje_usuario, conversacion)
+        tiempo_respuesta = time.time() - inicio_tiempo
+        
+        # Guardar respuesta de la IA
+        mensaje_ia_obj = await sync_to_async(crear_mensaje_ia)(conversacion, respuesta_ia, tiempo_respuesta)
+        
+        await sync_to_async(ConversationSummaryService().programar)(conversacion.id)
+        
+        return JsonResponse({
+            'success': True,
+            'mensaje_usuario': {
+                'id': mensaje_usuario_obj.id,
+                'contenido': mensaje_usuario_obj.contenido,
+                'fecha': mensaje_usuario_obj.fecha_envio.isoformat(),
+                'tipo': mensaje_usuario_obj.tipo
+            },
+            'mensaje_ia': {
+                'id': mensaje_ia_obj.id,
+                'contenido': mensaje_ia_obj.contenido,
+                'fecha': mensaje_ia_obj.fecha_envio.isoformat(),
+                'tipo': mensaje_ia_obj.tipo,
+                'tiempo_respuesta': mensaje_ia_obj.tiempo_respuesta,
+                'documentos_consultados': mensaje_ia_obj.documentos_consultados
+            },
+            'conversacion_id': conversacion.id
+        })
+        
+    except Exception as e:
+        return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
+
+
+def _evento_sse(evento, datos):
+    """
+    Serializa un evento server-sent events
+    """
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def enviar_mensaje_stream(request):
+    """
+    API endpoint que responde con server-sent events, fragmento a fragmento.
+    La respuesta completa se guarda en Mensaje al terminar el stream
+    (o lo generado hasta el momento si el cliente se desconecta).
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    
+    mensaje_usuario = data.get('mensaje', '').strip()
+    conversacion_id = data.get('conversacion_id')
+    
+    if not mensaje_usuario:
+        return JsonResponse({'error': 'Mensaje vacío'}, status=400)
+    
+    # Obtener o crear conversación
+    if conversacion_id:
+        conversacion = get_object_or_404(
+            Conversacion,
+            id=conversacion_id,
+            usuario=request.user
+        )
+    else:
+        conversacion = Conversacion.objects.create(
+            usuario=request.user,
+            titulo=mensaje_usuario[:50] + "..." if len(mensaje_usuario) > 50 else mensaje_usuario
+        )
+    
+    # Guardar mensaje del usuario
+    mensaje_usuario_obj = Mensaje.objects.create(
+        conversacion=conversacion,
+        tipo='usuario',
+        contenido=mensaje_usuario
+    )
+    
+    usuario = request.user
+    
+    def eventos():
+        inicio_tiempo = time.time()
+        partes = []
+        preparacion = None
+        fragmentos = None
+        # Puede fallar al construirse (p. ej. sin OPENAI_API_KEY): el finally no debe depender de él
+        servicio_ia = None
+        
+        try:
+            yield _evento_sse('inicio', {
+                'conversacion_id': conversacion.id,
+                'mensaje_usuario': {
+                    'id': mensaje_usuario_obj.id,
+                    'contenido': mensaje_usuario_obj.contenido,
+                    'fecha': mensaje_usuario_obj.fecha_envio.isoformat(),
+                    'tipo': mensaje_usuario_obj.tipo
+                }
+            })
+            
+            servicio_ia = AsistenteIAService()
+            with servicio_ia.telemetria.medir('historial'):
+                historial = obtener_historial(conversacion)
+            
+            def crear():
+                directa = respuesta_directa(servicio_ia, mensaje_usuario, usuario)
+                if directa is not None:
+                    # La respuesta del motor de reglas se envía como un único fragmento
+                    return {
+                        'servicio_ia': servicio_ia,
+                        'documentos_consultados': directa['documentos_consultados'],
+                        'consultas': directa['consultas'],
+                        'analisis': {'entidades': directa['entidades_extraidas']}
+                    }, (fragmento for fragmento in [directa['respuesta']])
+                
+                preparacion = recopilar_contexto_ia(servicio_ia, usuario, mensaje_usuario, conversacion, historial)
+                # Los tokens del prompt se conocen al empezar el stream: se leen del servicio que lo generó
+                preparacion['servicio_ia'] = servicio_ia
+                return preparacion, servicio_ia.generar_respuesta_ia_stream(
+                    mensaje_usuario, preparacion['contexto'], preparacion['historial'], usuario,
+                    resumen=conversacion.resumen, db_resultados=preparacion['db_resultados']
+                )
+            
+            # Las consultas idénticas en curso leen los mismos fragmentos
+            preparacion, fragmentos = consultas_en_vuelo.compartir_stream(
+                servicio_ia.clave_en_vuelo(mensaje_usuario, usuario, historial, conversacion.resumen), crear
+            )
+            
+            for fragmento in fragmentos:
+                partes.append(fragmento)
+                yield _evento_sse('token', {'texto': fragmento})
+        
+        except Exception as e:
+            partes.append(f"Lo siento, hubo un error al procesar tu consulta: {str(e)}")
+            yield _evento_sse('error', {'error': partes[-1]})
+        
+        finally:
+            # Cliente desconectado o stream terminado: cerrar la generación remota
+            if fragmentos is not None:
+                fragmentos.close()
+            
+            mensaje_ia_obj = None
+            if partes:
+                if servicio_ia is not None:
+                    servicio_ia.telemetria.compartida = bool(preparacion) and preparacion['servicio_ia'] is not servicio_ia
+                mensaje_ia_obj = crear_mensaje_ia(conversacion, {
+                    'respuesta': ''.join(partes),
+                    'tokens_usados': preparacion['servicio_ia'].tokens_prompt if preparacion else None,
+                    'documentos_consultados': preparacion['documentos_consultados'] if preparacion else [],
+                    'consultas': preparacion['consultas'] if preparacion else [],
+                    'entidades_extraidas': preparacion['analisis']['entidades'] if preparacion else [],
+                    'telemetria': servicio_ia.telemetria if servicio_ia is not None else None
+                }, time.time() - inicio_tiempo)
+            
+            if mensaje_ia_obj is not None:
+                ConversationSummaryService().programar(conversacion.id)
+        
+        if mensaje_ia_obj is not None:
+            yield _evento_sse('fin', {
+                'conversacion_id': conversacion.id,
+                'mensaje_ia': {
+                    'id': mensaje_ia_obj.id,
+                    'contenido': mensaje_ia_obj.contenido,
+                    'fecha': mensaje_ia_obj.fecha_envio.isoformat(),
+                    'tipo': mensaje_ia_obj.tipo,
+                    'tiempo_respuesta': mensaje_ia_obj.tiempo_respuesta,
+                    'documentos_consultados': mensaje_ia_obj.documentos_consultados
+                }
+            })
+    
+    response = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def enviar_mensaje_cola(request):
+    """
+    API endpoint que guarda el mensaje y encola la consulta para el trabajador
+    (manage.py procesar_tareas_ia). Responde de inmediato con el id de la tarea;
+    el resultado se consulta en estado_tarea o estado_tarea_stream.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    
+    mensaje_usuario = data.get('mensaje', '').strip()
+    conversacion_id = data.get('conversacion_id')
+    
+    if not mensaje_usuario:
+        return JsonResponse({'error': 'Mensaje vacío'}, status=400)
+    
+    with transaction.atomic():
+        # Obtener o crear conversación
+        if conversacion_id:
+            conversacion = get_object_or_404(
+                Conversacion,
+                id=conversacion_id,
+                usuario=request.user
+            )
+        else:
+            conversacion = Conversacion.objects.create(
+                usuario=request.user,
+                titulo=mensaje_usuario[:50] + "..." if len(mensaje_usuario) > 50 else mensaje_usuario
+            )
+        
+        mensaje_usuario_obj = Mensaje.objects.create(
+            conversacion=conversacion,
+            tipo='usuario',
+            contenido=mensaje_usuario
+        )
+        tarea = ColaTareasIA().encolar(request.user, conversacion, mensaje_usuario_obj)
+    
+    return JsonResponse({
+        'success': True,
+        'tarea': _tarea_json(tarea),
+        'mensaje_usuario': {
+            'id': mensaje_usuario_obj.id,
+            'contenido': mensaje_usuario_obj.contenido,
+            'fecha': mensaje_usuario_obj.fecha_envio.isoformat(),
+            'tipo': mensaje_usuario_obj.tipo
+        },
+        'conversacion_id': conversacion.id
+    }, status=202)
+
+
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def enviar_lote(request):
+    """
+    API endpoint para un lote de preguntas (p. ej. plazos, partes y documentos
+    de un mismo caso): se responden en paralelo en un pool acotado y se guardan
+    en la conversación en el orden de las preguntas. Con "stream": true responde
+    con server-sent events: 'resultado' por cada pregunta a medida que termina y
+    'fin' con todas en orden. Un error en una pregunta va en su propio 'error'.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    
+    preguntas = [p.strip() for p in data.get('preguntas') or [] if isinstance(p, str) and p.strip()]
+    conversacion_id = data.get('conversacion_id')
+    maximo = int(getattr(settings, 'CHAT_LOTE_MAX_PREGUNTAS', 50))
+    
+    if not preguntas:
+        return JsonResponse({'error': 'Lote vacío'}, status=400)
+    if len(preguntas) > maximo:
+        return JsonResponse({'error': f'El lote admite como máximo {maximo} preguntas'}, status=400)
+    
+    # Obtener o crear conversación
+    if conversacion_id:
+        conversacion = get_object_or_404(
+            Conversacion,
+            id=conversacion_id,
+            usuario=request.user
+        )
+    else:
+        titulo = f"Lote: {preguntas[0]}"
+        conversacion = Conversacion.objects.create(
+            usuario=request.user,
+            titulo=titulo[:50] + "..." if len(titulo) > 50 else titulo
+        )
+    
+    lote = LoteConsultasIA(request.user, conversacion)
+    
+    if not data.get('stream'):
+        inicio_tiempo = time.time()
+        resultados = lote.responder_ordenado(preguntas)
+        mensajes = lote.guardar(resultados)
+        return JsonResponse({
+            'success': True,
+            'conversacion_id': conversacion.id,
+            'duracion': round(time.time() - inicio_tiempo, 3),
+            'busquedas_compartidas': lote.db_service.reutilizadas,
+            'resultados': [_resultado_lote_json(r, m) for r, m in zip(resultados, mensajes)]
+        })
+    
+    def eventos():
+        inicio_tiempo = time.time()
+        resultados = []
+        mensajes = []
+        yield _evento_sse('inicio', {'conversacion_id': conversacion.id, 'total': len(preguntas)})
+        try:
+            for resultado in lote.responder(preguntas):
+                resultados.append(resultado)
+                yield _evento_sse('resultado', _resultado_lote_json(resultado))
+        finally:
+            # También si el cliente se desconecta: se guardan las respuestas ya terminadas
+            if resultados:
+                mensajes = lote.guardar(resultados)
+        
+        yield _evento_sse('fin', {
+            'conversacion_id': conversacion.id,
+            'duracion': round(time.time() - inicio_tiempo, 3),
+            'busquedas_compartidas': lote.db_service.reutilizadas,
+            'resultados': [_resultado_lote_json(r, m) for r, m in zip(ordenar(resultados), mensajes)]
+        })
+    
+    response = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _resultado_lote_json(resultado, mensaje_ia=None):
+    datos = {
+        'indice': resultado['indice'],
+        'pregunta': resultado['pregunta'],
+        'respuesta': resultado['respuesta'],
+        'error': resultado['error'],
+        'tipo_consulta': resultado.get('tipo_consulta'),
+        'documentos_consultados': resultado.get('documentos_consultados', []),
+        'tiempo_respuesta': round(resultado['tiempo_respuesta'], 3),
+        'repetida_de': resultado['repetida_de'],
+    }
+    if mensaje_ia is not None:
+        datos['mensaje_ia_id'] = mensaje_ia.id
+    return datos
+
+
+def _tarea_json(tarea, mensaje_ia=None):
+    datos = {
+        'id': tarea.id,
+        'estado': tarea.estado,
+        'intentos': tarea.intentos,
+        'error': tarea.error or None,
+    }
+    if mensaje_ia is not None:
+        datos['mensaje_ia'] = {
+            'id': mensaje_ia.id,
+            'contenido': mensaje_ia.contenido,
+            'fecha': mensaje_ia.fecha_envio.isoformat(),
+            'tipo': mensaje_ia.tipo,
+            'tiempo_respuesta': mensaje_ia.tiempo_respuesta,
+            'documentos_consultados': mensaje_ia.documentos_consultados
+        }
+    return datos
+
+
+def _consultar_tarea(tarea_id, usuario):
+    tarea = TareaIA.objects.select_related('mensaje_respuesta').filter(id=tarea_id, usuario=usuario).first()
+    if tarea is None:
+        return None
+    return _tarea_json(tarea, tarea.mensaje_respuesta)
+
+
+@login_required
+@require_http_methods(["GET"])
+def estado_tarea(request, tarea_id):
+    """
+    Estado de una tarea encolada y, cuando está completada, la respuesta
+    """
+    datos = _consultar_tarea(tarea_id, request.user)
+    if datos is None:
+        return JsonResponse({'error': 'Tarea no encontrada'}, status=404)
+    return JsonResponse({'success': True, 'tarea': datos})
+
+
+@login_required
+@require_http_methods(["GET"])
+async def estado_tarea_stream(request, tarea_id):
+    """
+    Server-sent events con el estado de la tarea hasta que termina. Es una vista
+    asíncrona: bajo ASGI la espera no ocupa un worker.
+    """
+    usuario = await request.auser()
+    consultar = sync_to_async(_consultar_tarea)
+    datos = await consultar(tarea_id, usuario)
+    if datos is None:
+        return JsonResponse({'error': 'Tarea no encontrada'}, status=404)
+    
+    intervalo = float(getattr(settings, 'CHAT_TAREAS_INTERVALO', 0.5))
+    
+    async def eventos():
+        nonlocal datos
+        estado = None
+        while True:
+            if datos['estado'] != estado:
+                estado = datos['estado']
+                yield _evento_sse('estado', datos)
+            if estado in (TareaIA.COMPLETADA, TareaIA.FALLIDA):
+                yield _evento_sse('fin' if estado == TareaIA.COMPLETADA else 'error', datos)
+                return
+            await asyncio.sleep(intervalo)
+            datos = await consultar(tarea_id, usuario)
+    
+    response = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+MENSAJES_POR_PAGINA = 30
+CAMPOS_MENSAJE = ('id', 'tipo', 'contenido', 'fecha_envio', 'tiempo_respuesta')
+CAMPOS_METADATOS = ('documentos_consultados', 'entidades_extraidas')
+
+
+def paginar_mensajes(conversacion, antes=None, despues=None, limite=MENSAJES_POR_PAGINA, metadatos=False):
+    """
+    Página de mensajes en orden cronológico, paginada por cursor (fecha_envio, id):
+    los anteriores al mensaje `antes`, los posteriores a `despues` o, sin cursor,
+    los más recientes. Los campos JSON solo se cargan si se piden `metadatos`.
+    Devuelve los mensajes y si quedan más hacia atrás (`anteriores`) o adelante (`posteriores`).
+    """
+    campos = CAMPOS_MENSAJE + (CAMPOS_METADATOS if metadatos else ())
+    mensajes = Mensaje.objects.filter(conversacion=conversacion)
+    
+    pivote_id = despues if despues is not None else antes
+    if pivote_id is not None:
+        # La fecha del mensaje de referencia se resuelve en la misma consulta
+        fecha = Subquery(Mensaje.objects.filter(id=pivote_id, conversacion=conversacion).values('fecha_envio')[:1])
+        if despues is not None:
+            mensajes = mensajes.filter(Q(fecha_envio__gt=fecha) | Q(fecha_envio=fecha, id__gt=despues))
+        else:
+            mensajes = mensajes.filter(Q(fecha_envio__lt=fecha) | Q(fecha_envio=fecha, id__lt=antes))
+    
+    # Se pide un mensaje de más para saber si hay otra página
+    if despues is not None:
+        filas = list(mensajes.order_by('fecha_envio', 'id').values(*campos)[:limite + 1])
+        hay_mas = len(filas) > limite
+        filas = filas[:limite]
+        return {'mensajes': filas, 'anteriores': True, 'posteriores': hay_mas}
+    
+    filas = list(mensajes.order_by('-fecha_envio', '-id').values(*campos)[:limite + 1])
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    filas.reverse()
+    return {'mensajes': filas, 'anteriores': hay_mas, 'posteriores': antes is not None}
+
+
+def _mensaje_json(mensaje):
+    datos = {
+        'id': mensaje['id'],
+        'contenido': mensaje['contenido'],
+        'tipo': mensaje['tipo'],
+        'fecha': mensaje['fecha_envio'].isoformat(),
+        'tiempo_respuesta': mensaje['tiempo_respuesta'],
+    }
+    for campo in CAMPOS_METADATOS:
+        if campo in mensaje:
+            datos[campo] = mensaje[campo]
+    return datos
+
+
+def _parametros_pagina(request):
+    """
+    Lee antes/despues/limite/metadatos de la query string (ValueError si no son válidos)
+    """
+    antes = request.GET.get('antes')
+    despues = request.GET.get('despues')
+    return {
+        'antes': int(antes) if antes else None,
+        'despues': int(despues) if despues else None,
+        'limite': min(max(int(request.GET.get('limite', MENSAJES_POR_PAGINA)), 1), 100),
+        'metadatos': request.GET.get('metadatos') in ('1', 'true'),
+    }
+
+
 @login_required
 @require_http_methods(["GET"])
 def obtener_conversacion(request, conversacion_id):
     """
-    Obtiene los mensajes de una conversación específica
+    Obtiene una conversación con su última página de mensajes
+    (las anteriores se piden a obtener_mensajes)
     """
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'No autenticado'}, status=401)
     
+    try:
+        parametros = _parametros_pagina(request)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    
     try:
         conversacion = get_object_or_404(
-            Conversacion,
+            Conversacion.objects.only('id', 'titulo', 'fecha_creacion', 'fecha_actualizacion'),
             id=conversacion_id,
             usuario=request.user
         )
         
-        mensajes = conversacion.mensajes.all().order_by('fecha_envio')
-        
-        mensajes_data = []
-        for mensaje in mensajes:
-            mensajes_data.append({
-                'id': mensaje.id,
-                'contenido': mensaje.contenido,
-                'tipo': mensaje.tipo,
-                'fecha': mensaje.fecha_envio.isoformat(),
-                'tiempo_respuesta': mensaje.tiempo_respuesta,
-                'documentos_consultados': mensaje.documentos_consultados
-            })
+        pagina = paginar_mensajes(conversacion, limite=parametros['limite'], metadatos=parametros['metadatos'])
         
         return JsonResponse({
             'success': True,
@@ -235,13 +937,37 @@ def obtener_conversacion(request, conversacion_id):
                 'fecha_creacion': conversacion.fecha_creacion.isoformat(),
                 'fecha_actualizacion': conversacion.fecha_actualizacion.isoformat()
             },
-            'mensajes': mensajes_data
+            'mensajes': [_mensaje_json(mensaje) for mensaje in pagina['mensajes']],
+            'anteriores': pagina['anteriores']
         })
         
     except Exception as e:
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 
 
+@login_required
+@require_http_methods(["GET"])
+def obtener_mensajes(request, conversacion_id):
+    """
+    Mensajes de una conversación anteriores (?antes=<id>) o posteriores
+    (?despues=<id>) a un mensaje; ?metadatos=1 incluye los campos JSON
+    """
+    try:
+        parametros = _parametros_pagina(request)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    
+    conversacion = get_object_or_404(Conversacion.objects.only('id'), id=conversacion_id, usuario=request.user)
+    pagina = paginar_mensajes(conversacion, **parametros)
+    
+    return JsonResponse({
+        'success': True,
+        'mensajes': [_mensaje_json(mensaje) for mensaje in pagina['mensajes']],
+        'anteriores': pagina['anteriores'],
+        'posteriores': pagina['posteriores']
+    })
+
+
 @login_required
 @require_http_methods(["POST"])
 def crear_conversacion(request):
@@ -295,36 +1021,75 @@ def eliminar_conversacion(request, conversacion_id):
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 
 
+def _codificar_cursor(fecha, objeto_id):
+    """
+    Cursor opaco con la posición (fecha, id) del último elemento de la página
+    """
+    return base64.urlsafe_b64encode(f"{fecha.isoformat()}|{objeto_id}".encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    """
+    Devuelve (fecha, id) o lanza ValueError si el cursor no es válido
+    """
+    fecha, objeto_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(fecha), int(objeto_id)
+
+
 @login_required
 @require_http_methods(["GET"])
 def obtener_conversaciones(request):
     """
-    Obtiene las conversaciones del usuario
+    Obtiene las conversaciones del usuario, de la más reciente a la más antigua,
+    paginadas por cursor (?cursor=...&limite=20) con una sola consulta
     """
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'No autenticado'}, status=401)
     
+    try:
+        limite = min(max(int(request.GET.get('limite', 20)), 1), 100)
+    except ValueError:
+        return JsonResponse({'error': 'Límite inválido'}, status=400)
+    
     try:
         conversaciones = Conversacion.objects.filter(
             usuario=request.user,
             activa=True
-        ).order_by('-fecha_actualizacion')
-        
-        conversaciones_data = []
-        for conv in conversaciones:
-            ultimo_mensaje = conv.mensajes.last()
-            conversaciones_data.append({
-                'id': conv.id,
-                'titulo': conv.titulo,
-                'fecha_creacion': conv.fecha_creacion.isoformat(),
-                'fecha_actualizacion': conv.fecha_actualizacion.isoformat(),
-                'ultimo_mensaje': ultimo_mensaje.contenido if ultimo_mensaje else None,
-                'cantidad_mensajes': conv.mensajes.count()
-            })
+        )
+        
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                fecha, conversacion_id = _decodificar_cursor(cursor)
+            except ValueError:
+                return JsonResponse({'error': 'Cursor inválido'}, status=400)
+            conversaciones = conversaciones.filter(
+                Q(fecha_actualizacion__lt=fecha) | Q(fecha_actualizacion=fecha, id__lt=conversacion_id)
+            )
+        
+        filas = list(conversaciones.order_by('-fecha_actualizacion', '-id').values(
+            'id', 'titulo', 'fecha_creacion', 'fecha_actualizacion', 'ultimo_mensaje', 'cantidad_mensajes'
+        )[:limite + 1])
+        
+        # Se pide un elemento de más para saber si hay otra página
+        siguiente_cursor = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            siguiente_cursor = _codificar_cursor(filas[-1]['fecha_actualizacion'], filas[-1]['id'])
+        
+        conversaciones_data = [{
+            'id': fila['id'],
+            'titulo': fila['titulo'],
+            'fecha_creacion': fila['fecha_creacion'].isoformat(),
+            'fecha_actualizacion': fila['fecha_actualizacion'].isoformat(),
+            'ultimo_mensaje': fila['ultimo_mensaje'] or None,
+            'cantidad_mensajes': fila['cantidad_mensajes']
+        } for fila in filas]
         
         return JsonResponse({
             'success': True,
-            'conversaciones': conversaciones_data
+            'conversaciones': conversaciones_data,
+            'siguiente_cursor': siguiente_cursor
         })
         
     except Exception as e:
@@ -356,4 +1121,75 @@ def obtener_sugerencias(request):
         })
         
     except Exception as e:
-        return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
+
+@login_required
+@require_http_methods(["GET"])
+def estadisticas_cache(request):
+    """
+    Contadores de aciertos/fallos de la caché de respuestas de OpenAI
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    try:
+        return JsonResponse({
+            'success': True,
+            'estadisticas': RespuestaCacheService().estadisticas()
+        })
+        
+    except Exception as e:
+        return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
+
+
+@login_required
+@require_http_methods(["GET"])
+def estadisticas_telemetria(request):
+    """
+    Percentiles (p50/p95/p99) por etapa del pipeline del chat, de consultas SQL
+    y de tokens, sobre las respuestas de las últimas ?horas= (24 por defecto)
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    try:
+        horas = float(request.GET.get('horas', 24))
+    except ValueError:
+        return JsonResponse({'error': 'Parámetro horas inválido'}, status=400)
+    if horas <= 0:
+        return JsonResponse({'error': 'Parámetro horas inválido'}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'telemetria': resumen_telemetria(horas)
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def consultas_populares(request):
+    """
+    Documentos, casos o actores (?tipo=, documento por defecto) más consultados
+    por el chat en los últimos ?dias= (30 por defecto), con el resumen de uso del período
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    
+    tipo = request.GET.get('tipo', 'documento')
+    if tipo not in TIPOS:
+        return JsonResponse({'error': 'Parámetro tipo inválido'}, status=400)
+    try:
+        dias = float(request.GET.get('dias', 30))
+        limite = int(request.GET.get('limite', 10))
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros dias/limite inválidos'}, status=400)
+    if dias <= 0 or not 1 <= limite <= MAX_LIMITE_RANKING:
+        return JsonResponse({'error': 'Parámetros dias/limite inválidos'}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'tipo': tipo,
+        'ventana_dias': dias,
+        'ranking': mas_consultados(tipo, dias, limite),
+        'uso': resumen_uso(dias)
+    })
@@ -0,0 +1,94 @@
+"""
+Precalentamiento del chat al iniciar un proceso (opcional, CHAT_PRECALENTAR):
+carga en un hilo en segundo plano lo que la primera pregunta pagaría en frío
+(cliente de OpenAI del pool y codificador de tokens, índice BM25, tipos de
+documento y de caso del motor de reglas, snapshot de sugerencias) sin demorar
+el arranque. La duración de cada paso y la total se registran en el log.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Espera máxima a que termine django.setup() antes de tocar la base de datos
+ESPERA_APPS = 30.0  # segundos
+
+_iniciado = False
+_lock = threading.Lock()
+
+
+def precalentar() -> Dict[str, float]:
+    """
+    Ejecuta los pasos del precalentamiento y devuelve su duración en
+    milisegundos; un paso que falla se registra y no detiene los demás
+    """
+    from .database_service import DatabaseQueryService
+    from .search_index import obtener_indice
+    from .services import AsistenteIAService
+    from .suggestion_service import SuggestionService
+
+    pasos = (
+        # Importa openai y crea el cliente compartido del pool (y el codificador de tiktoken)
+        ('cliente', AsistenteIAService),
+        ('indice', obtener_indice),
+        ('tipos', lambda: DatabaseQueryService().motor._tipos()),
+        ('sugerencias', lambda: SuggestionService().get_snapshot()),
+    )
+
+    duraciones = {}
+    inicio_total = time.perf_counter()
+    for nombre, paso in pasos:
+        inicio = time.perf_counter()
+        try:
+            paso()
+        except Exception:
+            logger.exception('Precalentamiento del chat: falló el paso %s', nombre)
+        duraciones[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+    duraciones['total'] = round((time.perf_counter() - inicio_total) * 1000, 1)
+
+    logger.info(
+        'Precalentamiento del chat completado en %.1f ms (%s)', duraciones['total'],
+        ', '.join(f'{nombre} {ms:.1f} ms' for nombre, ms in duraciones.items() if nombre != 'total')
+    )
+    return duraciones
+
+
+def iniciar_precalentamiento() -> bool:
+    """
+    Lanza precalentar() en un hilo daemon si CHAT_PRECALENTAR está activo
+    (una vez por proceso). Se omite en el proceso vigilante del autoreload de
+    runserver, que no atiende peticiones.
+    """
+    global _iniciado
+    if not getattr(settings, 'CHAT_PRECALENTAR', False):
+        return False
+    if 'runserver' in sys.argv and os.environ.get('RUN_MAIN') != 'true':
+        return False
+    with _lock:
+        if _iniciado:
+            return False
+        _iniciado = True
+
+    threading.Thread(target=_ejecutar, name='chat-precalentamiento', daemon=True).start()
+    return True
+
+
+def _ejecutar():
+    try:
+        # ready() corre antes de que el registro de apps termine de cargarse
+        limite = time.monotonic() + ESPERA_APPS
+        while not apps.ready and time.monotonic() < limite:
+            time.sleep(0.05)
+        precalentar()
+    except Exception:
+        logger.exception('Precalentamiento del chat interrumpido')
+    finally:
+        connections.close_all()
@@ -0,0 +1,121 @@
+"""
+Estadísticas de casos, documentos, actores y usuarios calculadas en una sola
+consulta agrupada por entidad. Las comparten el chat, el panel y los reportes.
+"""
+from collections import Counter
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from actores.models import Actor
+from casos.models import Caso
+from documentos.models import Documento, VersionDocumento
+from seguridad.models import Usuario
+
+
+CACHE_KEY = 'estadisticas:{entidad}'
+
+
+def _contar(filas: List[Dict[str, Any]], campo: str, nombre: str = None, columna: str = 'count') -> List[Dict[str, Any]]:
+    """Suma `columna` agrupando por `campo` (de mayor a menor)"""
+    totales = Counter()
+    for fila in filas:
+        if fila[columna]:
+            totales[fila[campo]] += fila[columna]
+    return [{nombre or campo: valor, 'count': count} for valor, count in totales.most_common()]
+
+
+class StatisticsService:
+    """
+    Cada entidad se resuelve con un GROUP BY sobre sus facetas y el resto de
+    conteos (totales, abiertos, por tipo...) se derivan en Python.
+    Los resultados se guardan en caché con un TTL corto.
+    """
+
+    def __init__(self):
+        self.ttl = int(getattr(settings, 'ESTADISTICAS_TTL', 60))
+
+    def casos(self) -> Dict[str, Any]:
+        return self._en_cache('casos', self._calcular_casos)
+
+    def documentos(self) -> Dict[str, Any]:
+        return self._en_cache('documentos', self._calcular_documentos)
+
+    def actores(self) -> Dict[str, Any]:
+        return self._en_cache('actores', self._calcular_actores)
+
+    def usuarios(self) -> Dict[str, Any]:
+        return self._en_cache('usuarios', self._calcular_usuarios)
+
+    def _en_cache(self, entidad: str, calcular) -> Dict[str, Any]:
+        clave = CACHE_KEY.format(entidad=entidad)
+        datos = cache.get(clave)
+        if datos is None:
+            datos = calcular()
+            cache.set(clave, datos, self.ttl)
+        return datos
+
+    # === CÁLCULOS ===
+
+    def _calcular_casos(self) -> Dict[str, Any]:
+        filas = list(Caso.objects.order_by().values('tipoCaso', 'estado').annotate(count=Count('id')))
+        por_estado = _contar(filas, 'estado')
+        conteo_estado = {fila['estado']: fila['count'] for fila in por_estado}
+        return {
+            'total': sum(fila['count'] for fila in filas),
+            'por_tipo': _contar(filas, 'tipoCaso'),
+            'por_estado': por_estado,
+            'abiertos': conteo_estado.get('ABIERTO', 0),
+            'cerrados': conteo_estado.get('CERRADO', 0),
+        }
+
+    def _calcular_documentos(self) -> Dict[str, Any]:
+        filas = list(
+            Documento.objects.order_by().values('tipoDocumento__nombre').annotate(
+                count=Count('id'),
+                con_palabras_clave=Count('id', filter=~Q(palabraClave='')),
+            )
+        )
+        total = sum(fila['count'] for fila in filas)
+        con_palabras_clave = sum(fila['con_palabras_clave'] for fila in filas)
+        return {
+            'total': total,
+            'por_tipo': _contar(filas, 'tipoDocumento__nombre'),
+            'con_palabras_clave': con_palabras_clave,
+            'sin_palabras_clave': total - con_palabras_clave,
+            'versiones': VersionDocumento.objects.count(),
+        }
+
+    def _calcular_actores(self) -> Dict[str, Any]:
+        # Los subtipos son OneToOne con Actor: un LEFT JOIN por subtipo y un único GROUP BY
+        filas = list(
+            Actor.objects.order_by().values('abogado__especialidad', 'cliente__tipoCliente').annotate(
+                count=Count('id'),
+                abogados=Count('abogado'),
+                clientes=Count('cliente'),
+                asistentes=Count('asistente'),
+            )
+        )
+        return {
+            'total': sum(fila['count'] for fila in filas),
+            'abogados': sum(fila['abogados'] for fila in filas),
+            'clientes': sum(fila['clientes'] for fila in filas),
+            'asistentes': sum(fila['asistentes'] for fila in filas),
+            'por_especialidad': _contar(filas, 'abogado__especialidad', 'especialidad', 'abogados'),
+            'por_tipo_cliente': _contar(filas, 'cliente__tipoCliente', 'tipoCliente', 'clientes'),
+        }
+
+    def _calcular_usuarios(self) -> Dict[str, Any]:
+        # Un usuario puede tener varios roles: los totales se cuentan aparte para no duplicarlos
+        totales = Usuario.objects.aggregate(
+            total=Count('id'),
+            activos=Count('id', filter=Q(is_active=True)),
+        )
+        return {
+            'total': totales['total'],
+            'activos': totales['activos'],
+            'inactivos': totales['total'] - totales['activos'],
+            'por_rol': list(Usuario.objects.order_by().values('groups__name').annotate(count=Count('id'))),
+        }
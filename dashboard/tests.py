@@ -1,3 +1,63 @@
+from datetime import date
+
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from actores.models import Actor, Abogado, Cliente
+from casos.models import Caso, Expediente, Carpeta
+from documentos.models import Documento, TipoDocumento
+from seguridad.models import Usuario
+from .statistics_service import StatisticsService
+
+
+class StatisticsServiceTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for i, (tipo, estado) in enumerate([("Divorcio", "ABIERTO"), ("Divorcio", "CERRADO"), ("Penal", "ABIERTO")]):
+            Caso.objects.create(nroCaso=f"CAS-{i}", tipoCaso=tipo, estado=estado, fechaInicio=date(2024, 1, 1))
+
+    def test_casos_en_una_consulta(self):
+        servicio = StatisticsService()
+        with self.assertNumQueries(1):
+            stats = servicio.casos()
+
+        self.assertEqual(stats["total"], 3)
+        self.assertEqual(stats["abiertos"], 2)
+        self.assertEqual(stats["cerrados"], 1)
+        self.assertEqual(stats["por_tipo"][0], {"tipoCaso": "Divorcio", "count": 2})
+
+        # Segunda lectura desde la caché
+        with self.assertNumQueries(0):
+            servicio.casos()
+
+    def test_documentos_y_actores(self):
+        expediente = Expediente.objects.create(
+            caso=Caso.objects.first(), nroExpediente="EXP-1", fechaCreacion=date(2024, 1, 1)
+        )
+        carpeta = Carpeta.objects.create(expediente=expediente, nombre="General")
+        tipo = TipoDocumento.objects.create(nombre="Contrato")
+        Documento.objects.create(
+            carpeta=carpeta, tipoDocumento=tipo, nombreDocumento="A", palabraClave="renta", fechaDoc=date(2024, 1, 1)
+        )
+        Documento.objects.create(carpeta=carpeta, tipoDocumento=tipo, nombreDocumento="B", fechaDoc=date(2024, 1, 1))
+        ana = Usuario.objects.create_user(username="ana", email="ana@example.com", password="123456")
+        luis = Usuario.objects.create_user(username="luis", email="luis@example.com", password="123456")
+        abogado = Actor.objects.create(usuario=ana, tipoActor="ABO", nombres="Ana", apellidoPaterno="Paz", ci="100")
+        Abogado.objects.create(actor=abogado, nroCredencial="AB-1", especialidad="Civil")
+        cliente = Actor.objects.create(usuario=luis, tipoActor="CLI", nombres="Luis", apellidoPaterno="Rojas", ci="200")
+        Cliente.objects.create(actor=cliente, tipoCliente="NATURAL")
+
+        servicio = StatisticsService()
+        documentos = servicio.documentos()
+        with self.assertNumQueries(1):
+            actores = servicio.actores()
+
+        self.assertEqual(documentos["total"], 2)
+        self.assertEqual(documentos["con_palabras_clave"], 1)
+        self.assertEqual(documentos["sin_palabras_clave"], 1)
+        self.assertEqual(actores["total"], 2)
+        self.assertEqual(actores["abogados"], 1)
+        self.assertEqual(actores["clientes"], 1)
+        self.assertEqual(actores["por_especialidad"], [{"especialidad": "Civil", "count": 1}])
+        self.assertEqual(actores["por_tipo_cliente"], [{"tipoCliente": "NATURAL", "count": 1}])
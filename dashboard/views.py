@@ -1,9 +1,10 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import TemplateView
-from django.db.models import Count
+from django.db.models import F
 from casos.models import Caso
 from documentos.models import Documento, VersionDocumento
 from actores.models import Actor
+from .statistics_service import StatisticsService
 
 class PanelView(LoginRequiredMixin, TemplateView):
     template_name = "dashboard/panel.html"
@@ -12,10 +13,13 @@ class PanelView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
 
-        # Indicadores generales
-        ctx["total_casos"] = Caso.objects.count()
-        ctx["total_documentos"] = Documento.objects.count()
-        ctx["total_versiones"] = VersionDocumento.objects.count()
+        # Indicadores generales (estadísticas compartidas, en caché)
+        estadisticas = StatisticsService()
+        ctx["estadisticas_casos"] = estadisticas.casos()
+        ctx["estadisticas_documentos"] = estadisticas.documentos()
+        ctx["total_casos"] = ctx["estadisticas_casos"]["total"]
+        ctx["total_documentos"] = ctx["estadisticas_documentos"]["total"]
+        ctx["total_versiones"] = ctx["estadisticas_documentos"]["versiones"]
 
         # Datos del usuario (si tiene Actor)
         actor = getattr(self.request.user, "actor", None)
@@ -29,9 +33,9 @@ class PanelView(LoginRequiredMixin, TemplateView):
             ctx["mis_casos"] = 0
             ctx["mis_documentos"] = 0
 
-        # Casos más activos
+        # Casos más activos (totales del expediente, sin agregar la tabla de documentos)
         ctx["top_casos_docs"] = (
-            Caso.objects.annotate(num_docs=Count("expediente__carpetas__documentos"))
+            Caso.objects.annotate(num_docs=F("expediente__numDocumentos"))
             .filter(num_docs__gt=0)
             .order_by("-num_docs")[:5]
         )
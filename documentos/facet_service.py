@@ -0,0 +1,161 @@
+"""
+Facetas del listado de documentos: cuántos documentos hay por tipo, por etapa
+procesal y por año/mes, cada una con los filtros actuales salvo el suyo,
+calculadas con una sola consulta agrupada. Se guardan en caché por la huella de los filtros
+normalizados y se invalidan por versión al guardar o eliminar documentos (ver
+documentos.signals y GestDocSi2.cache_versions); las escrituras masivas, y con
+la caché local las de otros procesos, solo se reflejan al vencer el TTL, por
+eso los conteos se presentan como aproximados.
+"""
+import hashlib
+import json
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from GestDocSi2.cache_versions import acotar_ttl, incrementar_version, version
+from .models import Documento
+
+# Claves en la caché de Django: la versión cambia con cada escritura de documentos
+FACETAS_VERSION_KEY = 'documentos:facetas:version'
+FACETAS_KEY = 'documentos:facetas:{version}:{huella}'
+
+# Meses que se muestran en el listado (los más recientes)
+MAX_MESES = 12
+
+
+def normalizar_filtros(parametros) -> Dict[str, Any]:
+    """
+    Filtros del listado (q, tipo, etapa, desde, hasta) en forma canónica: los
+    valores inválidos se descartan, así dos URLs equivalentes comparten la caché
+    """
+    def entero(valor):
+        valor = (valor or '').strip()
+        return int(valor) if valor.isdigit() else None
+
+    def fecha(valor):
+        try:
+            return datetime.strptime((valor or '').strip(), '%Y-%m-%d').date()
+        except ValueError:
+            return None
+
+    return {
+        'q': ' '.join((parametros.get('q') or '').split()).lower(),
+        'tipo': entero(parametros.get('tipo')),
+        'etapa': entero(parametros.get('etapa')),
+        'desde': fecha(parametros.get('desde')),
+        'hasta': fecha(parametros.get('hasta')),
+    }
+
+
+def filtrar_documentos(filtros: Dict[str, Any], documentos=None):
+    """Aplica los filtros normalizados; lo comparten el listado y las facetas"""
+    if documentos is None:
+        documentos = Documento.objects.all()
+    documentos = _filtrar_texto(filtros, documentos)
+    for condicion in _condiciones(filtros).values():
+        documentos = documentos.filter(condicion)
+    return documentos
+
+
+def _filtrar_texto(filtros: Dict[str, Any], documentos):
+    if filtros['q']:
+        documentos = documentos.filter(
+            Q(nombreDocumento__icontains=filtros['q']) | Q(palabraClave__icontains=filtros['q'])
+        )
+    return documentos
+
+
+def _condiciones(filtros: Dict[str, Any]) -> Dict[str, Q]:
+    """Condición de cada faceta filtrable (tipo, etapa, fecha); vacía si no se filtra"""
+    fecha = Q()
+    if filtros['desde']:
+        fecha &= Q(fechaDoc__gte=filtros['desde'])
+    if filtros['hasta']:
+        fecha &= Q(fechaDoc__lte=filtros['hasta'])
+    return {
+        'tipo': Q(tipoDocumento_id=filtros['tipo']) if filtros['tipo'] is not None else Q(),
+        'etapa': Q(etapaProcesal_id=filtros['etapa']) if filtros['etapa'] is not None else Q(),
+        'fecha': fecha,
+    }
+
+
+def contar_facetas(filtros: Dict[str, Any], ttl: Optional[int] = None) -> Dict[str, Any]:
+    """
+    {'total', 'tipos': {id: n}, 'etapas': {id o None: n}, 'anios': [(año, n)],
+    'meses': [(año, mes, n)]} de los documentos que cumplen los filtros
+    """
+    if ttl is None:
+        ttl = acotar_ttl(int(getattr(settings, 'DOCUMENTOS_FACETAS_TTL', 300)))
+    clave = FACETAS_KEY.format(version=version(FACETAS_VERSION_KEY), huella=huella_filtros(filtros))
+    facetas = cache.get(clave)
+    if facetas is None:
+        facetas = _calcular(filtros)
+        cache.set(clave, facetas, ttl)
+    return facetas
+
+
+def huella_filtros(filtros: Dict[str, Any]) -> str:
+    base = json.dumps(filtros, sort_keys=True, default=str)
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+
+def invalidar_facetas():
+    """Cambia de versión; las facetas anteriores dejan de usarse y expiran solas"""
+    incrementar_version(FACETAS_VERSION_KEY)
+
+
+def _contar(condiciones: Dict[str, Q], excepto: Optional[str] = None) -> Count:
+    """Count con todas las condiciones menos la de la faceta `excepto`"""
+    condicion = Q()
+    for faceta, q in condiciones.items():
+        if faceta != excepto:
+            condicion &= q
+    return Count('id', filter=condicion) if condicion else Count('id')
+
+
+def _calcular(filtros: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Un GROUP BY por (tipo, etapa, año, mes) sobre los documentos que cumplen la
+    búsqueda de texto. Cada faceta se cuenta con todos los filtros menos el
+    suyo (facetas de exploración: con un tipo elegido se siguen viendo los
+    conteos de los demás tipos) mediante conteos condicionales en la misma
+    consulta; el total usa todos los filtros. Cada faceta se suma en Python.
+    """
+    condiciones = _condiciones(filtros)
+    filas = (
+        _filtrar_texto(filtros, Documento.objects.all())
+        .values('tipoDocumento_id', 'etapaProcesal_id', anio=ExtractYear('fechaDoc'), mes=ExtractMonth('fechaDoc'))
+        .annotate(
+            n=_contar(condiciones),
+            n_tipo=_contar(condiciones, excepto='tipo'),
+            n_etapa=_contar(condiciones, excepto='etapa'),
+            n_fecha=_contar(condiciones, excepto='fecha'),
+        )
+        .order_by()
+    )
+
+    total = 0
+    tipos, etapas, anios, meses = Counter(), Counter(), Counter(), Counter()
+    for fila in filas:
+        total += fila['n']
+        if fila['n_tipo']:
+            tipos[fila['tipoDocumento_id']] += fila['n_tipo']
+        if fila['n_etapa']:
+            etapas[fila['etapaProcesal_id']] += fila['n_etapa']
+        if fila['n_fecha']:
+            anios[fila['anio']] += fila['n_fecha']
+            meses[(fila['anio'], fila['mes'])] += fila['n_fecha']
+
+    return {
+        'total': total,
+        'tipos': dict(tipos),
+        'etapas': dict(etapas),
+        'anios': sorted(anios.items(), reverse=True),
+        'meses': [(anio, mes, n) for (anio, mes), n in sorted(meses.items(), reverse=True)],
+    }
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documentos', '0003_remove_versiondocumento_documentos__usuario_2c01d2_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='tamanoArchivo',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='versiondocumento',
+            name='tamanoArchivo',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
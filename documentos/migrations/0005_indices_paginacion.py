@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documentos', '0004_tamano_archivo'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='documento',
+            name='documentos__fechaDo_a17f22_idx',
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['fechaDoc', 'id'], name='documentos__fechaDo_9a78af_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['nombreDocumento', 'id'], name='documentos__nombreD_64d8b4_idx'),
+        ),
+    ]
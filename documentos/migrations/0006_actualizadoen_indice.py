@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documentos', '0005_indices_paginacion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documento',
+            name='actualizadoEn',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -67,6 +67,8 @@ class Documento(models.Model):
         null=True,
         help_text="Archivo físico del documento"
     )
+    # Bytes del archivo, guardados al subirlo (totales de carpeta y expediente)
+    tamanoArchivo = models.BigIntegerField(default=0, editable=False)
     estado = models.CharField(max_length=20, default="ACTIVO")
     palabraClave = models.CharField(max_length=150, blank=True)
     fechaDoc = models.DateField(help_text="Fecha del documento (emisión o recepción)")
@@ -88,12 +90,14 @@ class Documento(models.Model):
     )
 
     creadoEn = models.DateTimeField(auto_now_add=True)
-    actualizadoEn = models.DateTimeField(auto_now=True)
+    actualizadoEn = models.DateTimeField(auto_now=True, db_index=True)  # marca del índice del chat (chat.search_index)
 
     class Meta:
         indexes = [
             models.Index(fields=["carpeta", "estado"]),
-            models.Index(fields=["fechaDoc"]),
+            # Listado paginado por cursor: (clave de orden, id)
+            models.Index(fields=["fechaDoc", "id"]),
+            models.Index(fields=["nombreDocumento", "id"]),
         ]
 
     def __str__(self):
@@ -124,6 +128,7 @@ class VersionDocumento(models.Model):
         null=True,
         help_text="Archivo físico de esta versión"
     )
+    tamanoArchivo = models.BigIntegerField(default=0, editable=False)
     fechaCambio = models.DateTimeField(auto_now_add=True)
     comentario = models.TextField(blank=True)
 
@@ -0,0 +1,97 @@
+"""
+Mantienen los totales de contenido de carpetas y expedientes
+(casos.rollup_service) al guardar o eliminar documentos y versiones, e
+invalidan las facetas del listado (documentos.facet_service). Las
+escrituras masivas (QuerySet.update, bulk_create) no pasan por aquí: el
+comando reconciliar_totales corrige los desvíos y las facetas vencen por TTL.
+"""
+from django.db.models import Count, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from casos.rollup_service import acumular_en_carpeta
+from .facet_service import invalidar_facetas
+from .models import Documento, VersionDocumento
+
+
+def tamano_archivo(archivo) -> int:
+    """Bytes del archivo (recién subido o ya guardado); 0 si no hay o no se puede leer"""
+    if not archivo:
+        return 0
+    try:
+        return archivo.size
+    except (OSError, ValueError):
+        return 0
+
+
+def _anterior(instance, campos):
+    """Valores guardados antes de este save(), o None si la fila es nueva"""
+    if instance._state.adding or instance.pk is None:
+        return None
+    return type(instance).objects.filter(pk=instance.pk).values(*campos).first()
+
+
+@receiver(pre_save, sender=Documento)
+def documento_por_guardar(sender, instance, **kwargs):
+    anterior = _anterior(instance, ("carpeta_id", "rutaDocumento", "tamanoArchivo"))
+    instance._anterior = anterior
+    if anterior is None or anterior["rutaDocumento"] != instance.rutaDocumento.name:
+        instance.tamanoArchivo = tamano_archivo(instance.rutaDocumento)
+
+
+@receiver(post_save, sender=Documento)
+def documento_guardado(sender, instance, created, **kwargs):
+    anterior = getattr(instance, "_anterior", None)
+    if created or anterior is None:
+        acumular_en_carpeta(instance.carpeta_id, documentos=1, bytes_=instance.tamanoArchivo)
+    elif anterior["carpeta_id"] != instance.carpeta_id:
+        # Se movió de carpeta: el documento y sus versiones pasan de una cadena a otra
+        versiones = instance.versiones.aggregate(n=Count("id"), b=Sum("tamanoArchivo"))
+        n, b = versiones["n"], versiones["b"] or 0
+        acumular_en_carpeta(anterior["carpeta_id"], documentos=-1, versiones=-n, bytes_=-(anterior["tamanoArchivo"] + b))
+        acumular_en_carpeta(instance.carpeta_id, documentos=1, versiones=n, bytes_=instance.tamanoArchivo + b)
+    else:
+        acumular_en_carpeta(instance.carpeta_id, bytes_=instance.tamanoArchivo - anterior["tamanoArchivo"])
+
+
+@receiver(post_delete, sender=Documento)
+def documento_eliminado(sender, instance, **kwargs):
+    # Sus versiones se eliminan antes (en cascada) y se descuentan por su cuenta
+    acumular_en_carpeta(instance.carpeta_id, documentos=-1, bytes_=-instance.tamanoArchivo)
+
+
+@receiver(pre_save, sender=VersionDocumento)
+def version_por_guardar(sender, instance, **kwargs):
+    anterior = _anterior(instance, ("rutaArchivo", "tamanoArchivo"))
+    instance._anterior = anterior
+    if anterior is None or anterior["rutaArchivo"] != instance.rutaArchivo.name:
+        instance.tamanoArchivo = tamano_archivo(instance.rutaArchivo)
+
+
+@receiver(post_save, sender=VersionDocumento)
+def version_guardada(sender, instance, created, **kwargs):
+    anterior = getattr(instance, "_anterior", None)
+    carpeta_id = _carpeta_de(instance.documento_id)
+    if carpeta_id is None:
+        return
+    if created or anterior is None:
+        acumular_en_carpeta(carpeta_id, versiones=1, bytes_=instance.tamanoArchivo)
+    else:
+        acumular_en_carpeta(carpeta_id, bytes_=instance.tamanoArchivo - anterior["tamanoArchivo"])
+
+
+@receiver(post_delete, sender=VersionDocumento)
+def version_eliminada(sender, instance, **kwargs):
+    carpeta_id = _carpeta_de(instance.documento_id)
+    if carpeta_id is not None:
+        acumular_en_carpeta(carpeta_id, versiones=-1, bytes_=-instance.tamanoArchivo)
+
+
+def _carpeta_de(documento_id):
+    return Documento.objects.filter(pk=documento_id).values_list("carpeta_id", flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Documento)
+def invalidar_facetas_documentos(sender, **kwargs):
+    """Cambió un documento: las facetas en caché pasan a una nueva versión"""
+    invalidar_facetas()
@@ -1,3 +1,85 @@
+from datetime import date
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from casos.models import Carpeta, Caso, Expediente
+from seguridad.models import Usuario
+from .facet_service import FACETAS_VERSION_KEY, contar_facetas, normalizar_filtros
+from .models import Documento, EtapaProcesal, TipoDocumento
+
+
+class FacetasDocumentosTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caso = Caso.objects.create(nroCaso="CIV-2024-001", tipoCaso="Divorcio", fechaInicio=date(2024, 1, 1))
+        expediente = Expediente.objects.create(caso=caso, nroExpediente="EXP-0001", fechaCreacion=date(2024, 1, 1))
+        self.carpeta = Carpeta.objects.create(expediente=expediente, nombre="Raíz")
+        self.contrato = TipoDocumento.objects.create(nombre="Contrato")
+        self.demanda = TipoDocumento.objects.create(nombre="Demanda")
+        self.etapa = EtapaProcesal.objects.create(nombre="Inicial")
+        self.crear("Contrato de alquiler", self.contrato, date(2024, 1, 10), self.etapa)
+        self.crear("Contrato laboral", self.contrato, date(2024, 3, 5))
+        self.crear("Demanda", self.demanda, date(2023, 3, 5))
+
+    def crear(self, nombre, tipo, fecha, etapa=None):
+        return Documento.objects.create(
+            carpeta=self.carpeta, tipoDocumento=tipo, etapaProcesal=etapa, nombreDocumento=nombre, fechaDoc=fecha
+        )
+
+    def test_facetas_en_una_consulta_y_en_cache(self):
+        filtros = normalizar_filtros({"q": "  CONTRATO "})
+        with self.assertNumQueries(1):
+            facetas = contar_facetas(filtros)
+        self.assertEqual(facetas["total"], 2)
+        self.assertEqual(facetas["tipos"], {self.contrato.id: 2})
+        self.assertEqual(facetas["etapas"], {self.etapa.id: 1, None: 1})
+        self.assertEqual(facetas["meses"], [(2024, 3, 1), (2024, 1, 1)])
+
+        # Filtros equivalentes (mayúsculas, espacios, valores inválidos) comparten la entrada
+        with self.assertNumQueries(0):
+            self.assertEqual(contar_facetas(normalizar_filtros({"q": "contrato", "tipo": "x", "desde": "mal"})), facetas)
+
+    def test_cada_faceta_ignora_su_propio_filtro(self):
+        filtros = normalizar_filtros({"tipo": str(self.contrato.id), "desde": "2024-02-01"})
+        with self.assertNumQueries(1):
+            facetas = contar_facetas(filtros)
+
+        self.assertEqual(facetas["total"], 1)
+        # Tipos: solo con el filtro de fecha; años: solo con el de tipo
+        self.assertEqual(facetas["tipos"], {self.contrato.id: 1})
+        self.assertEqual(facetas["anios"], [(2024, 2)])
+        self.assertEqual(facetas["etapas"], {None: 1})
+
+        facetas = contar_facetas(normalizar_filtros({"tipo": str(self.demanda.id)}))
+        self.assertEqual(facetas["total"], 1)
+        self.assertEqual(facetas["tipos"], {self.contrato.id: 2, self.demanda.id: 1})
+
+    def test_guardar_un_documento_invalida_las_facetas(self):
+        filtros = normalizar_filtros({"tipo": str(self.demanda.id)})
+        self.assertEqual(contar_facetas(filtros)["anios"], [(2023, 1)])
+
+        self.crear("Otra demanda", self.demanda, date(2024, 6, 1))
+        self.assertEqual(contar_facetas(filtros)["anios"], [(2024, 1), (2023, 1)])
+
+    def test_version_desalojada_no_reutiliza_facetas_anteriores(self):
+        filtros = normalizar_filtros({})
+        self.assertEqual(contar_facetas(filtros)["tipos"], {self.contrato.id: 2, self.demanda.id: 1})
+
+        # Escritura sin señales y versión perdida (desalojo o reinicio de la caché)
+        Documento.objects.filter(nombreDocumento="Demanda").update(tipoDocumento=self.contrato)
+        cache.delete(FACETAS_VERSION_KEY)
+        self.assertEqual(contar_facetas(filtros)["tipos"], {self.contrato.id: 3})
+
+    def test_listado_muestra_los_conteos(self):
+        usuario = Usuario.objects.create_user(username="abogado1", email="abogado1@example.com", password="123456")
+        self.client.force_login(usuario)
+
+        respuesta = self.client.get(reverse("documentos:documento_list"), {"desde": "2024-01-01"})
 
-# Create your tests here.
+        self.assertContains(respuesta, "Contrato (2)")
+        self.assertContains(respuesta, "Demanda (0)")
+        self.assertContains(respuesta, "03/2024 · 1")
+        self.assertEqual(respuesta.context["page_obj"].total, 2)
@@ -5,9 +5,10 @@ from .forms import DocumentoForm, VersionDocumentoForm, TipoDocumentoForm, Etapa
 from django.db.models import Max
 from django.utils import timezone
 from casos.models import Carpeta
-from django.db.models import Q
-from datetime import datetime
-from django.core.paginator import Paginator
+from calendar import monthrange
+from datetime import date
+from GestDocSi2.pagination import paginar_keyset
+from .facet_service import contar_facetas, filtrar_documentos, normalizar_filtros, MAX_MESES
 # Create your views here.
 
 
@@ -25,52 +26,44 @@ def documento_list(request):
     hasta = request.GET.get("hasta", "")
     ordenar = request.GET.get("ordenar", "-fechaDoc")
 
-    # 🔹 Consulta base
-    documentos = Documento.objects.select_related("carpeta", "tipoDocumento", "etapaProcesal").all()
-
-    # 🔍 Búsqueda por texto o palabra clave
-    if q:
-        documentos = documentos.filter(
-            Q(nombreDocumento__icontains=q) | Q(palabraClave__icontains=q)
-        )
-
-    # 🔍 Filtros específicos
-    if tipo:
-        documentos = documentos.filter(tipoDocumento__id=tipo)
-
-    if etapa:
-        documentos = documentos.filter(etapaProcesal__id=etapa)
-
-    # 🔍 Rango de fechas
-    if desde:
-        try:
-            documentos = documentos.filter(fechaDoc__gte=datetime.strptime(desde, "%Y-%m-%d").date())
-        except ValueError:
-            pass
-
-    if hasta:
-        try:
-            documentos = documentos.filter(fechaDoc__lte=datetime.strptime(hasta, "%Y-%m-%d").date())
-        except ValueError:
-            pass
+    # 🔹 Consulta base con los filtros normalizados (los mismos que usan las facetas)
+    filtros = normalizar_filtros(request.GET)
+    documentos = filtrar_documentos(
+        filtros, Documento.objects.select_related("carpeta", "tipoDocumento", "etapaProcesal")
+    )
 
     # 🔄 Orden dinámico
-    if ordenar in ["nombreDocumento", "-nombreDocumento", "fechaDoc", "-fechaDoc"]:
-        documentos = documentos.order_by(ordenar)
-    else:
-        documentos = documentos.order_by("-fechaDoc")
-
-    # 📄 Paginación
-    paginator = Paginator(documentos, 10)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    if ordenar not in ["nombreDocumento", "-nombreDocumento", "fechaDoc", "-fechaDoc"]:
+        ordenar = "-fechaDoc"
+
+    # 📄 Paginación por cursor (sin OFFSET ni COUNT sobre el join)
+    page_obj = paginar_keyset(request, documentos, (ordenar,), por_pagina=10, total=None)
+
+    # 📊 Facetas (en caché por filtros): conteos junto a cada opción, por mes y el total
+    facetas = contar_facetas(filtros)
+    page_obj.total = facetas["total"]
+    tipos = list(TipoDocumento.objects.filter(activo=True).order_by("nombre"))
+    for t in tipos:
+        t.num_documentos = facetas["tipos"].get(t.id, 0)
+    etapas = list(EtapaProcesal.objects.filter(estado="ACTIVO").order_by("nombre"))
+    for e in etapas:
+        e.num_documentos = facetas["etapas"].get(e.id, 0)
+    meses = []
+    for anio, mes, total in facetas["meses"][:MAX_MESES]:
+        parametros = request.GET.copy()
+        parametros.pop("cursor", None)
+        parametros["desde"] = date(anio, mes, 1).isoformat()
+        parametros["hasta"] = date(anio, mes, monthrange(anio, mes)[1]).isoformat()
+        meses.append({"anio": anio, "mes": mes, "total": total, "url": "?" + parametros.urlencode()})
 
     # 📦 Contexto
     context = {
         "documentos": page_obj,
         "page_obj": page_obj,
-        "tipos": TipoDocumento.objects.filter(activo=True).order_by("nombre"),
-        "etapas": EtapaProcesal.objects.filter(estado="ACTIVO").order_by("nombre"),
+        "tipos": tipos,
+        "etapas": etapas,
+        "facetas": facetas,
+        "meses": meses,
         "q": q,
         "tipo": tipo,
         "etapa": etapa,
@@ -248,17 +241,19 @@ def etapa_procesal_create(request):
 def carpeta_detalle(request, carpeta_id=None):
     if carpeta_id:
         carpeta = get_object_or_404(Carpeta, pk=carpeta_id)
+        ancestros = carpeta.ancestros()
         subcarpetas = Carpeta.objects.filter(carpetaPadre=carpeta)
         documentos = Documento.objects.filter(carpeta=carpeta)
     else:
         carpeta = None
+        ancestros = Carpeta.objects.none()
         subcarpetas = Carpeta.objects.filter(carpetaPadre__isnull=True)
         documentos = Documento.objects.none()
 
     return render(
         request,
         "documentos/carpeta_detalle.html",
-        {"carpeta": carpeta, "subcarpetas": subcarpetas, "documentos": documentos},
+        {"carpeta": carpeta, "ancestros": ancestros, "subcarpetas": subcarpetas, "documentos": documentos},
     )
 
 
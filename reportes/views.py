@@ -5,6 +5,7 @@ from django.db.models import Q
 from django.utils.http import urlencode
 from casos.models import Caso
 from documentos.models import Documento
+from dashboard.statistics_service import StatisticsService
 from .forms import ReportBuilderForm
 from .utils import queryset_to_xlsx, render_pdf_from_html
 from django.template.loader import render_to_string
@@ -97,6 +98,23 @@ def report_builder(request):
     # Mantener los filtros actuales para exportar con mismos criterios
     current_qs = urlencode(request.GET, doseq=True)
 
+    # Resumen general del modelo (estadísticas compartidas con el panel y el chat)
+    resumen = None
+    if modelo == "caso":
+        stats = StatisticsService().casos()
+        resumen = {
+            "titulo": "Casos por estado",
+            "total": stats["total"],
+            "facetas": [(f["estado"], f["count"]) for f in stats["por_estado"]],
+        }
+    elif modelo == "documento":
+        stats = StatisticsService().documentos()
+        resumen = {
+            "titulo": "Documentos por tipo",
+            "total": stats["total"],
+            "facetas": [(f["tipoDocumento__nombre"], f["count"]) for f in stats["por_tipo"]],
+        }
+
     return render(
         request,
         "reportes/report_builder.html",
@@ -106,6 +124,7 @@ def report_builder(request):
             "columns": columns or [],
             "modelo": modelo,
             "export_query": current_qs,
+            "resumen": resumen,
         },
     )
 
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('seguridad', '0003_permiso_creado_por_permiso_modificado_por_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['fecha', 'id'], name='bitacora_fecha_2640d0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['date_joined', 'id'], name='seguridad_u_date_jo_86d979_idx'),
+        ),
+    ]
@@ -12,6 +12,11 @@ class Usuario(AbstractUser):
     creadoEn = models.DateTimeField(auto_now_add=True)
     actualizadoEn = models.DateTimeField(auto_now=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["date_joined", "id"]),
+        ]
+
     @property
     def nombreUser(self):
         return self.username
@@ -153,6 +158,7 @@ class Bitacora(models.Model):
         indexes = [
             models.Index(fields=["idUsuario", "fecha"]),
             models.Index(fields=["login", "fecha"]),
+            models.Index(fields=["fecha", "id"]),
         ]
 
     def __str__(self):
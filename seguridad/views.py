@@ -1,6 +1,7 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from .models import Bitacora, DetalleBitacora
+from GestDocSi2.pagination import paginar_keyset
 
 from rest_framework.permissions import IsAuthenticated
 
@@ -20,7 +21,7 @@ def bitacora_list(request):
     accion = request.GET.get("accion")
     fecha = request.GET.get("fecha")
 
-    bitacoras = Bitacora.objects.select_related("idUsuario").order_by("-fecha")
+    bitacoras = Bitacora.objects.select_related("idUsuario")
 
     if usuario:
         bitacoras = bitacoras.filter(idUsuario__username__icontains=usuario)
@@ -29,7 +30,8 @@ def bitacora_list(request):
     if fecha:
         bitacoras = bitacoras.filter(fecha__date=fecha)
 
-    return render(request, "seguridad/bitacora_list.html", {"bitacoras": bitacoras})
+    pagina = paginar_keyset(request, bitacoras, ("-fecha",), por_pagina=50)
+    return render(request, "seguridad/bitacora_list.html", {"bitacoras": pagina, "pagina": pagina})
 
 
 #DETALLE DE LAS BITACORAS